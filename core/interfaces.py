@@ -30,6 +30,17 @@ class IIndexRepository(ABC):
     ) -> List[Dict[str, Any]]:
         """Query index with embedding."""
         pass
+    
+    @abstractmethod
+    def query_index_batch(
+        self,
+        index: Any,
+        embeddings: Any,
+        topk: int,
+        index_metadata: Optional[IndexMetadata] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Query index with all embeddings (N, D) in one search; one result list per row."""
+        pass
 
 
 class IFileRepository(ABC):
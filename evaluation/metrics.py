@@ -24,8 +24,8 @@ def extract_file_id_from_segment_id(segment_id: str) -> str:
     segment_id_str = str(segment_id)
     # Check if it's a segment ID (contains _seg_)
     if "_seg_" in segment_id_str:
-        # Split on _seg_ and take the first part
-        return segment_id_str.split("_seg_")[0]
+        # Split on the last _seg_ (file IDs may contain it themselves)
+        return segment_id_str.rsplit("_seg_", 1)[0]
     else:
         # Already a file ID, return as-is
         return segment_id_str
@@ -82,7 +82,7 @@ def compute_recall_at_k(
                         found = False
                         for result in aggregated_results:
                             match_id = result.get("id", "")
-                            match_file_id = extract_file_id_from_segment_id(match_id)
+                            match_file_id = result.get("file_id") or extract_file_id_from_segment_id(match_id)
                             if match_file_id == expected_id:
                                 found = True
                                 break
@@ -1,18 +1,44 @@
 """Fingerprint extraction and indexing."""
 from .load_model import load_fingerprint_model
-from .embed import segment_audio, extract_embeddings, normalize_embeddings
-from .query_index import build_index, load_index, query_index
-from .original_embeddings_cache import OriginalEmbeddingsCache
+from .embed import (
+    DecodedAudio,
+    SegmentMatrix,
+    segment_audio,
+    segment_audio_matrix,
+    segment_signal,
+    extract_embeddings,
+    normalize_embeddings,
+)
+from .query_index import build_index, load_index, query_index, search_batch, format_results
+from .segment_map import SegmentFileMap, segment_file_map
+from .sharded_index import ShardedIndex
+from .index_updates import MutableIndex
+from .score_aggregation import SegmentHits, CandidateScores, aggregate_hits
+from .original_embeddings_cache import OriginalEmbeddingsCache, get_shared_cache
 from .incremental_index import update_index_incremental
 
 __all__ = [
     "load_fingerprint_model",
+    "DecodedAudio",
+    "SegmentMatrix",
     "segment_audio",
+    "segment_audio_matrix",
+    "segment_signal",
     "extract_embeddings",
     "normalize_embeddings",
     "build_index",
     "load_index",
     "query_index",
+    "search_batch",
+    "format_results",
+    "SegmentFileMap",
+    "segment_file_map",
+    "ShardedIndex",
+    "MutableIndex",
+    "SegmentHits",
+    "CandidateScores",
+    "aggregate_hits",
     "OriginalEmbeddingsCache",
+    "get_shared_cache",
     "update_index_incremental",
 ]
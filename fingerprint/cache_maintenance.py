@@ -0,0 +1,160 @@
+"""Maintenance of the on-disk original-embeddings cache.
+
+run_cache_maintenance records missing entry sizes, removes orphaned files
+and manifest rows, purges entries of outdated models and evicts least
+recently accessed entries until the cache fits its size limit.
+PeriodicCacheMaintenance repeats this on a background thread; the
+cleanup_embeddings_indexes.py script runs it once from the command line.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from .original_embeddings_cache import ORPHAN_GRACE_SECONDS, OriginalEmbeddingsCache
+from .periodic_task import PeriodicTask, start_periodic_task
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MaintenanceReport:
+    """
+    Outcome of one maintenance pass.
+
+    Attributes:
+        sizes_recorded: Entries whose on-disk size was recorded
+        missing_entries: Manifest rows dropped because their files were gone
+        orphan_files: Files and directories no manifest row referred to
+        purged: Entries of outdated models removed
+        evicted: Entries removed to stay under the size limit
+        freed_bytes: Bytes freed by eviction
+        total_bytes: Cache size after the pass
+        elapsed: Wall time in seconds
+    """
+    sizes_recorded: int = 0
+    missing_entries: int = 0
+    orphan_files: int = 0
+    purged: int = 0
+    evicted: int = 0
+    freed_bytes: int = 0
+    total_bytes: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"cache {self.total_bytes / (1024 ** 3):.2f} GB after purging {self.purged} outdated entries, "
+            f"evicting {self.evicted} ({self.freed_bytes / (1024 ** 2):.1f} MB), removing "
+            f"{self.orphan_files} orphaned files and {self.missing_entries} dangling entries "
+            f"in {self.elapsed:.1f}s"
+        )
+
+
+def run_cache_maintenance(
+    cache: OriginalEmbeddingsCache,
+    max_bytes: Optional[int] = None,
+    keep_model_hashes: Optional[Iterable[str]] = None,
+    remove_orphans: bool = True,
+    orphan_grace_seconds: float = ORPHAN_GRACE_SECONDS
+) -> MaintenanceReport:
+    """
+    Run one maintenance pass over the cache.
+
+    Args:
+        cache: Cache to maintain
+        max_bytes: Size limit; least recently accessed entries beyond it are
+            evicted (None = no limit)
+        keep_model_hashes: Model hashes whose entries stay; entries of any
+            other model are purged (None = keep all)
+        remove_orphans: Reconcile the cache directory with the manifest
+        orphan_grace_seconds: Unreferenced files younger than this are kept
+
+    Returns:
+        MaintenanceReport of the pass
+    """
+    start_time = time.time()
+    report = MaintenanceReport()
+    report.sizes_recorded = cache.refresh_sizes()
+    if remove_orphans:
+        counts = cache.remove_orphans(grace_seconds=orphan_grace_seconds)
+        report.missing_entries = counts["missing_entries"]
+        report.orphan_files = counts["orphan_files"]
+    if keep_model_hashes is not None:
+        report.purged = cache.purge_model_hashes(keep_model_hashes)
+    if max_bytes is not None:
+        report.evicted, report.freed_bytes = cache.evict_to_size(max_bytes)
+    report.total_bytes = cache.total_bytes()
+    report.elapsed = time.time() - start_time
+    logger.info(f"Cache maintenance: {report.summary()}")
+    return report
+
+
+class PeriodicCacheMaintenance(PeriodicTask):
+    """Runs run_cache_maintenance on a daemon thread every interval_seconds."""
+
+    name = "cache-maintenance"
+
+    def __init__(self, cache: OriginalEmbeddingsCache, interval_seconds: float, **maintenance_kwargs):
+        """
+        Args:
+            cache: Cache to maintain
+            interval_seconds: Pause between passes (the first pass runs immediately)
+            **maintenance_kwargs: Passed to run_cache_maintenance
+        """
+        super().__init__(interval_seconds)
+        self.cache = cache
+        self.maintenance_kwargs = maintenance_kwargs
+        self.last_report: Optional[MaintenanceReport] = None
+
+    def run_once(self):
+        self.last_report = run_cache_maintenance(self.cache, **self.maintenance_kwargs)
+
+
+def maintenance_settings(model_config: Optional[dict]) -> dict:
+    """
+    run_cache_maintenance arguments from the ``embeddings_cache`` config section.
+
+    Args:
+        model_config: Loaded fingerprint model config
+
+    Returns:
+        Dictionary with max_bytes and keep_model_hashes
+    """
+    cache_config = ((model_config or {}).get("config") or {}).get("embeddings_cache") or {}
+    max_size_gb = cache_config.get("max_size_gb")
+    keep_model_hashes = None
+    if cache_config.get("purge_stale_models", False) and model_config is not None:
+        keep_model_hashes = [OriginalEmbeddingsCache.compute_model_hash(model_config)]
+    return {
+        "max_bytes": int(max_size_gb * 1024 ** 3) if max_size_gb else None,
+        "keep_model_hashes": keep_model_hashes,
+    }
+
+
+def start_periodic_maintenance(
+    cache: OriginalEmbeddingsCache,
+    model_config: Optional[dict] = None
+) -> Optional[PeriodicCacheMaintenance]:
+    """
+    Start background maintenance of a cache as configured in ``embeddings_cache``.
+
+    At most one task runs per cache; nothing is started when
+    ``maintenance_interval_minutes`` is not set.
+
+    Args:
+        cache: Cache to maintain
+        model_config: Loaded fingerprint model config
+
+    Returns:
+        The running task, or None if periodic maintenance is disabled
+    """
+    cache_config = ((model_config or {}).get("config") or {}).get("embeddings_cache") or {}
+    interval_minutes = cache_config.get("maintenance_interval_minutes")
+    if not interval_minutes:
+        return None
+
+    def create() -> PeriodicCacheMaintenance:
+        logger.info(f"Cache maintenance scheduled every {interval_minutes} min for {cache.cache_dir}")
+        return PeriodicCacheMaintenance(cache, interval_minutes * 60, **maintenance_settings(model_config))
+
+    return start_periodic_task(cache.cache_dir, create)
@@ -0,0 +1,277 @@
+"""SQLite-backed manifest for the original-embeddings cache."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class ManifestTable(MutableMapping):
+    """
+    Dictionary view of one manifest table (key -> JSON-serializable dict).
+
+    Values are stored as JSON; the fields named in ``columns`` are also
+    stored in indexed columns so they can be filtered without decoding rows
+    (and can be updated on their own with update_columns). Values returned
+    are copies: assign a changed dict back to persist it.
+    """
+
+    def __init__(self, manifest: "CacheManifest", table: str, key_column: str, columns: Sequence[str] = ()):
+        self._manifest = manifest
+        self.table = table
+        self.key_column = key_column
+        self.columns = tuple(columns)
+
+    def __getitem__(self, key: str) -> Dict:
+        row = self._manifest.execute(
+            f"SELECT {', '.join(('info',) + self.columns)} FROM {self.table} WHERE {self.key_column} = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        info = json.loads(row[0])
+        # Columns may have been updated without rewriting the JSON
+        info.update({column: value for column, value in zip(self.columns, row[1:]) if value is not None})
+        return info
+
+    def __setitem__(self, key: str, value: Dict):
+        names = [self.key_column, *self.columns, "info"]
+        values = [key, *(value.get(column) for column in self.columns), json.dumps(value)]
+        # Upsert (not INSERT OR REPLACE) so update triggers see the old row
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names[1:])
+        self._manifest.execute(
+            f"INSERT INTO {self.table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+            f"ON CONFLICT ({self.key_column}) DO UPDATE SET {updates}",
+            values
+        )
+
+    def update_columns(self, key: str, **values):
+        """Set indexed columns of an existing row without rewriting its JSON."""
+        self._where(values)  # Validates column names
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        self._manifest.execute(
+            f"UPDATE {self.table} SET {assignments} WHERE {self.key_column} = ?", [*values.values(), key]
+        )
+
+    def __delitem__(self, key: str):
+        cursor = self._manifest.execute(f"DELETE FROM {self.table} WHERE {self.key_column} = ?", (key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self._manifest.execute(
+            f"SELECT 1 FROM {self.table} WHERE {self.key_column} = ?", (key,)
+        ).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # Materialized, so callers may modify the table while iterating
+        return iter(self.keys_where())
+
+    def __len__(self) -> int:
+        return self._manifest.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _where(self, filters: Dict) -> tuple:
+        unknown = set(filters) - set(self.columns)
+        if unknown:
+            raise ValueError(f"Not an indexed column of {self.table}: {sorted(unknown)}")
+        if not filters:
+            return "", []
+        clauses = [f"{column} IS ?" for column in filters]
+        return " WHERE " + " AND ".join(clauses), list(filters.values())
+
+    def keys_where(self, order_by: Optional[str] = None, limit: Optional[int] = None, **filters) -> List[str]:
+        """
+        Keys of rows whose indexed columns equal the given values (None matches NULL).
+
+        Args:
+            order_by: Indexed column to sort by, ascending with NULLs first
+                (default: insertion order)
+            limit: Maximum number of keys
+        """
+        where, params = self._where(filters)
+        if order_by is not None:
+            self._where({order_by: None})  # Validates the column name
+        order = f"{order_by}, rowid" if order_by else "rowid"
+        sql = f"SELECT {self.key_column} FROM {self.table}{where} ORDER BY {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [row[0] for row in self._manifest.execute(sql, params).fetchall()]
+
+    def distinct(self, column: str) -> List:
+        """Distinct values of an indexed column."""
+        self._where({column: None})  # Validates the column name
+        return [row[0] for row in self._manifest.execute(f"SELECT DISTINCT {column} FROM {self.table}").fetchall()]
+
+    def count_where(self, **filters) -> int:
+        """Number of rows whose indexed columns equal the given values."""
+        where, params = self._where(filters)
+        return self._manifest.execute(f"SELECT COUNT(*) FROM {self.table}{where}", params).fetchone()[0]
+
+    def clear(self):
+        self._manifest.execute(f"DELETE FROM {self.table}")
+
+
+class CacheManifest:
+    """
+    Cache manifest in an SQLite database (WAL mode).
+
+    Several processes (UI, CLI tools, ingestion) can read and write the same
+    manifest: readers never block, writers wait up to ``timeout`` seconds for
+    each other. Every write commits on its own unless it runs inside
+    ``batch()``, which groups all writes of the calling thread into one
+    transaction. Each thread uses its own connection.
+
+    Triggers keep the entry count and the sum of ``size_bytes`` in a
+    counters table, so cache size statistics never scan the entries.
+    """
+
+    ENTRY_COLUMNS = ("file_id", "model_hash", "format", "size_bytes", "last_access")
+    # Columns added after the first release of the schema: name -> SQL type
+    ADDED_ENTRY_COLUMNS = {"size_bytes": "INTEGER", "last_access": "REAL"}
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS entries (
+            cache_key TEXT PRIMARY KEY,
+            file_id TEXT,
+            model_hash TEXT,
+            format TEXT,
+            info TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS entries_file_id ON entries (file_id)",
+        "CREATE INDEX IF NOT EXISTS entries_model_hash ON entries (model_hash)",
+        """CREATE TABLE IF NOT EXISTS file_stats (
+            path TEXT PRIMARY KEY,
+            info TEXT NOT NULL
+        )""",
+    )
+
+    COUNTER_SCHEMA = (
+        "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)",
+        "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO counters VALUES ('num_entries', (SELECT COUNT(*) FROM entries))",
+        "INSERT OR IGNORE INTO counters VALUES ('total_bytes', (SELECT COALESCE(SUM(size_bytes), 0) FROM entries))",
+        """CREATE TRIGGER IF NOT EXISTS entries_counters_insert AFTER INSERT ON entries BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'num_entries';
+            UPDATE counters SET value = value + COALESCE(NEW.size_bytes, 0) WHERE name = 'total_bytes';
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS entries_counters_delete AFTER DELETE ON entries BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'num_entries';
+            UPDATE counters SET value = value - COALESCE(OLD.size_bytes, 0) WHERE name = 'total_bytes';
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS entries_counters_update AFTER UPDATE OF size_bytes ON entries BEGIN
+            UPDATE counters SET value = value + COALESCE(NEW.size_bytes, 0) - COALESCE(OLD.size_bytes, 0)
+            WHERE name = 'total_bytes';
+        END""",
+    )
+
+    def __init__(self, db_path: Path, timeout: float = 30.0):
+        """
+        Open (and create if needed) a manifest database.
+
+        Args:
+            db_path: SQLite database file
+            timeout: Seconds a writer waits for another writer's transaction
+        """
+        self.db_path = Path(db_path)
+        self.timeout = timeout
+        self._local = threading.local()
+        with self.batch():
+            for statement in self.SCHEMA:
+                self.execute(statement)
+            existing = {row[1] for row in self.execute("PRAGMA table_info(entries)").fetchall()}
+            for column, sql_type in self.ADDED_ENTRY_COLUMNS.items():
+                if column not in existing:
+                    self.execute(f"ALTER TABLE entries ADD COLUMN {column} {sql_type}")
+            for statement in self.COUNTER_SCHEMA:
+                self.execute(statement)
+        # Cache entries: cache_key -> {file_id, file_hash, model_hash, num_segments, ...}
+        self.entries = ManifestTable(self, "entries", "cache_key", self.ENTRY_COLUMNS)
+        # Audio file identities: resolved path -> {ino, size, mtime_ns, hash}
+        self.file_stats = ManifestTable(self, "file_stats", "path")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; batch() opens explicit transactions
+            conn = sqlite3.connect(str(self.db_path), timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    def execute(self, sql: str, params: Sequence = ()) -> sqlite3.Cursor:
+        """Run one statement on the calling thread's connection."""
+        return self._connection().execute(sql, params)
+
+    @contextmanager
+    def batch(self):
+        """
+        Group the calling thread's writes into one transaction.
+
+        Nested batches join the outermost one. The transaction is committed
+        on exit and rolled back if the block raises.
+        """
+        conn = self._connection()
+        if self._local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.execute("COMMIT")
+
+    def counter(self, name: str) -> int:
+        """Current value of a counter ("num_entries" or "total_bytes")."""
+        row = self.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def import_json(self, json_path: Path) -> int:
+        """
+        Import a JSON manifest written by older versions of the cache.
+
+        Both the bare ``{cache_key: entry}`` form and the
+        ``{"entries": ..., "file_stats": ...}`` form are read. The file is
+        renamed to ``<name>.migrated`` afterwards so it is imported once.
+
+        Args:
+            json_path: Path of cache_manifest.json
+
+        Returns:
+            Number of cache entries imported
+        """
+        with open(json_path, 'r') as f:
+            manifest = json.load(f)
+        file_stats = {}
+        if isinstance(manifest.get("entries"), dict):
+            file_stats = manifest.get("file_stats", {})
+            manifest = manifest["entries"]
+
+        with self.batch():
+            for cache_key, info in manifest.items():
+                if cache_key not in self.entries:
+                    self.entries[cache_key] = info
+            for path, info in file_stats.items():
+                if path not in self.file_stats:
+                    self.file_stats[path] = info
+        os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+        logger.info(f"Migrated {len(manifest)} entries from {json_path} to {self.db_path}")
+        return len(manifest)
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
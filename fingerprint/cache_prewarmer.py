@@ -3,16 +3,87 @@
 PHASE 1 OPTIMIZATION: This module pre-warms the cache for original files
 before queries, ensuring TIER 1 (direct similarity) activates more often.
 This provides faster and more accurate similarity scores.
+
+warm_up_originals embeds the originals a run will query that are not cached
+yet (with the ingestion process pool or the already-loaded model) and loads
+the cached ones into the shared cache's memory tier, optionally on a
+background thread while the first queries proceed.
 """
 import logging
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Iterable, Optional, List
 import pandas as pd
-from .original_embeddings_cache import OriginalEmbeddingsCache
+from .original_embeddings_cache import OriginalEmbeddingsCache, get_shared_cache
 
 logger = logging.getLogger(__name__)
 
 
+def _resolve_original_path(file_path_str: str) -> Path:
+    """Manifest path of an original, tried against the usual data directories if relative."""
+    file_path = Path(file_path_str)
+    if not file_path.is_absolute():
+        # Try resolving relative paths
+        for base_dir in [Path("data/originals"), Path("data/test_audio"), Path.cwd()]:
+            potential_path = base_dir / file_path
+            if potential_path.exists():
+                return potential_path
+    return file_path
+
+
+@dataclass
+class WarmupReport:
+    """
+    Coverage of a cache warm-up.
+    
+    Attributes:
+        requested: Originals the warm-up was asked for
+        already_cached: Originals found in the cache (now held in memory)
+        embedded: Originals embedded and cached by the warm-up
+        failed: orig_id -> error for originals that could not be embedded
+        not_found: orig_ids missing from the manifest or on disk
+        elapsed: Wall time in seconds
+    """
+    requested: int = 0
+    already_cached: int = 0
+    embedded: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+    not_found: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+    
+    @property
+    def coverage(self) -> float:
+        """Fraction of requested originals that are now cached."""
+        return (self.already_cached + self.embedded) / self.requested if self.requested else 1.0
+    
+    def summary(self) -> str:
+        return (
+            f"{self.already_cached + self.embedded}/{self.requested} originals cached "
+            f"({self.coverage:.1%}: {self.already_cached} already cached, {self.embedded} embedded, "
+            f"{len(self.failed)} failed, {len(self.not_found)} not found) in {self.elapsed:.1f}s"
+        )
+
+
+class CacheWarmup:
+    """Handle of a warm-up started by warm_up_originals."""
+    
+    def __init__(self, report: WarmupReport, thread: Optional[threading.Thread] = None):
+        self.report = report
+        self._thread = thread
+    
+    @property
+    def done(self) -> bool:
+        return self._thread is None or not self._thread.is_alive()
+    
+    def wait(self, timeout: Optional[float] = None) -> WarmupReport:
+        """Wait for a background warm-up to finish and return its report."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.report
+
+
 def prewarm_cache_for_original(
     expected_orig_id: str,
     files_manifest_path: Optional[Path],
@@ -37,7 +108,7 @@ def prewarm_cache_for_original(
         return False
     
     try:
-        cache = OriginalEmbeddingsCache()
+        cache = get_shared_cache(model_config)
         files_df = pd.read_csv(files_manifest_path)
         orig_row = files_df[files_df["id"] == expected_orig_id]
         
@@ -50,14 +121,7 @@ def prewarm_cache_for_original(
             logger.debug(f"No file path found for {expected_orig_id}")
             return False
         
-        orig_file_path = Path(orig_file_path_str)
-        if not orig_file_path.is_absolute():
-            # Try resolving relative paths
-            for base_dir in [Path("data/originals"), Path("data/test_audio"), Path.cwd()]:
-                potential_path = base_dir / orig_file_path
-                if potential_path.exists():
-                    orig_file_path = potential_path
-                    break
+        orig_file_path = _resolve_original_path(orig_file_path_str)
         
         if not orig_file_path.exists():
             logger.debug(f"Original file not found: {orig_file_path}")
@@ -81,18 +145,21 @@ def prewarm_cache_for_original(
 def prewarm_all_originals(
     files_manifest_path: Path,
     model_config: dict,
-    limit: Optional[int] = None
+    limit: Optional[int] = None,
+    fingerprint_config_path: Optional[Path] = None
 ) -> int:
     """
     Pre-warm cache for all original files in manifest.
     
     This can be called at startup to cache all originals,
-    eliminating cache misses during queries.
+    eliminating cache misses during queries. Originals that are not cached
+    yet are embedded (see warm_up_originals).
     
     Args:
         files_manifest_path: Path to files manifest CSV
         model_config: Model configuration dictionary
         limit: Optional limit on number of files to pre-warm (None = all)
+        fingerprint_config_path: Fingerprint config for pooled embedding workers
         
     Returns:
         Number of files successfully pre-warmed
@@ -101,46 +168,145 @@ def prewarm_all_originals(
         logger.warning(f"PHASE 1: Manifest not found: {files_manifest_path}")
         return 0
     
+    orig_ids = None
+    if limit:
+        orig_ids = pd.read_csv(files_manifest_path)["id"].head(limit).tolist()
+    report = warm_up_originals(
+        files_manifest_path,
+        model_config,
+        orig_ids=orig_ids,
+        fingerprint_config_path=fingerprint_config_path,
+        background=False
+    ).report
+    return report.already_cached + report.embedded
+
+
+def warm_up_originals(
+    files_manifest_path: Path,
+    model_config: dict,
+    orig_ids: Optional[Iterable[str]] = None,
+    fingerprint_config_path: Optional[Path] = None,
+    num_workers: Optional[int] = None,
+    background: bool = True,
+    cache: Optional[OriginalEmbeddingsCache] = None
+) -> CacheWarmup:
+    """
+    Make sure the originals of a run are cached and held in memory.
+    
+    Cached originals are loaded into the shared cache's memory tier. Missing
+    ones are embedded with the ingestion process pool when num_workers > 1
+    (needs fingerprint_config_path), otherwise in-process with the model in
+    model_config, and written to the cache.
+    
+    Args:
+        files_manifest_path: Path to files manifest CSV
+        model_config: Loaded fingerprint model config
+        orig_ids: Originals to warm up (None = every file in the manifest)
+        fingerprint_config_path: Fingerprint config YAML the pool workers load
+        num_workers: Embedding worker processes (default: ``prewarm.num_workers``,
+            then ``ingestion.num_workers`` from the fingerprint config)
+        background: Run on a background thread and return immediately
+        cache: Embeddings cache (default: get_shared_cache(model_config))
+        
+    Returns:
+        CacheWarmup handle; wait() returns the WarmupReport
+    """
+    if num_workers is None:
+        config = model_config.get("config") or {}
+        num_workers = (
+            (config.get("prewarm") or {}).get("num_workers")
+            or (config.get("ingestion") or {}).get("num_workers")
+            or 1
+        )
+    report = WarmupReport()
+    cache = cache or get_shared_cache(model_config)
+    args = (cache, files_manifest_path, model_config, orig_ids, fingerprint_config_path, num_workers, report)
+    if not background:
+        _run_warmup(*args)
+        return CacheWarmup(report)
+    
+    thread = threading.Thread(target=_run_warmup, args=args, name="cache-warmup")
+    thread.start()
+    logger.info("Cache warm-up started in the background")
+    return CacheWarmup(report, thread)
+
+
+def _run_warmup(
+    cache: OriginalEmbeddingsCache,
+    files_manifest_path: Path,
+    model_config: dict,
+    orig_ids: Optional[Iterable[str]],
+    fingerprint_config_path: Optional[Path],
+    num_workers: int,
+    report: WarmupReport
+):
+    """Body of warm_up_originals; fills report in place."""
+    start_time = time.time()
     try:
         files_df = pd.read_csv(files_manifest_path)
-        total_files = len(files_df)
-        
-        if limit:
-            files_df = files_df.head(limit)
+        files_df["id"] = files_df["id"].astype(str)
+        if orig_ids is not None:
+            wanted = list(dict.fromkeys(str(orig_id) for orig_id in orig_ids))
+            report.not_found.extend(sorted(set(wanted) - set(files_df["id"])))
+            files_df = files_df[files_df["id"].isin(wanted)]
+        files_df = files_df.drop_duplicates("id")
+        report.requested = len(files_df) + len(report.not_found)
         
-        logger.info(f"PHASE 1: Pre-warming cache for {len(files_df)}/{total_files} original files...")
-        
-        cache = OriginalEmbeddingsCache()
-        prewarmed_count = 0
-        
-        for idx, row in files_df.iterrows():
-            file_id = row.get("id")
+        missing = []
+        for _, row in files_df.iterrows():
             file_path_str = row.get("file_path") or row.get("path")
-            
-            if not file_id or not file_path_str:
+            file_path = _resolve_original_path(file_path_str) if isinstance(file_path_str, str) else None
+            if file_path is None or not file_path.exists():
+                report.not_found.append(row["id"])
                 continue
-            
-            file_path = Path(file_path_str)
-            if not file_path.is_absolute():
-                for base_dir in [Path("data/originals"), Path("data/test_audio"), Path.cwd()]:
-                    potential_path = base_dir / file_path
-                    if potential_path.exists():
-                        file_path = potential_path
-                        break
-            
-            if file_path.exists():
-                try:
-                    embeddings, _ = cache.get(file_id, file_path, model_config)
-                    if embeddings is not None:
-                        prewarmed_count += 1
-                        if (prewarmed_count % 10) == 0:
-                            logger.info(f"PHASE 1: Pre-warmed {prewarmed_count}/{len(files_df)} files...")
-                except Exception as e:
-                    logger.debug(f"PHASE 1: Failed to pre-warm {file_id}: {e}")
-        
-        logger.info(f"PHASE 1: Cache pre-warming complete: {prewarmed_count}/{len(files_df)} files cached")
-        return prewarmed_count
+            embeddings, _ = cache.get(row["id"], file_path, model_config)
+            if embeddings is not None:
+                report.already_cached += 1
+            else:
+                missing.append({"id": row["id"], "file_path": str(file_path)})
         
+        if missing:
+            logger.info(f"Cache warm-up: embedding {len(missing)} uncached originals")
+            if num_workers > 1 and fingerprint_config_path is not None:
+                from .catalog_ingest import ingest_catalog
+                
+                ingestion_config = (model_config.get("config") or {}).get("ingestion") or {}
+                result = ingest_catalog(
+                    pd.DataFrame(missing),
+                    fingerprint_config_path,
+                    cache=cache,
+                    num_workers=num_workers,
+                    threads_per_worker=ingestion_config.get("threads_per_worker"),
+                    decode_threads=ingestion_config.get("decode_threads", 2)
+                )
+                report.embedded += len(result.generated)
+                report.already_cached += len(result.cached)
+                report.failed.update(result.failed)
+            else:
+                for item in missing:
+                    try:
+                        _embed_in_process(cache, item["id"], Path(item["file_path"]), model_config)
+                        report.embedded += 1
+                    except Exception as e:
+                        logger.error(f"Cache warm-up: failed to embed {item['id']}: {e}")
+                        report.failed[item["id"]] = str(e)
     except Exception as e:
-        logger.error(f"PHASE 1: Failed to pre-warm cache: {e}")
-        return 0
+        logger.error(f"Cache warm-up failed: {e}", exc_info=True)
+    finally:
+        report.elapsed = time.time() - start_time
+        logger.info(f"Cache warm-up complete: {report.summary()}")
+
+
+def _embed_in_process(cache: OriginalEmbeddingsCache, file_id: str, file_path: Path, model_config: dict):
+    """Embed one original with the loaded model and cache it."""
+    from .embed import segment_audio_matrix, extract_embeddings, normalize_embeddings
+    
+    segments = segment_audio_matrix(
+        file_path,
+        segment_length=model_config["segment_length"],
+        sample_rate=model_config["sample_rate"],
+        overlap_ratio=model_config.get("overlap_ratio", None)
+    )
+    embeddings = extract_embeddings(segments, model_config, output_dir=None, save_embeddings=False)
+    embeddings = normalize_embeddings(embeddings, method="l2")
+    cache.set(file_id, file_path, model_config, embeddings, segments.to_dicts())
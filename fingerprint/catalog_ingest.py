@@ -0,0 +1,430 @@
+"""
+Multi-process embedding extraction for catalog indexing.
+
+Worker processes each load their own fingerprint model (with pinned torch
+thread counts) and embed whole files. The parent decodes audio on a small
+thread pool into shared memory blocks, hands each block to the next free
+worker, and writes results to OriginalEmbeddingsCache as they complete.
+Only the parent writes the cache, and files already cached are skipped, so
+an interrupted run resumes where it stopped.
+"""
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+from .embed import DecodedAudio, extract_embeddings, normalize_embeddings
+from .original_embeddings_cache import OriginalEmbeddingsCache
+
+logger = logging.getLogger(__name__)
+
+# Environment variables that size native thread pools in worker processes
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+@dataclass
+class WorkerStats:
+    """Throughput of one ingestion worker."""
+    files: int = 0
+    segments: int = 0
+    audio_seconds: float = 0.0
+    busy_seconds: float = 0.0
+
+    @property
+    def segments_per_second(self) -> float:
+        return self.segments / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    @property
+    def realtime_factor(self) -> float:
+        """Seconds of audio embedded per second of worker time."""
+        return self.audio_seconds / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+
+@dataclass
+class IngestResult:
+    """
+    Outcome of a catalog ingestion run.
+
+    Attributes:
+        embeddings: file_id -> L2-normalized embeddings (N_segments, D), cached and new
+        cached: file_ids served from the cache
+        generated: file_ids embedded in this run
+        failed: file_id -> error message
+        worker_stats: Per-worker throughput
+        elapsed: Wall time in seconds
+    """
+    embeddings: Dict[str, np.ndarray] = field(default_factory=dict)
+    cached: List[str] = field(default_factory=list)
+    generated: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    worker_stats: Dict[int, WorkerStats] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+
+def resolve_manifest_path(row: pd.Series) -> Optional[Path]:
+    """Audio path of a manifest row ("file_path" or "path"), resolved against the working directory."""
+    file_path_str = row.get("file_path") or row.get("path")
+    if not file_path_str or pd.isna(file_path_str):
+        return None
+    file_path = Path(file_path_str)
+    if not file_path.is_absolute() and not file_path.exists():
+        potential_path = Path.cwd() / file_path
+        if potential_path.exists():
+            file_path = potential_path
+    return file_path
+
+
+@contextmanager
+def _thread_env(threads: Optional[int]):
+    """Set native thread-pool sizes inherited by processes started in this block."""
+    saved = {name: os.environ.get(name) for name in _THREAD_ENV_VARS}
+    try:
+        if threads:
+            for name in _THREAD_ENV_VARS:
+                os.environ[name] = str(threads)
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _worker_main(
+    worker_id: int,
+    fingerprint_config_path: str,
+    threads_per_worker: Optional[int],
+    task_queue,
+    result_queue,
+    embeddings_dir: Optional[str]
+):
+    """Worker process: load a model, then embed files from shared memory until told to stop."""
+    from .cpu_backend import configure_threads
+    from .load_model import load_fingerprint_model
+
+    configure_threads(threads_per_worker, 1 if threads_per_worker else None)
+    try:
+        model_config = load_fingerprint_model(Path(fingerprint_config_path), use_server=False)
+        result_queue.put(("ready", worker_id, {
+            "model_hash": OriginalEmbeddingsCache.compute_model_hash(model_config),
+            "sample_rate": model_config["sample_rate"],
+            "segment_length": model_config["segment_length"],
+            "overlap_ratio": model_config.get("overlap_ratio"),
+        }))
+    except Exception as e:
+        result_queue.put(("fatal", worker_id, {"message": f"Model load failed: {e}"}))
+        return
+
+    parent = mp.parent_process()
+    while True:
+        try:
+            task = task_queue.get(timeout=1.0)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                return  # Orphaned by a crashed parent
+            continue
+        if task is None:
+            return
+
+        file_id = task["file_id"]
+        start = time.perf_counter()
+        shm = shared_memory.SharedMemory(name=task["shm_name"])
+        try:
+            samples = np.ndarray((task["num_samples"],), dtype=np.float32, buffer=shm.buf)
+            audio = DecodedAudio(
+                samples=samples,
+                sample_rate=task["sample_rate"],
+                file_id=Path(task["file_path"]).stem,
+                path=Path(task["file_path"])
+            )
+            segments = audio.segment(
+                segment_length=model_config["segment_length"],
+                overlap_ratio=model_config.get("overlap_ratio")
+            )
+            embeddings = extract_embeddings(
+                segments,
+                model_config,
+                output_dir=Path(embeddings_dir) / file_id if embeddings_dir else None,
+                save_embeddings=embeddings_dir is not None
+            )
+            embeddings = normalize_embeddings(embeddings, method="l2")
+            segment_dicts = segments.to_dicts()
+            result_queue.put(("done", worker_id, {
+                "file_id": file_id,
+                "embeddings": embeddings,
+                "segments": segment_dicts,
+                "audio_seconds": task["num_samples"] / task["sample_rate"],
+                "busy_seconds": time.perf_counter() - start,
+            }))
+        except Exception as e:
+            result_queue.put(("error", worker_id, {"file_id": file_id, "message": str(e)}))
+        finally:
+            # Views into the block must be gone before it is closed
+            samples = audio = segments = None
+            try:
+                shm.close()
+            except BufferError:
+                logger.warning(f"Shared memory for {file_id} still referenced; leaving it mapped")
+
+
+def ingest_catalog(
+    files_df: pd.DataFrame,
+    fingerprint_config_path: Path,
+    cache: Optional[OriginalEmbeddingsCache] = None,
+    num_workers: Optional[int] = None,
+    threads_per_worker: Optional[int] = None,
+    decode_threads: int = 2,
+    embeddings_dir: Optional[Path] = None,
+    progress_interval: float = 10.0
+) -> IngestResult:
+    """
+    Embed every file of a manifest with a pool of worker processes.
+
+    Args:
+        files_df: Manifest rows with "id" and "file_path" (or "path")
+        fingerprint_config_path: Fingerprint config YAML each worker loads
+        cache: Embeddings cache (results are written as they complete)
+        num_workers: Worker processes (default: CPU count / threads_per_worker)
+        threads_per_worker: torch/BLAS threads per worker (None = library default)
+        decode_threads: Parent threads decoding audio into shared memory
+        embeddings_dir: Also save per-segment .npy files under embeddings_dir/<file_id>
+        progress_interval: Seconds between progress log lines
+
+    Returns:
+        IngestResult with embeddings for every successfully processed file
+    """
+    cache = cache or OriginalEmbeddingsCache()
+    if num_workers is None:
+        num_workers = max(1, (os.cpu_count() or 1) // max(1, threads_per_worker or 1))
+    start_time = time.time()
+    result = IngestResult()
+
+    rows = []
+    for _, row in files_df.iterrows():
+        file_path = resolve_manifest_path(row)
+        if file_path is None or not file_path.exists():
+            logger.error(f"File not found for {row.get('id')}: {file_path}")
+            result.failed[str(row.get("id"))] = "file not found"
+            continue
+        rows.append((str(row["id"]), file_path))
+    if not rows:
+        result.elapsed = time.time() - start_time
+        return result
+
+    # Spawned workers: no inherited torch/CUDA/thread-pool state. Each worker
+    # has its own task queue so the parent knows which files a worker holds.
+    ctx = mp.get_context("spawn")
+    result_queue = ctx.Queue()
+    task_queues = {}
+
+    def _start_worker(worker_id: int):
+        task_queues[worker_id] = ctx.Queue()
+        with _thread_env(threads_per_worker):
+            process = ctx.Process(
+                target=_worker_main,
+                args=(
+                    worker_id, str(fingerprint_config_path), threads_per_worker,
+                    task_queues[worker_id], result_queue, str(embeddings_dir) if embeddings_dir else None
+                ),
+                name=f"ingest-worker-{worker_id}",
+                daemon=True
+            )
+            process.start()
+        return process
+
+    workers = {worker_id: _start_worker(worker_id) for worker_id in range(num_workers)}
+    result.worker_stats = {worker_id: WorkerStats() for worker_id in workers}
+    restarts_left = num_workers
+    logger.info(f"Started {num_workers} ingestion workers ({threads_per_worker or 'default'} threads each)")
+
+    tasks: Dict[str, dict] = {}  # file_id -> decoded task (shared memory owned by the parent)
+    ready = deque()  # Decoded file_ids waiting for a worker
+    outstanding = {worker_id: [] for worker_id in workers}  # worker_id -> dispatched file_ids
+    attempts: Dict[str, int] = {}
+    decoding = {}
+    decoder = ThreadPoolExecutor(max_workers=max(1, decode_threads), thread_name_prefix="ingest-decode")
+
+    def _release(file_id: str):
+        task = tasks.pop(file_id, None)
+        if task is not None:
+            task["shm"].close()
+            task["shm"].unlink()
+
+    def _decode(file_id: str, file_path: Path, sample_rate: int) -> dict:
+        audio = DecodedAudio.load(file_path, sample_rate)
+        samples = np.asarray(audio.samples, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, samples.nbytes))
+        np.ndarray(samples.shape, dtype=np.float32, buffer=shm.buf)[:] = samples
+        return {
+            "file_id": file_id,
+            "file_path": str(file_path),
+            "shm": shm,
+            "shm_name": shm.name,
+            "num_samples": len(samples),
+            "sample_rate": audio.sample_rate,
+        }
+
+    try:
+        # Workers report the model hash (cache key) once their model is loaded
+        model_info = None
+        while model_info is None:
+            try:
+                kind, worker_id, payload = result_queue.get(timeout=5.0)
+            except queue.Empty:
+                if not any(process.is_alive() for process in workers.values()):
+                    raise RuntimeError("All ingestion workers exited before loading a model")
+                continue
+            if kind == "fatal":
+                raise RuntimeError(f"Ingestion worker {worker_id}: {payload['message']}")
+            if kind == "ready":
+                model_info = payload
+        cache_model_config = {
+            "model_hash": model_info["model_hash"],
+            "sample_rate": model_info["sample_rate"],
+            "segment_length": model_info["segment_length"],
+        }
+
+        # Idempotent restarts: skip everything a previous run already cached
+        pending = deque()
+        for file_id, file_path in rows:
+            embeddings, _ = cache.get(file_id, file_path, cache_model_config)
+            if embeddings is not None:
+                result.embeddings[file_id] = embeddings
+                result.cached.append(file_id)
+            else:
+                pending.append((file_id, file_path))
+        logger.info(f"Ingestion: {len(result.cached)} files cached, {len(pending)} to embed")
+
+        total = len(pending)
+        completed = 0
+        last_report = time.time()
+        max_decoded = 2 * num_workers  # Bounds decoded audio held in shared memory
+
+        while completed < total:
+            # Decode ahead so workers never wait on I/O
+            while pending and len(tasks) + len(decoding) < max_decoded:
+                file_id, file_path = pending.popleft()
+                decoding[file_id] = (file_path, decoder.submit(_decode, file_id, file_path, model_info["sample_rate"]))
+            for file_id, (file_path, future) in list(decoding.items()):
+                if not future.done():
+                    continue
+                del decoding[file_id]
+                try:
+                    tasks[file_id] = future.result()
+                    ready.append(file_id)
+                except Exception as e:
+                    logger.error(f"Failed to decode {file_id} ({file_path}): {e}")
+                    result.failed[file_id] = f"decode failed: {e}"
+                    completed += 1
+
+            # Dispatch: at most two files per worker (one running, one queued)
+            for worker_id, process in workers.items():
+                while ready and process.is_alive() and len(outstanding[worker_id]) < 2:
+                    file_id = ready.popleft()
+                    task_queues[worker_id].put({key: value for key, value in tasks[file_id].items() if key != "shm"})
+                    outstanding[worker_id].append(file_id)
+
+            try:
+                kind, worker_id, payload = result_queue.get(timeout=0.2)
+            except queue.Empty:
+                kind = None
+
+            # Results for files no longer assigned to the worker (requeued after a crash) are stale
+            if kind in ("done", "error") and payload["file_id"] in outstanding.get(worker_id, []):
+                file_id = payload["file_id"]
+                outstanding[worker_id].remove(file_id)
+                if kind == "done":
+                    file_path = Path(tasks[file_id]["file_path"])
+                    cache.set(file_id, file_path, cache_model_config, payload["embeddings"], payload["segments"])
+                    result.embeddings[file_id] = payload["embeddings"]
+                    result.generated.append(file_id)
+                    stats = result.worker_stats[worker_id]
+                    stats.files += 1
+                    stats.segments += len(payload["embeddings"])
+                    stats.audio_seconds += payload["audio_seconds"]
+                    stats.busy_seconds += payload["busy_seconds"]
+                else:
+                    logger.error(f"Worker {worker_id} failed on {file_id}: {payload['message']}")
+                    result.failed[file_id] = payload["message"]
+                _release(file_id)
+                completed += 1
+            elif kind == "ready" and payload["model_hash"] != model_info["model_hash"]:
+                logger.warning(f"Worker {worker_id} loaded a different model (hash {payload['model_hash']})")
+            elif kind == "fatal":
+                logger.error(f"Ingestion worker {worker_id}: {payload['message']}")
+
+            # A dead worker's files are retried once on the other workers
+            for worker_id, process in list(workers.items()):
+                if process.is_alive():
+                    continue
+                for file_id in outstanding[worker_id]:
+                    attempts[file_id] = attempts.get(file_id, 0) + 1
+                    if attempts[file_id] < 2:
+                        ready.appendleft(file_id)
+                    else:
+                        logger.error(f"{file_id} crashed ingestion workers twice, skipping")
+                        result.failed[file_id] = f"worker died (exit code {process.exitcode})"
+                        _release(file_id)
+                        completed += 1
+                outstanding[worker_id] = []
+                del workers[worker_id]
+                logger.error(f"Ingestion worker {worker_id} died (exit code {process.exitcode})")
+                if restarts_left > 0 and completed < total:
+                    restarts_left -= 1
+                    workers[worker_id] = _start_worker(worker_id)
+            if not workers:
+                raise RuntimeError("All ingestion workers died")
+
+            if time.time() - last_report >= progress_interval or completed == total:
+                last_report = time.time()
+                _log_progress(completed, total, time.time() - start_time, result.worker_stats)
+    finally:
+        for file_id, (_, future) in list(decoding.items()):
+            try:
+                tasks[file_id] = future.result()
+            except Exception:
+                pass
+        decoder.shutdown(wait=True)
+        for worker_id in workers:
+            task_queues[worker_id].put(None)
+        for process in workers.values():
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        for file_id in list(tasks):
+            _release(file_id)
+
+    result.elapsed = time.time() - start_time
+    for worker_id, stats in sorted(result.worker_stats.items()):
+        logger.info(
+            f"Worker {worker_id}: {stats.files} files, {stats.segments} segments, "
+            f"{stats.segments_per_second:.1f} segments/s, {stats.realtime_factor:.1f}x realtime"
+        )
+    logger.info(
+        f"Ingestion complete in {result.elapsed:.1f}s: {len(result.generated)} embedded, "
+        f"{len(result.cached)} cached, {len(result.failed)} failed"
+    )
+    return result
+
+
+def _log_progress(completed: int, total: int, elapsed: float, worker_stats: Dict[int, WorkerStats]):
+    """Log overall progress, ETA and per-worker throughput."""
+    rate = completed / elapsed if elapsed > 0 else 0.0
+    eta = (total - completed) / rate if rate > 0 else float("inf")
+    eta_str = f"{eta / 60:.1f} min" if eta != float("inf") else "unknown"
+    throughput = ", ".join(
+        f"w{worker_id}={stats.segments_per_second:.1f} seg/s"
+        for worker_id, stats in sorted(worker_stats.items())
+    )
+    logger.info(f"Ingestion progress: {completed}/{total} files ({rate:.2f} files/s, ETA {eta_str}) [{throughput}]")
@@ -0,0 +1,237 @@
+"""Optimized CPU inference backends for the MERT embedding model."""
+import logging
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+
+from .onnx_backend import OnnxBackendConfig
+
+logger = logging.getLogger(__name__)
+
+try:
+    import torch
+    HAS_TORCH = True
+except (ImportError, OSError):
+    HAS_TORCH = False
+
+PRECISIONS = ("fp32", "int8", "bf16")
+GRAPH_MODES = ("eager", "torch_compile", "torchscript")
+
+
+@dataclass
+class CpuBackendConfig:
+    """
+    CPU inference backend for the MERT model.
+
+    Attributes:
+        precision: "fp32", "int8" (dynamic quantization of Linear layers) or
+            "bf16" (autocast where the CPU supports bfloat16)
+        graph_mode: "eager", "torch_compile" or "torchscript" (traced graph)
+        intra_op_threads: torch intra-op threads (None = torch default)
+        inter_op_threads: torch inter-op threads (None = torch default)
+    """
+    precision: str = "fp32"
+    graph_mode: str = "eager"
+    intra_op_threads: Optional[int] = None
+    inter_op_threads: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, config: Optional[Dict]) -> "CpuBackendConfig":
+        """Build from the ``model.cpu_backend`` config section."""
+        config = config or {}
+        backend = cls(
+            precision=config.get("precision", "fp32"),
+            graph_mode=config.get("graph_mode", "eager"),
+            intra_op_threads=config.get("intra_op_threads"),
+            inter_op_threads=config.get("inter_op_threads"),
+        )
+        if backend.precision not in PRECISIONS:
+            raise ValueError(f"Unknown CPU precision '{backend.precision}', expected one of {PRECISIONS}")
+        if backend.graph_mode not in GRAPH_MODES:
+            raise ValueError(f"Unknown CPU graph mode '{backend.graph_mode}', expected one of {GRAPH_MODES}")
+        return backend
+
+    @property
+    def label(self) -> str:
+        """Short name, e.g. "int8/torchscript"."""
+        return f"{self.precision}/{self.graph_mode}"
+
+
+def configure_threads(intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+    """
+    Set torch CPU thread pools.
+
+    The inter-op pool can only be sized before torch starts parallel work;
+    later attempts are logged and ignored.
+    """
+    if not HAS_TORCH:
+        return
+    if intra_op_threads:
+        torch.set_num_threads(int(intra_op_threads))
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(int(inter_op_threads))
+        except RuntimeError as e:
+            logger.warning(f"Could not set inter-op threads to {inter_op_threads}: {e}")
+    logger.info(f"Torch CPU threads: intra-op={torch.get_num_threads()}, inter-op={torch.get_num_interop_threads()}")
+
+
+def bf16_supported() -> bool:
+    """Whether the CPU has native bfloat16 kernels (oneDNN AVX512-BF16/AMX)."""
+    if not HAS_TORCH:
+        return False
+    try:
+        return bool(torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def apply_cpu_backend(
+    model: Any,
+    backend: CpuBackendConfig,
+    example_inputs: Optional[Dict[str, Any]] = None
+) -> Tuple[Any, Any, Optional[Any]]:
+    """
+    Prepare an FP32 eager model for CPU inference with the given backend.
+
+    The original model is left untouched (quantization returns a copy), so
+    backends can be re-applied or compared against FP32.
+
+    Args:
+        model: FP32 eager MERT model (eval mode)
+        backend: Backend configuration
+        example_inputs: Processor output ({"input_values": tensor}) used to
+            trace TorchScript graphs and warm up compiled graphs
+
+    Returns:
+        Tuple of (model, forward_model, autocast_dtype):
+        ``model`` is the (possibly quantized) eager model, ``forward_model``
+        the compiled/traced graph (None for eager), ``autocast_dtype`` the
+        CPU autocast dtype (None for no autocast)
+    """
+    if not HAS_TORCH:
+        raise ValueError("PyTorch not available. Cannot configure CPU backend.")
+
+    configure_threads(backend.intra_op_threads, backend.inter_op_threads)
+
+    autocast_dtype = None
+    if backend.precision == "int8":
+        # Dynamic int8 quantization of Linear layers (weights int8, activations quantized on the fly)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend.precision == "bf16":
+        if bf16_supported():
+            autocast_dtype = torch.bfloat16
+        else:
+            logger.warning("bfloat16 not supported on this CPU, using FP32")
+
+    forward_model = None
+    if backend.graph_mode != "eager":
+        try:
+            forward_model = _capture_graph(model, backend.graph_mode, example_inputs, autocast_dtype)
+        except Exception as e:
+            logger.warning(f"{backend.graph_mode} graph capture failed ({e}), using eager execution")
+            forward_model = None
+
+    logger.info(f"CPU backend ready: {backend.label}")
+    return model, forward_model, autocast_dtype
+
+
+def _capture_graph(model: Any, graph_mode: str, example_inputs: Optional[Dict[str, Any]], autocast_dtype) -> Any:
+    """Compile or trace ``model`` and run it once on ``example_inputs``."""
+    if graph_mode == "torchscript":
+        if example_inputs is None:
+            raise ValueError("TorchScript tracing needs example inputs")
+        # Trace a tuple-returning graph; callers read outputs[0] (last_hidden_state)
+        config = getattr(model, "config", None)
+        return_dict = getattr(config, "return_dict", True)
+        try:
+            if config is not None:
+                config.return_dict = False
+            with torch.no_grad():
+                forward_model = torch.jit.trace(
+                    model, (example_inputs["input_values"],), strict=False, check_trace=False
+                )
+        finally:
+            if config is not None:
+                config.return_dict = return_dict
+    else:
+        forward_model = torch.compile(model, dynamic=True)
+
+    # Warm-up run: compiles lazily-built graphs and surfaces failures now
+    if example_inputs is not None:
+        with torch.no_grad():
+            if autocast_dtype is not None:
+                with torch.autocast(device_type="cpu", dtype=autocast_dtype):
+                    forward_model(example_inputs["input_values"])
+            else:
+                forward_model(example_inputs["input_values"])
+    return forward_model
+
+
+def cpu_backend_parity_report(
+    generator: Any,
+    backends: List[Union[CpuBackendConfig, OnnxBackendConfig]],
+    audio: np.ndarray,
+    sample_rate: int,
+    repeats: int = 3
+) -> List[Dict]:
+    """
+    Compare CPU backends against FP32 eager on the same segments.
+
+    Each backend (torch CPU backends, or OnnxBackendConfig for ONNX
+    Runtime) is applied to ``generator`` in turn; its embeddings are
+    compared to the FP32 eager embeddings (cosine drift = 1 - cosine
+    similarity per segment) and its best-of-``repeats`` latency gives the
+    speedup. The generator is restored to FP32 eager afterwards.
+
+    Args:
+        generator: EmbeddingGenerator with a loaded MERT model
+        backends: Backends to compare
+        audio: Segment buffer (N, samples)
+        sample_rate: Sample rate of ``audio``
+        repeats: Timed runs per backend (after one warm-up)
+
+    Returns:
+        List of report rows (dicts) starting with the FP32 baseline
+    """
+    def _run(backend) -> Tuple[np.ndarray, float, bool]:
+        if isinstance(backend, OnnxBackendConfig):
+            applied = generator.set_onnx_backend(backend)
+        else:
+            generator.set_cpu_backend(backend)
+            applied = generator.cpu_backend_applied
+        embeddings = generator.generate_embeddings_from_audio(audio, sample_rate)  # warm-up
+        timings = []
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            embeddings = generator.generate_embeddings_from_audio(audio, sample_rate)
+            timings.append(time.perf_counter() - start)
+        return embeddings, min(timings), applied
+
+    baseline_backend = CpuBackendConfig()
+    baseline, baseline_time, _ = _run(baseline_backend)
+
+    report = []
+    for backend in [baseline_backend] + [b for b in backends if b.label != baseline_backend.label]:
+        if backend is baseline_backend:
+            embeddings, elapsed, applied = baseline, baseline_time, True
+        else:
+            embeddings, elapsed, applied = _run(backend)
+        drift = 1.0 - np.sum(embeddings * baseline, axis=1)
+        report.append({
+            **asdict(backend),
+            "backend": backend.label,
+            "applied": applied,
+            "latency_ms": elapsed * 1000,
+            "speedup": baseline_time / elapsed if elapsed > 0 else 0.0,
+            "cosine_drift_mean": float(np.mean(drift)),
+            "cosine_drift_max": float(np.max(drift)),
+        })
+        logger.info(
+            f"CPU backend {backend.label}: {elapsed * 1000:.1f} ms "
+            f"({report[-1]['speedup']:.2f}x), cosine drift max {report[-1]['cosine_drift_max']:.2e}"
+        )
+
+    generator.set_cpu_backend(baseline_backend)
+    return report
@@ -1,10 +1,11 @@
 """Audio segmentation and embedding extraction."""
 import logging
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Dict, Optional, Union
 import numpy as np
 import librosa
-from tqdm import tqdm
 
 logger = logging.getLogger(__name__)
 
@@ -62,15 +63,249 @@ def _get_optimal_batch_size(model: any, embedding_dim: int = 512, max_batch: int
         return 32
 
 
-def segment_audio(
+@dataclass
+class SegmentMatrix:
+    """
+    Fixed-length segments of one decoded signal as a single 2D array.
+    
+    ``audio`` is a strided (N, segment_samples) view over the decoded signal, so
+    overlapping segments share memory instead of being sliced and copied one
+    at a time. Per-segment metadata lives in parallel numpy arrays; segment
+    dictionaries are only built on demand (``__getitem__`` / ``to_dicts``),
+    e.g. when results are serialized to JSON.
+    
+    Attributes:
+        audio: (N, segment_samples) float32 array (read-only strided view)
+        file_id: Source file identifier (stem of the audio path)
+        sample_rate: Sample rate of ``audio``
+        start_samples: (N,) int64 segment start offsets in samples
+        end_samples: (N,) int64 segment end offsets in samples
+        scale_lengths: (N,) float64 segment length in seconds (scale)
+        scale_weights: (N,) float64 per-segment scale weight
+        source: DecodedAudio the segments were cut from, if any (lets
+            extract_embeddings reuse track-level features across scales)
+    """
+    audio: np.ndarray
+    file_id: str
+    sample_rate: int
+    start_samples: np.ndarray
+    end_samples: np.ndarray
+    scale_lengths: np.ndarray
+    scale_weights: np.ndarray
+    source: Optional["DecodedAudio"] = field(default=None, repr=False)
+    
+    def __len__(self) -> int:
+        return len(self.start_samples)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def __getitem__(self, i: int) -> Dict:
+        """Build the metadata dict for segment ``i`` (no audio)."""
+        start = int(self.start_samples[i]) / self.sample_rate
+        end = int(self.end_samples[i]) / self.sample_rate
+        return {
+            "segment_id": self.segment_id(i),
+            "file_id": self.file_id,
+            "segment_idx": int(i),
+            "start": start,
+            "end": end,
+            "duration": end - start,
+            "start_sample": int(self.start_samples[i]),
+            "end_sample": int(self.end_samples[i]),
+            "sample_rate": self.sample_rate,
+            "scale_length": float(self.scale_lengths[i]),
+            "scale_weight": float(self.scale_weights[i]),
+        }
+    
+    def segment_id(self, i: int) -> str:
+        """Segment ID in the index format ``{file_id}_seg_{i:04d}``."""
+        return f"{self.file_id}_seg_{int(i):04d}"
+    
+    @property
+    def segment_ids(self) -> List[str]:
+        """Segment IDs for all rows."""
+        return [self.segment_id(i) for i in range(len(self))]
+    
+    @property
+    def starts(self) -> np.ndarray:
+        """(N,) segment start times in seconds."""
+        return self.start_samples / self.sample_rate
+    
+    @property
+    def ends(self) -> np.ndarray:
+        """(N,) segment end times in seconds."""
+        return self.end_samples / self.sample_rate
+    
+    def to_dicts(self, include_audio: bool = False) -> List[Dict]:
+        """
+        Materialize segment dictionaries.
+        
+        Args:
+            include_audio: Attach each row of ``audio`` under the "audio" key
+                (the legacy ``segment_audio`` format)
+        
+        Returns:
+            List of segment dictionaries
+        """
+        segments = [self[i] for i in range(len(self))]
+        if include_audio:
+            for seg, row in zip(segments, self.audio):
+                seg["audio"] = row
+        return segments
+
+
+def segment_signal(
+    y: np.ndarray,
+    sr: int,
+    file_id: str,
+    segment_length: float = 0.5,
+    hop_length: Optional[float] = None,
+    overlap_ratio: Optional[float] = None,
+    scale_weight: float = 1.0
+) -> SegmentMatrix:
+    """
+    Segment an already-decoded mono signal into a strided segment matrix.
+    
+    Args:
+        y: Mono signal (1D)
+        sr: Sample rate of ``y``
+        file_id: Source file identifier used for segment IDs
+        segment_length: Length of each segment in seconds
+        hop_length: Hop length in seconds (if None, calculated from overlap_ratio or no overlap)
+        overlap_ratio: Overlap ratio (0.0 = no overlap, 0.5 = 50% overlap)
+        scale_weight: Weight recorded for every segment of this scale
+    
+    Returns:
+        SegmentMatrix over ``y`` (no audio is copied)
+    """
+    y = np.asarray(y, dtype=np.float32)
+    segment_samples = int(segment_length * sr)
+    
+    # Determine hop length
+    if hop_length is None:
+        if overlap_ratio is not None and overlap_ratio > 0:
+            hop_samples = int(segment_samples * (1 - overlap_ratio))
+        else:
+            hop_samples = segment_samples  # No overlap
+    else:
+        hop_samples = int(hop_length * sr)
+    hop_samples = max(1, hop_samples)
+    
+    if segment_samples <= 0 or len(y) < segment_samples:
+        audio = np.empty((0, max(segment_samples, 0)), dtype=np.float32)
+    else:
+        # Every hop_samples-th window of a sliding view: a zero-copy strided matrix
+        audio = np.lib.stride_tricks.sliding_window_view(y, segment_samples)[::hop_samples]
+    
+    num_segments = len(audio)
+    start_samples = np.arange(num_segments, dtype=np.int64) * hop_samples
+    
+    return SegmentMatrix(
+        audio=audio,
+        file_id=file_id,
+        sample_rate=sr,
+        start_samples=start_samples,
+        end_samples=start_samples + segment_samples,
+        scale_lengths=np.full(num_segments, segment_length, dtype=np.float64),
+        scale_weights=np.full(num_segments, scale_weight, dtype=np.float64),
+    )
+
+
+@dataclass
+class DecodedAudio:
+    """
+    Decoded mono signal for one query, shared by every pass over that file.
+    
+    The file is decoded and resampled once; each scale and transform
+    optimizer then takes its segment matrices and features from this object
+    instead of calling ``librosa.load`` again.
+    
+    Attributes:
+        samples: Mono float32 signal at ``sample_rate``
+        sample_rate: Sample rate of ``samples``
+        file_id: Source file identifier used for segment IDs
+        path: Source audio path (informational)
+    """
+    samples: np.ndarray
+    sample_rate: int
+    file_id: str
+    path: Optional[Path] = None
+    _feature_cache: Dict = field(default_factory=dict, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    
+    @classmethod
+    def load(cls, audio_path: Path, sample_rate: int = 44100) -> "DecodedAudio":
+        """
+        Decode an audio file once at ``sample_rate``.
+        
+        Args:
+            audio_path: Path to audio file
+            sample_rate: Target sample rate
+        
+        Returns:
+            DecodedAudio for the file
+        """
+        audio_path = Path(audio_path)
+        y, sr = librosa.load(str(audio_path), sr=sample_rate, mono=True)
+        return cls(samples=y, sample_rate=sr, file_id=audio_path.stem, path=audio_path)
+    
+    @property
+    def duration(self) -> float:
+        """Signal duration in seconds."""
+        return len(self.samples) / self.sample_rate
+    
+    def segment(
+        self,
+        segment_length: float = 0.5,
+        hop_length: Optional[float] = None,
+        overlap_ratio: Optional[float] = None,
+        scale_weight: float = 1.0
+    ) -> SegmentMatrix:
+        """Strided segment matrix over the decoded signal (see ``segment_signal``)."""
+        segments = segment_signal(
+            self.samples, self.sample_rate, self.file_id,
+            segment_length=segment_length,
+            hop_length=hop_length,
+            overlap_ratio=overlap_ratio,
+            scale_weight=scale_weight
+        )
+        segments.source = self
+        return segments
+    
+    def cached(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """
+        Compute a whole-signal feature once and reuse it for later calls.
+        
+        Thread-safe: scales processed in parallel wait for and share the
+        first computation instead of repeating it.
+        """
+        with self._lock:
+            if key not in self._feature_cache:
+                self._feature_cache[key] = compute()
+            return self._feature_cache[key]
+    
+    def melspectrogram(self, n_mels: int = 128, fmin: float = 0, fmax: Optional[float] = None) -> np.ndarray:
+        """Mel spectrogram of the full signal, computed once per parameter set."""
+        return self.cached(
+            ("melspectrogram", n_mels, fmin, fmax),
+            lambda: librosa.feature.melspectrogram(
+                y=self.samples, sr=self.sample_rate, n_mels=n_mels, fmin=fmin, fmax=fmax
+            )
+        )
+
+
+def segment_audio_matrix(
     audio_path: Path,
     segment_length: float = 0.5,
     hop_length: Optional[float] = None,
     sample_rate: int = 44100,
-    overlap_ratio: Optional[float] = None
-) -> List[Dict]:
+    overlap_ratio: Optional[float] = None,
+    scale_weight: float = 1.0
+) -> SegmentMatrix:
     """
-    Segment audio into fixed-length chunks with optional overlap.
+    Load and segment audio into a strided segment matrix.
     
     Args:
         audio_path: Path to audio file
@@ -78,65 +313,87 @@ def segment_audio(
         hop_length: Hop length in seconds (if None, calculated from overlap_ratio or no overlap)
         sample_rate: Sample rate for audio
         overlap_ratio: Overlap ratio (0.0 = no overlap, 0.5 = 50% overlap)
+        scale_weight: Weight recorded for every segment of this scale
     
     Returns:
-        List of segment dictionaries with start, end, path, etc.
+        SegmentMatrix with one row per segment
     """
+    audio_path = Path(audio_path)
     try:
-        # Load audio
-        y, sr = librosa.load(str(audio_path), sr=sample_rate, mono=True)
-        
-        duration = len(y) / sr
-        segment_samples = int(segment_length * sr)
-        
-        # Determine hop length
-        if hop_length is None:
-            if overlap_ratio is not None and overlap_ratio > 0:
-                # Calculate hop length from overlap ratio
-                hop_samples = int(segment_samples * (1 - overlap_ratio))
-            else:
-                hop_samples = segment_samples  # No overlap
-        else:
-            hop_samples = int(hop_length * sr)
-        
-        segments = []
-        start_sample = 0
-        segment_idx = 0
-        
-        while start_sample + segment_samples <= len(y):
-            end_sample = start_sample + segment_samples
-            segment_audio = y[start_sample:end_sample]
-            
-            start_time = start_sample / sr
-            end_time = end_sample / sr
-            
-            segment_id = f"{audio_path.stem}_seg_{segment_idx:04d}"
-            
-            segments.append({
-                "segment_id": segment_id,
-                "file_id": audio_path.stem,
-                "start": start_time,
-                "end": end_time,
-                "duration": end_time - start_time,
-                "start_sample": start_sample,
-                "end_sample": end_sample,
-                "audio": segment_audio,  # In-memory for now
-                "sample_rate": sr,
-            })
-            
-            start_sample += hop_samples
-            segment_idx += 1
-        
+        segments = DecodedAudio.load(audio_path, sample_rate).segment(
+            segment_length=segment_length,
+            hop_length=hop_length,
+            overlap_ratio=overlap_ratio,
+            scale_weight=scale_weight
+        )
         logger.debug(f"Segmented {audio_path} into {len(segments)} segments")
         return segments
-        
     except Exception as e:
         logger.error(f"Segmentation failed for {audio_path}: {e}")
         raise
 
 
+def segment_audio(
+    audio_path: Path,
+    segment_length: float = 0.5,
+    hop_length: Optional[float] = None,
+    sample_rate: int = 44100,
+    overlap_ratio: Optional[float] = None
+) -> List[Dict]:
+    """
+    Segment audio into fixed-length chunks with optional overlap.
+    
+    Thin wrapper over ``segment_audio_matrix`` for callers that need segment
+    dictionaries; each "audio" entry is a row view into the segment matrix.
+    
+    Args:
+        audio_path: Path to audio file
+        segment_length: Length of each segment in seconds
+        hop_length: Hop length in seconds (if None, calculated from overlap_ratio or no overlap)
+        sample_rate: Sample rate for audio
+        overlap_ratio: Overlap ratio (0.0 = no overlap, 0.5 = 50% overlap)
+    
+    Returns:
+        List of segment dictionaries with start, end, path, etc.
+    """
+    return segment_audio_matrix(
+        audio_path,
+        segment_length=segment_length,
+        hop_length=hop_length,
+        sample_rate=sample_rate,
+        overlap_ratio=overlap_ratio
+    ).to_dicts(include_audio=True)
+
+
+def _stack_segment_audio(segments: List[Dict]) -> Optional[np.ndarray]:
+    """
+    Stack segment audio into one contiguous (N, samples) float32 buffer.
+    
+    Returns None when segments have different lengths and cannot be stacked.
+    """
+    lengths = {len(seg["audio"]) for seg in segments}
+    if len(lengths) != 1:
+        return None
+    return np.stack([np.asarray(seg["audio"], dtype=np.float32) for seg in segments])
+
+
+def _extract_track_pooled_embeddings(segments: SegmentMatrix, model: Any) -> np.ndarray:
+    """
+    Pool segment embeddings from the track-level frame states of ``segments.source``.
+    
+    Frame states are cached on the DecodedAudio, so further scales of the same
+    query reuse the single forward pass.
+    """
+    source = segments.source
+    frames, frame_rate = source.cached(
+        ("track_frames", id(model)),
+        lambda: model.generate_track_frame_embeddings(source.samples, source.sample_rate)
+    )
+    return model.pool_frame_embeddings(frames, frame_rate, segments.starts, segments.ends)
+
+
 def extract_embeddings(
-    segments: List[Dict],
+    segments: Union[List[Dict], SegmentMatrix],
     model: any,
     output_dir: Optional[Path] = None,
     save_embeddings: bool = True,
@@ -145,8 +402,12 @@ def extract_embeddings(
     """
     Extract embeddings for segments using model with batch processing for GPU acceleration.
     
+    Segment audio is handed to the model in memory as a stacked (N, samples)
+    buffer; no temporary audio files are written. A SegmentMatrix is consumed
+    directly, without building or stacking per-segment dictionaries.
+    
     Args:
-        segments: List of segment dictionaries
+        segments: SegmentMatrix or list of segment dictionaries
         model: EmbeddingGenerator model (or dict with 'model' key)
         output_dir: Directory to save embeddings (optional)
         save_embeddings: Whether to save to disk
@@ -155,21 +416,14 @@ def extract_embeddings(
     Returns:
         Array of embeddings (N_segments, D)
     """
-    embeddings = []
+    if not segments:
+        raise ValueError("No embeddings were extracted - no segments provided.")
     
     # Extract the actual model from dict if needed
     actual_model = model
     if isinstance(model, dict):
         actual_model = model.get("model", model)
     
-    # Check if model supports batch processing
-    has_batch_method = hasattr(actual_model, "generate_embeddings_batch")
-    has_generate_embedding = hasattr(actual_model, "generate_embedding")
-    
-    # Import required modules
-    import tempfile
-    import soundfile as sf
-    
     # Get embedding dimension for fallback
     embedding_dim = 512
     if hasattr(actual_model, "embedding_dim"):
@@ -177,6 +431,25 @@ def extract_embeddings(
     elif isinstance(model, dict) and "embedding_dim" in model:
         embedding_dim = model["embedding_dim"]
     
+    if isinstance(segments, SegmentMatrix):
+        sample_rate = segments.sample_rate
+        segment_ids = segments.segment_ids
+    else:
+        sample_rate = segments[0]["sample_rate"]
+        segment_ids = [seg["segment_id"] for seg in segments]
+    
+    # Models without the in-memory API fall back to librosa features
+    if not hasattr(actual_model, "generate_embeddings_from_audio"):
+        from fingerprint.load_model import FallbackEmbeddingGenerator
+        logger.warning(
+            f"Model {type(actual_model).__name__} has no in-memory embedding API, "
+            f"using librosa fallback features"
+        )
+        actual_model = FallbackEmbeddingGenerator(
+            embedding_dim=embedding_dim,
+            sample_rate=sample_rate
+        )
+    
     # PHASE 1 & 3 OPTIMIZATION: Dynamic batch sizing based on GPU memory
     if batch_size == 32:  # Only optimize if using default
         try:
@@ -190,160 +463,86 @@ def extract_embeddings(
             # Fallback to local optimization
             batch_size = _get_optimal_batch_size(actual_model, embedding_dim, max_batch=128)
     
-    logger.info(f"Extracting embeddings using model: {type(actual_model).__name__}, batch_support: {has_batch_method}, batch_size: {batch_size}")
+    logger.info(f"Extracting embeddings using model: {type(actual_model).__name__}, batch_size: {batch_size}")
     
-    # Try batch processing first (much faster on GPU)
-    if has_batch_method and len(segments) > 1:
+    # Track-level mode: one model pass per decoded track, pooled into every
+    # segment window (shared across all scales cut from the same DecodedAudio)
+    if (
+        isinstance(segments, SegmentMatrix)
+        and segments.source is not None
+        and getattr(actual_model, "supports_track_pooling", False)
+    ):
         try:
-            # Prepare temporary files for all segments
-            temp_paths = []
-            temp_files_to_cleanup = []
-            
-            for seg in segments:
-                try:
-                    tmp_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-                    tmp_path = Path(tmp_file.name)
-                    sf.write(str(tmp_path), seg["audio"], seg["sample_rate"])
-                    tmp_file.close()
-                    temp_paths.append(tmp_path)
-                    temp_files_to_cleanup.append(tmp_path)
-                except Exception as e:
-                    logger.warning(f"Failed to create temp file for {seg['segment_id']}: {e}")
-                    temp_paths.append(None)
-            
-            # Process in batches
-            for i in range(0, len(temp_paths), batch_size):
-                batch_paths = temp_paths[i:i+batch_size]
-                batch_segments = segments[i:i+batch_size]
-                
-                # Filter out None paths
-                valid_batch = [(p, s) for p, s in zip(batch_paths, batch_segments) if p is not None]
-                if not valid_batch:
-                    continue
-                
-                valid_paths = [p for p, _ in valid_batch]
-                valid_seg_ids = [s["segment_id"] for _, s in valid_batch]
-                
-                try:
-                    # Use batch processing
-                    batch_embeddings = actual_model.generate_embeddings_batch(valid_paths, batch_size=len(valid_paths))
-                    
-                    # Process results
-                    for emb, seg_id in zip(batch_embeddings, valid_seg_ids):
-                        if emb is not None:
-                            emb = np.asarray(emb)
-                            if len(emb.shape) > 1:
-                                emb = emb.flatten()
-                            
-                            if emb.size > 0:
-                                embeddings.append(emb)
-                                
-                                # Save if requested
-                                if save_embeddings and output_dir:
-                                    output_dir.mkdir(parents=True, exist_ok=True)
-                                    emb_path = output_dir / f"{seg_id}.npy"
-                                    np.save(emb_path, emb)
-                            else:
-                                logger.warning(f"Empty embedding for {seg_id}")
-                        else:
-                            logger.warning(f"None embedding for {seg_id}")
-                            
-                except Exception as e:
-                    logger.warning(f"Batch processing failed for batch {i//batch_size}: {e}, falling back to sequential")
-                    # Fall back to sequential for this batch
-                    for tmp_path, seg in valid_batch:
-                        try:
-                            if has_generate_embedding:
-                                emb = actual_model.generate_embedding(tmp_path)
-                                if emb is not None:
-                                    emb = np.asarray(emb)
-                                    if len(emb.shape) > 1:
-                                        emb = emb.flatten()
-                                    if emb.size > 0:
-                                        embeddings.append(emb)
-                        except Exception as e2:
-                            logger.error(f"Failed to extract embedding for {seg['segment_id']}: {e2}")
-            
-            # Cleanup temp files
-            for tmp_path in temp_files_to_cleanup:
-                if tmp_path and tmp_path.exists():
-                    try:
-                        tmp_path.unlink()
-                    except Exception as cleanup_error:
-                        logger.warning(f"Failed to cleanup temp file {tmp_path}: {cleanup_error}")
-            
-            if embeddings:
-                embeddings_array = np.vstack(embeddings)
-                logger.info(f"Successfully extracted {len(embeddings)}/{len(segments)} embeddings using batch processing, shape: {embeddings_array.shape}")
-                return embeddings_array
-            else:
-                logger.warning("Batch processing produced no embeddings, falling back to sequential")
-                
+            embeddings_array = _extract_track_pooled_embeddings(segments, actual_model)
+            if save_embeddings and output_dir:
+                output_dir.mkdir(parents=True, exist_ok=True)
+                for seg_id, emb in zip(segment_ids, embeddings_array):
+                    np.save(output_dir / f"{seg_id}.npy", emb)
+            logger.info(f"Pooled {len(embeddings_array)} segment embeddings from track-level frames, shape: {embeddings_array.shape}")
+            return embeddings_array
         except Exception as e:
-            logger.warning(f"Batch processing failed: {e}, falling back to sequential processing")
+            logger.warning(f"Track-level pooling failed for {segments.file_id}: {e}, falling back to per-segment batches")
     
-    # Fallback to sequential processing
-    logger.debug("Using sequential embedding extraction")
-    for seg in tqdm(segments, desc="Extracting embeddings", leave=False):
-        tmp_path = None
+    # Build (segment indices, audio) batches. Equal-length segments share one
+    # contiguous buffer; ragged segments go to the model as a list when it can
+    # bucket them by length, otherwise one at a time. Models with their own
+    # length-bucket scheduler size batches themselves (batch_size is a cap).
+    if isinstance(segments, SegmentMatrix):
+        audio = segments.audio
+    else:
+        audio = _stack_segment_audio(segments)
+    has_scheduler = getattr(actual_model, "batch_scheduler", None) is not None
+    if audio is not None:
+        step = len(segments) if has_scheduler else batch_size
+        batches = [
+            (range(i, min(i + step, len(segments))), audio[i:i + step])
+            for i in range(0, len(segments), step)
+        ]
+    elif hasattr(actual_model, "generate_embeddings_from_audio_list"):
+        logger.debug("Segments have different lengths, using length-bucketed batching")
+        batches = [(range(len(segments)), [np.asarray(seg["audio"], dtype=np.float32) for seg in segments])]
+    else:
+        logger.debug("Segments have different lengths, embedding one segment per batch")
+        batches = [
+            (range(i, i + 1), np.asarray(seg["audio"], dtype=np.float32)[np.newaxis, :])
+            for i, seg in enumerate(segments)
+        ]
+    
+    embeddings = []
+    extracted_ids = []
+    
+    for batch_idx, (seg_indices, batch_audio) in enumerate(batches):
         try:
-            # Always save segment to temp file since models expect file paths
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-                tmp_path = Path(tmp.name)
-                sf.write(str(tmp_path), seg["audio"], seg["sample_rate"])
-            
-            # Use generate_embedding (takes Path) if available
-            if has_generate_embedding:
-                try:
-                    emb = actual_model.generate_embedding(tmp_path)
-                except Exception as e:
-                    logger.warning(f"Model.generate_embedding failed for {seg['segment_id']}: {e}, trying fallback")
-                    # Fall back to librosa-based extraction
-                    from fingerprint.load_model import FallbackEmbeddingGenerator
-                    fallback = FallbackEmbeddingGenerator(
-                        embedding_dim=embedding_dim,
-                        sample_rate=seg["sample_rate"]
-                    )
-                    emb = fallback.generate_embedding(tmp_path)
-            else:
-                # Fallback: use librosa features
-                from fingerprint.load_model import FallbackEmbeddingGenerator
-                fallback = FallbackEmbeddingGenerator(
-                    embedding_dim=embedding_dim,
-                    sample_rate=seg["sample_rate"]
+            if isinstance(batch_audio, list):
+                batch_embeddings = actual_model.generate_embeddings_from_audio_list(
+                    batch_audio, sample_rate, batch_size=batch_size
                 )
-                emb = fallback.generate_embedding(tmp_path)
-            
-            # Validate embedding
-            if emb is not None:
-                emb = np.asarray(emb)
-                if len(emb.shape) == 0 or emb.size == 0:
-                    logger.warning(f"Empty embedding for {seg['segment_id']}")
-                    emb = None
-                elif len(emb.shape) > 1:
-                    # Flatten if needed
-                    emb = emb.flatten()
-            
-            if emb is not None and emb.size > 0:
-                embeddings.append(emb)
-                
-                # Save if requested
-                if save_embeddings and output_dir:
-                    output_dir.mkdir(parents=True, exist_ok=True)
-                    emb_path = output_dir / f"{seg['segment_id']}.npy"
-                    np.save(emb_path, emb)
             else:
-                logger.warning(f"Failed to extract embedding for {seg['segment_id']}: embedding is None or empty")
-                
+                batch_embeddings = actual_model.generate_embeddings_from_audio(
+                    batch_audio, sample_rate, batch_size=min(batch_size, len(batch_audio))
+                )
+            batch_results = list(zip(seg_indices, batch_embeddings))
         except Exception as e:
-            logger.error(f"Failed to extract embedding for {seg['segment_id']}: {e}", exc_info=True)
-        finally:
-            # Always clean up temp file
-            if tmp_path and tmp_path.exists():
+            logger.warning(f"Batch processing failed for batch {batch_idx}: {e}, falling back to sequential")
+            batch_results = []
+            for seg_idx, seg_audio in zip(seg_indices, batch_audio):
                 try:
-                    tmp_path.unlink()
-                except Exception as cleanup_error:
-                    logger.warning(f"Failed to cleanup temp file {tmp_path}: {cleanup_error}")
+                    emb = actual_model.generate_embedding_from_audio(seg_audio, sample_rate)
+                    batch_results.append((seg_idx, emb))
+                except Exception as e2:
+                    logger.error(f"Failed to extract embedding for {segment_ids[seg_idx]}: {e2}")
+        
+        for seg_idx, emb in batch_results:
+            seg_id = segment_ids[seg_idx]
+            if emb is None:
+                logger.warning(f"None embedding for {seg_id}")
+                continue
+            emb = np.asarray(emb)
+            if emb.size == 0:
+                logger.warning(f"Empty embedding for {seg_id}")
+                continue
+            embeddings.append(emb.flatten())
+            extracted_ids.append(seg_id)
     
     if not embeddings:
         error_msg = (
@@ -355,6 +554,13 @@ def extract_embeddings(
         raise ValueError(error_msg)
     
     embeddings_array = np.vstack(embeddings)
+    
+    # Save if requested
+    if save_embeddings and output_dir:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for seg_id, emb in zip(extracted_ids, embeddings_array):
+            np.save(output_dir / f"{seg_id}.npy", emb)
+    
     logger.info(f"Successfully extracted {len(embeddings)}/{len(segments)} embeddings, shape: {embeddings_array.shape}")
     
     return embeddings_array
@@ -2,10 +2,16 @@
 import numpy as np
 import soundfile as sf
 import librosa
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
 import logging
 
+from .cpu_backend import CpuBackendConfig, apply_cpu_backend
+from .onnx_backend import BACKENDS, OnnxBackendConfig, OnnxMertSession
+
 logger = logging.getLogger(__name__)
 
 # Default MERT model name
@@ -55,6 +61,187 @@ if not HAS_TRANSFORMERS and not HAS_OPENL3:
     logger.warning("Neither transformers (for MERT) nor openl3 installed. Using fallback embedding method.")
 
 
+@dataclass
+class BatchStats:
+    """Padding and throughput figures for one model forward pass."""
+    num_items: int
+    real_samples: int
+    padded_samples: int
+    elapsed_seconds: float
+    sample_rate: int
+    
+    @property
+    def padding_efficiency(self) -> float:
+        """Fraction of the padded batch that is real audio (1.0 = no padding)."""
+        return self.real_samples / self.padded_samples if self.padded_samples else 1.0
+    
+    @property
+    def throughput(self) -> float:
+        """Seconds of real audio embedded per wall-clock second."""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.real_samples / self.sample_rate / self.elapsed_seconds
+
+
+class LengthBucketScheduler:
+    """
+    Groups variable-length segments into length buckets and sizes each batch
+    by a padded-audio budget instead of a fixed segment count.
+    
+    Segments are sorted by length and split into buckets of
+    ``bucket_width_seconds``; a batch never mixes buckets, so padding is
+    bounded by the bucket width. Short segments therefore go into large
+    batches and long ones into small batches with the same padded
+    cost per forward pass.
+    """
+    
+    def __init__(
+        self,
+        budget_seconds: float = 120.0,
+        bucket_width_seconds: float = 0.25,
+        max_batch_size: Optional[int] = None
+    ):
+        """
+        Initialize scheduler.
+        
+        Args:
+            budget_seconds: Max padded audio (batch size x longest item) per batch
+            bucket_width_seconds: Length range of one bucket
+            max_batch_size: Optional hard cap on items per batch
+        """
+        self.budget_seconds = budget_seconds
+        self.bucket_width_seconds = bucket_width_seconds
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self.history: List[BatchStats] = []
+    
+    def plan(
+        self,
+        lengths: Sequence[int],
+        sample_rate: int,
+        max_batch_size: Optional[int] = None,
+        exact_lengths: bool = False
+    ) -> List[np.ndarray]:
+        """
+        Plan batches for segments of the given lengths.
+        
+        Args:
+            lengths: Segment lengths in samples
+            sample_rate: Sample rate the lengths are expressed in
+            max_batch_size: Optional per-call cap on items per batch
+            exact_lengths: Only batch segments of identical length (for models
+                whose outputs change under padding)
+        
+        Returns:
+            List of index arrays into ``lengths``, one per batch
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if len(lengths) == 0:
+            return []
+        
+        caps = [c for c in (self.max_batch_size, max_batch_size) if c]
+        max_items = min(caps) if caps else len(lengths)
+        budget = max(1, int(self.budget_seconds * sample_rate))
+        bucket_width = 1 if exact_lengths else max(1, int(self.bucket_width_seconds * sample_rate))
+        
+        order = np.argsort(lengths, kind="stable")
+        buckets = (lengths[order] - 1) // bucket_width
+        
+        batches = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            # Close the batch at a bucket boundary, at the item cap, or when the
+            # next (longest-so-far, since sorted) item would exceed the budget
+            if end < len(order):
+                same_bucket = buckets[end] == buckets[start]
+                fits = (end - start + 1) * lengths[order[end]] <= budget
+                if same_bucket and fits and end - start < max_items:
+                    continue
+            batches.append(order[start:end])
+            start = end
+        return batches
+    
+    def record(self, stats: BatchStats):
+        """Record stats for a completed batch (thread-safe)."""
+        with self._lock:
+            self.history.append(stats)
+    
+    def summary(self) -> Dict:
+        """Aggregate padding efficiency and throughput over recorded batches."""
+        with self._lock:
+            history = list(self.history)
+        real = sum(s.real_samples / s.sample_rate for s in history)
+        padded = sum(s.padded_samples / s.sample_rate for s in history)
+        elapsed = sum(s.elapsed_seconds for s in history)
+        return {
+            "batches": len(history),
+            "segments": sum(s.num_items for s in history),
+            "audio_seconds": real,
+            "padding_efficiency": real / padded if padded else 1.0,
+            "throughput": real / elapsed if elapsed > 0 else 0.0,
+        }
+    
+    def reset(self):
+        """Clear recorded stats."""
+        with self._lock:
+            self.history = []
+
+
+def frame_mask(sample_lengths: Sequence[int], num_frames: int, hop: int) -> np.ndarray:
+    """
+    Output frames of a padded batch that cover real audio.
+    
+    Args:
+        sample_lengths: Unpadded length of every batch item in samples (N,)
+        num_frames: Frames the model returned per item
+        hop: Samples between consecutive output frames
+    
+    Returns:
+        Boolean mask (N, num_frames)
+    """
+    sample_lengths = np.asarray(sample_lengths, dtype=np.int64)
+    frame_lengths = np.minimum(-(-sample_lengths // hop), num_frames)  # Ceiling division
+    return np.arange(num_frames)[np.newaxis, :] < frame_lengths[:, np.newaxis]
+
+
+def plan_track_chunks(
+    num_samples: int,
+    hop: int,
+    chunk_samples: int,
+    context_samples: int
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Windows of a track-level pass (see EmbeddingGenerator.generate_track_frame_embeddings).
+    
+    Chunk and context lengths are rounded down to whole frames, so the core
+    frames of consecutive chunks tile the track's frames exactly once.
+    
+    Args:
+        num_samples: Track length in samples
+        hop: Samples between consecutive output frames
+        chunk_samples: Core length of a chunk
+        context_samples: Extra audio on each side of a chunk
+    
+    Returns:
+        One (window_start, window_end, first_core_frame, num_core_frames)
+        per chunk: the sample range to run the model on, and which of its
+        output frames belong to the chunk's core
+    """
+    chunk = max(hop, chunk_samples // hop * hop)
+    context = context_samples // hop * hop
+    total_frames = max(1, int(np.ceil(num_samples / hop)))
+    
+    chunks = []
+    for core_start in range(0, num_samples, chunk):
+        core_end = min(core_start + chunk, num_samples)
+        window_start = max(0, core_start - context)
+        window_end = min(num_samples, core_end + context)
+        first = (core_start - window_start) // hop
+        num_core = min(int(np.ceil(core_end / hop)), total_frames) - core_start // hop
+        chunks.append((window_start, window_end, first, num_core))
+    return chunks
+
+
 class EmbeddingGenerator:
     """
     Generates embeddings using Music Foundation Models (MERT/MuQ) with OpenL3 fallback.
@@ -71,7 +258,16 @@ class EmbeddingGenerator:
         input_repr: str = "mel256",
         device: Optional[str] = None,
         dtype: str = "float32",
-        model_name: Optional[str] = None
+        model_name: Optional[str] = None,
+        track_pooling: bool = False,
+        track_chunk_seconds: float = 30.0,
+        track_context_seconds: float = 5.0,
+        batch_budget_seconds: float = 120.0,
+        bucket_width_seconds: float = 0.25,
+        cpu_backend: Optional[Dict] = None,
+        backend: str = "torch",
+        onnx_backend: Optional[Dict] = None,
+        max_layer: Optional[int] = None
     ):
         """
         Initialize embedding generator.
@@ -84,13 +280,44 @@ class EmbeddingGenerator:
             input_repr: Input representation for OpenL3 ('mel256' or 'linear')
             device: torch device ("cuda", "cpu", or None for auto)
             model_name: Optional MERT model name override
+            track_pooling: Run MERT once per track and pool frame-level hidden
+                states into segment embeddings (see generate_track_frame_embeddings)
+            track_chunk_seconds: Chunk length for track-level MERT passes
+            track_context_seconds: Extra context on each side of a chunk
+            batch_budget_seconds: Max padded audio per MERT forward pass
+            bucket_width_seconds: Length range of one MERT batching bucket
+            cpu_backend: CPU inference backend for MERT (precision, graph_mode,
+                intra_op_threads, inter_op_threads; see fingerprint.cpu_backend)
+            backend: MERT inference runtime: "torch" or "onnx" (ONNX Runtime,
+                CPU execution provider)
+            onnx_backend: ONNX Runtime settings (cache_dir, opset,
+                optimization_level, threads; see fingerprint.onnx_backend)
+            max_layer: Run only the first N MERT transformer layers and use
+                layer N's hidden states (None = all layers)
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown MERT backend '{backend}', expected one of {BACKENDS}")
         self.embedding_dim = embedding_dim
         self.sample_rate = sample_rate
         self.content_type = content_type
         self.input_repr = input_repr
         self.model_type = model_type
         self.model_name = model_name or MERT_MODEL_NAME
+        self.track_pooling = track_pooling
+        self.track_chunk_seconds = track_chunk_seconds
+        self.track_context_seconds = track_context_seconds
+        self.cpu_backend = CpuBackendConfig.from_dict(cpu_backend)
+        self.backend = backend
+        self.onnx_backend = OnnxBackendConfig.from_dict(onnx_backend)
+        self.max_layer = None  # Applied depth (None = full model)
+        self._mert_full_layers = None  # Original encoder layers, kept for restoring depth
+        self._mert_base_model = None  # FP32 eager model backends are derived from
+        self._mert_forward_model = None  # Compiled/traced graph or ONNX session (None = eager)
+        self._cpu_autocast_dtype = None
+        self.batch_scheduler = LengthBucketScheduler(
+            budget_seconds=batch_budget_seconds,
+            bucket_width_seconds=bucket_width_seconds
+        )
         
         if not HAS_TORCH:
             self.device = "cpu"
@@ -150,6 +377,152 @@ class EmbeddingGenerator:
         if self.active_model_name is None:
             self.active_model_name = "librosa"
             logger.warning("No embedding models available, using librosa fallback")
+        
+        # Truncated depth: drop encoder layers past max_layer before backends are derived
+        if max_layer is not None and self.active_model_name == "mert" and self.mert_model is not None:
+            self._truncate_mert_layers(max_layer)
+        
+        # Optimized inference: ONNX Runtime, or torch CPU backends (int8 / bf16 / graph capture / threads)
+        if self.active_model_name == "mert" and self.mert_model is not None:
+            if self.backend == "onnx":
+                self.set_onnx_backend(self.onnx_backend)
+            elif self.device == "cpu":
+                self.set_cpu_backend(self.cpu_backend)
+    
+    def set_cpu_backend(self, backend=None):
+        """
+        Apply a CPU inference backend to the loaded MERT model.
+        
+        Backends are always derived from the original FP32 eager model, so
+        they can be switched (e.g. for parity reports) without reloading.
+        
+        Args:
+            backend: CpuBackendConfig or ``model.cpu_backend`` config dict
+        """
+        if not isinstance(backend, CpuBackendConfig):
+            backend = CpuBackendConfig.from_dict(backend)
+        if self.mert_model is None:
+            raise ValueError("MERT model not loaded")
+        if self._mert_base_model is None:
+            self._mert_base_model = self.mert_model
+        
+        example_inputs = None
+        if backend.graph_mode != "eager":
+            mert_sr = self._get_mert_sampling_rate()
+            example_inputs = self.mert_processor(
+                raw_speech=np.zeros(mert_sr, dtype=np.float32),
+                sampling_rate=mert_sr,
+                return_tensors="pt"
+            )
+            example_inputs = {"input_values": example_inputs["input_values"].to(self.device).float()}
+        
+        self.cpu_backend = backend
+        self.backend = "torch"
+        self.mert_model, self._mert_forward_model, self._cpu_autocast_dtype = apply_cpu_backend(
+            self._mert_base_model, backend, example_inputs=example_inputs
+        )
+    
+    def set_max_layer(self, max_layer: Optional[int] = None):
+        """
+        Change the MERT depth without reloading the model.
+        
+        Truncation is applied to the FP32 eager model and the active backend
+        (torch CPU backend or ONNX) is re-derived from it.
+        
+        Args:
+            max_layer: Number of transformer layers to run (None = all)
+        """
+        if self.mert_model is None:
+            raise ValueError("MERT model not loaded")
+        self._truncate_mert_layers(max_layer)
+        if self.backend == "onnx":
+            self.set_onnx_backend(self.onnx_backend)
+        elif self._mert_base_model is not None:
+            self.set_cpu_backend(self.cpu_backend)
+    
+    @property
+    def num_mert_layers(self) -> int:
+        """Number of transformer layers in the full MERT model."""
+        if self._mert_full_layers is not None:
+            return len(self._mert_full_layers)
+        model = self._mert_base_model if self._mert_base_model is not None else self.mert_model
+        return len(model.encoder.layers)
+    
+    def _truncate_mert_layers(self, max_layer: Optional[int]):
+        """Keep the first ``max_layer`` encoder layers of the eager model (None restores all)."""
+        model = self._mert_base_model if self._mert_base_model is not None else self.mert_model
+        encoder = getattr(model, "encoder", None)
+        if not hasattr(encoder, "layers"):
+            raise ValueError("MERT model has no encoder.layers; cannot truncate depth")
+        if self._mert_full_layers is None:
+            self._mert_full_layers = encoder.layers
+        
+        total = len(self._mert_full_layers)
+        if max_layer is not None and not 1 <= int(max_layer) <= total:
+            raise ValueError(f"max_layer must be between 1 and {total}, got {max_layer}")
+        if max_layer is None or int(max_layer) == total:
+            encoder.layers = self._mert_full_layers
+            self.max_layer = None
+        else:
+            # Same container type as the original (torch.nn.ModuleList for HF models)
+            encoder.layers = type(self._mert_full_layers)(list(self._mert_full_layers)[:int(max_layer)])
+            self.max_layer = int(max_layer)
+        # Part of the ONNX cache key, so truncated graphs are exported separately
+        model.config.num_hidden_layers = len(encoder.layers)
+        logger.info(f"MERT depth: {len(encoder.layers)}/{total} transformer layers")
+    
+    def set_onnx_backend(self, config=None) -> bool:
+        """
+        Run MERT through ONNX Runtime (CPU execution provider).
+        
+        The graph is exported from the FP32 eager model on first use and
+        cached on disk keyed by model name and config hash. If onnxruntime is
+        missing or the export fails, the torch backend stays in use.
+        
+        Args:
+            config: OnnxBackendConfig or ``model.onnx`` config dict
+        
+        Returns:
+            True if the ONNX backend is active
+        """
+        if not isinstance(config, OnnxBackendConfig):
+            config = OnnxBackendConfig.from_dict(config)
+        if self.mert_model is None:
+            raise ValueError("MERT model not loaded")
+        if self._mert_base_model is None:
+            self._mert_base_model = self.mert_model
+        self.onnx_backend = config
+        
+        if self.device != "cpu":
+            # ONNX Runtime runs on the CPU execution provider; keep pooling on the same device
+            logger.warning(f"ONNX backend runs on CPU; moving MERT from {self.device} to cpu")
+            self.device = "cpu"
+            self._mert_base_model.to("cpu")
+        
+        model_name = getattr(self._mert_base_model.config, "_name_or_path", None) or self.model_name
+        try:
+            session = OnnxMertSession.from_model(
+                self._mert_base_model, model_name, self._get_mert_sampling_rate(), config
+            )
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable ({e}), using torch backend")
+            self.set_cpu_backend(self.cpu_backend)
+            return False
+        
+        self.backend = "onnx"
+        self.mert_model = self._mert_base_model
+        self._mert_forward_model = session
+        self._cpu_autocast_dtype = None
+        return True
+    
+    @property
+    def cpu_backend_applied(self) -> bool:
+        """Whether every requested CPU backend option is in effect (bf16 support, graph capture)."""
+        if self.cpu_backend.precision == "bf16" and self._cpu_autocast_dtype is None:
+            return False
+        if self.cpu_backend.graph_mode != "eager" and self._mert_forward_model is None:
+            return False
+        return True
     
     def _load_mert(self) -> bool:
         """Load MERT model from Hugging Face."""
@@ -246,9 +619,7 @@ class EmbeddingGenerator:
         
         try:
             # Get MERT processor's required sampling rate (usually 24000)
-            mert_sr = getattr(self.mert_processor, 'sampling_rate', 24000)
-            if hasattr(self.mert_processor, 'feature_extractor'):
-                mert_sr = getattr(self.mert_processor.feature_extractor, 'sampling_rate', 24000)
+            mert_sr = self._get_mert_sampling_rate()
             
             logger.debug(f"MERT requires sampling rate: {mert_sr} Hz (input: {sr} Hz)")
             
@@ -282,40 +653,7 @@ class EmbeddingGenerator:
             
             # Generate embeddings with CUDA error handling and AMP (Automatic Mixed Precision)
             with torch.no_grad():
-                try:
-                    # Clear CUDA cache to prevent memory issues
-                    if self.device == "cuda":
-                        torch.cuda.empty_cache()
-                    
-                    # Use Automatic Mixed Precision (AMP) for safe FP16 inference on GPU
-                    if self.device == "cuda" and HAS_AMP:
-                        with autocast(device_type='cuda'):  # AMP automatically uses FP16 where safe, FP32 where needed
-                            outputs = self.mert_model(**inputs)
-                    else:
-                        # CPU or AMP not available: use FP32
-                        outputs = self.mert_model(**inputs)
-                    
-                    # Synchronize CUDA operations to catch errors early
-                    if self.device == "cuda":
-                        torch.cuda.synchronize()
-                except RuntimeError as e:
-                    if "CUDA" in str(e) or "device-side" in str(e).lower():
-                        logger.error(f"CUDA error during inference: {e}")
-                        # Clear cache and retry once (without AMP as fallback)
-                        if self.device == "cuda":
-                            torch.cuda.empty_cache()
-                            torch.cuda.synchronize()
-                            # Retry without AMP as fallback
-                            try:
-                                logger.warning("Retrying inference without AMP as fallback")
-                                outputs = self.mert_model(**inputs)
-                            except Exception as retry_e:
-                                logger.error(f"Retry without AMP also failed: {retry_e}")
-                                raise
-                        else:
-                            raise
-                    else:
-                        raise
+                outputs = self._run_mert_forward(inputs)
                 # Extract embeddings (adjust based on MERT output structure)
                 if hasattr(outputs, 'last_hidden_state'):
                     embeddings = outputs.last_hidden_state
@@ -332,7 +670,7 @@ class EmbeddingGenerator:
                 if len(embeddings.shape) > 1:
                     embeddings = embeddings[0]
                 
-                emb = embeddings.cpu().numpy()
+                emb = embeddings.float().cpu().numpy()
             
             # Ensure correct dimension
             if len(emb) != self.embedding_dim:
@@ -367,26 +705,122 @@ class EmbeddingGenerator:
         try:
             # Load and preprocess audio
             y, sr = librosa.load(audio_path, sr=self.sample_rate, mono=True)
-            
-            # Generate embedding based on active model
-            if self.active_model_name == "mert" and self.mert_model is not None:
-                emb = self._generate_mert_embedding(y, sr)
-            elif self.active_model_name == "muq" and self.muq_model is not None:
-                # MuQ embedding generation (to be implemented)
-                logger.warning("MuQ embedding not fully implemented, using fallback")
-                emb = self._generate_openl3_embedding(y, sr) if HAS_OPENL3 else self._generate_librosa_embedding(y, sr)
-            elif self.active_model_name == "openl3" and HAS_OPENL3:
-                emb = self._generate_openl3_embedding(y, sr)
-            else:
-                # Fallback to librosa features
-                emb = self._generate_librosa_embedding(y, sr)
-            
-            return emb
+            return self.generate_embedding_from_audio(y, sr)
             
         except Exception as e:
             logger.error(f"Error generating embedding for {audio_path}: {e}")
             raise
     
+    def generate_embedding_from_audio(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        """
+        Generate embedding for a single in-memory audio signal.
+        
+        Args:
+            audio: Mono audio samples (samples,)
+            sr: Sample rate of the audio
+        
+        Returns:
+            Normalized embedding vector (embedding_dim,)
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        
+        # Generate embedding based on active model
+        if self.active_model_name == "mert" and self.mert_model is not None:
+            return self._generate_mert_embedding(audio, sr)
+        elif self.active_model_name == "muq" and self.muq_model is not None:
+            # MuQ embedding generation (to be implemented)
+            logger.warning("MuQ embedding not fully implemented, using fallback")
+            return self._generate_openl3_embedding(audio, sr) if HAS_OPENL3 else self._generate_librosa_embedding(audio, sr)
+        elif self.active_model_name == "openl3" and HAS_OPENL3:
+            return self._generate_openl3_embedding(audio, sr)
+        else:
+            # Fallback to librosa features
+            return self._generate_librosa_embedding(audio, sr)
+    
+    def generate_embeddings_from_audio(
+        self,
+        audio: np.ndarray,
+        sample_rate: int,
+        batch_size: int = 32
+    ) -> np.ndarray:
+        """
+        Generate embeddings for a stack of equal-length in-memory segments.
+        
+        This is the file-free path used by `extract_embeddings`: segments are
+        passed as one contiguous buffer, so nothing is written to or decoded
+        from disk.
+        
+        Args:
+            audio: Segment audio buffer (N, samples), or (samples,) for one segment
+            sample_rate: Sample rate of the buffer
+            batch_size: Number of segments per model forward pass
+        
+        Returns:
+            Embedding matrix (N, embedding_dim), float32, L2-normalized rows
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 1:
+            audio = audio[np.newaxis, :]
+        if audio.ndim != 2:
+            raise ValueError(f"Expected audio buffer of shape (N, samples), got {audio.shape}")
+        if len(audio) == 0:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        
+        if self.active_model_name == "mert" and self.mert_model is not None:
+            return self._generate_mert_embeddings_bucketed(audio, sample_rate, max_batch_size=batch_size)
+        elif self.active_model_name == "openl3" and HAS_OPENL3:
+            return self._generate_openl3_embeddings(audio, sample_rate)
+        elif self.active_model_name == "muq" and self.muq_model is not None:
+            logger.warning("MuQ embedding not fully implemented, using fallback")
+            if HAS_OPENL3:
+                return self._generate_openl3_embeddings(audio, sample_rate)
+            return self._generate_librosa_embeddings(audio, sample_rate)
+        else:
+            return self._generate_librosa_embeddings(audio, sample_rate)
+    
+    def generate_embeddings_from_audio_list(
+        self,
+        audio_list: List[np.ndarray],
+        sample_rate: int,
+        batch_size: int = 32
+    ) -> np.ndarray:
+        """
+        Generate embeddings for variable-length in-memory segments.
+        
+        MERT batches are formed by the length-bucket scheduler with attention
+        masks, so mixed scales and short tail segments do not pay for padding
+        to the longest segment.
+        
+        Args:
+            audio_list: List of mono segments (samples,) of any lengths
+            sample_rate: Sample rate of the segments
+            batch_size: Max segments per model forward pass
+        
+        Returns:
+            Embedding matrix (N, embedding_dim), float32, L2-normalized rows
+        """
+        if len(audio_list) == 0:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        if self.active_model_name == "mert" and self.mert_model is not None:
+            return self._generate_mert_embeddings_bucketed(audio_list, sample_rate, max_batch_size=batch_size)
+        return np.vstack([
+            self.generate_embeddings_from_audio(np.asarray(y, dtype=np.float32), sample_rate)
+            for y in audio_list
+        ])
+    
+    def _finalize_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        """Pad/truncate rows to embedding_dim and L2-normalize (FP32 output)."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[1] > self.embedding_dim:
+            embeddings = embeddings[:, :self.embedding_dim]
+        elif embeddings.shape[1] < self.embedding_dim:
+            embeddings = np.pad(embeddings, ((0, 0), (0, self.embedding_dim - embeddings.shape[1])), mode='constant')
+        
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms = np.where(norms == 0, 1, norms)
+        # Always use FP32 for output embeddings (FAISS requires FP32)
+        return (embeddings / norms).astype(np.float32)
+    
     def _generate_openl3_embedding(self, audio: np.ndarray, sr: int) -> np.ndarray:
         """Generate embedding using OpenL3."""
         if not HAS_OPENL3:
@@ -446,6 +880,32 @@ class EmbeddingGenerator:
         # FP16 is only used internally during model inference via AMP
         return emb.astype(np.float32)
     
+    def _generate_openl3_embeddings(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        """Generate OpenL3 embeddings for a stack of segments in one call."""
+        if not HAS_OPENL3:
+            raise ValueError("OpenL3 not available")
+        
+        emb_list, _ = openl3.get_audio_embedding(
+            list(audio),
+            sr=sr,
+            model=self.content_type,
+            input_repr=self.input_repr,
+            embedding_size=self.embedding_dim,
+            center=True,
+            hop_size=0.1,
+            verbose=False
+        )
+        # Average over time frames to get one vector per segment
+        return self._finalize_embeddings(np.stack([np.mean(emb, axis=0) for emb in emb_list]))
+    
+    def _generate_librosa_embeddings(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        """Generate librosa mel embeddings for a stack of segments (vectorized)."""
+        # librosa treats leading axes as channels: (N, samples) -> (N, n_mels, frames)
+        mel_spec = librosa.feature.melspectrogram(
+            y=audio, sr=sr, n_mels=128, fmax=8000
+        )
+        return self._finalize_embeddings(np.mean(mel_spec, axis=-1))
+    
     def generate_embeddings_batch(
         self,
         audio_paths: List[Path],
@@ -463,13 +923,9 @@ class EmbeddingGenerator:
         """
         embeddings = []
         
-        # For MERT, we can do actual batching
+        # For MERT, we can do actual batching (length-bucketed, see _generate_mert_embeddings_bucketed)
         if self.active_model_name == "mert" and self.mert_model is not None:
-            # Batch processing for MERT
-            for i in range(0, len(audio_paths), batch_size):
-                batch_paths = audio_paths[i:i+batch_size]
-                batch_embeddings = self._generate_mert_batch(batch_paths)
-                embeddings.extend(batch_embeddings)
+            embeddings.extend(self._generate_mert_batch(audio_paths, max_batch_size=batch_size))
         else:
             # Sequential processing for other models
             for path in audio_paths:
@@ -482,14 +938,16 @@ class EmbeddingGenerator:
         
         return embeddings
     
-    def _generate_mert_batch(self, audio_paths: List[Path]) -> List[np.ndarray]:
-        """Generate MERT embeddings in batch."""
-        # Get MERT processor's required sampling rate (usually 24000)
+    def _get_mert_sampling_rate(self) -> int:
+        """Get MERT processor's required sampling rate (usually 24000)."""
         mert_sr = getattr(self.mert_processor, 'sampling_rate', 24000)
         if hasattr(self.mert_processor, 'feature_extractor'):
             mert_sr = getattr(self.mert_processor.feature_extractor, 'sampling_rate', 24000)
-        
-        logger.debug(f"MERT batch processing with sampling rate: {mert_sr} Hz")
+        return mert_sr
+    
+    def _generate_mert_batch(self, audio_paths: List[Path], max_batch_size: Optional[int] = None) -> List[np.ndarray]:
+        """Generate MERT embeddings in batch."""
+        mert_sr = self._get_mert_sampling_rate()
         
         # Load all audio files and resample to MERT's required rate
         audio_list = []
@@ -502,56 +960,127 @@ class EmbeddingGenerator:
             
             audio_list.append(y)
         
-        # Process batch
         try:
-            # Convert to list of numpy arrays for MERT processor
-            audio_numpy_list = [audio for audio in audio_list]
+            return list(self._generate_mert_embeddings_bucketed(audio_list, mert_sr, max_batch_size=max_batch_size))
+        except Exception as e:
+            logger.error(f"Error in MERT batch processing: {e}")
+            # Fallback to individual processing
+            return [self.generate_embedding(path) for path in audio_paths]
+    
+    def _generate_mert_embeddings_bucketed(
+        self,
+        audio,
+        sr: int,
+        max_batch_size: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Generate MERT embeddings with length-bucketed dynamic batching.
+        
+        Audio is resampled to MERT's rate once, batches are planned by
+        ``batch_scheduler`` (sample budget, no cross-bucket padding) and each
+        batch's padding efficiency and throughput is recorded.
+        
+        Args:
+            audio: Stacked buffer (N, samples) or list of 1D arrays
+            sr: Sample rate of the audio
+            max_batch_size: Optional cap on segments per batch
+        
+        Returns:
+            Embedding matrix (N, embedding_dim) in input order
+        """
+        mert_sr = self._get_mert_sampling_rate()
+        if sr != mert_sr:
+            if isinstance(audio, np.ndarray) and audio.ndim == 2:
+                audio = librosa.resample(audio, orig_sr=sr, target_sr=mert_sr, axis=-1)
+            else:
+                audio = [librosa.resample(np.asarray(y, dtype=np.float32), orig_sr=sr, target_sr=mert_sr) for y in audio]
+        
+        # Group-normalized conv feature encoders normalize over padding too,
+        # so those models only batch segments of identical length
+        feat_extract_norm = getattr(getattr(self.mert_model, "config", None), "feat_extract_norm", "layer")
+        lengths = [len(y) for y in audio]
+        batches = self.batch_scheduler.plan(
+            lengths, mert_sr,
+            max_batch_size=max_batch_size,
+            exact_lengths=feat_extract_norm == "group"
+        )
+        embeddings = np.zeros((len(lengths), self.embedding_dim), dtype=np.float32)
+        
+        for batch_num, indices in enumerate(batches, start=1):
+            batch_audio = [audio[i] for i in indices]
+            batch_start = time.time()
+            embeddings[indices] = self._generate_mert_batch_from_audio(batch_audio, mert_sr)
+            stats = BatchStats(
+                num_items=len(indices),
+                real_samples=int(sum(lengths[i] for i in indices)),
+                padded_samples=len(indices) * max(lengths[i] for i in indices),
+                elapsed_seconds=time.time() - batch_start,
+                sample_rate=mert_sr
+            )
+            self.batch_scheduler.record(stats)
+            logger.debug(
+                f"MERT batch {batch_num}/{len(batches)}: {stats.num_items} segments, "
+                f"padding efficiency {stats.padding_efficiency:.1%}, "
+                f"throughput {stats.throughput:.1f} audio-s/s"
+            )
+        
+        return embeddings
+    
+    def get_batching_stats(self) -> Dict:
+        """Padding efficiency and throughput over all MERT batches so far."""
+        return self.batch_scheduler.summary()
+    
+    def _generate_mert_batch_from_audio(self, audio, sr: int) -> np.ndarray:
+        """
+        Generate MERT embeddings for in-memory audio in one forward pass.
+        
+        Args:
+            audio: Stacked buffer (N, samples) or list of 1D arrays
+            sr: Sample rate of the audio
+        
+        Returns:
+            Embedding matrix (N, embedding_dim)
+        """
+        mert_sr = self._get_mert_sampling_rate()
+        logger.debug(f"MERT batch processing with sampling rate: {mert_sr} Hz (input: {sr} Hz)")
+        
+        # Resample to MERT's required sampling rate (one call for a stacked buffer)
+        if sr != mert_sr:
+            if isinstance(audio, np.ndarray) and audio.ndim == 2:
+                audio = librosa.resample(audio, orig_sr=sr, target_sr=mert_sr, axis=-1)
+            else:
+                audio = [librosa.resample(np.asarray(y), orig_sr=sr, target_sr=mert_sr) for y in audio]
+        
+        try:
+            # Ragged batches are zero-padded with an attention mask; equal-length
+            # batches are passed as-is
+            ragged = len({len(y) for y in audio}) > 1
             
             # Process with MERT - use MERT's sampling rate
-            inputs = self.mert_processor(
-                raw_speech=audio_numpy_list,
-                sampling_rate=mert_sr,  # Use MERT's required sampling rate
-                return_tensors="pt"
-            )
+            if ragged:
+                inputs = self.mert_processor(
+                    raw_speech=list(audio),
+                    sampling_rate=mert_sr,  # Use MERT's required sampling rate
+                    padding=True,
+                    return_attention_mask=True,
+                    return_tensors="pt"
+                )
+            else:
+                inputs = self.mert_processor(
+                    raw_speech=list(audio),
+                    sampling_rate=mert_sr,  # Use MERT's required sampling rate
+                    return_tensors="pt"
+                )
             
-            inputs = {k: v.to(self.device).float() for k, v in inputs.items()}  # Ensure FP32 inputs
+            attention_mask = inputs.get("attention_mask")
+            inputs = {
+                k: v.to(self.device) if k == "attention_mask" else v.to(self.device).float()  # Ensure FP32 inputs
+                for k, v in inputs.items()
+            }
             
             import torch
             with torch.no_grad():
-                try:
-                    # Clear CUDA cache to prevent memory issues
-                    if self.device == "cuda":
-                        torch.cuda.empty_cache()
-                    
-                    # Use Automatic Mixed Precision (AMP) for safe FP16 batch inference on GPU
-                    if self.device == "cuda" and HAS_AMP:
-                        with autocast(device_type='cuda'):  # AMP automatically uses FP16 where safe, FP32 where needed
-                            outputs = self.mert_model(**inputs)
-                    else:
-                        # CPU or AMP not available: use FP32
-                        outputs = self.mert_model(**inputs)
-                    
-                    # Synchronize CUDA operations to catch errors early
-                    if self.device == "cuda":
-                        torch.cuda.synchronize()
-                except RuntimeError as e:
-                    if "CUDA" in str(e) or "device-side" in str(e).lower():
-                        logger.error(f"CUDA error during batch inference: {e}")
-                        # Clear cache and retry once (without AMP as fallback)
-                        if self.device == "cuda":
-                            torch.cuda.empty_cache()
-                            torch.cuda.synchronize()
-                            # Retry without AMP as fallback
-                            try:
-                                logger.warning("Retrying batch inference without AMP as fallback")
-                                outputs = self.mert_model(**inputs)
-                            except Exception as retry_e:
-                                logger.error(f"Retry without AMP also failed: {retry_e}")
-                                raise
-                        else:
-                            raise
-                    else:
-                        raise
+                outputs = self._run_mert_forward(inputs)
                 if hasattr(outputs, 'last_hidden_state'):
                     embeddings = outputs.last_hidden_state
                 elif hasattr(outputs, 'pooler_output'):
@@ -559,34 +1088,195 @@ class EmbeddingGenerator:
                 else:
                     embeddings = outputs[0]
                 
-                # Average over time dimension
+                # Average over time dimension (real frames only for padded batches)
                 if len(embeddings.shape) > 2:
-                    embeddings = embeddings.mean(dim=1)
-                
-                embeddings = embeddings.cpu().numpy()
-            
-            # Process each embedding
-            results = []
-            for emb in embeddings:
-                if len(emb) != self.embedding_dim:
-                    if len(emb) > self.embedding_dim:
-                        emb = emb[:self.embedding_dim]
+                    if ragged and attention_mask is not None:
+                        frame_mask = self._get_frame_mask(embeddings.shape[1], attention_mask).to(embeddings.device)
+                        frame_mask = frame_mask.unsqueeze(-1).to(embeddings.dtype)
+                        embeddings = (embeddings * frame_mask).sum(dim=1) / frame_mask.sum(dim=1).clamp(min=1)
                     else:
-                        emb = np.pad(emb, (0, self.embedding_dim - len(emb)), mode='constant')
-                
-                norm = np.linalg.norm(emb)
-                if norm > 0:
-                    emb = emb / norm
+                        embeddings = embeddings.mean(dim=1)
                 
-                # Always use FP32 for output embeddings (FAISS requires FP32)
-                # FP16 is only used internally during model inference via AMP
-                results.append(emb.astype(np.float32))
+                embeddings = embeddings.float().cpu().numpy()
             
-            return results
+            return self._finalize_embeddings(embeddings)
         except Exception as e:
             logger.error(f"Error in MERT batch processing: {e}")
-            # Fallback to individual processing
-            return [self.generate_embedding(path) for path in audio_paths]
+            # Fallback to individual processing (audio is already at MERT's rate)
+            return np.vstack([self._generate_mert_embedding(np.asarray(y), mert_sr) for y in audio])
+    
+    def _get_frame_mask(self, num_frames: int, attention_mask):
+        """Map a sample-level attention mask to MERT's output frames."""
+        import torch
+        if hasattr(self.mert_model, "_get_feature_vector_attention_mask"):
+            return self.mert_model._get_feature_vector_attention_mask(num_frames, attention_mask.to(self.device)).bool()
+        # Approximate with the convolutional hop when the helper is unavailable
+        sample_lengths = attention_mask.sum(dim=-1).cpu().numpy()
+        return torch.from_numpy(frame_mask(sample_lengths, num_frames, self._get_mert_frame_hop()))
+    
+    def _run_mert_forward(self, inputs: Dict):
+        """
+        Run the MERT model on prepared inputs (call under torch.no_grad()).
+        
+        Uses AMP on CUDA and retries once without AMP on CUDA errors.
+        """
+        import torch
+        
+        model = self._select_forward_model(inputs)
+        try:
+            # Clear CUDA cache to prevent memory issues
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
+            
+            # Use Automatic Mixed Precision (AMP) for safe FP16 batch inference on GPU
+            if self.device == "cuda" and HAS_AMP:
+                with autocast(device_type='cuda'):  # AMP automatically uses FP16 where safe, FP32 where needed
+                    outputs = model(**inputs)
+            elif self._cpu_autocast_dtype is not None:
+                # CPU backend: bfloat16 autocast
+                with torch.autocast(device_type='cpu', dtype=self._cpu_autocast_dtype):
+                    outputs = model(**inputs)
+            else:
+                # CPU or AMP not available: use FP32
+                outputs = model(**inputs)
+            
+            # Synchronize CUDA operations to catch errors early
+            if self.device == "cuda":
+                torch.cuda.synchronize()
+            return outputs
+        except RuntimeError as e:
+            if ("CUDA" in str(e) or "device-side" in str(e).lower()) and self.device == "cuda":
+                logger.error(f"CUDA error during batch inference: {e}")
+                # Clear cache and retry once (without AMP as fallback)
+                torch.cuda.empty_cache()
+                torch.cuda.synchronize()
+                try:
+                    logger.warning("Retrying batch inference without AMP as fallback")
+                    return self.mert_model(**inputs)
+                except Exception as retry_e:
+                    logger.error(f"Retry without AMP also failed: {retry_e}")
+                    raise
+            raise
+    
+    def _select_forward_model(self, inputs: Dict):
+        """
+        Callable taking ``**inputs`` that runs the active backend.
+        
+        ONNX sessions take the attention mask; compiled/traced graphs take
+        input_values only, so masked batches run eager.
+        """
+        forward_model = self._mert_forward_model
+        if forward_model is not None and getattr(forward_model, "accepts_attention_mask", False):
+            return forward_model
+        if forward_model is not None and set(inputs) == {"input_values"}:
+            return lambda **kwargs: forward_model(kwargs["input_values"])
+        return self.mert_model
+    
+    @property
+    def supports_track_pooling(self) -> bool:
+        """Whether segment embeddings are pooled from one track-level MERT pass."""
+        return self.track_pooling and self.active_model_name == "mert" and self.mert_model is not None
+    
+    def _get_mert_frame_hop(self) -> int:
+        """Samples (at MERT's rate) between consecutive output frames (usually 320)."""
+        conv_stride = getattr(getattr(self.mert_model, "config", None), "conv_stride", None)
+        return int(np.prod(conv_stride)) if conv_stride else 320
+    
+    def generate_track_frame_embeddings(self, audio: np.ndarray, sr: int) -> Tuple[np.ndarray, float]:
+        """
+        Run MERT once over a whole track and return frame-level hidden states.
+        
+        The track is processed in chunks of ``track_chunk_seconds`` with
+        ``track_context_seconds`` of extra audio on each side; only each
+        chunk's core frames are kept, so every frame sees surrounding context
+        and overlapping segments / scales never recompute the same audio.
+        
+        Args:
+            audio: Mono track samples (samples,)
+            sr: Sample rate of the audio
+        
+        Returns:
+            Tuple of (frames (T, hidden_size) float32, frame_rate in frames/second)
+        """
+        if self.mert_model is None or self.mert_processor is None:
+            raise ValueError("MERT model not loaded")
+        
+        import torch
+        
+        mert_sr = self._get_mert_sampling_rate()
+        audio = np.asarray(audio, dtype=np.float32)
+        if sr != mert_sr:
+            audio = librosa.resample(audio, orig_sr=sr, target_sr=mert_sr)
+        
+        hop = self._get_mert_frame_hop()
+        chunks = plan_track_chunks(
+            len(audio), hop,
+            chunk_samples=int(self.track_chunk_seconds * mert_sr),
+            context_samples=int(self.track_context_seconds * mert_sr)
+        )
+        
+        frames = []
+        for window_start, window_end, first, num_core in chunks:
+            inputs = self.mert_processor(
+                raw_speech=audio[window_start:window_end],
+                sampling_rate=mert_sr,
+                return_tensors="pt"
+            )
+            inputs = {k: v.to(self.device).float() for k, v in inputs.items()}  # Ensure FP32 inputs
+            with torch.no_grad():
+                outputs = self._run_mert_forward(inputs)
+            hidden = outputs.last_hidden_state if hasattr(outputs, 'last_hidden_state') else outputs[0]
+            hidden = hidden[0].float().cpu().numpy()
+            
+            # Keep this chunk's core frames; convolutional edge loss at the
+            # window end is covered by repeating the last frame
+            core = hidden[first:first + num_core]
+            if len(core) < num_core:
+                edge = hidden[-1:] if len(core) == 0 else core[-1:]
+                core = np.vstack([core, np.repeat(edge, num_core - len(core), axis=0)])
+            frames.append(core)
+        
+        frame_rate = mert_sr / hop
+        frames = np.vstack(frames).astype(np.float32)
+        logger.debug(f"Track-level MERT: {len(audio) / mert_sr:.1f}s -> {len(frames)} frames at {frame_rate:.1f} Hz")
+        return frames, frame_rate
+    
+    def pool_frame_embeddings(
+        self,
+        frames: np.ndarray,
+        frame_rate: float,
+        starts: np.ndarray,
+        ends: np.ndarray
+    ) -> np.ndarray:
+        """
+        Mean-pool frame-level hidden states over arbitrary time windows.
+        
+        Uses a cumulative sum over frames, so each window costs O(1)
+        regardless of its length or how many windows overlap.
+        
+        Args:
+            frames: Frame-level hidden states (T, hidden_size)
+            frame_rate: Frames per second
+            starts: Window start times in seconds (N,)
+            ends: Window end times in seconds (N,)
+        
+        Returns:
+            Embedding matrix (N, embedding_dim), float32, L2-normalized rows
+        """
+        num_frames = len(frames)
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        if num_frames == 0 or len(starts) == 0:
+            return np.zeros((len(starts), self.embedding_dim), dtype=np.float32)
+        
+        first = np.clip(np.floor(starts * frame_rate).astype(np.int64), 0, num_frames - 1)
+        last = np.clip(np.ceil(ends * frame_rate).astype(np.int64), 0, num_frames)
+        last = np.maximum(last, first + 1)  # At least one frame per window
+        
+        cumulative = np.zeros((num_frames + 1, frames.shape[1]), dtype=np.float64)
+        np.cumsum(frames, axis=0, out=cumulative[1:])
+        pooled = (cumulative[last] - cumulative[first]) / (last - first)[:, np.newaxis]
+        return self._finalize_embeddings(pooled)
     
     def save_embedding(self, embedding: np.ndarray, output_path: Path):
         """Save embedding to disk as .npy file."""
@@ -606,6 +1296,10 @@ class EmbeddingGenerator:
             "device": self.device,
             "has_mert": self.mert_model is not None,
             "has_muq": self.muq_model is not None,
-            "has_openl3": HAS_OPENL3
+            "has_openl3": HAS_OPENL3,
+            "track_pooling": self.supports_track_pooling,
+            "backend": self.backend,
+            "max_layer": self.max_layer,
+            "cpu_backend": self.cpu_backend.label if self.device == "cpu" and self.backend == "torch" else None
         }
 
@@ -1,17 +1,18 @@
 """Incremental FAISS index updates for new files."""
-import json
 import logging
-import time
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 import faiss
 import pandas as pd
+import yaml
 
+from .catalog_ingest import ingest_catalog
 from .load_model import load_fingerprint_model
-from .embed import segment_audio, extract_embeddings, normalize_embeddings
+from .embed import segment_audio_matrix, extract_embeddings, normalize_embeddings
 from .original_embeddings_cache import OriginalEmbeddingsCache
-from .query_index import load_index
+from .query_index import index_exists
+from .index_updates import MutableIndex
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,17 +23,25 @@ def update_index_incremental(
     existing_index_path: Path,
     fingerprint_config_path: Path,
     output_index_path: Path,
-    index_config_path: Path = None
+    index_config_path: Path = None,
+    num_workers: Optional[int] = None,
+    replace_existing: bool = False
 ) -> Tuple[faiss.Index, Dict]:
     """
     Add new files to existing index incrementally.
     
+    Files already in the index are skipped, or re-embedded and replaced
+    with replace_existing (see fingerprint.index_updates).
+    
     Args:
         new_files_manifest_path: Path to manifest CSV with new files
         existing_index_path: Path to existing FAISS index
         fingerprint_config_path: Path to fingerprint config YAML
         output_index_path: Path to save updated index
         index_config_path: Path to index config JSON (optional)
+        num_workers: Embedding worker processes (default: ``ingestion.num_workers``
+            from the fingerprint config; 1 embeds in-process)
+        replace_existing: Replace the vectors of files that are already indexed
         
     Returns:
         Tuple of (updated_index, updated_metadata)
@@ -44,25 +53,27 @@ def update_index_incremental(
     # Initialize cache
     cache = OriginalEmbeddingsCache()
     
-    # Load model config
-    model_config = load_fingerprint_model(fingerprint_config_path)
+    # Ingestion settings decide between in-process and pooled embedding
+    with open(fingerprint_config_path, 'r') as f:
+        ingestion_config = (yaml.safe_load(f) or {}).get("ingestion") or {}
+    if num_workers is None:
+        num_workers = ingestion_config.get("num_workers") or 1
     
     # Load existing index
     logger.info(f"Loading existing index from {existing_index_path}")
-    existing_index, existing_metadata = load_index(existing_index_path)
-    existing_ids = existing_metadata.get("ids", [])
-    logger.info(f"Existing index contains {existing_index.ntotal} vectors")
+    existing_index = MutableIndex.open(existing_index_path, output_path=output_index_path)
+    logger.info(f"Existing index contains {existing_index.index.ntotal} vectors")
     
     # Load new files manifest
     new_files_df = pd.read_csv(new_files_manifest_path)
     logger.info(f"Processing {len(new_files_df)} new files")
     
     # Process new files
-    new_embeddings = []
-    new_ids = []
     skipped_count = 0
     added_count = 0
+    replaced_files = set()
     
+    rows_to_add = []
     for _, row in new_files_df.iterrows():
         file_id = row["id"]
         file_path_str = row.get("file_path") or row.get("path")
@@ -76,82 +87,96 @@ def update_index_incremental(
             continue
         
         # Check if already in index
-        if any(f"{file_id}_seg" in id_str for id_str in existing_ids):
-            logger.info(f"File {file_id} already in index, skipping")
-            skipped_count += 1
-            continue
-        
-        # Get or generate embeddings
-        cached_embeddings, cached_segments = cache.get(file_id, file_path, model_config)
-        
-        if cached_embeddings is None:
-            # Generate and cache
-            logger.info(f"Generating embeddings for new file: {file_id}")
-            overlap_ratio = model_config.get("overlap_ratio", None)
-            segments = segment_audio(
-                file_path,
-                segment_length=model_config["segment_length"],
-                sample_rate=model_config["sample_rate"],
-                overlap_ratio=overlap_ratio
-            )
-            embeddings = extract_embeddings(
-                segments,
-                model_config,
-                output_dir=None,
-                save_embeddings=False
-            )
-            embeddings = normalize_embeddings(embeddings, method="l2")
+        if str(file_id) in existing_index:
+            if not replace_existing:
+                logger.info(f"File {file_id} already in index, skipping")
+                skipped_count += 1
+                continue
+            replaced_files.add(str(file_id))
+        rows_to_add.append(row)
+    
+    if num_workers > 1 and rows_to_add:
+        # Process pool: one model per worker, results cached as they complete
+        ingest = ingest_catalog(
+            pd.DataFrame(rows_to_add),
+            fingerprint_config_path,
+            cache=cache,
+            num_workers=num_workers,
+            threads_per_worker=ingestion_config.get("threads_per_worker"),
+            decode_threads=ingestion_config.get("decode_threads", 2)
+        )
+        embeddings_by_file = ingest.embeddings
+    else:
+        embeddings_by_file = {}
+        model_config = load_fingerprint_model(fingerprint_config_path) if rows_to_add else None
+        for row in rows_to_add:
+            file_id = row["id"]
+            file_path = Path(row.get("file_path") or row.get("path"))
             
-            # Cache for future use
-            cache.set(file_id, file_path, model_config, embeddings, segments)
-        else:
-            logger.info(f"Using cached embeddings for new file: {file_id}")
-            embeddings = cached_embeddings
-        
-        # Add to new embeddings list
-        for i, emb in enumerate(embeddings):
-            seg_id = f"{file_id}_seg_{i:04d}"
-            new_embeddings.append(emb)
-            new_ids.append(seg_id)
-            added_count += 1
+            # Get or generate embeddings
+            cached_embeddings, cached_segments = cache.get(file_id, file_path, model_config)
+            
+            if cached_embeddings is None:
+                # Generate and cache
+                logger.info(f"Generating embeddings for new file: {file_id}")
+                overlap_ratio = model_config.get("overlap_ratio", None)
+                segments = segment_audio_matrix(
+                    file_path,
+                    segment_length=model_config["segment_length"],
+                    sample_rate=model_config["sample_rate"],
+                    overlap_ratio=overlap_ratio
+                )
+                embeddings = extract_embeddings(
+                    segments,
+                    model_config,
+                    output_dir=None,
+                    save_embeddings=False
+                )
+                embeddings = normalize_embeddings(embeddings, method="l2")
+                
+                # Cache for future use
+                cache.set(file_id, file_path, model_config, embeddings, segments.to_dicts())
+            else:
+                logger.info(f"Using cached embeddings for new file: {file_id}")
+                embeddings = cached_embeddings
+            embeddings_by_file[str(file_id)] = embeddings
+    
+    # New files in manifest order
+    added_files = []
+    added_embeddings = []
+    for row in rows_to_add:
+        file_id = row["id"]
+        embeddings = embeddings_by_file.get(str(file_id))
+        if embeddings is None:
+            continue
+        added_files.append(str(file_id))
+        added_embeddings.append(np.asarray(embeddings, dtype=np.float32))
+        added_count += len(embeddings)
     
-    if not new_embeddings:
+    if not added_files:
         logger.info("No new files to add to index")
-        return existing_index, existing_metadata
-    
-    # Add to existing index
-    logger.info(f"Adding {len(new_ids)} new vectors to index")
-    new_embeddings_array = np.vstack(new_embeddings).astype(np.float32)
-    
-    # Check if index supports incremental addition
-    if hasattr(existing_index, 'add'):
-        existing_index.add(new_embeddings_array)
+        if existing_index.source_path != existing_index.index_path:
+            # Callers expect the output index to exist after an update
+            existing_index.save()
+            logger.info(f"Saved unchanged index to {output_index_path}")
+        return existing_index.index, existing_index.metadata
+    
+    logger.info(f"Adding {added_count} new vectors to index")
+    # Sharded indexes only rewrite the shards receiving files
+    if replaced_files:
+        logger.info(f"Replacing the vectors of {len(replaced_files)} files already in the index")
+        existing_index.replace_files(added_files, added_embeddings)
     else:
-        logger.error("Index type does not support incremental addition")
-        raise ValueError("Index type does not support incremental addition. Use rebuild_index instead.")
-    
-    # Update metadata
-    updated_ids = existing_ids + new_ids
-    updated_metadata = existing_metadata.copy()
-    updated_metadata["ids"] = updated_ids
-    updated_metadata["num_vectors"] = existing_index.ntotal
-    updated_metadata["last_updated"] = time.time()
-    
-    # Save updated index
-    output_index_path.parent.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(existing_index, str(output_index_path))
+        existing_index.add_files(added_files, added_embeddings)
     logger.info(f"Saved updated index to {output_index_path}")
     
-    # Save updated metadata
-    metadata_path = output_index_path.with_suffix(".json")
-    with open(metadata_path, 'w') as f:
-        json.dump(updated_metadata, f, indent=2)
-    logger.info(f"Saved updated metadata to {metadata_path}")
-    
-    logger.info(f"Incremental update complete: {added_count} vectors added, {skipped_count} files skipped")
-    logger.info(f"Total vectors in index: {existing_index.ntotal}")
+    logger.info(
+        f"Incremental update complete: {added_count} vectors added ({len(replaced_files)} files replaced), "
+        f"{skipped_count} files skipped"
+    )
+    logger.info(f"Total vectors in index: {existing_index.index.ntotal}")
     
-    return existing_index, updated_metadata
+    return existing_index.index, existing_index.metadata
 
 
 def rebuild_index_if_needed(
@@ -174,7 +199,7 @@ def rebuild_index_if_needed(
     Returns:
         Path to index file (existing or newly built)
     """
-    if force_rebuild or not index_path.exists():
+    if force_rebuild or not index_exists(index_path):
         logger.info("Building new index...")
         # This would call the index building logic from run_experiment.py
         # For now, return the path - actual rebuild should be done via run_experiment
@@ -0,0 +1,229 @@
+"""Binary metadata sidecar of a FAISS index (memory-mappable ID tables)."""
+import json
+import logging
+import os
+import subprocess
+import sys
+from collections.abc import Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_FORMAT_VERSION = 2
+
+# Sidecar files next to the index: faiss_index.bin -> faiss_index.ids.npy, ...
+SIDECAR_ARRAYS = ("ids", "file_table", "segment_files")
+DAW_METADATA_SUFFIX = ".daw.json"
+
+
+def generation_path(index_path: Path, generation: int) -> Path:
+    """
+    Index file of an update generation: faiss_index.bin -> faiss_index.g000003.bin
+
+    Generation 0 (a freshly built index) is index_path itself. Sidecar files
+    are named after the index file, so each generation has its own.
+    """
+    if not generation:
+        return index_path
+    return index_path.with_suffix(f".g{generation:06d}{index_path.suffix}")
+
+
+def sidecar_path(index_path: Path, name: str) -> Path:
+    """Path of a sidecar array (``ids``, ``file_table`` or ``segment_files``)."""
+    return index_path.with_suffix(f".{name}.npy")
+
+
+def daw_metadata_path(index_path: Path) -> Path:
+    return index_path.with_suffix(DAW_METADATA_SUFFIX)
+
+
+class IdTable(Sequence):
+    """
+    Read-only list of segment IDs backed by a fixed-width string array.
+
+    The array is usually memory-mapped from ``.ids.npy``, so processes
+    sharing an index share the page cache instead of each holding a list of
+    Python strings. Indexing returns ``str``.
+    """
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.array[item].tolist()
+        return str(self.array[item])
+
+    def tolist(self):
+        return self.array.tolist()
+
+    def __add__(self, other):
+        return self.tolist() + list(other)
+
+    def __repr__(self) -> str:
+        return f"IdTable({len(self)} ids)"
+
+
+@contextmanager
+def replacing(path: Path) -> Iterator[Path]:
+    """
+    Temporary path to write instead of path; it replaces path once the block completes.
+
+    The rename gives path a new file, so readers never see a partly written
+    file and processes mapping the previous version keep a valid mapping.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    yield tmp_path
+    os.replace(tmp_path, path)
+
+
+def atomic_write_json(path: Path, data, indent: Optional[int] = 2):
+    """Write JSON through a temporary file (see replacing)."""
+    with replacing(path) as tmp_path, open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent, default=str)
+        f.write("\n")
+
+
+def _save_array(path: Path, array: np.ndarray):
+    """np.save through a temporary file (see replacing)."""
+    with replacing(path) as tmp_path, open(tmp_path, 'wb') as f:
+        np.save(f, array, allow_pickle=False)
+
+
+def write_sidecar(
+    index_path: Path,
+    ids: Iterable[str],
+    file_table: Iterable[str],
+    segment_files: np.ndarray,
+    daw_metadata: Optional[Dict] = None
+) -> Dict[str, str]:
+    """
+    Write the ID tables (and DAW metadata, if any) next to an index.
+
+    Returns:
+        Sidecar file names by entry, for the JSON metadata
+    """
+    arrays = {
+        "ids": np.asarray(list(ids), dtype=str),
+        "file_table": np.asarray(list(file_table), dtype=str),
+        "segment_files": np.asarray(segment_files, dtype=np.int32),
+    }
+    files = {}
+    for name, array in arrays.items():
+        path = sidecar_path(index_path, name)
+        _save_array(path, array)
+        files[name] = path.name
+
+    path = daw_metadata_path(index_path)
+    if daw_metadata:
+        atomic_write_json(path, daw_metadata, indent=None)
+        files["daw_metadata"] = path.name
+    elif path.exists():
+        path.unlink()
+    return files
+
+
+def read_sidecar(
+    index_path: Path,
+    metadata: Dict,
+    mmap: bool = True,
+    with_daw_metadata: bool = True
+) -> Dict:
+    """
+    Fill index metadata from its sidecar files (in place).
+
+    ``ids`` becomes an IdTable, ``segment_files`` an int32 array and
+    ``file_table`` a list; arrays are memory-mapped unless mmap is False.
+    DAW metadata is only read when requested.
+    """
+    files = metadata.get("sidecar") or {}
+    mmap_mode = "r" if mmap else None
+    for name in SIDECAR_ARRAYS:
+        if name not in files:
+            continue
+        array = np.load(index_path.parent / files[name], mmap_mode=mmap_mode, allow_pickle=False)
+        if name == "ids":
+            metadata["ids"] = IdTable(array)
+        elif name == "file_table":
+            metadata["file_table"] = array.tolist()
+        else:
+            metadata["segment_files"] = array
+    if with_daw_metadata:
+        metadata["daw_metadata"] = {}
+        if "daw_metadata" in files:
+            with open(index_path.parent / files["daw_metadata"], 'r') as f:
+                metadata["daw_metadata"] = json.load(f)
+    return metadata
+
+
+_LOAD_PROBE = """
+import json, sys, time
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+import numpy as np
+from fingerprint.query_index import load_index, search_batch
+
+
+def rss():
+    fields = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    fields[key] = int(value.split()[0]) / 1024.0
+    except OSError:
+        import resource
+        fields["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return fields
+
+
+before = rss()
+start = time.perf_counter()
+index, metadata = load_index(Path(sys.argv[2]), mmap=sys.argv[3] == "1")
+loaded = time.perf_counter()
+queries = np.random.default_rng(0).standard_normal((8, index.d)).astype(np.float32)
+distances, indices, file_ids = search_batch(index, queries, 10, metadata)
+hit_ids = [metadata["ids"][i] for i in indices[0] if i >= 0]
+queried = time.perf_counter()
+after = rss()
+print(json.dumps({
+    "load_seconds": loaded - start,
+    "first_query_seconds": queried - loaded,
+    "rss_mb": after.get("VmRSS"),
+    "rss_anon_mb": after.get("RssAnon"),
+    "rss_delta_mb": after.get("VmRSS", 0.0) - before.get("VmRSS", 0.0),
+    "anon_delta_mb": after.get("RssAnon", 0.0) - before.get("RssAnon", 0.0),
+}))
+"""
+
+
+def index_loading_report(index_path: Path, mmap: bool = True, repeats: int = 3) -> Dict:
+    """
+    Cold-start cost of loading an index in a fresh process.
+
+    Each run starts a new interpreter, loads the index and metadata with
+    load_index and answers one small batched query (which faults in the
+    pages a memory-mapped index needs). The fastest run is reported.
+
+    Returns:
+        Dict with load_seconds, first_query_seconds, rss_mb / rss_anon_mb
+        (resident / private memory after the query) and their deltas over
+        the interpreter before loading
+    """
+    repo_root = str(Path(__file__).resolve().parent.parent)
+    runs = []
+    for _ in range(max(1, repeats)):
+        output = subprocess.run(
+            [sys.executable, "-c", _LOAD_PROBE, repo_root, str(index_path), "1" if mmap else "0"],
+            check=True, capture_output=True, text=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run["load_seconds"] + run["first_query_seconds"])
+    return {"index_path": str(index_path), "mmap": mmap, **best}
@@ -0,0 +1,306 @@
+"""FAISS index construction for every ``index_type`` of config/index_config.json."""
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+# Index types storing compressed vectors; built through faiss.index_factory
+# from the parameters (M, nlist, pq_m, pq_nbits) and trained on a sample
+COMPRESSED_INDEX_TYPES = ("ivf_pq", "opq_ivf_pq", "hnsw_sq8", "hnsw_fp16")
+INDEX_TYPES = ("flat", "hnsw", "ivf") + COMPRESSED_INDEX_TYPES
+
+# parameters.refine -> index_factory suffix. The refine stage re-ranks
+# refine_k_factor * topk candidates of the compressed index with stored
+# vectors (memory-mapped along with the index by load_index).
+REFINE_STAGES = {
+    "flat": "RFlat",  # Exact float32 vectors
+    "fp16": "Refine(SQfp16)",
+    "sq8": "Refine(SQ8)",
+}
+
+# k-means warns below 39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+DEFAULT_TRAIN_SIZE = 100000
+
+
+def index_parameters(index_config: Dict) -> Dict:
+    """
+    Parameters of the configured index type.
+
+    ``parameters`` holds settings shared by all types; the block of the
+    index type in ``parameters_by_type`` (if any) overrides them, so
+    switching ``index_type`` does not require editing the parameters.
+    """
+    params = dict(index_config.get("parameters") or {})
+    by_type = index_config.get("parameters_by_type") or {}
+    params.update(by_type.get(index_config.get("index_type", "hnsw")) or {})
+    return params
+
+
+def factory_string(index_type: str, params: Dict) -> str:
+    """index_factory description of a compressed index type (with its refine stage)."""
+    M = params.get("M", 32)
+    nlist = params.get("nlist", 1024)
+    pq_m = params.get("pq_m", 64)
+    pq_nbits = params.get("pq_nbits", 8)
+    if index_type == "ivf_pq":
+        description = f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    elif index_type == "opq_ivf_pq":
+        description = f"OPQ{pq_m},IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    elif index_type == "hnsw_sq8":
+        description = f"HNSW{M},SQ8"
+    elif index_type == "hnsw_fp16":
+        description = f"HNSW{M},SQfp16"
+    else:
+        raise ValueError(f"Unknown compressed index type: {index_type}")
+
+    refine = params.get("refine")
+    if refine:
+        if refine not in REFINE_STAGES:
+            raise ValueError(f"Unknown refine stage '{refine}', expected one of {list(REFINE_STAGES)}")
+        description += "," + REFINE_STAGES[refine]
+    return description
+
+
+def training_sample(vectors: np.ndarray, num_vectors: int, seed: int = 0) -> np.ndarray:
+    """Up to num_vectors rows of vectors, drawn without replacement (all rows if fewer)."""
+    if len(vectors) <= num_vectors:
+        return vectors
+    rows = np.sort(np.random.default_rng(seed).choice(len(vectors), size=num_vectors, replace=False))
+    return vectors[rows]
+
+
+def min_training_vectors(index_type: str, params: Dict) -> int:
+    """Smallest training set an index type can be trained on (PQ needs 2**pq_nbits)."""
+    if index_type in ("ivf_pq", "opq_ivf_pq"):
+        return 2 ** params.get("pq_nbits", 8)
+    return 1
+
+
+def _fit_to_training_set(index_type: str, params: Dict, dim: int, num_train: int) -> Dict:
+    """
+    Check PQ parameters against the dimension and shrink nlist to the training set.
+
+    Raises:
+        ValueError: If pq_m does not divide dim or there are too few training
+            vectors for the PQ codebooks
+    """
+    params = dict(params)
+    if index_type in ("ivf_pq", "opq_ivf_pq"):
+        pq_m = params.get("pq_m", 64)
+        if dim % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}")
+        if num_train < min_training_vectors(index_type, params):
+            raise ValueError(
+                f"{index_type} needs at least {min_training_vectors(index_type, params)} "
+                f"training vectors, got {num_train}"
+            )
+    if index_type in ("ivf", "ivf_pq", "opq_ivf_pq"):
+        nlist = params.get("nlist", 1024 if index_type != "ivf" else 100)
+        max_nlist = max(1, num_train // MIN_POINTS_PER_CENTROID)
+        if nlist > max_nlist:
+            logger.warning(f"Reducing nlist from {nlist} to {max_nlist} for {num_train} training vectors")
+            nlist = max_nlist
+        params["nlist"] = nlist
+    return params
+
+
+def create_index(
+    index_type: str,
+    dim: int,
+    metric: int,
+    params: Dict,
+    training_vectors: Optional[np.ndarray] = None
+) -> faiss.Index:
+    """
+    Create an empty (trained) index.
+
+    Args:
+        index_type: One of INDEX_TYPES
+        dim: Embedding dimension
+        metric: faiss.METRIC_INNER_PRODUCT or faiss.METRIC_L2
+        params: Parameters of the index type (see index_parameters)
+        training_vectors: Vectors to train IVF / PQ / SQ indexes on (already
+            normalized like the indexed vectors)
+
+    Returns:
+        FAISS index ready for add()
+    """
+    if index_type == "flat":
+        if metric == faiss.METRIC_INNER_PRODUCT:
+            return faiss.IndexFlatIP(dim)
+        return faiss.IndexFlatL2(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params.get("M", 32), metric)
+        index.hnsw.efConstruction = params.get("ef_construction", 200)
+        return index
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if training_vectors is None or len(training_vectors) == 0:
+        raise ValueError(f"{index_type} index needs training vectors")
+    training_vectors = np.ascontiguousarray(training_vectors, dtype=np.float32)
+    params = _fit_to_training_set(index_type, params, dim, len(training_vectors))
+
+    if index_type == "ivf":
+        quantizer = faiss.IndexFlatL2(dim) if metric == faiss.METRIC_L2 else faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], metric)
+        index.nprobe = params.get("nprobe", 10)
+        logger.info("Training IVF index...")
+        index.train(training_vectors)
+        return index
+
+    description = factory_string(index_type, params)
+    index = faiss.index_factory(dim, description, metric)
+    components = index_components(index)
+    if "hnsw" in components:
+        components["hnsw"].hnsw.efConstruction = params.get("ef_construction", 200)
+    if "ivf" in components:
+        components["ivf"].nprobe = params.get("nprobe", 16)
+    if "refine" in components:
+        components["refine"].k_factor = float(params.get("refine_k_factor", 4))
+    logger.info(f"Training {index_type} index ({description}) on {len(training_vectors)} vectors...")
+    index.train(training_vectors)
+    return index
+
+
+def index_components(index: faiss.Index) -> Dict[str, faiss.Index]:
+    """
+    Search-tunable layers of an index: ``hnsw``, ``ivf`` and ``refine`` (those present).
+
+    Looks through the refine wrapper and OPQ pre-transforms, so HNSW
+    efSearch, IVF nprobe and the refine k_factor can be set on any index type.
+    """
+    components = {}
+    if isinstance(index, faiss.IndexRefine):
+        components["refine"] = index
+        index = faiss.downcast_index(index.base_index)
+    if isinstance(index, faiss.IndexHNSW):
+        components["hnsw"] = index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        components["ivf"] = ivf
+    return components
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    SearchParameters that restrict a search to the IDs of selector.
+
+    Every layer keeps the index's current settings (efSearch, nprobe,
+    k_factor, as set by configure_search), since parameters passed to a
+    search replace them.
+    """
+    def layer_parameters(layer: faiss.Index) -> faiss.SearchParameters:
+        if isinstance(layer, faiss.IndexRefine):
+            base_params = layer_parameters(faiss.downcast_index(layer.base_index))
+            params = faiss.IndexRefineSearchParameters()
+            params.k_factor = layer.k_factor
+            params.base_index_params = base_params
+            params.referenced_objects = [base_params]  # Keeps the nested parameters alive
+        elif isinstance(layer, faiss.IndexPreTransform):
+            index_params = layer_parameters(faiss.downcast_index(layer.index))
+            params = faiss.SearchParametersPreTransform()
+            params.index_params = index_params
+            params.referenced_objects = [index_params]
+        elif isinstance(layer, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = layer.hnsw.efSearch
+        elif faiss.try_extract_index_ivf(layer) is not None:
+            params = faiss.SearchParametersIVF()
+            params.nprobe = faiss.try_extract_index_ivf(layer).nprobe
+        else:
+            params = faiss.SearchParameters()
+        params.sel = selector
+        return params
+
+    return layer_parameters(index)
+
+
+def _recall_at_k(indices: np.ndarray, true_indices: np.ndarray) -> float:
+    """Mean fraction of the exact top-k found in the approximate top-k."""
+    k = true_indices.shape[1]
+    found = [len(np.intersect1d(row[:k], truth)) for row, truth in zip(indices, true_indices)]
+    return float(np.mean(found)) / k
+
+
+def compare_index_types(
+    embeddings: np.ndarray,
+    queries: np.ndarray,
+    index_configs: Dict[str, Dict],
+    work_dir: Path,
+    topk: int = 10,
+    repeats: int = 3,
+    memory_probe: bool = True
+) -> List[Dict]:
+    """
+    Memory, recall and latency of index configurations on the same data.
+
+    Each configuration is built with build_index, loaded as queries load it
+    (memory-mapped) and searched with all queries in one batch. Recall@topk
+    is measured against exact inner-product search on normalized vectors.
+
+    Args:
+        embeddings: Vectors to index (N, D)
+        queries: Query vectors (Q, D)
+        index_configs: Index configs by name
+        work_dir: Directory for the built indexes
+        topk: Query depth
+        repeats: Timed search repeats (the fastest is reported)
+        memory_probe: Also measure resident memory of a fresh process that
+            loads the index and answers a query (see index_loading_report)
+
+    Returns:
+        One dict per configuration: name, index_type, build_seconds,
+        index_bytes, bytes_per_vector, recall_at_k, ms_per_query and (with
+        memory_probe) rss_mb / rss_anon_mb of the probe process
+    """
+    from .query_index import build_index, load_index, normalize_vectors, search_batch
+    from .index_sidecar import index_loading_report
+
+    embeddings = normalize_vectors(embeddings)
+    queries = normalize_vectors(queries)
+    true_indices = np.argsort(-(queries @ embeddings.T), axis=1)[:, :topk]
+    ids = [f"vec{k:08d}_seg_0000" for k in range(len(embeddings))]
+
+    report = []
+    for name, index_config in index_configs.items():
+        index_path = Path(work_dir) / name / "faiss_index.bin"
+        start = time.perf_counter()
+        build_index(embeddings, ids, index_path, index_config)
+        build_seconds = time.perf_counter() - start
+
+        index, metadata = load_index(index_path, with_daw_metadata=False)
+        search_batch(index, queries[:1], topk, metadata)  # Fault in pages
+        timings = []
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            _, indices, _ = search_batch(index, queries, topk, metadata)
+            timings.append(time.perf_counter() - start)
+
+        index_bytes = index_path.stat().st_size
+        row = {
+            "name": name,
+            "index_type": index_config.get("index_type", "hnsw"),
+            "build_seconds": build_seconds,
+            "index_bytes": index_bytes,
+            "bytes_per_vector": index_bytes / len(embeddings),
+            "recall_at_k": _recall_at_k(indices, true_indices),
+            "ms_per_query": 1000.0 * min(timings) / len(queries),
+        }
+        del index
+        if memory_probe:
+            probe = index_loading_report(index_path, mmap=True, repeats=1)
+            row["rss_mb"] = probe["rss_mb"]
+            row["rss_anon_mb"] = probe["rss_anon_mb"]
+        report.append(row)
+        logger.info(
+            f"{name}: recall@{topk}={row['recall_at_k']:.3f}, {row['ms_per_query']:.3f} ms/query, "
+            f"{row['bytes_per_vector']:.0f} B/vector"
+        )
+    return report
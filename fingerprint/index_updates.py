@@ -0,0 +1,462 @@
+"""File-level updates of a saved index: removal, replacement and compaction.
+
+Index vectors are addressed by position, and the segment map
+(fingerprint.segment_map) is the ID layer between files and positions, so
+file membership is a dict lookup and a file's vectors are an integer range.
+Flat indexes drop a removed file's vectors right away. Graph and
+inverted-file indexes (HNSW, IVF, PQ, refine) cannot remove vectors
+cheaply, so their vectors are tombstoned instead: marked removed in the
+segment map (file code -1) and skipped by searches (search_index) until
+compaction rebuilds the index without them. PeriodicIndexCompaction
+compacts on a background thread once enough of an index is tombstoned.
+
+Every update is saved as one atomic change of index and metadata
+(query_index.save_index).
+"""
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import faiss
+
+from .index_sidecar import IdTable
+from .periodic_task import PeriodicTask, start_periodic_task
+from .query_index import append_files, load_index, save_index, _read_metadata
+from .segment_map import SegmentFileMap, segment_file_map, public_metadata
+
+logger = logging.getLogger(__name__)
+
+# Share of tombstoned vectors above which an index is compacted
+DEFAULT_COMPACTION_RATIO = 0.1
+# Vectors reconstructed and re-added per batch during compaction
+COMPACTION_BATCH_SIZE = 65536
+
+_index_locks: Dict[str, threading.RLock] = {}
+_index_locks_lock = threading.Lock()
+
+
+def index_lock(index_path: Path) -> threading.RLock:
+    """Lock that serializes updates of one index within this process."""
+    key = str(Path(index_path).resolve())
+    with _index_locks_lock:
+        return _index_locks.setdefault(key, threading.RLock())
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    """Whether vectors can be removed from the index itself (flat storage, later positions move down)."""
+    return isinstance(index, faiss.IndexFlatCodes)
+
+
+def _ids_array(ids) -> np.ndarray:
+    if isinstance(ids, IdTable):
+        return np.asarray(ids.array)
+    return np.asarray(list(ids if ids is not None else []), dtype=str)
+
+
+def _updated_metadata(
+    index: faiss.Index,
+    metadata: Dict,
+    ids,
+    mapping: SegmentFileMap,
+    removed_files: Iterable[str] = ()
+) -> Dict:
+    """Metadata of an index after its vectors or file table changed."""
+    updated = public_metadata(metadata)
+    updated.pop("file_ranges", None)
+    updated["ids"] = ids
+    updated["file_table"] = mapping.file_ids
+    updated["segment_files"] = mapping.segment_files
+    updated["num_vectors"] = index.ntotal
+    updated["last_updated"] = time.time()
+    removed_files = set(removed_files)
+    if removed_files and updated.get("daw_metadata"):
+        updated["daw_metadata"] = {file_id: data for file_id, data in updated["daw_metadata"].items()
+                                   if str(file_id) not in removed_files}
+    updated["_segment_map"] = mapping
+    return updated
+
+
+def _save(index: faiss.Index, index_path: Path, metadata: Dict, mapping: SegmentFileMap) -> Dict:
+    saved = save_index(index, index_path, metadata, segment_map=mapping)
+    saved["_segment_map"] = mapping
+    saved["_index_path"] = str(index_path)
+    return saved
+
+
+def remove_files(
+    index: faiss.Index,
+    metadata: Dict,
+    index_path: Path,
+    file_ids: Iterable[str],
+    save: bool = True
+) -> Dict:
+    """
+    Remove the vectors of files from an index.
+
+    Flat indexes lose the vectors right away; other index types keep them
+    as tombstones until compact_index.
+
+    Args:
+        index: Index loaded with mmap=False
+        metadata: Its metadata (from load_index)
+        index_path: Where to save the updated index
+        file_ids: Files to remove (files not in the index are ignored)
+        save: Save index and metadata
+
+    Returns:
+        Updated metadata (the given metadata if none of the files is indexed)
+    """
+    mapping = segment_file_map(metadata) or SegmentFileMap([], np.empty(0, dtype=np.int32))
+    removed = [str(file_id) for file_id in file_ids if file_id in mapping]
+    if not removed:
+        return metadata
+
+    updated_map = mapping.without_files(removed)
+    ids = metadata.get("ids")
+    if supports_removal(index):
+        positions = updated_map.removed_positions()
+        index.remove_ids(faiss.IDSelectorBatch(positions))
+        updated_map, kept = updated_map.compacted()
+        ids = IdTable(_ids_array(ids)[kept])
+        logger.info(f"Removed {len(positions)} vectors of {len(removed)} files")
+    else:
+        logger.info(
+            f"Tombstoned {updated_map.num_removed - mapping.num_removed} vectors of {len(removed)} files "
+            f"({updated_map.num_removed} of {index.ntotal} vectors removed)"
+        )
+
+    updated = _updated_metadata(index, metadata, ids, updated_map, removed_files=removed)
+    return _save(index, index_path, updated, updated_map) if save else updated
+
+
+def replace_files(
+    index: faiss.Index,
+    metadata: Dict,
+    index_path: Path,
+    file_ids: List[str],
+    embeddings: List[np.ndarray]
+) -> Dict:
+    """
+    Replace the vectors of files (or add them, if they are not indexed yet).
+
+    The old vectors are removed as in remove_files and the new ones
+    appended; both are saved as one update.
+
+    Returns:
+        Updated metadata
+    """
+    metadata = remove_files(index, metadata, index_path, file_ids, save=False)
+    return append_files(index, metadata, index_path, file_ids, embeddings)
+
+
+def compact_index(
+    index: faiss.Index,
+    metadata: Dict,
+    index_path: Path,
+    save: bool = True
+) -> Tuple[faiss.Index, Dict]:
+    """
+    Rebuild an index without its tombstoned vectors.
+
+    The remaining vectors are reconstructed from the index and added to an
+    empty copy of it (trained quantizers, OPQ rotations and graph
+    parameters are kept). Indexes with a refine stage reconstruct the
+    stored vectors exactly; IVF-PQ indexes without one re-encode their
+    decoded vectors, which gives back the same codes for nearly all of them.
+
+    Args:
+        index: Index loaded with mmap=False
+        metadata: Its metadata
+        index_path: Where to save the compacted index
+        save: Save index and metadata
+
+    Returns:
+        Tuple of (index, metadata); the given ones if nothing was tombstoned
+    """
+    mapping = segment_file_map(metadata)
+    if mapping is None or not mapping.num_removed:
+        return index, metadata
+
+    start = time.time()
+    compacted_map, kept = mapping.compacted()
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()  # For reconstruct
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    rebuilt_ivf = faiss.try_extract_index_ivf(rebuilt)
+    if rebuilt_ivf is not None:
+        rebuilt_ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    for offset in range(0, len(kept), COMPACTION_BATCH_SIZE):
+        rebuilt.add(index.reconstruct_batch(kept[offset:offset + COMPACTION_BATCH_SIZE]))
+
+    ids = IdTable(_ids_array(metadata.get("ids"))[kept])
+    updated = _updated_metadata(rebuilt, metadata, ids, compacted_map)
+    logger.info(
+        f"Compacted index: {mapping.num_removed} tombstoned vectors dropped, "
+        f"{rebuilt.ntotal} kept ({time.time() - start:.1f}s)"
+    )
+    if save:
+        updated = _save(rebuilt, index_path, updated, compacted_map)
+    return rebuilt, updated
+
+
+def removed_ratio(metadata: Optional[Dict]) -> float:
+    """Share of an index's vectors that are tombstoned (from metadata or saved JSON metadata)."""
+    if not metadata:
+        return 0.0
+    mapping = metadata.get("_segment_map")
+    if mapping is not None:
+        return mapping.num_removed / max(1, len(mapping))
+    return int(metadata.get("num_removed") or 0) / max(1, int(metadata.get("num_vectors") or 0))
+
+
+class MutableIndex:
+    """
+    A saved index with file-level updates.
+
+    ``file_id in index`` is a lookup in the file table of the segment map.
+    Files are added, removed and replaced with add_files / remove_file /
+    replace_file; each call saves index and metadata as one atomic update.
+    Before an update the index is reloaded if another writer (e.g.
+    PeriodicIndexCompaction) saved a newer generation in the meantime.
+    Sharded indexes update only the shards holding the files.
+
+    Updates from several threads of one process are serialized (index_lock);
+    separate processes must not update the same index concurrently.
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        index: Optional[faiss.Index] = None,
+        metadata: Optional[Dict] = None,
+        output_path: Optional[Path] = None,
+        compaction_ratio: Optional[float] = None
+    ):
+        """
+        Args:
+            index_path: Saved index
+            index: The index loaded with mmap=False (loaded from index_path if omitted)
+            metadata: Its metadata
+            output_path: Where updates are saved (default: index_path)
+            compaction_ratio: Tombstoned share from which needs_compaction is true
+                (default: ``maintenance.compaction_ratio`` of the index config)
+        """
+        self.source_path = Path(index_path)
+        self.index_path = Path(output_path) if output_path is not None else self.source_path
+        if index is None:
+            index, metadata = load_index(self.source_path, mmap=False)
+        self.index = index
+        self.metadata = metadata
+        if compaction_ratio is None:
+            maintenance = (self.metadata.get("config") or {}).get("maintenance") or {}
+            compaction_ratio = maintenance.get("compaction_ratio", DEFAULT_COMPACTION_RATIO)
+        self.compaction_ratio = compaction_ratio
+        self._lock = index_lock(self.index_path)
+
+    @classmethod
+    def open(cls, index_path: Path, output_path: Optional[Path] = None) -> "MutableIndex":
+        """
+        Load an index for updates and start its background compaction
+        (if ``maintenance.compaction_interval_minutes`` is configured).
+        """
+        index = cls(index_path, output_path=output_path)
+        start_periodic_compaction(index.index_path, index.metadata.get("config"))
+        return index
+
+    @property
+    def sharded(self) -> bool:
+        return hasattr(self.index, "shards")
+
+    @property
+    def file_map(self) -> SegmentFileMap:
+        return segment_file_map(self.metadata) or SegmentFileMap([], np.empty(0, dtype=np.int32))
+
+    def __contains__(self, file_id) -> bool:
+        return file_id in self.file_map
+
+    @property
+    def num_files(self) -> int:
+        return self.file_map.num_files
+
+    @property
+    def num_removed(self) -> int:
+        """Tombstoned vectors (still in the index, skipped by searches)."""
+        return self.file_map.num_removed
+
+    @property
+    def removed_ratio(self) -> float:
+        if self.sharded:
+            return max((removed_ratio(metadata) for metadata in self.index.shard_metadata), default=0.0)
+        return self.num_removed / max(1, self.index.ntotal)
+
+    def needs_compaction(self) -> bool:
+        return self.num_removed > 0 and self.removed_ratio >= self.compaction_ratio
+
+    def _sync(self):
+        """Reload the index if a newer generation was saved since it was loaded."""
+        if self.index_path != self.source_path:
+            return
+        saved = _read_metadata(self.index_path) or {}
+        if int(saved.get("generation") or 0) > int(self.metadata.get("generation") or 0):
+            logger.info(f"Reloading {self.index_path} (generation {saved['generation']})")
+            self.index, self.metadata = load_index(self.index_path, mmap=False)
+
+    def _saved(self, metadata: Dict):
+        self.metadata = metadata
+        self.source_path = self.index_path
+
+    def add_files(self, file_ids: List[str], embeddings: List[np.ndarray]):
+        """Add new files (embeddings (N_segments, D) per file)."""
+        with self._lock:
+            self._sync()
+            if self.sharded:
+                self._saved(self.index.add_files(file_ids, embeddings, self.index_path))
+            else:
+                self._saved(append_files(self.index, self.metadata, self.index_path, file_ids, embeddings))
+
+    def remove_files(self, file_ids: Iterable[str]) -> int:
+        """
+        Remove files from the index.
+
+        Returns:
+            Number of files removed (files not in the index are ignored)
+        """
+        with self._lock:
+            self._sync()
+            removed = [str(file_id) for file_id in file_ids if file_id in self]
+            if not removed:
+                return 0
+            if self.sharded:
+                self._saved(self.index.remove_files(removed, self.index_path))
+            else:
+                self._saved(remove_files(self.index, self.metadata, self.index_path, removed))
+            return len(removed)
+
+    def remove_file(self, file_id) -> bool:
+        """Remove one file; False if it is not in the index."""
+        return self.remove_files([file_id]) > 0
+
+    def replace_files(self, file_ids: List[str], embeddings: List[np.ndarray]):
+        """Replace the vectors of files (files not in the index are added)."""
+        with self._lock:
+            self._sync()
+            if self.sharded:
+                self._saved(self.index.replace_files(file_ids, embeddings, self.index_path))
+            else:
+                self._saved(replace_files(self.index, self.metadata, self.index_path, file_ids, embeddings))
+
+    def replace_file(self, file_id, embeddings: np.ndarray):
+        """Replace the vectors of one file (added if it is not in the index)."""
+        self.replace_files([str(file_id)], [embeddings])
+
+    def save(self):
+        """Save the index as it is (e.g. to output_path when no update wrote it there)."""
+        with self._lock:
+            self._sync()
+            if self.sharded:
+                self._saved(self.index._update_shards({}, self.index_path))
+            else:
+                self._saved(_save(self.index, self.index_path, self.metadata, self.file_map))
+
+    def compact(self, force: bool = False) -> int:
+        """
+        Rebuild the index without its tombstoned vectors.
+
+        Args:
+            force: Compact whenever anything is tombstoned (default: only
+                when needs_compaction)
+
+        Returns:
+            Number of vectors dropped
+        """
+        with self._lock:
+            self._sync()
+            num_removed = self.num_removed
+            if not num_removed or not (force or self.needs_compaction()):
+                return 0
+            if self.sharded:
+                self._saved(self.index.compact(self.index_path, min_ratio=0.0 if force else self.compaction_ratio))
+            else:
+                self.index, metadata = compact_index(self.index, self.metadata, self.index_path)
+                self._saved(metadata)
+            return num_removed - self.num_removed
+
+
+def compaction_due(index_path: Path, min_ratio: float = DEFAULT_COMPACTION_RATIO) -> bool:
+    """Whether a saved index (or any of its shards) has at least min_ratio of its vectors tombstoned."""
+    metadata = _read_metadata(index_path)
+    if not metadata:
+        return False
+    if "sharding" in metadata:
+        return any(compaction_due(index_path.parent / name, min_ratio) for name in metadata["sharding"]["shards"])
+    return int(metadata.get("num_removed") or 0) > 0 and removed_ratio(metadata) >= min_ratio
+
+
+def compact_saved_index(index_path: Path, min_ratio: float = DEFAULT_COMPACTION_RATIO) -> int:
+    """
+    Compact a saved index if enough of it is tombstoned.
+
+    The JSON metadata is checked first, so indexes that need no compaction
+    are not loaded.
+
+    Returns:
+        Number of vectors dropped
+    """
+    with index_lock(index_path):
+        if not compaction_due(index_path, min_ratio):
+            return 0
+        return MutableIndex(index_path, compaction_ratio=min_ratio).compact()
+
+
+class PeriodicIndexCompaction(PeriodicTask):
+    """Runs compact_saved_index on a daemon thread every interval_seconds."""
+
+    name = "index-compaction"
+
+    def __init__(self, index_path: Path, interval_seconds: float, min_ratio: float = DEFAULT_COMPACTION_RATIO):
+        """
+        Args:
+            index_path: Saved index to compact
+            interval_seconds: Pause between checks (the first check runs immediately)
+            min_ratio: Tombstoned share that triggers compaction
+        """
+        super().__init__(interval_seconds)
+        self.index_path = Path(index_path)
+        self.min_ratio = min_ratio
+        self.last_dropped: Optional[int] = None
+
+    def run_once(self):
+        self.last_dropped = compact_saved_index(self.index_path, self.min_ratio)
+
+
+def start_periodic_compaction(index_path: Path, index_config: Optional[Dict] = None) -> Optional[PeriodicIndexCompaction]:
+    """
+    Start background compaction of an index as configured in ``maintenance``.
+
+    At most one task runs per index; nothing is started when
+    ``compaction_interval_minutes`` is not set.
+
+    Args:
+        index_path: Saved index
+        index_config: Index configuration (e.g. ``metadata["config"]``)
+
+    Returns:
+        The running task, or None if periodic compaction is disabled
+    """
+    maintenance = (index_config or {}).get("maintenance") or {}
+    interval_minutes = maintenance.get("compaction_interval_minutes")
+    if not interval_minutes:
+        return None
+
+    def create() -> PeriodicIndexCompaction:
+        logger.info(f"Index compaction scheduled every {interval_minutes} min for {index_path}")
+        return PeriodicIndexCompaction(
+            index_path, interval_minutes * 60,
+            min_ratio=maintenance.get("compaction_ratio", DEFAULT_COMPACTION_RATIO)
+        )
+
+    return start_periodic_task(index_path, create)
@@ -35,10 +35,17 @@ def compute_file_hash(file_path: Path, algorithm: str = "sha256") -> str:
     return hash_obj.hexdigest()
 
 
-def load_fingerprint_model(config_path: Path) -> Dict[str, Any]:
+def load_fingerprint_model(config_path: Path, use_server: bool = True) -> Dict[str, Any]:
     """
     Load fingerprint model according to config.
     
+    If a model server (fingerprint.model_server) is running for the same
+    config, its client is used instead of loading the model in-process.
+    
+    Args:
+        config_path: Fingerprint config YAML
+        use_server: Use a running model server when ``model_server.enabled``
+    
     Returns:
         Dictionary with 'model' (EmbeddingGenerator) and 'config' (dict)
     """
@@ -50,6 +57,8 @@ def load_fingerprint_model(config_path: Path) -> Dict[str, Any]:
     audio_config = config.get("audio", {})
     embedding_config = config.get("embedding", {})
     segmentation_config = config.get("segmentation", {})
+    track_pooling_config = model_config.get("track_pooling") or {}
+    batching_config = embedding_config.get("batching") or {}
     
     # Verify model checksum if specified
     model_path = model_config.get("path")
@@ -60,8 +69,16 @@ def load_fingerprint_model(config_path: Path) -> Dict[str, Any]:
         if actual_checksum != expected_checksum:
             logger.warning(f"Model checksum mismatch! Expected {expected_checksum}, got {actual_checksum}")
     
+    # Reuse the model held by a running model server
+    generator = None
+    if use_server and HAS_EMBEDDING_GENERATOR:
+        from fingerprint.model_server import connect_model_server
+        generator = connect_model_server(config)
+    
     # Initialize embedding generator
-    if HAS_EMBEDDING_GENERATOR:
+    if generator is not None:
+        logger.info(f"✅ Using {generator.active_model_name} model from model server")
+    elif HAS_EMBEDDING_GENERATOR:
         try:
             generator = EmbeddingGenerator(
                 embedding_dim=embedding_config.get("dimension", 512),
@@ -69,7 +86,16 @@ def load_fingerprint_model(config_path: Path) -> Dict[str, Any]:
                 model_type=model_config.get("type", "auto"),  # Try "auto" to fallback gracefully
                 device=model_config.get("device"),
                 model_name=model_config.get("model_name"),  # Optional MERT model name
-                dtype=embedding_config.get("dtype", "float32")  # FP16 for speed, FP32 for accuracy
+                dtype=embedding_config.get("dtype", "float32"),  # FP16 for speed, FP32 for accuracy
+                track_pooling=track_pooling_config.get("enabled", False),
+                track_chunk_seconds=track_pooling_config.get("chunk_seconds", 30.0),
+                track_context_seconds=track_pooling_config.get("context_seconds", 5.0),
+                batch_budget_seconds=batching_config.get("budget_seconds", 120.0),
+                bucket_width_seconds=batching_config.get("bucket_width_seconds", 0.25),
+                cpu_backend=model_config.get("cpu_backend"),
+                backend=model_config.get("backend") or "torch",
+                onnx_backend=model_config.get("onnx"),
+                max_layer=model_config.get("max_layer")
             )
             logger.info(f"✅ Loaded {generator.active_model_name} model")
         except Exception as e:
@@ -114,32 +140,62 @@ class FallbackEmbeddingGenerator:
     
     def generate_embedding(self, audio_path: Path):
         """Generate embedding using librosa features."""
-        import numpy as np
         import librosa
         
         y, sr = librosa.load(str(audio_path), sr=self.sample_rate, mono=True)
+        return self.generate_embedding_from_audio(y, sr)
+    
+    def generate_embedding_from_audio(self, audio, sr: int):
+        """Generate embedding for a single in-memory audio signal."""
+        import numpy as np
+        
+        return self.generate_embeddings_from_audio(np.asarray(audio)[np.newaxis, :], sr)[0]
+    
+    def generate_embeddings_from_audio(self, audio, sample_rate: int, batch_size: int = 32):
+        """
+        Generate embeddings for a stack of equal-length in-memory segments.
+        
+        Args:
+            audio: Segment audio buffer (N, samples)
+            sample_rate: Sample rate of the buffer
+            batch_size: Unused; kept for API parity with EmbeddingGenerator
+        
+        Returns:
+            Embedding matrix (N, embedding_dim), float32, L2-normalized rows
+        """
+        import numpy as np
+        import librosa
+        
+        y = np.asarray(audio, dtype=np.float32)
+        if y.ndim == 1:
+            y = y[np.newaxis, :]
+        sr = sample_rate
+        if sr != self.sample_rate:
+            y = librosa.resample(y, orig_sr=sr, target_sr=self.sample_rate, axis=-1)
+            sr = self.sample_rate
         
-        # Extract features
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr)  # Fixed: chroma_stft instead of chroma
+        # Extract features. MFCC (dB clipping) and chroma (tuning estimate) are
+        # computed over all channels at once by librosa, so keep them per segment.
+        mfcc = np.stack([librosa.feature.mfcc(y=row, sr=sr, n_mfcc=13) for row in y])
+        chroma = np.stack([librosa.feature.chroma_stft(y=row, sr=sr) for row in y])
         spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
         
-        # Concatenate and flatten
+        # Concatenate per-segment feature means
         features = np.concatenate([
-            mfcc.mean(axis=1),
-            chroma.mean(axis=1),
-            spectral_centroid.mean(axis=1, keepdims=True).flatten()
-        ])
+            mfcc.mean(axis=-1),
+            chroma.mean(axis=-1),
+            spectral_centroid.mean(axis=-1)
+        ], axis=1)
         
         # Pad or truncate to embedding_dim
-        if len(features) < self.embedding_dim:
-            features = np.pad(features, (0, self.embedding_dim - len(features)))
+        if features.shape[1] < self.embedding_dim:
+            features = np.pad(features, ((0, 0), (0, self.embedding_dim - features.shape[1])))
         else:
-            features = features[:self.embedding_dim]
+            features = features[:, :self.embedding_dim]
         
         # Normalize
-        norm = np.linalg.norm(features)
-        if norm > 0:
-            features = features / norm
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        norms = np.where(norms > 0, norms, 1)
+        features = features / norms
         
         return features.astype(np.float32)
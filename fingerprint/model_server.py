@@ -0,0 +1,410 @@
+"""
+Persistent embedding model server.
+
+One long-lived process owns a loaded EmbeddingGenerator and serves embedding
+requests over localhost HTTP, so CLI tools and the web UI stop loading MERT
+from scratch in every process. ``load_fingerprint_model`` detects a running
+server for the same fingerprint config and returns a RemoteEmbeddingGenerator
+in place of the in-process model; without a server it loads in-process.
+
+Run with:
+    python -m fingerprint.model_server --config config/fingerprint_v1.yaml
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import queue
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+
+from .embedding_generator import EmbeddingGenerator
+from utils.error_handler import EmbeddingError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def config_fingerprint(config: Dict) -> str:
+    """Hash of a fingerprint config; clients only use a server loaded from the same config."""
+    config_str = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.md5(config_str.encode()).hexdigest()[:16]
+
+
+def server_url(server_config: Optional[Dict] = None) -> str:
+    """Base URL from the ``model_server`` config section."""
+    server_config = server_config or {}
+    host = server_config.get("host", DEFAULT_HOST)
+    port = server_config.get("port", DEFAULT_PORT)
+    return f"http://{host}:{port}"
+
+
+def _pack(**arrays) -> bytes:
+    """Serialize arrays as an uncompressed .npz payload."""
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _unpack(payload: bytes) -> Dict[str, np.ndarray]:
+    """Deserialize an .npz payload."""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+class ModelServer:
+    """
+    Localhost HTTP server around one loaded fingerprint model.
+
+    Endpoints:
+        GET  /health        JSON model info and config hash
+        POST /embed         npz {audio (N, samples) | audio_0..audio_{n-1}, sample_rate} -> npz {embeddings}
+        POST /track_frames  npz {audio (samples,), sample_rate} -> npz {frames, frame_rate}
+
+    HTTP handler threads only decode requests; all model calls run on one
+    worker thread. Equal-length segment stacks that arrive together (e.g.
+    concurrent queries) are concatenated into a single model call.
+    """
+
+    def __init__(
+        self,
+        model_config: Dict[str, Any],
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        max_batch_segments: int = 256
+    ):
+        """
+        Initialize model server.
+
+        Args:
+            model_config: Output of load_fingerprint_model (loaded in-process)
+            host: Interface to bind (keep on localhost; there is no authentication)
+            port: TCP port (0 picks a free port)
+            max_batch_segments: Max segments coalesced into one model call
+        """
+        self.model_config = model_config
+        self.generator = model_config["model"]
+        self.config_hash = config_fingerprint(model_config.get("config", {}))
+        self.max_batch_segments = max_batch_segments
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._work, name="model-server-worker", daemon=True)
+        self._serve_thread = None
+
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") == "/health":
+                    self._send(200, json.dumps(server.info()).encode(), "application/json")
+                else:
+                    self._send(404, json.dumps({"status": "error", "message": "Not found"}).encode(), "application/json")
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = _unpack(self.rfile.read(length))
+                    if self.path.rstrip("/") == "/embed":
+                        embeddings = server.submit("embed", request).result()
+                        self._send(200, _pack(embeddings=embeddings), "application/octet-stream")
+                    elif self.path.rstrip("/") == "/track_frames":
+                        frames, frame_rate = server.submit("track_frames", request).result()
+                        self._send(200, _pack(frames=frames, frame_rate=np.float64(frame_rate)), "application/octet-stream")
+                    else:
+                        self._send(404, json.dumps({"status": "error", "message": "Not found"}).encode(), "application/json")
+                except Exception as e:
+                    logger.error(f"Model server request {self.path} failed: {e}")
+                    self._send(500, json.dumps({"status": "error", "message": str(e)}).encode(), "application/json")
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self.host, self.port = self._httpd.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def info(self) -> Dict:
+        """Model description returned by /health."""
+        generator = self.generator
+        model_info = generator.get_model_info() if hasattr(generator, "get_model_info") else {}
+        return {
+            "status": "ok",
+            "config_hash": self.config_hash,
+            "model_class": str(type(generator)),
+            "active_model": getattr(generator, "active_model_name", type(generator).__name__),
+            "embedding_dim": int(getattr(generator, "embedding_dim", self.model_config.get("embedding_dim", 512))),
+            "sample_rate": int(getattr(generator, "sample_rate", self.model_config.get("sample_rate", 44100))),
+            "supports_track_pooling": bool(getattr(generator, "supports_track_pooling", False)),
+            "max_layer": getattr(generator, "max_layer", None),
+            "model_info": json.loads(json.dumps(model_info, default=str)),
+        }
+
+    def submit(self, kind: str, request: Dict[str, np.ndarray]) -> Future:
+        """Queue a decoded request for the model worker."""
+        future = Future()
+        self._requests.put((kind, request, future))
+        return future
+
+    def _work(self):
+        """Model worker: drain pending requests and coalesce equal-length stacks."""
+        while True:
+            pending = [self._requests.get()]
+            if pending[0] is None:
+                return
+            num_segments = _num_segments(pending[0][1])
+            while num_segments < self.max_batch_segments:
+                try:
+                    item = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._requests.put(None)  # Stop after this round
+                    break
+                pending.append(item)
+                num_segments += _num_segments(item[1])
+
+            stacks = {}
+            for kind, request, future in pending:
+                if kind == "embed" and "audio" in request and request["audio"].ndim == 2:
+                    key = (int(request["sample_rate"]), request["audio"].shape[1])
+                    stacks.setdefault(key, []).append((request, future))
+                else:
+                    self._run_single(kind, request, future)
+
+            for (sample_rate, _), items in stacks.items():
+                try:
+                    audio = np.concatenate([request["audio"] for request, _ in items]).astype(np.float32, copy=False)
+                    embeddings = self.generator.generate_embeddings_from_audio(audio, sample_rate)
+                    offset = 0
+                    for request, future in items:
+                        count = len(request["audio"])
+                        future.set_result(np.asarray(embeddings[offset:offset + count], dtype=np.float32))
+                        offset += count
+                    if len(items) > 1:
+                        logger.debug(f"Coalesced {len(items)} requests into one batch of {len(audio)} segments")
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
+
+    def _run_single(self, kind: str, request: Dict[str, np.ndarray], future: Future):
+        try:
+            sample_rate = int(request["sample_rate"])
+            if kind == "track_frames":
+                future.set_result(self.generator.generate_track_frame_embeddings(request["audio"], sample_rate))
+            else:
+                audio_list = [request[f"audio_{i}"] for i in range(_num_segments(request))]
+                if hasattr(self.generator, "generate_embeddings_from_audio_list"):
+                    embeddings = self.generator.generate_embeddings_from_audio_list(audio_list, sample_rate)
+                else:
+                    embeddings = np.vstack([
+                        self.generator.generate_embedding_from_audio(audio, sample_rate) for audio in audio_list
+                    ])
+                future.set_result(np.asarray(embeddings, dtype=np.float32))
+        except Exception as e:
+            future.set_exception(e)
+
+    def start(self) -> "ModelServer":
+        """Serve in background threads (returns immediately)."""
+        self._worker.start()
+        self._serve_thread = threading.Thread(target=self._httpd.serve_forever, name="model-server-http", daemon=True)
+        self._serve_thread.start()
+        logger.info(f"Model server listening on {self.url} ({self.info()['active_model']})")
+        return self
+
+    def serve_forever(self):
+        """Serve until interrupted."""
+        self.start()
+        try:
+            self._serve_thread.join()
+        except KeyboardInterrupt:
+            logger.info("Shutting down model server")
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._requests.put(None)
+
+
+def _num_segments(request: Dict[str, np.ndarray]) -> int:
+    if "audio" in request:
+        return len(request["audio"]) if request["audio"].ndim == 2 else 1
+    return sum(1 for key in request if key.startswith("audio_"))
+
+
+class RemoteEmbeddingGenerator:
+    """
+    Client for a running ModelServer with the EmbeddingGenerator embedding API.
+
+    Drop-in for the in-process model in ``model_config["model"]``: segment
+    stacks, ragged segment lists and track-level frame passes are sent to the
+    server; frame pooling runs locally.
+    """
+
+    # Numpy-only helpers shared with the in-process generator
+    pool_frame_embeddings = EmbeddingGenerator.pool_frame_embeddings
+    _finalize_embeddings = EmbeddingGenerator._finalize_embeddings
+
+    def __init__(self, url: str, info: Dict, timeout: float = 600.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.info = info
+        self.embedding_dim = int(info["embedding_dim"])
+        self.sample_rate = int(info["sample_rate"])
+        self.active_model_name = info.get("active_model")
+        self.model_class = info.get("model_class")
+        self.max_layer = info.get("max_layer")
+        self.supports_track_pooling = bool(info.get("supports_track_pooling", False))
+
+    @classmethod
+    def connect(
+        cls,
+        url: str,
+        config_hash: Optional[str] = None,
+        timeout: float = 600.0,
+        probe_timeout: float = 0.5
+    ) -> Optional["RemoteEmbeddingGenerator"]:
+        """
+        Connect to a server at ``url`` if one is running.
+
+        Args:
+            url: Server base URL
+            config_hash: Required config hash (None accepts any server)
+            timeout: Timeout for embedding requests in seconds
+            probe_timeout: Timeout for the health check in seconds
+
+        Returns:
+            RemoteEmbeddingGenerator, or None if no matching server is reachable
+        """
+        try:
+            with urllib.request.urlopen(f"{url.rstrip('/')}/health", timeout=probe_timeout) as response:
+                info = json.loads(response.read())
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            logger.debug(f"No model server at {url}: {e}")
+            return None
+        if config_hash is not None and info.get("config_hash") != config_hash:
+            logger.info(f"Model server at {url} was loaded from a different config, loading model in-process")
+            return None
+        logger.info(f"Using model server at {url} ({info.get('active_model')})")
+        return cls(url, info, timeout=timeout)
+
+    def _post(self, endpoint: str, **arrays) -> Dict[str, np.ndarray]:
+        request = urllib.request.Request(
+            f"{self.url}/{endpoint}",
+            data=_pack(**arrays),
+            headers={"Content-Type": "application/octet-stream"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return _unpack(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("message", str(e))
+            except ValueError:
+                message = str(e)
+            raise EmbeddingError(f"Model server {endpoint} failed: {message}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise EmbeddingError(f"Model server at {self.url} unreachable: {e}") from e
+
+    def generate_embeddings_from_audio(self, audio: np.ndarray, sample_rate: int, batch_size: int = 32) -> np.ndarray:
+        """Embed a stack of equal-length segments (N, samples) on the server."""
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 1:
+            audio = audio[np.newaxis, :]
+        return self._post("embed", audio=audio, sample_rate=np.int64(sample_rate))["embeddings"]
+
+    def generate_embeddings_from_audio_list(
+        self,
+        audio_list: List[np.ndarray],
+        sample_rate: int,
+        batch_size: int = 32
+    ) -> np.ndarray:
+        """Embed ragged segments on the server (bucketed there by length)."""
+        arrays = {f"audio_{i}": np.asarray(audio, dtype=np.float32) for i, audio in enumerate(audio_list)}
+        return self._post("embed", sample_rate=np.int64(sample_rate), **arrays)["embeddings"]
+
+    def generate_embedding_from_audio(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        """Embed one in-memory signal."""
+        return self.generate_embeddings_from_audio(np.asarray(audio)[np.newaxis, :], sr)[0]
+
+    def generate_track_frame_embeddings(self, audio: np.ndarray, sr: int) -> Tuple[np.ndarray, float]:
+        """Frame-level hidden states of a whole track, computed on the server."""
+        result = self._post("track_frames", audio=np.asarray(audio, dtype=np.float32), sample_rate=np.int64(sr))
+        return result["frames"], float(result["frame_rate"])
+
+    def get_model_info(self) -> Dict:
+        """Server-side model info."""
+        return {**self.info.get("model_info", {}), "model_server": self.url}
+
+
+def connect_model_server(config: Dict) -> Optional[RemoteEmbeddingGenerator]:
+    """
+    Find a running model server for this fingerprint config.
+
+    Honors ``model_server.enabled`` (default true), ``host``, ``port`` and
+    ``timeout`` from the config.
+
+    Args:
+        config: Parsed fingerprint config YAML
+
+    Returns:
+        RemoteEmbeddingGenerator, or None to load the model in-process
+    """
+    server_config = config.get("model_server") or {}
+    if not server_config.get("enabled", True):
+        return None
+    return RemoteEmbeddingGenerator.connect(
+        server_url(server_config),
+        config_hash=config_fingerprint(config),
+        timeout=server_config.get("timeout", 600.0)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fingerprint embeddings from one loaded model")
+    parser.add_argument("--config", type=Path, default=Path("config/fingerprint_v1.yaml"), help="Fingerprint config YAML")
+    parser.add_argument("--host", default=None, help="Bind address (default: model_server.host or 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=None, help="Port (default: model_server.port or 8765)")
+    parser.add_argument("--max-batch-segments", type=int, default=256, help="Max segments coalesced into one model call")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    from .load_model import load_fingerprint_model
+    model_config = load_fingerprint_model(args.config, use_server=False)
+    server_config = model_config.get("config", {}).get("model_server") or {}
+    server = ModelServer(
+        model_config,
+        host=args.host or server_config.get("host", DEFAULT_HOST),
+        port=args.port if args.port is not None else server_config.get("port", DEFAULT_PORT),
+        max_batch_segments=args.max_batch_segments
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""ONNX Runtime inference backend for the MERT embedding model."""
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import torch
+    HAS_TORCH = True
+except (ImportError, OSError):
+    HAS_TORCH = False
+
+try:
+    import onnxruntime as ort
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+    logger.debug("onnxruntime not available; model.backend 'onnx' will fall back to torch")
+
+BACKENDS = ("torch", "onnx")
+OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+
+# Bump when the exported graph changes (inputs/outputs, export settings)
+EXPORT_VERSION = 1
+
+
+@dataclass
+class OnnxBackendConfig:
+    """
+    ONNX Runtime backend for the MERT model.
+
+    Attributes:
+        cache_dir: Directory for exported graphs (keyed by model name and a hash
+            of its config, checkpoint revision and weights)
+        opset: ONNX opset used for export
+        optimization_level: ORT graph optimizations ("disable", "basic", "extended", "all")
+        intra_op_threads: ORT intra-op threads (None = ORT default, all physical cores)
+        inter_op_threads: ORT inter-op threads (None = sequential execution)
+    """
+    cache_dir: str = "data/cache/onnx"
+    opset: int = 17
+    optimization_level: str = "all"
+    intra_op_threads: Optional[int] = None
+    inter_op_threads: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, config: Optional[Dict]) -> "OnnxBackendConfig":
+        """Build from the ``model.onnx`` config section."""
+        config = config or {}
+        backend = cls(
+            cache_dir=config.get("cache_dir", "data/cache/onnx"),
+            opset=int(config.get("opset", 17)),
+            optimization_level=config.get("optimization_level", "all"),
+            intra_op_threads=config.get("intra_op_threads"),
+            inter_op_threads=config.get("inter_op_threads"),
+        )
+        if backend.optimization_level not in OPTIMIZATION_LEVELS:
+            raise ValueError(
+                f"Unknown ONNX optimization level '{backend.optimization_level}', "
+                f"expected one of {OPTIMIZATION_LEVELS}"
+            )
+        return backend
+
+    @property
+    def label(self) -> str:
+        """Short name, e.g. "onnx/all"."""
+        return f"onnx/{self.optimization_level}"
+
+
+@dataclass
+class OnnxModelOutput:
+    """Model output mirroring the fields the embedding code reads from HF outputs."""
+    last_hidden_state: Any
+
+    def __getitem__(self, index):
+        return (self.last_hidden_state,)[index]
+
+
+def weights_fingerprint(model: Any, samples_per_tensor: int = 1024) -> str:
+    """
+    Cheap hash of the model's weights.
+
+    Covers every tensor's name, shape and dtype and an evenly strided sample
+    of its values, so a fine-tuned or swapped checkpoint with the same config
+    gets a different hash without reading all of its weights.
+    """
+    digest = hashlib.md5()
+    state_dict = model.state_dict() if hasattr(model, "state_dict") else {}
+    for name, tensor in state_dict.items():
+        values = _to_numpy(tensor).ravel()
+        sample = values[::max(1, values.size // samples_per_tensor)]
+        digest.update(f"{name}:{tuple(tensor.shape)}:{values.dtype}".encode())
+        digest.update(np.ascontiguousarray(sample).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def model_config_hash(model: Any, opset: int) -> str:
+    """Hash of the model's architecture config, checkpoint and export settings."""
+    config = getattr(model, "config", None)
+    config_dict = config.to_dict() if hasattr(config, "to_dict") else {}
+    # Loader/runtime bookkeeping does not change the graph
+    for key in ("_name_or_path", "transformers_version", "return_dict", "torch_dtype"):
+        config_dict.pop(key, None)
+    hash_config = {
+        "model_config": config_dict,
+        "model_class": type(model).__name__,
+        # Hub revision the checkpoint was loaded from (None for local checkpoints)
+        "revision": getattr(config, "_commit_hash", None),
+        "weights": weights_fingerprint(model),
+        "opset": opset,
+        "export_version": EXPORT_VERSION,
+    }
+    config_str = json.dumps(hash_config, sort_keys=True, default=str)
+    return hashlib.md5(config_str.encode()).hexdigest()[:16]
+
+
+def get_onnx_cache_path(cache_dir: Path, model_name: str, config_hash: str) -> Path:
+    """Path of the cached graph for ``model_name`` (e.g. m-a-p_MERT-v1-330M_<hash>.onnx)."""
+    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_") or "model"
+    return Path(cache_dir) / f"{safe_name}_{config_hash}.onnx"
+
+
+def export_mert_to_onnx(model: Any, output_path: Path, sample_rate: int, opset: int = 17) -> Path:
+    """
+    Export the MERT conv feature extractor and transformer encoder to ONNX.
+
+    The graph takes ``input_values`` (batch, samples) float32 and
+    ``attention_mask`` (batch, samples) int64 with dynamic batch and time
+    axes, and returns ``last_hidden_state`` (batch, frames, hidden). The file
+    is written next to ``output_path`` first and moved into place, so
+    concurrent workers never load a partial graph.
+
+    Args:
+        model: FP32 eager MERT model (eval mode)
+        output_path: Destination .onnx file
+        sample_rate: Model sampling rate (sizes the example input)
+        opset: ONNX opset version
+
+    Returns:
+        Path to the exported graph
+    """
+    if not HAS_TORCH:
+        raise ValueError("PyTorch not available. Cannot export MERT to ONNX.")
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f"{output_path.stem}.{os.getpid()}.tmp.onnx")
+
+    device = next(model.parameters()).device
+    example_values = torch.zeros(2, int(sample_rate), dtype=torch.float32, device=device)
+    example_mask = torch.ones(2, int(sample_rate), dtype=torch.long, device=device)
+
+    # Export a tuple-returning graph; outputs[0] is last_hidden_state
+    config = getattr(model, "config", None)
+    return_dict = getattr(config, "return_dict", True)
+    try:
+        if config is not None:
+            config.return_dict = False
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (example_values, example_mask),
+                str(tmp_path),
+                input_names=["input_values", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_values": {0: "batch", 1: "samples"},
+                    "attention_mask": {0: "batch", 1: "samples"},
+                    "last_hidden_state": {0: "batch", 1: "frames"},
+                },
+                opset_version=opset,
+                **_legacy_export_kwargs(),
+            )
+        os.replace(tmp_path, output_path)
+    finally:
+        if config is not None:
+            config.return_dict = return_dict
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    logger.info(f"Exported MERT to ONNX: {output_path}")
+    return output_path
+
+
+def _legacy_export_kwargs() -> Dict[str, Any]:
+    """
+    Select the TorchScript-based exporter on torch releases that also have
+    the dynamo one; releases without the ``dynamo`` argument only have the
+    TorchScript exporter and reject it.
+    """
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        return {"dynamo": False}
+    return {}
+
+
+class OnnxMertSession:
+    """
+    ONNX Runtime session running the exported MERT graph on the CPU execution provider.
+
+    Callable like the HF model (``session(input_values, attention_mask=None)``)
+    and returns torch tensors, so it plugs into the existing pooling code.
+    """
+
+    # _run_mert_forward passes the attention mask to graphs that accept it
+    accepts_attention_mask = True
+
+    def __init__(self, onnx_path: Path, config: Optional[OnnxBackendConfig] = None):
+        if not HAS_ONNXRUNTIME:
+            raise ValueError("onnxruntime not available. Install with: pip install onnxruntime")
+
+        self.onnx_path = Path(onnx_path)
+        self.config = config or OnnxBackendConfig()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = {
+            "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[self.config.optimization_level]
+        if self.config.intra_op_threads:
+            options.intra_op_num_threads = int(self.config.intra_op_threads)
+        if self.config.inter_op_threads:
+            # The inter-op pool is only used when independent graph branches run in parallel
+            options.inter_op_num_threads = int(self.config.inter_op_threads)
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        self.session = ort.InferenceSession(
+            str(self.onnx_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        logger.info(
+            f"ONNX Runtime session ready: {self.onnx_path.name} "
+            f"(optimization={self.config.optimization_level}, "
+            f"intra-op={self.config.intra_op_threads or 'default'}, "
+            f"inter-op={self.config.inter_op_threads or 'default'})"
+        )
+
+    @classmethod
+    def from_model(
+        cls,
+        model: Any,
+        model_name: str,
+        sample_rate: int,
+        config: Optional[OnnxBackendConfig] = None
+    ) -> "OnnxMertSession":
+        """
+        Load the cached graph for ``model`` or export it on first use.
+
+        Args:
+            model: FP32 eager MERT model
+            model_name: Model identifier (part of the cache key)
+            sample_rate: Model sampling rate
+            config: Backend configuration
+
+        Returns:
+            OnnxMertSession over the cached graph
+        """
+        config = config or OnnxBackendConfig()
+        onnx_path = get_onnx_cache_path(
+            Path(config.cache_dir), model_name, model_config_hash(model, config.opset)
+        )
+        if onnx_path.exists():
+            logger.info(f"Using cached ONNX graph: {onnx_path}")
+        else:
+            export_mert_to_onnx(model, onnx_path, sample_rate, opset=config.opset)
+        return cls(onnx_path, config)
+
+    def __call__(self, input_values, attention_mask=None) -> OnnxModelOutput:
+        values = _to_numpy(input_values).astype(np.float32, copy=False)
+        feeds = {"input_values": values}
+        if "attention_mask" in self.input_names:
+            if attention_mask is None:
+                mask = np.ones(values.shape, dtype=np.int64)
+            else:
+                mask = _to_numpy(attention_mask).astype(np.int64, copy=False)
+            feeds["attention_mask"] = mask
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        return OnnxModelOutput(last_hidden_state=torch.from_numpy(hidden) if HAS_TORCH else hidden)
+
+
+def _to_numpy(array) -> np.ndarray:
+    """Contiguous numpy view of a torch tensor or array."""
+    if HAS_TORCH and isinstance(array, torch.Tensor):
+        array = array.detach().cpu().numpy()
+    return np.ascontiguousarray(array)
@@ -1,74 +1,339 @@
 """Cache system for original file embeddings."""
 import hashlib
 import json
+import os
 import logging
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple, List, Dict
+from typing import Iterable, Optional, Tuple, List, Dict
 import numpy as np
 import pandas as pd
 
+from .cache_manifest import CacheManifest
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Storage layouts of cache entries
+LEGACY_FORMAT = "segments"  # <key>/seg_XXXX.npy per segment + <key>/segments.json
+PACKED_FORMAT = "packed"  # <key>.npy (N_segments, D) matrix + <key>.segments.json
+STORAGE_DTYPES = ("float32", "float16")
+HASH_CHUNK_SIZE = 1 << 20
+DEFAULT_CACHE_DIR = Path("data/cache/original_embeddings")
+MANIFEST_DB_NAME = "cache_manifest.sqlite"
+LEGACY_MANIFEST_NAME = "cache_manifest.json"
+DEFAULT_MEMORY_BUDGET_MB = 512.0
+# Rough in-memory size of one segment metadata dictionary
+SEGMENT_METADATA_BYTES = 512
+# Minimum seconds between two last-access updates of one entry
+ACCESS_TOUCH_INTERVAL = 300.0
+# Unreferenced files younger than this may belong to a set() in progress
+ORPHAN_GRACE_SECONDS = 600.0
+
+
+def pack_segments(segments: List[Dict]) -> Dict:
+    """
+    Columnar form of segment dictionaries for compact storage.
+    
+    Keys whose value is the same for every segment (file_id, sample_rate, ...)
+    are stored once, and segment IDs in the ``{file_id}_seg_{idx:04d}`` format
+    are rebuilt on read. Lists whose dictionaries do not share one key set are
+    stored row-wise.
+    
+    Args:
+        segments: Segment dictionaries (JSON-serializable values)
+        
+    Returns:
+        Dictionary for json.dump, read back with unpack_segments
+    """
+    keys = list(segments[0].keys()) if segments else []
+    if any(list(seg.keys()) != keys for seg in segments):
+        return {"rows": segments}
+    
+    constants = {}
+    columns = {}
+    for key in keys:
+        values = [seg[key] for seg in segments]
+        if all(value == values[0] for value in values[1:]):
+            constants[key] = values[0]
+        else:
+            columns[key] = values
+    
+    packed = {"n": len(segments), "keys": keys, "constants": constants, "columns": columns}
+    ids = columns.get("segment_id")
+    if ids is not None and all(
+        isinstance(seg.get("segment_idx"), int) and seg["segment_id"] == f"{seg.get('file_id')}_seg_{seg['segment_idx']:04d}"
+        for seg in segments
+    ):
+        del columns["segment_id"]
+        packed["derived"] = ["segment_id"]
+    return packed
+
+
+def unpack_segments(packed: Dict) -> List[Dict]:
+    """Inverse of pack_segments."""
+    if "rows" in packed:
+        return packed["rows"]
+    segments = []
+    for i in range(packed["n"]):
+        seg = {}
+        for key in packed["keys"]:
+            if key in packed["constants"]:
+                seg[key] = packed["constants"][key]
+            elif key in packed["columns"]:
+                seg[key] = packed["columns"][key][i]
+        segments.append(seg)
+    if "segment_id" in packed.get("derived", []):
+        for seg in segments:
+            seg["segment_id"] = f"{seg.get('file_id')}_seg_{seg['segment_idx']:04d}"
+    # Restore key order
+    return [{key: seg[key] for key in packed["keys"]} for seg in segments]
+
+
+class EmbeddingsMemoryTier:
+    """
+    Thread-safe LRU of cache entries bounded by a byte budget.
+    
+    Entries are (embeddings, segments) tuples keyed by cache key. Stored
+    embedding arrays are marked read-only because every hit returns the same
+    array.
+    """
+    
+    def __init__(self, budget_bytes: int):
+        """
+        Initialize memory tier.
+        
+        Args:
+            budget_bytes: Maximum estimated size of all held entries
+        """
+        self.budget_bytes = int(budget_bytes)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, Optional[List[Dict]], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def _entry_bytes(embeddings: np.ndarray, segments: Optional[List[Dict]]) -> int:
+        return int(embeddings.nbytes) + SEGMENT_METADATA_BYTES * len(segments or [])
+    
+    def get(self, key: str) -> Tuple[Optional[np.ndarray], Optional[List[Dict]]]:
+        """Return a held entry (marking it most recently used) or (None, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        embeddings, segments, _ = entry
+        # Callers may edit segment dictionaries; the array is read-only
+        return embeddings, [dict(seg) for seg in segments] if segments is not None else None
+    
+    def put(self, key: str, embeddings: np.ndarray, segments: Optional[List[Dict]]):
+        """Hold an entry, evicting least recently used entries to stay within budget."""
+        embeddings = np.array(embeddings, dtype=np.float32)
+        embeddings.setflags(write=False)
+        size = self._entry_bytes(embeddings, segments)
+        if size > self.budget_bytes:
+            return
+        segments = [dict(seg) for seg in segments] if segments is not None else None
+        with self._lock:
+            if key in self._entries:
+                self.bytes_used -= self._entries.pop(key)[2]
+            self._entries[key] = (embeddings, segments, size)
+            self.bytes_used += size
+            self._evict()
+    
+    def _evict(self):
+        while self.bytes_used > self.budget_bytes and self._entries:
+            key, (_, _, size) = self._entries.popitem(last=False)
+            self.bytes_used -= size
+            self.evictions += 1
+            logger.debug(f"Evicted {key} from embeddings memory tier ({size / 1024:.1f} KB)")
+    
+    def discard(self, key: str):
+        """Drop an entry if held."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes_used -= entry[2]
+    
+    def resize(self, budget_bytes: int):
+        """Change the byte budget, evicting as needed."""
+        with self._lock:
+            self.budget_bytes = int(budget_bytes)
+            self._evict()
+    
+    def clear(self):
+        """Drop all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+    
+    def stats(self) -> Dict:
+        """Hit/miss/eviction counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
 class OriginalEmbeddingsCache:
-    """Cache for original file embeddings with incremental updates."""
+    """
+    Cache for original file embeddings with incremental updates.
+    
+    Each entry is stored packed: one contiguous (N_segments, D) matrix in
+    ``<cache_key>.npy`` and columnar segment metadata in
+    ``<cache_key>.segments.json``. Entries written in the older one-file-per-
+    segment layout are still read; ``migrate`` converts them.
+    
+    With a memory budget, entries read or written are also held in an
+    in-memory LRU tier (see get_shared_cache for the process-wide instance).
+    """
     
-    def __init__(self, cache_dir: Path = Path("data/cache/original_embeddings")):
+    def __init__(
+        self,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        dtype: str = "float32",
+        memory_budget_bytes: int = 0
+    ):
         """
         Initialize embeddings cache.
         
         Args:
             cache_dir: Directory to store cached embeddings
+            dtype: Storage dtype of new entries ("float32", or "float16" to halve
+                disk use at ~1e-3 precision; reads always return float32)
+            memory_budget_bytes: Byte budget of the in-memory LRU tier (0 = no tier)
         """
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown cache dtype '{dtype}', expected one of {STORAGE_DTYPES}")
         self.cache_dir = cache_dir
+        self.dtype = dtype
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.manifest_path = cache_dir / "cache_manifest.json"
-        self.manifest = self._load_manifest()
+        self.manifest_path = cache_dir / MANIFEST_DB_NAME
+        self.memory = EmbeddingsMemoryTier(memory_budget_bytes) if memory_budget_bytes > 0 else None
+        self._db = CacheManifest(self.manifest_path)
+        self._last_touch: Dict[str, float] = {}
+        # cache_key -> entry info and file path -> {"ino", "size", "mtime_ns", "hash"},
+        # dictionary views of SQLite tables (writes are committed immediately)
+        self.manifest = self._db.entries
+        self.file_stats = self._db.file_stats
+        
+        legacy_manifest_path = cache_dir / LEGACY_MANIFEST_NAME
+        if legacy_manifest_path.exists():
+            try:
+                self._db.import_json(legacy_manifest_path)
+            except Exception as e:
+                logger.warning(f"Failed to migrate {legacy_manifest_path}: {e}")
         logger.info(f"Initialized embeddings cache at {cache_dir}")
         logger.info(f"Cache contains {len(self.manifest)} entries")
     
-    def _load_manifest(self) -> dict:
-        """Load cache manifest."""
-        if self.manifest_path.exists():
-            try:
-                with open(self.manifest_path, 'r') as f:
-                    manifest = json.load(f)
-                    logger.info(f"Loaded cache manifest with {len(manifest)} entries")
-                    return manifest
-            except Exception as e:
-                logger.warning(f"Failed to load cache manifest: {e}, starting fresh")
-                return {}
-        return {}
+    def batch(self):
+        """
+        Context manager grouping manifest writes (e.g. many set() calls) into
+        one transaction, committed on exit.
+        """
+        return self._db.batch()
     
-    def _save_manifest(self):
-        """Save cache manifest."""
-        try:
-            with open(self.manifest_path, 'w') as f:
-                json.dump(self.manifest, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save cache manifest: {e}")
+    def _file_identity(self, file_path: Path) -> Tuple[str, Dict]:
+        """Manifest key and {ino, size, mtime_ns} of an audio file."""
+        stat = file_path.stat()
+        return str(file_path.resolve()), {"ino": stat.st_ino, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
     
-    def _get_file_hash(self, file_path: Path) -> str:
-        """Get file hash for cache key."""
+    def _known_file_hash(self, stats_key: str, identity: Dict) -> Optional[str]:
+        """Remembered content hash if the file's identity is unchanged."""
+        known = self.file_stats.get(stats_key)
+        if known and all(known.get(field) == value for field, value in identity.items()):
+            return known["hash"]
+        return None
+    
+    @staticmethod
+    def _hash_file_contents(file_path: Path) -> Optional[str]:
+        """MD5 of the file, read in chunks (None if it cannot be read)."""
         try:
-            return hashlib.md5(file_path.read_bytes()).hexdigest()
+            digest = hashlib.md5()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
         except Exception as e:
             logger.error(f"Failed to compute file hash for {file_path}: {e}")
-            # Fallback to file modification time and size
-            stat = file_path.stat()
-            return hashlib.md5(f"{stat.st_mtime}_{stat.st_size}".encode()).hexdigest()
+            return None
+    
+    @staticmethod
+    def _fallback_file_hash(identity: Dict) -> str:
+        # Modification time and size (not remembered)
+        return hashlib.md5(f"{identity['mtime_ns'] / 1e9}_{identity['size']}".encode()).hexdigest()
+    
+    def _get_file_hash(self, file_path: Path) -> str:
+        """
+        Get file content hash for cache key.
+        
+        The hash is remembered together with the file's inode, size and
+        mtime_ns; while those are unchanged the file is not read again.
+        
+        Args:
+            file_path: Path to the audio file
+            
+        Returns:
+            MD5 hex digest of the file contents
+        """
+        stats_key, identity = self._file_identity(file_path)
+        file_hash = self._known_file_hash(stats_key, identity)
+        if file_hash is not None:
+            return file_hash
+        
+        file_hash = self._hash_file_contents(file_path)
+        if file_hash is None:
+            return self._fallback_file_hash(identity)
+        self.file_stats[stats_key] = {**identity, "hash": file_hash}
+        return file_hash
     
     def _get_model_hash(self, model_config: dict) -> str:
         """Generate hash from model configuration."""
+        return self.compute_model_hash(model_config)
+    
+    @staticmethod
+    def compute_model_hash(model_config: dict) -> str:
+        """
+        Hash of the embedding-relevant model settings (cache key component).
+        
+        A precomputed ``model_hash`` entry is used as-is, so processes that do
+        not hold the model (e.g. the ingestion parent) share cache keys with
+        the worker processes that do.
+        """
+        if model_config.get("model_hash"):
+            return model_config["model_hash"]
         # Create hash from model config (excluding model object itself)
-        config_str = json.dumps({
+        hash_config = {
             "embedding_dim": model_config.get("embedding_dim", 512),
             "segment_length": model_config.get("segment_length", 10.0),
             "sample_rate": model_config.get("sample_rate", 44100),
-            "model_type": str(type(model_config.get("model", ""))),
-        }, sort_keys=True)
+            # Model server clients report the served model's class
+            "model_type": getattr(model_config.get("model"), "model_class", None) or str(type(model_config.get("model", ""))),
+        }
+        # Track-pooled embeddings differ from per-segment ones
+        if getattr(model_config.get("model"), "supports_track_pooling", False):
+            hash_config["track_pooling"] = True
+        # Truncated-depth MERT embeddings differ from full-depth ones
+        max_layer = getattr(model_config.get("model"), "max_layer", None)
+        if max_layer is not None:
+            hash_config["max_layer"] = max_layer
+        config_str = json.dumps(hash_config, sort_keys=True)
         return hashlib.md5(config_str.encode()).hexdigest()[:16]
     
     def _get_cache_key(self, file_id: str, file_hash: str, model_hash: str) -> str:
@@ -88,7 +353,13 @@ class OriginalEmbeddingsCache:
         else:
             return obj
     
-    def get(self, file_id: str, file_path: Path, model_config: dict) -> Tuple[Optional[np.ndarray], Optional[List[Dict]]]:
+    def get(
+        self,
+        file_id: str,
+        file_path: Path,
+        model_config: dict,
+        mmap_mode: Optional[str] = None
+    ) -> Tuple[Optional[np.ndarray], Optional[List[Dict]]]:
         """
         Get cached embeddings and segments.
         
@@ -96,9 +367,12 @@ class OriginalEmbeddingsCache:
             file_id: Unique identifier for the file
             file_path: Path to the audio file
             model_config: Model configuration dictionary
+            mmap_mode: "r" returns packed float32 entries as a read-only memory
+                map (each open map holds a file descriptor); None reads into memory
             
         Returns:
-            Tuple of (embeddings_array, segments_list) or (None, None) if not cached
+            Tuple of (embeddings_array, segments_list) or (None, None) if not cached.
+            Embeddings served from the memory tier are read-only.
         """
         if not file_path.exists():
             logger.warning(f"File does not exist: {file_path}")
@@ -108,41 +382,136 @@ class OriginalEmbeddingsCache:
         model_hash = self._get_model_hash(model_config)
         cache_key = self._get_cache_key(file_id, file_hash, model_hash)
         
+        if self.memory is not None:
+            embeddings, segments = self.memory.get(cache_key)
+            if embeddings is not None:
+                logger.debug(f"✓ Using in-memory cached embeddings for {file_id} ({len(embeddings)} segments)")
+                self._touch(cache_key)
+                return embeddings, segments
+        
         # Check manifest
         if cache_key not in self.manifest:
             logger.debug(f"No cache entry for {file_id} (key: {cache_key})")
             return None, None
         
-        cache_info = self.manifest[cache_key]
-        cache_dir = self.cache_dir / cache_key
-        
-        if not cache_dir.exists():
-            logger.warning(f"Cache directory missing for {file_id}, removing from manifest")
-            del self.manifest[cache_key]
-            self._save_manifest()
+        if not self._entry_exists(cache_key):
+            logger.warning(f"Cache files missing for {file_id}, removing from manifest")
+            self.manifest.pop(cache_key, None)
             return None, None
         
-        # Load embeddings
-        embedding_files = sorted(cache_dir.glob("seg_*.npy"))
-        if not embedding_files:
+        try:
+            embeddings, segments = self._load_entry(cache_key, mmap_mode=mmap_mode)
+        except Exception as e:
+            logger.error(f"Failed to load cached embeddings for {file_id}: {e}")
+            return None, None
+        if embeddings is None:
             logger.warning(f"No embedding files found in cache for {file_id}")
             return None, None
         
+        if self.memory is not None and mmap_mode is None:
+            self.memory.put(cache_key, embeddings, segments)
+        self._touch(cache_key)
+        logger.info(f"✓ Using cached embeddings for {file_id} ({len(embeddings)} segments)")
+        return embeddings, segments
+    
+    def _touch(self, cache_key: str):
+        """Record an access for size-capped eviction (at most every ACCESS_TOUCH_INTERVAL)."""
+        now = time.time()
+        if now - self._last_touch.get(cache_key, 0.0) < ACCESS_TOUCH_INTERVAL:
+            return
+        self._last_touch[cache_key] = now
         try:
-            embeddings = np.vstack([np.load(f) for f in embedding_files])
+            self.manifest.update_columns(cache_key, last_access=now)
+        except Exception as e:
+            logger.debug(f"Failed to record access of {cache_key}: {e}")
+    
+    def _entry_format(self, cache_key: str, info: Optional[Dict] = None) -> str:
+        if info is None:
+            info = self.manifest.get(cache_key, {})
+        return info.get("format") or LEGACY_FORMAT
+    
+    def _packed_paths(self, cache_key: str) -> Tuple[Path, Path]:
+        return self.cache_dir / f"{cache_key}.npy", self.cache_dir / f"{cache_key}.segments.json"
+    
+    def _entry_exists(self, cache_key: str) -> bool:
+        """Whether the embedding files of a manifest entry are on disk."""
+        if self._entry_format(cache_key) == PACKED_FORMAT:
+            return self._packed_paths(cache_key)[0].exists()
+        legacy_dir = self.cache_dir / cache_key
+        return legacy_dir.exists() and any(legacy_dir.glob("seg_*.npy"))
+    
+    def _load_entry(self, cache_key: str, mmap_mode: Optional[str] = None) -> Tuple[Optional[np.ndarray], Optional[List[Dict]]]:
+        """
+        Read one entry's embeddings and segments from disk (either layout).
+        
+        Args:
+            cache_key: Manifest key
+            mmap_mode: Passed to np.load for packed float32 entries
             
-            # Load segments metadata
-            segments_path = cache_dir / "segments.json"
+        Returns:
+            Tuple of (float32 embeddings, segments) or (None, None) if there are no embeddings
+        """
+        info = self.manifest[cache_key]
+        if self._entry_format(cache_key, info) == PACKED_FORMAT:
+            embeddings_path, segments_path = self._packed_paths(cache_key)
+            # Zero-length files cannot be memory-mapped
+            embeddings = np.load(embeddings_path, mmap_mode=mmap_mode if info.get("num_segments") else None)
+            if len(embeddings) == 0:
+                return None, None
+            if embeddings.dtype != np.float32:
+                embeddings = embeddings.astype(np.float32)
             segments = None
             if segments_path.exists():
                 with open(segments_path, 'r') as f:
-                    segments = json.load(f)
-            
-            logger.info(f"✓ Using cached embeddings for {file_id} ({len(embeddings)} segments)")
+                    segments = unpack_segments(json.load(f))
             return embeddings, segments
-        except Exception as e:
-            logger.error(f"Failed to load cached embeddings for {file_id}: {e}")
+        
+        legacy_dir = self.cache_dir / cache_key
+        embedding_files = sorted(legacy_dir.glob("seg_*.npy"))
+        if not embedding_files:
             return None, None
+        embeddings = np.vstack([np.load(f) for f in embedding_files])
+        segments = None
+        segments_path = legacy_dir / "segments.json"
+        if segments_path.exists():
+            with open(segments_path, 'r') as f:
+                segments = json.load(f)
+        return embeddings, segments
+    
+    def _write_entry(self, cache_key: str, embeddings: np.ndarray, segments: Optional[List[Dict]]):
+        """Write one entry in the packed layout (atomically, file by file)."""
+        embeddings_path, segments_path = self._packed_paths(cache_key)
+        matrix = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(matrix), -1)
+        
+        tmp_path = embeddings_path.with_suffix(".npy.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, embeddings_path)
+        
+        tmp_path = segments_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(pack_segments(self._convert_numpy_to_list(segments or [])), f, separators=(",", ":"))
+        os.replace(tmp_path, segments_path)
+    
+    def _entry_size(self, cache_key: str) -> int:
+        """Bytes on disk of an entry's files (either layout)."""
+        size = sum(path.stat().st_size for path in self._packed_paths(cache_key) if path.exists())
+        legacy_dir = self.cache_dir / cache_key
+        if legacy_dir.is_dir():
+            size += sum(path.stat().st_size for path in legacy_dir.iterdir() if path.is_file())
+        return size
+    
+    def _remove_entry_files(self, cache_key: str):
+        """Delete an entry's files in either layout."""
+        import shutil
+        for path in self._packed_paths(cache_key):
+            if path.exists():
+                path.unlink()
+        legacy_dir = self.cache_dir / cache_key
+        if legacy_dir.exists():
+            shutil.rmtree(legacy_dir)
     
     def set(self, file_id: str, file_path: Path, model_config: dict, 
              embeddings: np.ndarray, segments: List[Dict]):
@@ -160,22 +529,15 @@ class OriginalEmbeddingsCache:
         model_hash = self._get_model_hash(model_config)
         cache_key = self._get_cache_key(file_id, file_hash, model_hash)
         
-        cache_dir = self.cache_dir / cache_key
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        
         try:
-            # Save embeddings
-            for i, emb in enumerate(embeddings):
-                emb_path = cache_dir / f"seg_{i:04d}.npy"
-                np.save(emb_path, emb)
-            
-            # Save segments metadata (convert numpy arrays to lists)
-            segments_path = cache_dir / "segments.json"
-            segments_serializable = self._convert_numpy_to_list(segments)
-            with open(segments_path, 'w') as f:
-                json.dump(segments_serializable, f, indent=2)
+            self._write_entry(cache_key, embeddings, segments)
+            if (self.cache_dir / cache_key).exists():
+                # Overwrote a legacy entry
+                import shutil
+                shutil.rmtree(self.cache_dir / cache_key)
             
             # Update manifest
+            now = time.time()
             self.manifest[cache_key] = {
                 "file_id": file_id,
                 "file_path": str(file_path),
@@ -183,21 +545,27 @@ class OriginalEmbeddingsCache:
                 "model_hash": model_hash,
                 "num_segments": len(embeddings),
                 "embedding_dim": embeddings.shape[1] if len(embeddings) > 0 else 0,
-                "cached_at": time.time()
+                "format": PACKED_FORMAT,
+                "dtype": self.dtype,
+                "size_bytes": self._entry_size(cache_key),
+                "cached_at": now,
+                "last_access": now
             }
-            self._save_manifest()
+            if self.memory is not None and len(embeddings) > 0:
+                self.memory.put(cache_key, embeddings, self._convert_numpy_to_list(segments))
             
             logger.info(f"✓ Cached embeddings for {file_id} ({len(embeddings)} segments, dim={embeddings.shape[1] if len(embeddings) > 0 else 0})")
         except Exception as e:
             logger.error(f"Failed to cache embeddings for {file_id}: {e}", exc_info=True)
     
-    def get_new_files(self, files_manifest_path: Path, model_config: dict) -> pd.DataFrame:
+    def get_new_files(self, files_manifest_path: Path, model_config: dict, max_workers: int = 8) -> pd.DataFrame:
         """
         Identify which files in manifest are not yet cached.
         
         Args:
             files_manifest_path: Path to files manifest CSV
             model_config: Model configuration dictionary
+            max_workers: Threads hashing files whose stat changed
             
         Returns:
             DataFrame with only new files that need embedding generation
@@ -206,8 +574,8 @@ class OriginalEmbeddingsCache:
         model_hash = self._get_model_hash(model_config)
         new_files = []
         
+        candidates = []
         for _, row in files_df.iterrows():
-            file_id = row["id"]
             file_path_str = row.get("file_path") or row.get("path")
             if not file_path_str:
                 continue
@@ -216,24 +584,82 @@ class OriginalEmbeddingsCache:
             if not file_path.exists():
                 logger.warning(f"File not found: {file_path}, skipping")
                 continue
-            
+            stats_key, identity = self._file_identity(file_path)
+            candidates.append((row, file_path, stats_key, identity, self._known_file_hash(stats_key, identity)))
+        
+        # Only files whose stat changed are read; hashing releases the GIL
+        to_hash = [candidate for candidate in candidates if candidate[4] is None]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_hash)))) as executor:
+            new_hashes = list(executor.map(lambda candidate: self._hash_file_contents(candidate[1]), to_hash))
+        computed = {}
+        with self.batch():
+            for (_, _, stats_key, identity, _), file_hash in zip(to_hash, new_hashes):
+                if file_hash is None:
+                    computed[stats_key] = self._fallback_file_hash(identity)
+                else:
+                    computed[stats_key] = file_hash
+                    self.file_stats[stats_key] = {**identity, "hash": file_hash}
+        
+        for row, _, stats_key, _, known_hash in candidates:
+            file_hash = known_hash or computed[stats_key]
             # Check if cached
-            file_hash = self._get_file_hash(file_path)
+            file_id = row["id"]
             cache_key = self._get_cache_key(file_id, file_hash, model_hash)
             
             if cache_key not in self.manifest:
                 new_files.append(row)
             else:
-                # Verify cache directory exists
-                cache_dir = self.cache_dir / cache_key
-                if not cache_dir.exists() or not list(cache_dir.glob("seg_*.npy")):
+                # Verify cached files exist
+                if not self._entry_exists(cache_key):
                     logger.warning(f"Cache entry exists but files missing for {file_id}, will regenerate")
                     new_files.append(row)
         
         new_df = pd.DataFrame(new_files)
         logger.info(f"Found {len(new_df)} new files out of {len(files_df)} total files")
         return new_df
-    
+
+    def sample_embeddings(self, model_config: dict, num_vectors: int, seed: int = 0) -> Optional[np.ndarray]:
+        """
+        Segment embeddings drawn uniformly from all entries of a model config.
+
+        Used as the training set of compressed indexes (IVF-PQ, HNSW-SQ):
+        rows are picked by the segment counts in the manifest, and each entry
+        is memory-mapped so only the sampled rows are read.
+
+        Args:
+            model_config: Model configuration dictionary (selects the model hash)
+            num_vectors: Sample size (every cached segment if there are fewer)
+            seed: Random seed
+
+        Returns:
+            float32 array (n, D), or None if the cache has no entries for the model
+        """
+        keys = self.manifest.keys_where(model_hash=self._get_model_hash(model_config))
+        counts = np.array([self.manifest[key].get("num_segments") or 0 for key in keys], dtype=np.int64)
+        total = int(counts.sum())
+        if total == 0:
+            return None
+
+        rows = np.arange(total) if total <= num_vectors else np.sort(
+            np.random.default_rng(seed).choice(total, size=num_vectors, replace=False)
+        )
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        entries = np.searchsorted(offsets, rows, side="right") - 1
+        sample = []
+        for entry in np.unique(entries):
+            try:
+                embeddings, _ = self._load_entry(keys[entry], mmap_mode="r")
+            except Exception as e:
+                logger.warning(f"Skipping cache entry {keys[entry]} in training sample: {e}")
+                continue
+            if embeddings is not None:
+                local_rows = rows[entries == entry] - offsets[entry]
+                sample.append(np.asarray(embeddings[local_rows[local_rows < len(embeddings)]], dtype=np.float32))
+        if not sample:
+            return None
+        logger.info(f"Sampled {sum(len(s) for s in sample)} training vectors from {len(sample)} cache entries")
+        return np.vstack(sample)
+
     def clear(self, file_id: Optional[str] = None):
         """
         Clear cache entries.
@@ -243,39 +669,282 @@ class OriginalEmbeddingsCache:
         """
         if file_id:
             # Clear specific file
-            keys_to_remove = [
-                key for key, info in self.manifest.items()
-                if info.get("file_id") == file_id
-            ]
-            for key in keys_to_remove:
-                cache_dir = self.cache_dir / key
-                if cache_dir.exists():
-                    import shutil
-                    shutil.rmtree(cache_dir)
-                del self.manifest[key]
-            self._save_manifest()
+            with self.batch():
+                for key in self.manifest.keys_where(file_id=file_id):
+                    self._remove_entry_files(key)
+                    self.manifest.pop(key, None)
+                    if self.memory is not None:
+                        self.memory.discard(key)
             logger.info(f"Cleared cache for {file_id}")
         else:
-            # Clear all
+            # Clear all (the manifest database stays open, only its entries go)
             import shutil
-            if self.cache_dir.exists():
-                shutil.rmtree(self.cache_dir)
-            self.cache_dir.mkdir(parents=True, exist_ok=True)
-            self.manifest = {}
-            self._save_manifest()
+            self.manifest.clear()
+            self._last_touch.clear()
+            if self.memory is not None:
+                self.memory.clear()
+            for path in self.cache_dir.iterdir():
+                if path.name.startswith(MANIFEST_DB_NAME):
+                    continue
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
             logger.info("Cleared all cached embeddings")
     
+    def migrate(self, remove_legacy: bool = True, dtype: Optional[str] = None) -> Dict[str, int]:
+        """
+        Convert entries in the one-file-per-segment layout to the packed layout.
+        
+        Each entry is rewritten and its manifest row updated before its old
+        directory is removed, so an interrupted migration can simply be rerun.
+        
+        Args:
+            remove_legacy: Delete each entry's seg_XXXX.npy directory once packed
+            dtype: Storage dtype of migrated entries (default: the cache dtype)
+            
+        Returns:
+            Counts of "migrated", "skipped" (already packed) and "failed" entries
+        """
+        if dtype is not None and dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown cache dtype '{dtype}', expected one of {STORAGE_DTYPES}")
+        saved_dtype = self.dtype
+        self.dtype = dtype or self.dtype
+        counts = {"migrated": 0, "skipped": 0, "failed": 0}
+        try:
+            counts["skipped"] = self.manifest.count_where(format=PACKED_FORMAT)
+            for cache_key in self.manifest.keys_where(format=None):
+                try:
+                    embeddings, segments = self._load_entry(cache_key)
+                    if embeddings is None:
+                        raise ValueError("no seg_*.npy files")
+                    self._write_entry(cache_key, embeddings, segments)
+                    info = self.manifest[cache_key]
+                    info.update({"format": PACKED_FORMAT, "dtype": self.dtype})
+                    self.manifest[cache_key] = info
+                    if remove_legacy:
+                        import shutil
+                        shutil.rmtree(self.cache_dir / cache_key)
+                    self.manifest.update_columns(cache_key, size_bytes=self._entry_size(cache_key))
+                    counts["migrated"] += 1
+                except Exception as e:
+                    logger.error(f"Failed to migrate cache entry {cache_key}: {e}")
+                    counts["failed"] += 1
+        finally:
+            self.dtype = saved_dtype
+        logger.info(
+            f"Migrated {counts['migrated']} cache entries to the packed layout "
+            f"({counts['skipped']} already packed, {counts['failed']} failed)"
+        )
+        return counts
+    
     def get_cache_stats(self) -> Dict:
-        """Get cache statistics."""
-        total_size = 0
-        for cache_dir in self.cache_dir.iterdir():
-            if cache_dir.is_dir():
-                for file in cache_dir.glob("*.npy"):
-                    total_size += file.stat().st_size
+        """
+        Get cache statistics.
+        
+        Sizes come from counters maintained by the manifest, so this does not
+        walk the cache directory. Entries written before sizes were recorded
+        count as 0 bytes until refresh_sizes() runs.
+        """
+        num_entries = self._db.counter("num_entries")
+        num_packed = self.manifest.count_where(format=PACKED_FORMAT)
         
         return {
-            "num_cached_files": len(self.manifest),
-            "total_cache_size_mb": total_size / (1024 * 1024),
-            "cache_dir": str(self.cache_dir)
+            "num_cached_files": num_entries,
+            "num_packed_files": num_packed,
+            "num_legacy_files": num_entries - num_packed,
+            "total_cache_size_mb": self._db.counter("total_bytes") / (1024 * 1024),
+            "cache_dir": str(self.cache_dir),
+            "memory": self.memory.stats() if self.memory is not None else None
         }
+    
+    def total_bytes(self) -> int:
+        """Bytes on disk of all entries (maintained counter)."""
+        return self._db.counter("total_bytes")
+    
+    def remove_entry(self, cache_key: str):
+        """Delete one entry's files, manifest row and in-memory copy."""
+        self._remove_entry_files(cache_key)
+        self.manifest.pop(cache_key, None)
+        self._last_touch.pop(cache_key, None)
+        if self.memory is not None:
+            self.memory.discard(cache_key)
+    
+    def refresh_sizes(self) -> int:
+        """
+        Record the on-disk size of entries that have none (written by older versions).
+        
+        Returns:
+            Number of entries updated
+        """
+        keys = self.manifest.keys_where(size_bytes=None)
+        with self.batch():
+            for cache_key in keys:
+                self.manifest.update_columns(cache_key, size_bytes=self._entry_size(cache_key))
+        return len(keys)
+    
+    def evict_to_size(self, max_bytes: int) -> Tuple[int, int]:
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        
+        Entries never accessed since sizes were recorded go first.
+        
+        Args:
+            max_bytes: Size limit of all entries on disk
+            
+        Returns:
+            Tuple of (entries removed, bytes freed)
+        """
+        removed = 0
+        freed = 0
+        while self.total_bytes() > max_bytes:
+            keys = self.manifest.keys_where(order_by="last_access", limit=100)
+            if not keys:
+                break
+            with self.batch():
+                for cache_key in keys:
+                    if self.total_bytes() <= max_bytes:
+                        break
+                    before = self.total_bytes()
+                    self.remove_entry(cache_key)
+                    freed += before - self.total_bytes()
+                    removed += 1
+        if removed:
+            logger.info(f"Evicted {removed} cache entries ({freed / (1024 * 1024):.1f} MB) to stay under "
+                        f"{max_bytes / (1024 * 1024):.1f} MB")
+        return removed, freed
+    
+    def purge_model_hashes(self, keep: Iterable[str]) -> int:
+        """
+        Remove entries computed with models other than the given ones.
+        
+        Args:
+            keep: Model hashes whose entries stay (e.g. the current compute_model_hash)
+            
+        Returns:
+            Number of entries removed
+        """
+        keep = set(keep)
+        removed = 0
+        for model_hash in self.manifest.distinct("model_hash"):
+            if model_hash in keep:
+                continue
+            with self.batch():
+                for cache_key in self.manifest.keys_where(model_hash=model_hash):
+                    self.remove_entry(cache_key)
+                    removed += 1
+        if removed:
+            logger.info(f"Purged {removed} cache entries of outdated models")
+        return removed
+    
+    def remove_orphans(self, grace_seconds: float = ORPHAN_GRACE_SECONDS) -> Dict[str, int]:
+        """
+        Reconcile the cache directory with the manifest.
+        
+        Manifest entries whose files are gone are dropped, and files or
+        directories no entry refers to (including leftover .tmp files) are
+        deleted unless they are younger than grace_seconds.
+        
+        Args:
+            grace_seconds: Age below which unreferenced files are kept
+            
+        Returns:
+            Counts of "missing_entries" dropped and "orphan_files" deleted
+        """
+        import shutil
+        counts = {"missing_entries": 0, "orphan_files": 0}
+        with self.batch():
+            for cache_key in self.manifest:
+                if not self._entry_exists(cache_key):
+                    self.manifest.pop(cache_key, None)
+                    counts["missing_entries"] += 1
+        
+        cutoff = time.time() - grace_seconds
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith((MANIFEST_DB_NAME, LEGACY_MANIFEST_NAME)):
+                continue
+            if path.is_dir():
+                cache_key = path.name
+            elif path.name.endswith(".segments.json"):
+                cache_key = path.name[:-len(".segments.json")]
+            elif path.suffix == ".npy":
+                cache_key = path.stem
+            else:
+                cache_key = None  # Temporary files of interrupted writes
+            if cache_key is not None and cache_key in self.manifest:
+                continue
+            try:
+                if path.stat().st_mtime > cutoff:
+                    continue
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                counts["orphan_files"] += 1
+            except OSError as e:
+                logger.warning(f"Failed to remove orphaned cache file {path}: {e}")
+        if any(counts.values()):
+            logger.info(
+                f"Dropped {counts['missing_entries']} cache entries with missing files, "
+                f"removed {counts['orphan_files']} orphaned files"
+            )
+        return counts
+    
+    def log_memory_stats(self):
+        """Log the memory tier's hit/miss/eviction counters."""
+        if self.memory is None:
+            return
+        stats = self.memory.stats()
+        logger.info(
+            f"Embeddings memory tier: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evictions, "
+            f"{stats['entries']} entries, {stats['bytes_used'] / (1024 * 1024):.1f}/"
+            f"{stats['budget_bytes'] / (1024 * 1024):.1f} MB"
+        )
+
+
+_shared_caches: Dict[str, OriginalEmbeddingsCache] = {}
+_shared_caches_lock = threading.Lock()
 
+
+def get_shared_cache(
+    model_config: Optional[dict] = None,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    memory_budget_mb: Optional[float] = None
+) -> OriginalEmbeddingsCache:
+    """
+    Process-wide OriginalEmbeddingsCache with an in-memory LRU tier.
+    
+    One instance is kept per cache directory, so the manifest is loaded once
+    and originals revalidated by many queries are read from disk once.
+    
+    Args:
+        model_config: Loaded fingerprint model config; its
+            ``embeddings_cache.memory_budget_mb`` setting is used when
+            memory_budget_mb is not given, and background maintenance is
+            started for a new instance if ``maintenance_interval_minutes`` is set
+        cache_dir: Directory of the on-disk cache
+        memory_budget_mb: Byte budget of the memory tier in MB (0 disables it);
+            a different value resizes an existing instance
+        
+    Returns:
+        The shared cache for cache_dir
+    """
+    if memory_budget_mb is None:
+        cache_config = ((model_config or {}).get("config") or {}).get("embeddings_cache") or {}
+        memory_budget_mb = cache_config.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)
+    budget_bytes = int(memory_budget_mb * 1024 * 1024)
+    
+    key = str(Path(cache_dir).resolve())
+    with _shared_caches_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = OriginalEmbeddingsCache(cache_dir=Path(cache_dir), memory_budget_bytes=budget_bytes)
+            _shared_caches[key] = cache
+            from .cache_maintenance import start_periodic_maintenance
+            start_periodic_maintenance(cache, model_config)
+        elif cache.memory is None and budget_bytes > 0:
+            cache.memory = EmbeddingsMemoryTier(budget_bytes)
+        elif cache.memory is not None and cache.memory.budget_bytes != budget_bytes:
+            cache.memory.resize(budget_bytes)
+    return cache
@@ -1,35 +1,15 @@
 """Parallel processing utilities for query optimization."""
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, List, Tuple, Any, Optional, Sequence
 import numpy as np
 
+from .segment_map import file_id_from_segment_id
+
 logger = logging.getLogger(__name__)
 
 
-def _query_single_segment(args: Tuple) -> Dict:
-    """
-    Query single segment - thread-safe wrapper for parallel processing.
-    
-    Args:
-        args: Tuple of (seg, emb, index, topk, index_metadata)
-        
-    Returns:
-        Dictionary with segment query results
-    """
-    seg, emb, index, topk, index_metadata = args
-    
-    from .query_index import query_index
-    
-    results = query_index(
-        index,
-        emb,
-        topk=topk,
-        ids=index_metadata.get("ids") if index_metadata else None,
-        normalize=True,
-        index_metadata=index_metadata
-    )
-    
+def segment_result(seg: Dict, results: List[Dict]) -> Dict:
+    """Segment query result dictionary (segment metadata plus its hits)."""
     return {
         "segment_id": seg["segment_id"],
         "start": seg["start"],
@@ -41,24 +21,26 @@ def _query_single_segment(args: Tuple) -> Dict:
     }
 
 
-def query_segments_parallel(
-    segments: List[Dict],
+def query_segments_batch(
+    segments: Sequence[Dict],
     embeddings: np.ndarray,
     index: Any,
     topk: int,
-    index_metadata: Optional[Dict] = None,
-    max_workers: Optional[int] = None
+    index_metadata: Optional[Dict] = None
 ) -> List[Dict]:
     """
-    Query multiple segments in parallel for improved performance.
+    Query all segments with one batched index search.
+    
+    Segments of several scales can be passed together (concatenate their
+    segment lists and embedding matrices).
     
     Args:
-        segments: List of segment dictionaries
+        segments: SegmentMatrix or list of segment dictionaries (metadata only;
+            a SegmentMatrix builds each segment's dict on access)
         embeddings: Array of embeddings (N_segments, D)
         index: FAISS index
         topk: Number of top results per segment
         index_metadata: Index metadata dictionary
-        max_workers: Maximum number of worker threads (default: min(8, len(segments)))
         
     Returns:
         List of segment result dictionaries, in same order as input
@@ -66,54 +48,34 @@ def query_segments_parallel(
     if len(segments) == 0:
         return []
     
-    # Determine optimal number of workers
-    if max_workers is None:
-        max_workers = min(8, len(segments), 4)  # Conservative: max 8 workers
-    
-    # If only 1 segment, no need for parallel processing
-    if len(segments) == 1:
-        return [_query_single_segment((segments[0], embeddings[0], index, topk, index_metadata))]
+    from .query_index import search_batch, format_results, is_inner_product
     
-    # Prepare arguments for parallel processing
-    query_args = [
-        (seg, emb, index, topk, index_metadata)
-        for seg, emb in zip(segments, embeddings)
-    ]
-    
-    # Execute queries in parallel
-    results = [None] * len(segments)
-    
-    try:
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            futures = {executor.submit(_query_single_segment, args): i 
-                      for i, args in enumerate(query_args)}
-            
-            # Collect results as they complete
-            for future in as_completed(futures):
-                idx = futures[future]
-                try:
-                    results[idx] = future.result()
-                except Exception as e:
-                    logger.error(f"Error querying segment {idx}: {e}")
-                    # Fallback: create empty result
-                    results[idx] = {
-                        "segment_id": segments[idx].get("segment_id", f"seg_{idx}"),
-                        "start": segments[idx].get("start", 0.0),
-                        "end": segments[idx].get("end", 0.0),
-                        "segment_idx": idx,
-                        "scale_length": segments[idx].get("scale_length", 3.5),
-                        "scale_weight": segments[idx].get("scale_weight", 1.0),
-                        "results": []
-                    }
-    except Exception as e:
-        logger.error(f"Parallel query execution failed: {e}, falling back to sequential")
-        # Fallback to sequential processing
-        results = []
-        for args in query_args:
-            results.append(_query_single_segment(args))
+    distances, indices, file_ids = search_batch(index, embeddings, topk, index_metadata)
+    results = format_results(
+        distances,
+        indices,
+        ids=index_metadata.get("ids") if index_metadata else None,
+        inner_product=is_inner_product(index, index_metadata),
+        file_ids=file_ids
+    )
+    return [segment_result(seg, seg_results) for seg, seg_results in zip(segments, results)]
+
+
+def query_segments_parallel(
+    segments: Sequence[Dict],
+    embeddings: np.ndarray,
+    index: Any,
+    topk: int,
+    index_metadata: Optional[Dict] = None,
+    max_workers: Optional[int] = None
+) -> List[Dict]:
+    """
+    Query multiple segments (kept for compatibility; see query_segments_batch).
     
-    return results
+    One batched search replaces the former thread-per-segment fan-out, so
+    max_workers is ignored.
+    """
+    return query_segments_batch(segments, embeddings, index, topk, index_metadata)
 
 
 def check_early_termination(
@@ -182,7 +144,7 @@ def check_early_termination(
     
     # Check if expected original is top candidate with high confidence
     for candidate_id, scores in candidate_scores.items():
-        if expected_orig_id in str(candidate_id):
+        if file_id_from_segment_id(candidate_id) == expected_orig_id:
             rank_1_ratio = scores["rank_1_count"] / scores["total_segments"] if scores["total_segments"] > 0 else 0.0
             max_similarity = scores["max_similarity"]
             mean_similarity = np.mean(scores["similarities"]) if scores["similarities"] else 0.0
@@ -0,0 +1,81 @@
+"""Background tasks that repeat a maintenance pass on a daemon thread.
+
+Used by PeriodicCacheMaintenance (fingerprint.cache_maintenance) and
+PeriodicIndexCompaction (fingerprint.index_updates). start_periodic_task
+keeps at most one running task per resolved path.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Runs run_once on a daemon thread every interval_seconds."""
+
+    # Thread name and log label of the task
+    name = "periodic-task"
+
+    def __init__(self, interval_seconds: float):
+        """
+        Args:
+            interval_seconds: Pause between passes (the first pass runs immediately)
+        """
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self):
+        """One pass of the task (exceptions are logged, the next pass still runs)."""
+        raise NotImplementedError
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "PeriodicTask":
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop after the current pass (if any) and wait for the thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"{self.name} failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+
+_periodic_tasks: Dict[str, PeriodicTask] = {}
+_periodic_tasks_lock = threading.Lock()
+
+
+def start_periodic_task(path: Path, create: Callable[[], PeriodicTask]) -> PeriodicTask:
+    """
+    Start a task for a path unless one is already running for it.
+
+    Args:
+        path: Cache directory or index the task maintains (registry key once resolved)
+        create: Builds the task when none is running
+
+    Returns:
+        The running task
+    """
+    key = str(Path(path).resolve())
+    with _periodic_tasks_lock:
+        task = _periodic_tasks.get(key)
+        if task is None or not task.running:
+            task = create().start()
+            _periodic_tasks[key] = task
+    return task
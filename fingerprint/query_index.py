@@ -1,13 +1,31 @@
 """FAISS index building and querying."""
 import json
 import logging
+import time
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict
 import numpy as np
 import faiss
 
+from .segment_map import SegmentFileMap, segment_file_map, public_metadata
+from .index_sidecar import (
+    SIDECAR_FORMAT_VERSION, atomic_write_json, generation_path, read_sidecar, replacing, write_sidecar
+)
+from .index_types import (
+    DEFAULT_TRAIN_SIZE,
+    create_index,
+    index_components,
+    index_parameters,
+    min_training_vectors,
+    search_parameters,
+    training_sample,
+)
+
 logger = logging.getLogger(__name__)
 
+# Search parameters that search tuning sets per tier (see fingerprint.search_tuning)
+TUNED_PARAMETERS = ("ef_search", "nprobe")
+
 
 def build_index(
     embeddings: np.ndarray,
@@ -15,21 +33,38 @@ def build_index(
     index_path: Path,
     index_config: Dict,
     save_metadata: bool = True,
-    daw_metadata: Optional[Dict[str, Dict]] = None
+    daw_metadata: Optional[Dict[str, Dict]] = None,
+    training_vectors: Optional[np.ndarray] = None
 ) -> faiss.Index:
     """
     Build FAISS index from embeddings.
     
+    Index types are listed in fingerprint.index_types; IVF, IVF-PQ, OPQ+IVF-PQ
+    and HNSW-SQ indexes are trained on at most ``training.num_vectors`` vectors
+    (default 100000) sampled from training_vectors, or from the embeddings.
+    With ``sharding.num_shards`` > 1 the catalog is split by file into shards
+    (see fingerprint.sharded_index) and a ShardedIndex is returned.
+    
     Args:
         embeddings: Array of embeddings (N, D)
         ids: List of IDs corresponding to embeddings
         index_path: Path to save index
         index_config: Index configuration dictionary
         save_metadata: Whether to save ID mapping
+        training_vectors: Training set for trained index types (e.g. sampled
+            from the embeddings cache); defaults to the embeddings
         
     Returns:
-        FAISS index object
+        FAISS index object (or ShardedIndex)
     """
+    num_shards = int((index_config.get("sharding") or {}).get("num_shards") or 1)
+    if num_shards > 1 and save_metadata:
+        from .sharded_index import build_sharded_index
+        return build_sharded_index(
+            embeddings, ids, index_path, index_config, num_shards,
+            daw_metadata=daw_metadata, training_vectors=training_vectors
+        )
+    
     n_vectors, dim = embeddings.shape
     index_type = index_config.get("index_type", "hnsw")
     metric = index_config.get("metric", "cosine")
@@ -37,7 +72,8 @@ def build_index(
     logger.info(f"Building {index_type} index with {n_vectors} vectors of dimension {dim}")
     
     # Normalize embeddings for cosine similarity
-    if index_config.get("normalize", True) or metric == "cosine":
+    normalize = index_config.get("normalize", True) or metric == "cosine"
+    if normalize:
         norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
         norms = np.where(norms == 0, 1, norms)
         embeddings = embeddings / norms
@@ -50,54 +86,36 @@ def build_index(
         elif metric == "ip":
             metric = faiss.METRIC_INNER_PRODUCT
     
-    # Create index based on type
-    if index_type == "flat":
-        if metric == faiss.METRIC_INNER_PRODUCT:
-            index = faiss.IndexFlatIP(dim)
-        else:
-            index = faiss.IndexFlatL2(dim)
-    
-    elif index_type == "hnsw":
-        params = index_config.get("parameters", {})
-        M = params.get("M", 32)
-        ef_construction = params.get("ef_construction", 200)
-        
-        if metric == faiss.METRIC_INNER_PRODUCT:
-            index = faiss.IndexHNSWFlat(dim, M, faiss.METRIC_INNER_PRODUCT)
-        else:
-            index = faiss.IndexHNSWFlat(dim, M, faiss.METRIC_L2)
-        
-        index.hnsw.efConstruction = ef_construction
-    
-    elif index_type == "ivf":
-        params = index_config.get("parameters", {})
-        nlist = params.get("nlist", 100)
-        nprobe = params.get("nprobe", 10)
-        
-        quantizer = faiss.IndexFlatL2(dim) if metric == faiss.METRIC_L2 else faiss.IndexFlatIP(dim)
-        index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
-        index.nprobe = nprobe
-        
-        # Train index
-        logger.info("Training IVF index...")
-        index.train(embeddings)
+    # Training set (only used by index types that need training)
+    params = index_parameters(index_config)
+    training = index_config.get("training") or {}
+    if index_type not in ("flat", "hnsw"):
+        if training_vectors is None:
+            training_vectors = embeddings
+        training_vectors = training_sample(
+            training_vectors, training.get("num_vectors", DEFAULT_TRAIN_SIZE), training.get("seed", 0)
+        ).astype(np.float32)
+        if normalize:
+            training_vectors = normalize_vectors(training_vectors)
+        if len(training_vectors) < min_training_vectors(index_type, params):
+            # E.g. a temporary index over one file: exact search is as fast
+            logger.warning(f"Too few vectors to train a {index_type} index ({len(training_vectors)}), building a flat index")
+            index_type = "flat"
     
-    else:
-        raise ValueError(f"Unknown index type: {index_type}")
+    # Create index based on type
+    index = create_index(index_type, dim, metric, params, training_vectors)
     
     # Add vectors to index
     logger.info("Adding vectors to index...")
     index.add(embeddings.astype(np.float32))
     
     # Save index
-    index_path.parent.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(index_path))
+    write_index(index, index_path)
     logger.info(f"Saved index to {index_path}")
     
     # Save metadata (ID mapping)
     if save_metadata:
-        metadata_path = index_path.with_suffix(".json")
-        metadata = {
+        save_index_metadata(index_path, {
             "ids": ids,
             "num_vectors": n_vectors,
             "dimension": dim,
@@ -105,143 +123,598 @@ def build_index(
             "metric": metric,
             "config": index_config,
             "daw_metadata": daw_metadata or {},  # Store DAW metadata
-        }
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2, default=str)
-        logger.info(f"Saved metadata to {metadata_path}")
+        })
         if daw_metadata:
             logger.info(f"Included DAW metadata for {len(daw_metadata)} files")
     
     return index
 
 
-def load_index(index_path: Path) -> Tuple[faiss.Index, Dict]:
-    """Load FAISS index and metadata."""
-    index = faiss.read_index(str(index_path))
+def write_index(index: faiss.Index, index_path: Path):
+    """
+    Write an index through a temporary file.
+    
+    The final rename gives the path a new file, so processes that have the
+    previous version memory-mapped keep reading a valid file.
+    """
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with replacing(index_path) as tmp_path:
+        faiss.write_index(index, str(tmp_path))
+
+
+def save_index_metadata(
+    index_path: Path,
+    metadata: Dict,
+    segment_map: Optional[SegmentFileMap] = None,
+    data_path: Optional[Path] = None
+) -> Dict:
+    """
+    Save index metadata: a small JSON file plus the binary sidecar.
+    
+    Segment IDs, the segment -> file map and DAW metadata go to sidecar files
+    (see fingerprint.index_sidecar); everything else stays in the JSON.
+    
+    Args:
+        index_path: Path of the index the metadata belongs to
+        metadata: Metadata dict (with ``ids`` and optionally ``daw_metadata``)
+        segment_map: Segment -> file map of ``ids`` (built from the IDs if omitted)
+        data_path: Index file the sidecar files are named after (default: index_path)
+        
+    Returns:
+        The metadata as written to the JSON file
+    """
+    metadata = public_metadata(metadata)
+    ids = metadata.pop("ids", None)
+    if ids is None:
+        ids = []
+    daw_metadata = metadata.pop("daw_metadata", None)
+    mapping = segment_map if segment_map is not None else SegmentFileMap.from_ids(ids)
+    for key in ("file_table", "file_ranges", "segment_files"):
+        metadata.pop(key, None)
+    
+    metadata["format_version"] = SIDECAR_FORMAT_VERSION
+    metadata["num_files"] = mapping.num_files
+    metadata["num_removed"] = mapping.num_removed
+    metadata["sidecar"] = write_sidecar(
+        data_path or index_path, ids, mapping.file_ids, mapping.segment_files, daw_metadata
+    )
     
     metadata_path = index_path.with_suffix(".json")
-    if metadata_path.exists():
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
-    else:
-        metadata = {"ids": None}
+    atomic_write_json(metadata_path, metadata)
+    logger.info(f"Saved metadata to {metadata_path} (+ sidecar: {', '.join(metadata['sidecar'].values())})")
+    return metadata
+
+
+def _read_metadata(index_path: Path) -> Optional[Dict]:
+    """JSON metadata of the index at index_path (None if there is none)."""
+    metadata_path = index_path.with_suffix(".json")
+    if not metadata_path.exists():
+        return None
+    with open(metadata_path, 'r') as f:
+        return json.load(f)
+
+
+def _index_files(index_path: Path, metadata: Optional[Dict]) -> List[str]:
+    """Names of the index file and sidecar files that JSON metadata refers to."""
+    if not metadata or "sharding" in metadata:
+        return []
+    return [metadata.get("index_file") or index_path.name] + list((metadata.get("sidecar") or {}).values())
+
+
+def save_index(
+    index: faiss.Index,
+    index_path: Path,
+    metadata: Dict,
+    segment_map: Optional[SegmentFileMap] = None
+) -> Dict:
+    """
+    Save an updated index together with its metadata as one atomic change.
+    
+    The index and sidecar files are written under the names of a new
+    generation (faiss_index.g000001.bin, faiss_index.g000001.ids.npy, ...)
+    and the JSON metadata, which names them, is replaced last: load_index
+    sees either the previous index with its metadata or the new one, never
+    a mix. Files of the previous generation are removed afterwards
+    (processes that have them memory-mapped keep valid mappings).
+    
+    Args:
+        index: Updated index
+        index_path: Index path (the JSON metadata is index_path.with_suffix(".json"))
+        metadata: Its metadata (with ``ids`` and optionally ``daw_metadata``)
+        segment_map: Segment -> file map of ``ids`` (built from the IDs if omitted)
+        
+    Returns:
+        Saved metadata (with ``generation`` and ``index_file``)
+    """
+    previous = _read_metadata(index_path)
+    generation = max(int((previous or {}).get("generation") or 0), int(metadata.get("generation") or 0)) + 1
+    data_path = generation_path(index_path, generation)
+    write_index(index, data_path)
+    
+    metadata = dict(metadata)
+    metadata["generation"] = generation
+    metadata["index_file"] = data_path.name
+    saved = save_index_metadata(index_path, metadata, segment_map=segment_map, data_path=data_path)
     
-    logger.info(f"Loaded index from {index_path}")
+    current = set(_index_files(index_path, saved))
+    for name in _index_files(index_path, previous):
+        if name not in current:
+            (index_path.parent / name).unlink(missing_ok=True)
+    logger.info(f"Saved index generation {generation} to {data_path}")
+    return metadata
+
+
+def append_files(
+    index: faiss.Index,
+    metadata: Dict,
+    index_path: Path,
+    file_ids: List[str],
+    embeddings: List[np.ndarray]
+) -> Dict:
+    """
+    Add the segment vectors of new files to an index and save it with its metadata.
+    
+    Index and metadata are saved as one atomic change (see save_index).
+    
+    Args:
+        index: Index loaded with mmap=False
+        metadata: Its metadata (from load_index)
+        index_path: Where to save the updated index
+        file_ids: New files, in order
+        embeddings: Embeddings (N_segments, D) of each file
+        
+    Returns:
+        Updated metadata
+    """
+    mapping = segment_file_map(metadata) or SegmentFileMap([], np.empty(0, dtype=np.int32))
+    new_ids = [f"{file_id}_seg_{i:04d}" for file_id, file_embeddings in zip(file_ids, embeddings)
+               for i in range(len(file_embeddings))]
+    if new_ids:
+        index.add(np.ascontiguousarray(np.vstack(embeddings), dtype=np.float32))
+    
+    updated_files = mapping.extend(file_ids, [len(file_embeddings) for file_embeddings in embeddings])
+    updated_metadata = public_metadata(metadata)
+    updated_metadata.pop("file_ranges", None)
+    updated_metadata["ids"] = list(metadata.get("ids") or []) + new_ids
+    updated_metadata["file_table"] = updated_files.file_ids
+    updated_metadata["segment_files"] = updated_files.segment_files
+    updated_metadata["num_vectors"] = index.ntotal
+    updated_metadata["last_updated"] = time.time()
+    
+    updated_metadata = save_index(index, index_path, updated_metadata, segment_map=updated_files)
+    updated_metadata["_segment_map"] = updated_files
+    updated_metadata["_index_path"] = str(index_path)
+    return updated_metadata
+
+
+def index_exists(index_path: Path) -> bool:
+    """
+    Whether an index exists at index_path: the index file itself, a saved
+    update generation of it, or a shard manifest.
+    """
+    if index_path.exists():
+        return True
+    metadata = _read_metadata(index_path)
+    if not metadata:
+        return False
+    if "index_file" in metadata:
+        return (index_path.parent / metadata["index_file"]).exists()
+    return "sharding" in metadata
+
+
+def _read_index(index_path: Path, mmap: bool) -> Tuple[faiss.Index, bool]:
+    """Read an index, memory-mapping its vector storage where the index type allows."""
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)  # faiss >= 1.8
+    if mmap and mmap_flag is not None:
+        try:
+            return faiss.read_index(str(index_path), mmap_flag | faiss.IO_FLAG_READ_ONLY), True
+        except RuntimeError as e:
+            logger.debug(f"Memory-mapped read not supported for {index_path}: {e}")
+    return faiss.read_index(str(index_path)), False
+
+
+def load_index(
+    index_path: Path,
+    mmap: bool = True,
+    with_daw_metadata: bool = True
+) -> Tuple[faiss.Index, Dict]:
+    """
+    Load FAISS index and metadata.
+    
+    Args:
+        index_path: Path to the index file
+        mmap: Memory-map the index storage and sidecar arrays (read-only:
+            pass False to add vectors to the loaded index)
+        with_daw_metadata: Also read the DAW metadata sidecar
+        
+    Returns:
+        Tuple of (index, metadata dict); ``ids`` is an IdTable for indexes
+        with a sidecar and a list for older JSON-only metadata. Sharded
+        indexes load as a ShardedIndex with the metadata of all shards combined.
+        Updated indexes load the generation their JSON metadata names.
+    """
+    for attempt in range(2):
+        metadata = _read_metadata(index_path) or {"ids": None}
+        if "sharding" in metadata:
+            from .sharded_index import ShardedIndex
+            index = ShardedIndex.load(index_path, metadata, mmap=mmap, with_daw_metadata=with_daw_metadata)
+            return index, index.metadata
+        
+        data_path = index_path.parent / metadata.get("index_file", index_path.name)
+        try:
+            index, mmapped = _read_index(data_path, mmap)
+            if "sidecar" in metadata:
+                read_sidecar(index_path, metadata, mmap=mmap, with_daw_metadata=with_daw_metadata)
+            break
+        except (OSError, RuntimeError):
+            # An update replaced the generation between reading the JSON and its files
+            if attempt or not metadata.get("generation"):
+                raise
+            logger.debug(f"Index generation {metadata['generation']} of {index_path} was replaced, reloading")
+    metadata["_index_path"] = str(index_path)
+    
+    logger.info(f"Loaded index from {data_path}" + (" (memory-mapped)" if mmapped else ""))
     return index, metadata
 
 
-def query_index(
+def _metric_from_metadata(index_metadata: Optional[Dict]) -> Optional[int]:
+    """FAISS metric enum stored in index metadata (integer or string form)."""
+    if not index_metadata:
+        return None
+    metric_type = index_metadata.get("metric")
+    # Handle both integer enum (from JSON) and string representations
+    if isinstance(metric_type, str):
+        if metric_type.lower() in ["inner_product", "ip", "cosine"]:
+            return faiss.METRIC_INNER_PRODUCT
+        if metric_type.lower() == "l2":
+            return faiss.METRIC_L2
+        return None
+    return metric_type
+
+
+def is_inner_product(index: faiss.Index, index_metadata: Optional[Dict] = None) -> bool:
+    """
+    Whether search distances of this index are inner products (= cosine similarity).
+    
+    CRITICAL: For cosine similarity with normalized vectors, FAISS uses
+    METRIC_INNER_PRODUCT and the "distance" returned IS the similarity
+    (higher = more similar); L2 distances have to be converted.
+    """
+    metric_type = getattr(index, "metric_type", None)
+    if metric_type is None:
+        metric_type = _metric_from_metadata(index_metadata)
+    if metric_type is None:
+        # Default: cosine similarity on normalized vectors (our index config)
+        return True
+    return metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def to_similarity(distances: np.ndarray, inner_product: bool) -> np.ndarray:
+    """Convert search distances to similarities (higher = more similar)."""
+    if inner_product:
+        return distances
+    return 1.0 / (1.0 + distances)
+
+
+def configure_search(index: faiss.Index, topk: int, index_metadata: Optional[Dict] = None):
+    """
+    Set search-time parameters for a query depth of topk.
+    
+    From the index config parameters (see index_parameters): HNSW layers get ``efSearch``
+    (``ef_search``, default 50, raised to at least the depth the layer is
+    searched to), IVF layers ``nprobe`` and refine stages ``k_factor``
+    (``refine_k_factor``) when set. The index is only touched when a value
+    changes.
+    """
+    shards = getattr(index, "shards", None)
+    if shards is not None:  # ShardedIndex
+        for shard in shards:
+            configure_search(shard, topk, index_metadata)
+        return
+    
+    components = index_components(index)
+    if not components:
+        return
+    params = index_parameters((index_metadata or {}).get("config") or {})
+    
+    refine = components.get("refine")
+    if refine is not None and "refine_k_factor" in params:
+        k_factor = float(params["refine_k_factor"])
+        if refine.k_factor != k_factor:
+            refine.k_factor = k_factor
+            logger.debug(f"Set refine k_factor to {k_factor}")
+    # The layer under a refine stage is searched k_factor times deeper
+    base_depth = int(topk * refine.k_factor) if refine is not None else topk
+    
+    hnsw = components.get("hnsw")
+    if hnsw is not None:
+        # Ensure ef_search is at least topk (improves recall)
+        ef_search = max(params.get("ef_search", 50), base_depth)
+        if hnsw.hnsw.efSearch != ef_search:
+            hnsw.hnsw.efSearch = ef_search
+            logger.debug(f"Set HNSW ef_search to {ef_search} for topk={topk}")
+    
+    ivf = components.get("ivf")
+    if ivf is not None and "nprobe" in params:
+        nprobe = min(int(params["nprobe"]), ivf.nlist)
+        if ivf.nprobe != nprobe:
+            ivf.nprobe = nprobe
+            logger.debug(f"Set IVF nprobe to {nprobe}")
+
+
+def with_search_parameters(index_metadata: Optional[Dict], parameters: Dict) -> Dict:
+    """
+    Shallow copy of index metadata whose config searches with other parameters.
+    
+    ``parameters`` (e.g. ef_search, nprobe) override the config's
+    ``parameters`` and those of its index type in ``parameters_by_type``.
+    The copy shares IDs and the segment map with the original.
+    """
+    index_metadata = index_metadata if index_metadata is not None else {}
+    segment_file_map(index_metadata)  # Build the map once, in the shared dict
+    config = dict(index_metadata.get("config") or {})
+    config["parameters"] = {**(config.get("parameters") or {}), **parameters}
+    index_type = config.get("index_type", "hnsw")
+    by_type = dict(config.get("parameters_by_type") or {})
+    if by_type.get(index_type) is not None:
+        by_type[index_type] = {**by_type[index_type], **parameters}
+        config["parameters_by_type"] = by_type
+    view = {key: value for key, value in index_metadata.items() if key not in ("_search_tiers", "_live_selector")}
+    view["config"] = config
+    return view
+
+
+def search_tier(index_metadata: Optional[Dict], tier: Optional[str]) -> Optional[Dict]:
+    """Tuned search settings of a tier (transform severity), see fingerprint.search_tuning."""
+    search_tiers = ((index_metadata or {}).get("config") or {}).get("search_tiers") or {}
+    return (search_tiers.get("tiers") or {}).get(tier) if tier else None
+
+
+def tier_metadata(index_metadata: Optional[Dict], tier: Optional[str]) -> Optional[Dict]:
+    """
+    Index metadata that searches with the tuned ef_search / nprobe of a tier.
+    
+    Returns the metadata itself when the tier has no tuned settings; views
+    are built once per tier and kept under ``"_search_tiers"``.
+    """
+    settings = search_tier(index_metadata, tier)
+    if not settings:
+        return index_metadata
+    views = index_metadata.setdefault("_search_tiers", {})
+    if tier not in views:
+        tuned = {key: settings[key] for key in TUNED_PARAMETERS if settings.get(key) is not None}
+        views[tier] = with_search_parameters(index_metadata, tuned)
+    return views[tier]
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows as float32 (zero rows are left as they are)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms = np.where(norms == 0, 1, norms)
+    return vectors / norms
+
+
+def reconstruct_vectors(index: faiss.Index, positions: np.ndarray) -> np.ndarray:
+    """
+    Stored vectors at index positions (N, D), as added (normalized).
+    
+    A contiguous run of positions (e.g. one file's range) is read with one
+    reconstruct_n call. IVF layers get a direct map on first use; sharded
+    indexes read every position from its shard.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    shards = getattr(index, "shards", None)
+    if shards is not None:  # ShardedIndex
+        vectors = np.empty((len(positions), index.d), dtype=np.float32)
+        shard_of_position = np.searchsorted(index.offsets, positions, side="right") - 1
+        for shard in np.unique(shard_of_position):
+            rows = shard_of_position == shard
+            vectors[rows] = reconstruct_vectors(shards[shard], positions[rows] - index.offsets[shard])
+        return vectors
+    if len(positions) == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    if positions[-1] - positions[0] == len(positions) - 1 and np.all(np.diff(positions) == 1):
+        return index.reconstruct_n(int(positions[0]), len(positions))
+    return index.reconstruct_batch(positions)
+
+
+def removed_vectors_selector(index_metadata: Optional[Dict]) -> Optional[faiss.IDSelector]:
+    """
+    IDSelector of the vectors that still belong to a file, if files were
+    removed from the index without compacting it (else None).
+    
+    Built once per segment map and kept in the metadata under ``"_live_selector"``.
+    """
+    mapping = segment_file_map(index_metadata)
+    if mapping is None or not mapping.num_removed:
+        return None
+    cached = index_metadata.get("_live_selector")
+    if cached is None or cached[0] is not mapping:
+        removed = faiss.IDSelectorBatch(mapping.removed_positions())
+        selector = faiss.IDSelectorNot(removed)
+        cached = (mapping, selector, removed)  # The outer selector does not own the inner one
+        index_metadata["_live_selector"] = cached
+    return cached[1]
+
+
+def search_index(index: faiss.Index, x: np.ndarray, k: int, index_metadata: Optional[Dict] = None):
+    """index.search that skips the vectors of removed files (see fingerprint.index_updates)."""
+    selector = None if hasattr(index, "shards") else removed_vectors_selector(index_metadata)
+    if selector is None:
+        return index.search(x, k)
+    return index.search(x, k, params=search_parameters(index, selector))
+
+
+def search_batch(
     index: faiss.Index,
     query_vectors: np.ndarray,
     topk: int = 10,
-    ids: Optional[List[str]] = None,
-    normalize: bool = True,
-    index_metadata: Optional[Dict] = None
-) -> List[Dict]:
+    index_metadata: Optional[Dict] = None,
+    normalize: bool = True
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
     """
-    Query FAISS index.
+    Search many query vectors with one index.search call.
+    
+    All segments of a query (of every scale) can be stacked into one matrix;
+    search parameters are set once for the batch.
     
     Args:
         index: FAISS index
         query_vectors: Query embeddings (N, D) or (D,)
-        topk: Number of results to return
-        ids: List of IDs for index vectors (from metadata)
-        normalize: Whether to normalize query vectors
-        index_metadata: Index metadata dict (may contain ef_search parameter)
+        topk: Number of results per query vector
+        index_metadata: Index metadata dict (IDs and ef_search parameter)
+        normalize: Whether to L2-normalize query vectors
         
     Returns:
-        List of result dictionaries
+        Tuple of (distances, indices, file_ids), each (N, topk). Missing hits
+        have index -1 and file ID None; file_ids is None without metadata IDs.
+    """
+    if normalize:
+        query_vectors = normalize_vectors(query_vectors)
+    else:
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+    
+    topk = max(1, min(int(topk), index.ntotal)) if index.ntotal else max(1, int(topk))
+    configure_search(index, topk, index_metadata)
+    distances, indices = search_index(index, np.ascontiguousarray(query_vectors), topk, index_metadata)
+    
+    mapping = segment_file_map(index_metadata)
+    file_ids = mapping.file_ids_of(indices) if mapping is not None else None
+    return distances, indices, file_ids
+
+
+def score_file(
+    index: faiss.Index,
+    query_vectors: np.ndarray,
+    file_id: str,
+    index_metadata: Optional[Dict],
+    normalize: bool = True
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    # Handle single vector
-    if query_vectors.ndim == 1:
-        query_vectors = query_vectors.reshape(1, -1)
+    Exact similarities of query vectors to every indexed segment of one file.
     
-    # Normalize query vectors
+    Reads the file's stored vectors from the index (one reconstruct_n call
+    for its contiguous range, see reconstruct_vectors) and scores them with
+    one matrix product, instead of searching the whole index deep enough to
+    reach the file's segments.
+    
+    Args:
+        index: FAISS index
+        query_vectors: Query embeddings (N, D) or (D,)
+        file_id: File whose segments to score
+        index_metadata: Index metadata (segment -> file map)
+        normalize: Whether to L2-normalize query vectors
+        
+    Returns:
+        Tuple of (similarities (N, M), positions (M)): the similarity of every
+        query vector to each of the file's M segments, on the same scale as
+        search results (see to_similarity), and the segments' index positions.
+        M is 0 if the file is not indexed.
+    """
     if normalize:
-        norms = np.linalg.norm(query_vectors, axis=1, keepdims=True)
-        norms = np.where(norms == 0, 1, norms)
-        query_vectors = query_vectors / norms
-    
-    # Set ef_search for HNSW indexes (improves recall)
-    if isinstance(index, faiss.IndexHNSWFlat) or isinstance(index, faiss.IndexHNSW):
-        ef_search = 50  # Default
-        if index_metadata:
-            config = index_metadata.get("config", {})
-            params = config.get("parameters", {})
-            ef_search = params.get("ef_search", 50)
-        # Ensure ef_search is at least topk
-        ef_search = max(ef_search, topk)
-        index.hnsw.efSearch = ef_search
-        logger.debug(f"Set HNSW ef_search to {ef_search} for topk={topk}")
-    
-    # Query
-    distances, indices = index.search(query_vectors.astype(np.float32), topk)
-    
-    # Format results
-    # Determine metric type from metadata for correct similarity calculation
-    # CRITICAL: For cosine similarity with normalized vectors, FAISS uses METRIC_INNER_PRODUCT
-    # In this case, the "distance" returned IS the cosine similarity (higher = more similar)
-    metric_type = None
-    if index_metadata:
-        metric_type = index_metadata.get("metric")
-        # Handle both integer enum (from JSON) and string representations
-        if isinstance(metric_type, str):
-            if metric_type.lower() in ["inner_product", "ip", "cosine"]:
-                metric_type = faiss.METRIC_INNER_PRODUCT
-            elif metric_type.lower() == "l2":
-                metric_type = faiss.METRIC_L2
-        elif isinstance(metric_type, int):
-            # JSON loads enum as integer, compare directly
-            pass  # Already an integer enum
-    
-    # For HNSW with inner product (cosine similarity), distance IS similarity
-    # For L2 distance, convert to similarity
-    is_inner_product = False
-    if isinstance(index, faiss.IndexFlatIP):
-        is_inner_product = True
-    elif isinstance(index, (faiss.IndexHNSWFlat, faiss.IndexHNSW)):
-        # Check metric from metadata
-        # METRIC_INNER_PRODUCT = 0, METRIC_L2 = 1
-        if metric_type == faiss.METRIC_INNER_PRODUCT or metric_type == 0:
-            is_inner_product = True
-        elif metric_type == faiss.METRIC_L2 or metric_type == 1:
-            is_inner_product = False
-        else:
-            # Default: assume inner product for HNSW (most common case with normalized vectors)
-            # Cosine similarity with normalized vectors uses inner product metric
-            # This is safe because our config uses cosine similarity with normalization
-            is_inner_product = True
-            logger.debug(f"Metric type not found in metadata (got {metric_type}), assuming inner product (cosine similarity) for HNSW index")
+        query_vectors = normalize_vectors(query_vectors)
+    else:
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+    
+    mapping = segment_file_map(index_metadata)
+    positions = mapping.segments_of(file_id) if mapping is not None else np.empty(0, dtype=np.int64)
+    file_vectors = reconstruct_vectors(index, positions)
+    products = query_vectors @ file_vectors.T
+    if is_inner_product(index, index_metadata):
+        return products, positions
+    # Squared L2 distances, as an L2 index reports them
+    distances = (
+        np.einsum("ij,ij->i", query_vectors, query_vectors)[:, None]
+        + np.einsum("ij,ij->i", file_vectors, file_vectors)[None, :]
+        - 2.0 * products
+    )
+    return to_similarity(np.maximum(distances, 0.0), False), positions
+
+
+def format_results(
+    distances: np.ndarray,
+    indices: np.ndarray,
+    ids: Optional[List[str]] = None,
+    inner_product: bool = True,
+    file_ids: Optional[np.ndarray] = None
+) -> List[List[Dict]]:
+    """
+    Result dictionaries (rank, index, distance, similarity, id, file_id) per query row.
+    
+    Args:
+        distances: Search distances (N, K)
+        indices: Search indices (N, K), -1 for missing hits
+        ids: List of IDs for index vectors (from metadata)
+        inner_product: Distances are similarities (see is_inner_product)
+        file_ids: File ID of every hit (N, K), as returned by search_batch
+        
+    Returns:
+        One list of result dictionaries per query row, missing hits dropped
+    """
+    similarities = to_similarity(np.asarray(distances, dtype=np.float64), inner_product).tolist()
+    distance_rows = np.asarray(distances, dtype=np.float64).tolist()
+    index_rows = np.asarray(indices).tolist()
+    file_rows = file_ids.tolist() if file_ids is not None else [[None] * len(row) for row in index_rows]
+    num_ids = len(ids) if ids else 0
     
     results = []
-    for i, (dist_row, idx_row) in enumerate(zip(distances, indices)):
+    for dist_row, sim_row, idx_row, file_row in zip(distance_rows, similarities, index_rows, file_rows):
         query_results = []
-        for dist, idx in zip(dist_row, idx_row):
+        for dist, similarity, idx, file_id in zip(dist_row, sim_row, idx_row, file_row):
             if idx < 0:  # Invalid index
                 continue
-            
-            # Calculate similarity correctly based on metric type
-            if is_inner_product:
-                # Inner product (cosine similarity for normalized vectors): distance IS similarity
-                # Higher distance = higher similarity (range typically 0-1 for normalized vectors)
-                similarity = float(dist)
-            else:
-                # L2 distance: convert to similarity (lower distance = higher similarity)
-                similarity = float(1.0 / (1.0 + dist))
-            
             result = {
                 "rank": len(query_results) + 1,
-                "index": int(idx),
-                "distance": float(dist),
+                "index": idx,
+                "distance": dist,
                 "similarity": similarity,
             }
-            
-            if ids and idx < len(ids):
+            if idx < num_ids:
                 result["id"] = ids[idx]
-            
+            if file_id is not None:
+                result["file_id"] = file_id
             query_results.append(result)
-        
         results.append(query_results)
+    return results
+
+
+def query_index(
+    index: faiss.Index,
+    query_vectors: np.ndarray,
+    topk: int = 10,
+    ids: Optional[List[str]] = None,
+    normalize: bool = True,
+    index_metadata: Optional[Dict] = None
+) -> List[Dict]:
+    """
+    Query FAISS index.
+    
+    Thin wrapper around search_batch and format_results; pass all query
+    vectors at once rather than calling this per segment.
+    
+    Args:
+        index: FAISS index
+        query_vectors: Query embeddings (N, D) or (D,)
+        topk: Number of results to return
+        ids: List of IDs for index vectors (from metadata)
+        normalize: Whether to normalize query vectors
+        index_metadata: Index metadata dict (may contain ef_search parameter)
+        
+    Returns:
+        List of result dictionaries (a list of such lists for several queries)
+    """
+    distances, indices, file_ids = search_batch(index, query_vectors, topk, index_metadata, normalize=normalize)
+    results = format_results(distances, indices, ids, is_inner_product(index, index_metadata), file_ids)
     
     # Return single result if single query
     if len(results) == 1:
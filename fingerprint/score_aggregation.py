@@ -0,0 +1,302 @@
+"""Vectorized aggregation of segment search hits into candidate scores."""
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+from .segment_map import SegmentFileMap
+
+logger = logging.getLogger(__name__)
+
+
+def _segment_field(segment, name: str, default):
+    """Field of a segment result dict or SegmentResult."""
+    if isinstance(segment, dict):
+        return segment.get(name, default)
+    return getattr(segment, name, default)
+
+
+class SegmentHits:
+    """
+    Search hits of S query segments as (S, K) arrays.
+
+    Attributes:
+        similarities: Hit similarities (S, K), 0 for missing hits
+        indices: Index positions of hits (S, K), -1 for missing hits
+        ranks: Rank of each hit within its segment (S, K), 0 for missing hits
+        scale_weights: Multi-scale weight of each segment (S,)
+        scale_lengths: Segment length of each segment (S,)
+        starts: Start time of each segment (S,)
+    """
+
+    def __init__(
+        self,
+        similarities: np.ndarray,
+        indices: np.ndarray,
+        ranks: Optional[np.ndarray] = None,
+        scale_weights: Optional[np.ndarray] = None,
+        scale_lengths: Optional[np.ndarray] = None,
+        starts: Optional[np.ndarray] = None,
+        rows: Optional[List[List[Dict]]] = None
+    ):
+        self.similarities = np.asarray(similarities, dtype=np.float64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        num_segments = self.indices.shape[0]
+        if ranks is None:
+            # Search order: rank = position among the segment's valid hits
+            ranks = np.where(self.valid, np.cumsum(self.valid, axis=1), 0)
+        self.ranks = np.asarray(ranks, dtype=np.int64)
+        self.scale_weights = np.ones(num_segments) if scale_weights is None else np.asarray(scale_weights, dtype=np.float64)
+        self.scale_lengths = np.ones(num_segments) if scale_lengths is None else np.asarray(scale_lengths, dtype=np.float64)
+        self.starts = np.arange(num_segments, dtype=np.float64) if starts is None else np.asarray(starts, dtype=np.float64)
+        self._rows = rows
+
+    @classmethod
+    def from_segment_results(cls, segment_results: Sequence) -> "SegmentHits":
+        """Build from segment result dicts (or SegmentResult objects) in their given order."""
+        rows = [_segment_field(seg, "results", None) or [] for seg in segment_results]
+        num_segments = len(rows)
+        width = max((len(row) for row in rows), default=0)
+        similarities = np.zeros((num_segments, width))
+        indices = np.full((num_segments, width), -1, dtype=np.int64)
+        ranks = np.zeros((num_segments, width), dtype=np.int64)
+        for s, row in enumerate(rows):
+            if row:
+                n = len(row)
+                similarities[s, :n] = [hit.get("similarity", 0.0) for hit in row]
+                indices[s, :n] = [hit.get("index", -1) for hit in row]
+                ranks[s, :n] = [hit.get("rank", k + 1) for k, hit in enumerate(row)]
+        return cls(
+            similarities,
+            indices,
+            ranks=ranks,
+            scale_weights=[_segment_field(seg, "scale_weight", 1.0) for seg in segment_results],
+            scale_lengths=[_segment_field(seg, "scale_length", 1.0) for seg in segment_results],
+            starts=[_segment_field(seg, "start", float(s)) for s, seg in enumerate(segment_results)],
+            rows=rows
+        )
+
+    def __len__(self) -> int:
+        return self.indices.shape[0]
+
+    @property
+    def valid(self) -> np.ndarray:
+        return self.indices >= 0
+
+    @property
+    def weighted_similarities(self) -> np.ndarray:
+        """Similarities scaled by their segment's multi-scale weight (S, K)."""
+        return self.similarities * self.scale_weights[:, None]
+
+    def candidate_keys(self, segment_map: Optional[SegmentFileMap] = None) -> np.ndarray:
+        """
+        Candidate of every hit (S, K): its index position, or its file code
+        when a segment map is given (file-level candidates). -1 for missing hits.
+        """
+        if segment_map is None:
+            return np.where(self.valid, self.indices, -1)
+        return segment_map.files_of(self.indices).astype(np.int64)
+
+    def hit(self, position: int) -> Optional[Dict]:
+        """Result dict at flat position s * K + k (None for hits built from arrays)."""
+        if self._rows is None:
+            return None
+        s, k = divmod(int(position), self.indices.shape[1])
+        return self._rows[s][k]
+
+
+class CandidateScores:
+    """
+    Per-candidate statistics of SegmentHits, computed with scatter reductions.
+
+    Candidates are ordered by first appearance (row-major over the hits), like
+    the dict insertion order of the per-candidate loop this replaces.
+    Similarity statistics use scale-weighted similarities.
+
+    Attributes:
+        keys: Candidate keys (C,)
+        match_count: Hits per candidate
+        rank_1_count, rank_5_count, rank_10_count: Hits within rank 1/5/10
+        weighted_similarity: Similarity-weighted mean, sum(s * w) / sum(w) with
+            w = s**2 * scale_weight (plain mean when the weights sum to 0)
+        geometric_mean: Geometric mean similarity (NaN unless all similarities > 0)
+        avg_similarity, max_similarity: Mean and max similarity
+        avg_rank, min_rank: Mean and best rank
+        best_hit: Flat (s * K + k) position of the candidate's most similar hit
+        max_run, total_run: Longest and summed runs of consecutive segments
+            whose top hit is the candidate
+    """
+
+    def __init__(self, hits: SegmentHits, keys: np.ndarray, mask: Optional[np.ndarray] = None,
+                 ranks: Optional[np.ndarray] = None):
+        """
+        Args:
+            hits: Segment hits
+            keys: Candidate key of every hit (S, K), see SegmentHits.candidate_keys
+            mask: Hits to aggregate (default: all valid hits)
+            ranks: Ranks to use for the rank statistics (default: hits.ranks)
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        mask = keys >= 0 if mask is None else (np.asarray(mask, dtype=bool) & (keys >= 0))
+        ranks = hits.ranks if ranks is None else np.asarray(ranks, dtype=np.int64)
+        self.num_segments = len(hits)
+
+        self.positions = np.flatnonzero(mask)
+        hit_keys = keys.ravel()[self.positions]
+        unique_keys, first_seen, inverse = np.unique(hit_keys, return_index=True, return_inverse=True)
+        order = np.argsort(first_seen, kind="stable")
+        relabel = np.empty_like(order)
+        relabel[order] = np.arange(len(order))
+        self.keys = unique_keys[order]
+        self.hit_candidates = relabel[inverse]
+
+        sims = hits.weighted_similarities.ravel()[self.positions]
+        scale_weights = np.broadcast_to(hits.scale_weights[:, None], keys.shape).ravel()[self.positions]
+        hit_ranks = ranks.ravel()[self.positions]
+
+        self.match_count = self.count()
+        self.rank_1_count = self.count(hit_ranks == 1)
+        self.rank_5_count = self.count(hit_ranks <= 5)
+        self.rank_10_count = self.count(hit_ranks <= 10)
+
+        similarity_sum = self.sum(sims)
+        self.avg_similarity = similarity_sum / np.maximum(self.match_count, 1)
+        self.max_similarity = self.max(sims)
+        self.avg_rank = self.sum(hit_ranks) / np.maximum(self.match_count, 1)
+        self.min_rank = self.min(hit_ranks).astype(np.int64)
+
+        weights = sims ** 2 * scale_weights
+        weights_sum = self.sum(weights)
+        self.weighted_similarity = np.where(
+            weights_sum > 0,
+            self.sum(sims * weights) / np.where(weights_sum > 0, weights_sum, 1.0),
+            self.avg_similarity
+        )
+        all_positive = self.count(sims <= 0) == 0
+        log_mean = self.sum(np.log(np.where(sims > 0, sims, 1.0))) / np.maximum(self.match_count, 1)
+        self.geometric_mean = np.where(all_positive, np.exp(log_mean), np.nan)
+
+        # Most similar hit (first one on ties)
+        best = np.lexsort((np.arange(len(sims)), -sims, self.hit_candidates))
+        starts = np.searchsorted(self.hit_candidates[best], np.arange(len(self.keys)))
+        self.best_hit = self.positions[best[starts]] if len(best) else np.empty(0, dtype=np.int64)
+
+        self.max_run, self.total_run = self._top_hit_runs(keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def count(self, hit_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Number of aggregated hits per candidate (optionally only where hit_mask holds)."""
+        weights = None if hit_mask is None else np.asarray(hit_mask, dtype=np.float64)
+        return np.bincount(self.hit_candidates, weights=weights, minlength=len(self.keys)).astype(np.int64)
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """Per-candidate sum of per-hit values (aligned with the aggregated hits)."""
+        return np.bincount(self.hit_candidates, weights=values, minlength=len(self.keys))
+
+    def max(self, values: np.ndarray) -> np.ndarray:
+        result = np.full(len(self.keys), -np.inf)
+        np.maximum.at(result, self.hit_candidates, values)
+        return result
+
+    def min(self, values: np.ndarray) -> np.ndarray:
+        result = np.full(len(self.keys), np.inf)
+        np.minimum.at(result, self.hit_candidates, values)
+        return result
+
+    def hit_values(self, values: np.ndarray) -> np.ndarray:
+        """Select the aggregated hits from an (S, K) array, aligned with sum/max/min."""
+        return np.asarray(values).ravel()[self.positions]
+
+    def slots(self, keys: np.ndarray):
+        """Candidate slot of each key, and whether the key is a candidate at all."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        sorter = np.argsort(self.keys)
+        slots = sorter[np.minimum(np.searchsorted(self.keys, keys, sorter=sorter), len(self.keys) - 1)]
+        return slots, self.keys[slots] == keys
+
+    def _top_hit_runs(self, keys: np.ndarray):
+        """Runs of consecutive segments (in row order) sharing the same top hit."""
+        max_run = np.zeros(len(self.keys), dtype=np.int64)
+        total_run = np.zeros(len(self.keys), dtype=np.int64)
+        if keys.size == 0:
+            return max_run, total_run
+        top = keys[:, 0]
+        starts = np.flatnonzero(np.concatenate([[True], top[1:] != top[:-1]]))
+        lengths = np.diff(np.append(starts, len(top)))
+        slots, found = self.slots(top[starts])
+        found &= top[starts] >= 0
+        np.maximum.at(max_run, slots[found], lengths[found])
+        np.add.at(total_run, slots[found], lengths[found])
+        return max_run, total_run
+
+    def temporal_score(self, total_segments: Optional[int] = None) -> np.ndarray:
+        """Temporal consistency: mean of longest and summed top-hit run, relative to segments."""
+        total_segments = total_segments or self.num_segments
+        if not total_segments:
+            return np.zeros(len(self.keys))
+        return (self.max_run / total_segments) * 0.5 + (self.total_run / total_segments) * 0.5
+
+    def consecutive_pairs(self, hits: SegmentHits, keys: np.ndarray, depth: int = 10) -> np.ndarray:
+        """
+        Per candidate, number of neighbouring segment pairs (segments ordered by
+        start time) that both have it among their first ``depth`` hits.
+        """
+        keys = np.asarray(keys, dtype=np.int64)[np.argsort(hits.starts, kind="stable"), :depth]
+        present = keys >= 0
+        if not present.any():
+            return np.zeros(len(self.keys), dtype=np.int64)
+        # (segment, key) pairs as single integers; a pair is shared if (segment + 1, key) exists
+        stride = int(keys.max()) + 1
+        rows = np.broadcast_to(np.arange(len(keys))[:, None], keys.shape)
+        codes = np.unique(rows[present] * stride + keys[present])
+        slots, found = self.slots(codes[np.isin(codes + stride, codes)] % stride)
+        return np.bincount(slots[found], minlength=len(self.keys))
+
+
+def aggregate_hits(
+    hits: SegmentHits,
+    segment_map: Optional[SegmentFileMap] = None,
+    mask: Optional[np.ndarray] = None,
+    ranks: Optional[np.ndarray] = None
+) -> CandidateScores:
+    """
+    Aggregate segment hits into per-candidate statistics.
+
+    Args:
+        hits: Segment hits
+        segment_map: Aggregate per file through this map (default: per index vector)
+        mask: Hits to aggregate (default: all valid hits)
+        ranks: Ranks to use for rank statistics (default: hits.ranks)
+
+    Returns:
+        CandidateScores
+    """
+    return CandidateScores(hits, hits.candidate_keys(segment_map), mask=mask, ranks=ranks)
+
+
+def candidate_hit_profile(hits: SegmentHits, keys: np.ndarray, candidate_keys: Sequence[int]) -> Dict[str, np.ndarray]:
+    """
+    First hit of each given candidate in every segment.
+
+    Args:
+        hits: Segment hits
+        keys: Candidate key of every hit (S, K)
+        candidate_keys: Candidates to profile (C,)
+
+    Returns:
+        Dict of (C, S) arrays: "found", "similarity" and "rank" of the first hit
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    candidate_keys = np.asarray(candidate_keys, dtype=np.int64)
+    matches = keys[None, :, :] == candidate_keys[:, None, None]  # (C, S, K)
+    found = matches.any(axis=2)
+    first = matches.argmax(axis=2)
+    segments = np.arange(keys.shape[0])[None, :]
+    return {
+        "found": found,
+        "similarity": hits.similarities[segments, first],
+        "rank": hits.ranks[segments, first],
+    }
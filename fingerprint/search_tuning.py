@@ -0,0 +1,303 @@
+"""Search-parameter tuning: recall of the true original against search latency.
+
+tune_search_parameters replays held-out query embeddings, whose original
+file is known, against an index while sweeping efSearch (HNSW layers),
+nprobe (IVF layers) and the query depth topk. For every setting it measures,
+per tier (transform severity), the recall of the true original (the share
+of query vectors whose topk hits include a segment of it) and the p50 / p99
+latency of a query's batched search on this machine, plus the p99 latency
+per segment searched (a query's latency divided by its segments). select_tier_settings
+picks one setting per tier from the Pareto front of recall and p99 latency,
+and the settings are written to ``search_tiers`` of the index config, where
+run_queries reads them (query_index.tier_metadata).
+"""
+import itertools
+import json
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+from .index_sidecar import atomic_write_json
+from .index_types import index_components
+from .query_index import (
+    TUNED_PARAMETERS,
+    normalize_vectors,
+    reconstruct_vectors,
+    search_batch,
+    with_search_parameters,
+)
+from .segment_map import segment_file_map
+
+logger = logging.getLogger(__name__)
+
+# Swept values; ef_search applies to HNSW layers and nprobe to IVF layers only
+DEFAULT_GRID = {
+    "ef_search": [16, 32, 64, 128, 256],
+    "nprobe": [1, 4, 16, 64, 256],
+    "topk": [10, 20, 50, 100],
+}
+
+# Per tier: the recall to reach and the p99 latency (ms per query) to stay under
+DEFAULT_TARGETS = {
+    "mild": {"min_recall": 0.99, "target_p99_ms": 10.0},
+    "moderate": {"min_recall": 0.97, "target_p99_ms": 20.0},
+    "severe": {"min_recall": 0.95, "target_p99_ms": 50.0},
+}
+
+# Relative noise of synthetic held-out queries per tier (see held_out_from_index)
+DEFAULT_TIER_NOISE = {"mild": 0.3, "moderate": 0.6, "severe": 0.9}
+
+
+@dataclass
+class HeldOutQueries:
+    """
+    Query embeddings with their true original.
+
+    Attributes:
+        embeddings: Query segment embeddings (N, D)
+        file_ids: True original file of every segment (N)
+        tiers: Tier (transform severity) of every segment (N)
+        query_ids: Query every segment belongs to (N); a query's segments
+            are searched in one batch, as run_queries searches them
+    """
+    embeddings: np.ndarray
+    file_ids: np.ndarray
+    tiers: np.ndarray
+    query_ids: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    @classmethod
+    def load(cls, path: Path) -> "HeldOutQueries":
+        """Load from an .npz with embeddings, file_ids, tiers and (optionally) query_ids."""
+        data = np.load(path, allow_pickle=False)
+        query_ids = data["query_ids"] if "query_ids" in data else np.arange(len(data["embeddings"]))
+        return cls(
+            embeddings=np.asarray(data["embeddings"], dtype=np.float32),
+            file_ids=data["file_ids"].astype(str),
+            tiers=data["tiers"].astype(str),
+            query_ids=np.asarray(query_ids).astype(str),
+        )
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            embeddings=self.embeddings,
+            file_ids=np.asarray(self.file_ids, dtype=str),
+            tiers=np.asarray(self.tiers, dtype=str),
+            query_ids=np.asarray(self.query_ids, dtype=str),
+        )
+
+    def queries(self) -> List[np.ndarray]:
+        """Row indices of every query."""
+        _, inverse = np.unique(self.query_ids, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.flatnonzero(np.diff(inverse[order])) + 1
+        return np.split(order, bounds)
+
+
+def held_out_from_index(
+    index,
+    index_metadata: Dict,
+    num_queries: int = 300,
+    segments_per_query: int = 16,
+    tier_noise: Optional[Dict[str, float]] = None,
+    seed: int = 0
+) -> HeldOutQueries:
+    """
+    Synthetic held-out queries: noisy copies of runs of indexed segments.
+
+    A stand-in for embeddings of transformed audio when none are at hand.
+    Queries are spread evenly over the tiers; each copies up to
+    segments_per_query consecutive segments of a random file and adds
+    random noise of relative norm ``tier_noise[tier]``.
+    """
+    tier_noise = tier_noise or DEFAULT_TIER_NOISE
+    mapping = segment_file_map(index_metadata)
+    if mapping is None or not mapping.num_files:
+        raise ValueError("Index metadata has no files to draw held-out queries from")
+    rng = np.random.default_rng(seed)
+    tiers = list(tier_noise)
+
+    embeddings, file_ids, query_tiers, query_ids = [], [], [], []
+    for query, code in enumerate(rng.integers(mapping.num_files, size=num_queries)):
+        file_id = mapping.file_ids[code]
+        positions = mapping.segments_of(file_id)
+        start = int(rng.integers(max(1, len(positions) - segments_per_query + 1)))
+        positions = positions[start:start + segments_per_query]
+        vectors = normalize_vectors(reconstruct_vectors(index, positions))
+        tier = tiers[query % len(tiers)]
+        noise = normalize_vectors(rng.standard_normal(vectors.shape).astype(np.float32))
+        embeddings.append(vectors + tier_noise[tier] * noise)
+        file_ids += [file_id] * len(vectors)
+        query_tiers += [tier] * len(vectors)
+        query_ids += [f"q{query:05d}"] * len(vectors)
+
+    return HeldOutQueries(
+        embeddings=normalize_vectors(np.vstack(embeddings)),
+        file_ids=np.asarray(file_ids, dtype=str),
+        tiers=np.asarray(query_tiers, dtype=str),
+        query_ids=np.asarray(query_ids, dtype=str),
+    )
+
+
+def _sweep(index, grid: Dict[str, List]) -> List[Dict]:
+    """Parameter settings to measure (only the parameters the index type uses)."""
+    shards = getattr(index, "shards", None)
+    components = index_components(shards[0] if shards else index)
+    ef_values = grid.get("ef_search") if "hnsw" in components else None
+    nprobe_values = grid.get("nprobe") if "ivf" in components else None
+    if nprobe_values:
+        nlist = components["ivf"].nlist
+        nprobe_values = sorted({min(int(nprobe), nlist) for nprobe in nprobe_values})
+    settings = []
+    for ef_search, nprobe, topk in itertools.product(ef_values or [None], nprobe_values or [None], grid["topk"]):
+        setting = {"topk": int(topk)}
+        if ef_search is not None:
+            # configure_search searches HNSW at least topk deep
+            setting["ef_search"] = max(int(ef_search), int(topk))
+        if nprobe is not None:
+            setting["nprobe"] = int(nprobe)
+        if setting not in settings:
+            settings.append(setting)
+    return settings
+
+
+def tune_search_parameters(
+    index,
+    index_metadata: Dict,
+    queries: HeldOutQueries,
+    grid: Optional[Dict[str, List]] = None
+) -> List[Dict]:
+    """
+    Measure recall and latency of every swept setting, per tier.
+
+    Args:
+        index: Index to tune (as loaded for querying)
+        index_metadata: Its metadata
+        queries: Held-out queries
+        grid: Values to sweep (default DEFAULT_GRID)
+
+    Returns:
+        One dict per setting and tier: tier, topk, ef_search / nprobe (as
+        applicable), recall, p50_ms, p99_ms (per query), p99_segment_ms
+        (per query segment), num_queries
+    """
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    mapping = segment_file_map(index_metadata)
+    true_codes = np.array([mapping.file_code(file_id) for file_id in queries.file_ids], dtype=np.int32)
+    groups = queries.queries()
+    group_tiers = np.array([queries.tiers[rows[0]] for rows in groups])
+    group_sizes = np.array([len(rows) for rows in groups])
+    embeddings = normalize_vectors(queries.embeddings)
+
+    report = []
+    for setting in _sweep(index, grid):
+        topk = setting["topk"]
+        metadata = with_search_parameters(
+            index_metadata, {key: setting[key] for key in TUNED_PARAMETERS if key in setting}
+        )
+        search_batch(index, embeddings[groups[0]], topk, metadata)  # Warm up
+        found = np.zeros(len(queries), dtype=bool)
+        latencies = np.empty(len(groups))
+        for query, rows in enumerate(groups):
+            start = time.perf_counter()
+            _, indices, _ = search_batch(index, embeddings[rows], topk, metadata, normalize=False)
+            latencies[query] = time.perf_counter() - start
+            found[rows] = (mapping.files_of(indices) == true_codes[rows, None]).any(axis=1)
+
+        for tier in np.unique(group_tiers):
+            tier_latencies = latencies[group_tiers == tier] * 1000.0
+            segment_latencies = tier_latencies / group_sizes[group_tiers == tier]
+            report.append({
+                "tier": str(tier),
+                **setting,
+                "recall": float(found[queries.tiers == tier].mean()),
+                "p50_ms": float(np.percentile(tier_latencies, 50)),
+                "p99_ms": float(np.percentile(tier_latencies, 99)),
+                "p99_segment_ms": float(np.percentile(segment_latencies, 99)),
+                "num_queries": int(len(tier_latencies)),
+            })
+        logger.debug(f"Measured {setting}")
+    return report
+
+
+def pareto_front(rows: List[Dict]) -> List[Dict]:
+    """Settings no other setting beats on both recall and p99 latency, fastest first."""
+    ordered = sorted(rows, key=lambda row: (row["p99_ms"], -row["recall"]))
+    front = []
+    for row in ordered:
+        if not front or row["recall"] > front[-1]["recall"]:
+            front.append(row)
+    return front
+
+
+def select_tier_settings(report: List[Dict], targets: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+    """
+    One setting per tier from its Pareto front.
+
+    The fastest setting that reaches the tier's min_recall within its
+    target_p99_ms; failing that, the best recall within target_p99_ms;
+    failing that, the fastest setting.
+
+    Returns:
+        Setting and measurements by tier
+    """
+    targets = targets or DEFAULT_TARGETS
+    selected = {}
+    for tier in sorted({row["tier"] for row in report}):
+        front = pareto_front([row for row in report if row["tier"] == tier])
+        target = targets.get(tier) or {}
+        max_p99 = target.get("target_p99_ms")
+        within = [row for row in front if max_p99 is None or row["p99_ms"] <= max_p99]
+        good = [row for row in within if row["recall"] >= target.get("min_recall", 1.0)]
+        if good:
+            choice = good[0]
+        elif within:
+            choice = max(within, key=lambda row: (row["recall"], -row["p99_ms"]))
+        else:
+            choice = front[0]
+            logger.warning(f"No setting meets the {max_p99} ms p99 target of tier {tier}, using the fastest")
+        selected[tier] = {key: round(value, 4) if isinstance(value, float) else value
+                          for key, value in choice.items() if key not in ("tier", "num_queries")}
+    return selected
+
+
+def search_tiers_entry(selected: Dict[str, Dict], index_metadata: Optional[Dict] = None) -> Dict:
+    """The ``search_tiers`` config entry of tuned settings."""
+    return {
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "num_vectors": int((index_metadata or {}).get("num_vectors") or 0),
+        "tiers": selected,
+    }
+
+
+def write_search_tiers(index_config_path: Path, search_tiers: Dict):
+    """Store tuned settings in an index config file (used by indexes built from it)."""
+    with open(index_config_path, 'r') as f:
+        index_config = json.load(f)
+    index_config["search_tiers"] = search_tiers
+    atomic_write_json(index_config_path, index_config)
+    logger.info(f"Wrote search tiers to {index_config_path}")
+
+
+def apply_search_tiers(index_path: Path, search_tiers: Dict):
+    """
+    Store tuned settings in the config of a built index (used by its next queries).
+
+    Only the JSON metadata (or shard manifest) changes; it is replaced atomically.
+    """
+    from .index_updates import index_lock
+
+    metadata_path = index_path.with_suffix(".json")
+    with index_lock(index_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+        metadata.setdefault("config", {})["search_tiers"] = search_tiers
+        atomic_write_json(metadata_path, metadata)
+    logger.info(f"Applied search tiers to {metadata_path}")
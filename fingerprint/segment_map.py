@@ -0,0 +1,217 @@
+"""Integer mapping between index vectors (segments) and catalog files."""
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_ID_SEPARATOR = "_seg_"
+
+
+def file_id_from_segment_id(segment_id) -> str:
+    """
+    File ID of a segment ID in the index format ``{file_id}_seg_{i:04d}``.
+
+    IDs without a segment suffix are returned as they are.
+    """
+    segment_id = str(segment_id) if segment_id is not None else ""
+    if SEGMENT_ID_SEPARATOR in segment_id:
+        return segment_id.rsplit(SEGMENT_ID_SEPARATOR, 1)[0]
+    return segment_id
+
+
+def result_file_id(result: Dict) -> str:
+    """File ID of a search hit or aggregated candidate (``file_id``, else parsed from ``id``)."""
+    return result.get("file_id") or file_id_from_segment_id(result.get("id", ""))
+
+
+class SegmentFileMap:
+    """
+    Index vector -> file lookups through integer arrays.
+
+    Attributes:
+        file_ids: File table (file code -> file ID)
+        segment_files: File code of every index vector (int32, N)
+        file_offsets: Start of each file's run in ``segment_order`` (F + 1)
+        segment_order: Index positions grouped by file (None when every file's
+            vectors are contiguous in the index, the usual layout, in which case
+            ``file_offsets`` are index positions themselves)
+
+    Vectors with file code -1 belong to removed files (tombstones): they stay
+    in the index until it is compacted, but map to no file.
+    """
+
+    def __init__(self, file_ids: Sequence[str], segment_files: np.ndarray):
+        self.file_ids: List[str] = [str(file_id) for file_id in file_ids]
+        self.segment_files = np.asarray(segment_files, dtype=np.int32)
+        self._file_id_array = np.array(self.file_ids + [None], dtype=object)  # Code -1 -> None
+        self._codes = {file_id: code for code, file_id in enumerate(self.file_ids)}
+
+        removed = self.segment_files < 0
+        self.num_removed = int(np.count_nonzero(removed))
+        live_files = self.segment_files[~removed] if self.num_removed else self.segment_files
+        counts = np.bincount(live_files, minlength=len(self.file_ids)) if len(live_files) else \
+            np.zeros(len(self.file_ids), dtype=np.int64)
+        self.file_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        if self.num_removed or (len(self.segment_files) and np.any(np.diff(self.segment_files) < 0)):
+            # Removed vectors (code -1) sort first and are left out
+            self.segment_order = np.argsort(self.segment_files, kind="stable")[self.num_removed:]
+        else:
+            self.segment_order = None
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[str]) -> "SegmentFileMap":
+        """Build from segment IDs (file table in order of first appearance)."""
+        codes: Dict[str, int] = {}
+        segment_files = np.fromiter(
+            (codes.setdefault(file_id_from_segment_id(seg_id), len(codes)) for seg_id in ids),
+            dtype=np.int32
+        )
+        return cls(list(codes), segment_files)
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict) -> Optional["SegmentFileMap"]:
+        """Build from index metadata (stored file table, else parsed from ``ids``)."""
+        file_table = metadata.get("file_table")
+        if file_table is not None:
+            if metadata.get("file_ranges") is not None:
+                ranges = np.asarray(metadata["file_ranges"], dtype=np.int64).reshape(-1, 2)
+                segment_files = np.repeat(np.arange(len(file_table), dtype=np.int32), ranges[:, 1] - ranges[:, 0])
+                return cls(file_table, segment_files)
+            if metadata.get("segment_files") is not None:
+                return cls(file_table, np.asarray(metadata["segment_files"], dtype=np.int32))
+        if metadata.get("ids"):
+            return cls.from_ids(metadata["ids"])
+        return None
+
+    def to_metadata(self) -> Dict:
+        """Index metadata fields; contiguous files are stored as [start, end) ranges only."""
+        if self.segment_order is None:
+            return {
+                "file_table": self.file_ids,
+                "file_ranges": np.stack([self.file_offsets[:-1], self.file_offsets[1:]], axis=1).tolist(),
+            }
+        return {"file_table": self.file_ids, "segment_files": self.segment_files.tolist()}
+
+    def __len__(self) -> int:
+        return len(self.segment_files)
+
+    def __contains__(self, file_id) -> bool:
+        return str(file_id) in self._codes
+
+    @property
+    def num_files(self) -> int:
+        return len(self.file_ids)
+
+    def file_code(self, file_id) -> int:
+        """Code of a file in the file table (-1 if it is not indexed)."""
+        return self._codes.get(str(file_id), -1)
+
+    def num_segments(self, file_id) -> int:
+        code = self.file_code(file_id)
+        return int(self.file_offsets[code + 1] - self.file_offsets[code]) if code >= 0 else 0
+
+    def file_range(self, file_id) -> Optional[Tuple[int, int]]:
+        """[start, end) index positions of a file's vectors, if they are contiguous."""
+        code = self.file_code(file_id)
+        if code < 0:
+            return None
+        start, end = int(self.file_offsets[code]), int(self.file_offsets[code + 1])
+        if self.segment_order is not None:
+            positions = self.segment_order[start:end]
+            if len(positions) == 0 or positions[-1] - positions[0] != len(positions) - 1:
+                return None
+            return int(positions[0]), int(positions[-1]) + 1
+        return start, end
+
+    def segments_of(self, file_id) -> np.ndarray:
+        """Index positions of a file's vectors (empty if it is not indexed)."""
+        code = self.file_code(file_id)
+        if code < 0:
+            return np.empty(0, dtype=np.int64)
+        start, end = self.file_offsets[code], self.file_offsets[code + 1]
+        if self.segment_order is None:
+            return np.arange(start, end, dtype=np.int64)
+        return self.segment_order[start:end]
+
+    def files_of(self, indices: np.ndarray) -> np.ndarray:
+        """File codes of index positions (-1 for missing hits)."""
+        indices = np.asarray(indices)
+        valid = (indices >= 0) & (indices < len(self.segment_files))
+        return np.where(valid, self.segment_files[np.where(valid, indices, 0)], -1).astype(np.int32)
+
+    def file_ids_of(self, indices: np.ndarray) -> np.ndarray:
+        """File IDs of index positions (object array, None for missing hits)."""
+        return self._file_id_array[self.files_of(indices)]
+
+    def removed_positions(self) -> np.ndarray:
+        """Index positions of removed vectors (tombstones)."""
+        if not self.num_removed:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.segment_files < 0).astype(np.int64)
+
+    def without_files(self, file_ids: Iterable[str]) -> "SegmentFileMap":
+        """Map with the vectors of these files marked removed and the files dropped from the file table."""
+        dropped = np.zeros(len(self.file_ids), dtype=bool)
+        for file_id in file_ids:
+            code = self.file_code(file_id)
+            if code >= 0:
+                dropped[code] = True
+        if not dropped.any():
+            return self
+        new_codes = np.where(dropped, -1, np.cumsum(~dropped) - 1).astype(np.int32)
+        new_codes = np.append(new_codes, np.int32(-1))  # Already removed (-1) stays removed
+        table = [file_id for file_id, drop in zip(self.file_ids, dropped) if not drop]
+        return SegmentFileMap(table, new_codes[self.segment_files])
+
+    def compacted(self) -> Tuple["SegmentFileMap", np.ndarray]:
+        """
+        Map without the removed vectors.
+
+        Returns:
+            Tuple of (map, kept): kept are the old index positions of the
+            remaining vectors, in order
+        """
+        kept = np.flatnonzero(self.segment_files >= 0).astype(np.int64)
+        return SegmentFileMap(self.file_ids, self.segment_files[kept]), kept
+
+    def extend(self, file_ids: Sequence[str], counts: Sequence[int]) -> "SegmentFileMap":
+        """Map with the vectors of new files appended (counts vectors per file, in order)."""
+        codes = dict(self._codes)
+        table = list(self.file_ids)
+        new_codes = []
+        for file_id in file_ids:
+            file_id = str(file_id)
+            if file_id not in codes:
+                codes[file_id] = len(table)
+                table.append(file_id)
+            new_codes.append(codes[file_id])
+        appended = np.repeat(np.asarray(new_codes, dtype=np.int32), np.asarray(counts, dtype=np.int64))
+        return SegmentFileMap(table, np.concatenate([self.segment_files, appended]))
+
+
+def segment_file_map(index_metadata: Optional[Dict]) -> Optional[SegmentFileMap]:
+    """
+    SegmentFileMap of an index, built once per metadata dict.
+
+    The map is kept in the dict under ``"_segment_map"`` (keys starting with
+    an underscore are never written back to disk).
+
+    Returns:
+        The map, or None if the metadata has neither a file table nor IDs
+    """
+    if not index_metadata:
+        return None
+    mapping = index_metadata.get("_segment_map")
+    ids = index_metadata.get("ids")
+    expected = len(ids) if ids else index_metadata.get("num_vectors")
+    if mapping is None or (expected is not None and len(mapping) != expected):
+        mapping = SegmentFileMap.from_metadata(index_metadata)
+        if mapping is not None:
+            index_metadata["_segment_map"] = mapping
+    return mapping
+
+
+def public_metadata(index_metadata: Dict) -> Dict:
+    """Copy of index metadata without in-memory caches (safe to serialize)."""
+    return {key: value for key, value in index_metadata.items() if not str(key).startswith("_")}
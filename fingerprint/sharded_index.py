@@ -0,0 +1,425 @@
+"""Catalog index split by file into shards, searched in parallel (scatter-gather)."""
+import json
+import logging
+import time
+import zlib
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence as SequenceType, Tuple
+import numpy as np
+import faiss
+
+from .segment_map import SegmentFileMap, segment_file_map
+from .index_sidecar import SIDECAR_FORMAT_VERSION, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+PARTITION = "crc32"  # File ID -> shard: crc32(file_id) % num_shards
+
+
+def shard_path(index_path: Path, shard: int) -> Path:
+    """Index file of one shard: faiss_index.bin -> faiss_index.shard000.bin"""
+    return index_path.with_suffix(f".shard{shard:03d}.bin")
+
+
+def shard_of(file_id, num_shards: int) -> int:
+    """Shard a file belongs to (stable across processes and runs)."""
+    return zlib.crc32(str(file_id).encode("utf-8")) % num_shards
+
+
+class ShardedIdTable(Sequence):
+    """Read-only list of segment IDs over the ID tables of all shards (in shard order)."""
+
+    def __init__(self, tables: SequenceType[SequenceType[str]]):
+        self.tables = list(tables)
+        self.offsets = np.concatenate([[0], np.cumsum([len(table) for table in self.tables])]).astype(np.int64)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        item = int(item)
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("ID table index out of range")
+        shard = int(np.searchsorted(self.offsets, item, side="right")) - 1
+        return str(self.tables[shard][item - int(self.offsets[shard])])
+
+    def tolist(self):
+        ids = []
+        for table in self.tables:
+            ids.extend(table.tolist() if hasattr(table, "tolist") else list(table))
+        return ids
+
+    def __add__(self, other):
+        return self.tolist() + list(other)
+
+    def __repr__(self) -> str:
+        return f"ShardedIdTable({len(self)} ids in {len(self.tables)} shards)"
+
+
+def merge_shard_results(
+    distances: List[np.ndarray],
+    indices: List[np.ndarray],
+    k: int,
+    inner_product: bool,
+    file_rank: Optional[np.ndarray] = None
+) -> tuple:
+    """
+    Merge per-shard top-k lists into one top-k.
+
+    Hits are ordered by score; equal scores are ordered by file (file_rank
+    of the hit, e.g. the file ID's position in sorted order) and then by
+    index position, so the merged lists do not depend on the shard layout
+    or on which shard answered first.
+
+    Args:
+        distances: (N, k_s) distances of every shard
+        indices: (N, k_s) global index positions of every shard (-1 = no hit)
+        k: Merged depth
+        inner_product: Distances are similarities (higher is better)
+        file_rank: Tie-break rank of every global index position
+
+    Returns:
+        Tuple of (distances, indices), each (N, k)
+    """
+    all_distances = np.concatenate(distances, axis=1)
+    all_indices = np.concatenate(indices, axis=1)
+    missing = all_indices < 0
+    score = np.where(missing, np.inf, -all_distances if inner_product else all_distances)
+    if file_rank is not None and len(file_rank):
+        ranks = np.where(missing, np.iinfo(np.int64).max, file_rank[np.where(missing, 0, all_indices)])
+    else:
+        ranks = np.zeros_like(all_indices)
+    order = np.lexsort((np.where(missing, np.iinfo(np.int64).max, all_indices), ranks, score), axis=-1)[:, :k]
+    merged_distances = np.take_along_axis(all_distances, order, axis=1)
+    merged_indices = np.take_along_axis(all_indices, order, axis=1)
+    if merged_indices.shape[1] < k:
+        pad = k - merged_indices.shape[1]
+        merged_distances = np.pad(merged_distances, ((0, 0), (0, pad)), constant_values=-np.inf if inner_product else np.inf)
+        merged_indices = np.pad(merged_indices, ((0, 0), (0, pad)), constant_values=-1)
+    return merged_distances.astype(np.float32), merged_indices
+
+
+class ShardedIndex:
+    """
+    Index over shards that each hold a disjoint set of files.
+
+    Every shard is an ordinary index (own .bin, JSON metadata and sidecar)
+    that can be rebuilt or updated alone. Search runs on all shards in
+    parallel threads (FAISS releases the GIL) and merges their top-k with
+    merge_shard_results. Index positions are global: shard s covers
+    ``offsets[s]:offsets[s + 1]``, and ``metadata`` combines the IDs, file
+    tables and DAW metadata of all shards accordingly.
+
+    Offers the parts of the faiss.Index interface used for querying
+    (``ntotal``, ``d``, ``metric_type``, ``search``); vectors are added per
+    file with add_files.
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        manifest: Dict,
+        shards: List[faiss.Index],
+        shard_metadata: List[Dict],
+        search_threads: Optional[int] = None
+    ):
+        self.index_path = Path(index_path)
+        self.manifest = manifest
+        self.shards = shards
+        self.shard_metadata = shard_metadata
+        self.search_threads = search_threads or len(shards)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._refresh()
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.shards)
+
+    @property
+    def ntotal(self) -> int:
+        return int(sum(shard.ntotal for shard in self.shards))
+
+    @property
+    def d(self) -> int:
+        return self.shards[0].d
+
+    @property
+    def metric_type(self) -> int:
+        return self.shards[0].metric_type
+
+    def _refresh(self):
+        """Rebuild global offsets, combined metadata and tie-break ranks from the shards."""
+        maps = [segment_file_map(metadata) or SegmentFileMap([], np.empty(0, dtype=np.int32))
+                for metadata in self.shard_metadata]
+        self.offsets = np.concatenate([[0], np.cumsum([shard.ntotal for shard in self.shards])]).astype(np.int64)
+
+        file_table: List[str] = []
+        segment_files = []
+        for mapping in maps:
+            # Tombstoned vectors (-1) stay unassigned
+            segment_files.append(np.where(mapping.segment_files >= 0, mapping.segment_files + len(file_table), -1))
+            file_table.extend(mapping.file_ids)
+        segment_files = np.concatenate(segment_files).astype(np.int32) if segment_files else np.empty(0, dtype=np.int32)
+
+        daw_metadata = None
+        if any("daw_metadata" in metadata for metadata in self.shard_metadata):
+            daw_metadata = {}
+            for metadata in self.shard_metadata:
+                daw_metadata.update(metadata.get("daw_metadata") or {})
+
+        metadata = dict(self.manifest)
+        metadata["ids"] = ShardedIdTable([metadata_.get("ids") or [] for metadata_ in self.shard_metadata])
+        metadata["file_table"] = file_table
+        metadata["segment_files"] = segment_files
+        metadata["num_vectors"] = self.ntotal
+        metadata["num_files"] = len(file_table)
+        if daw_metadata is not None:
+            metadata["daw_metadata"] = daw_metadata
+        self.metadata = metadata
+
+        # Tie-break rank of each global position: its file ID's place in sorted order
+        file_order = np.argsort(np.asarray(file_table, dtype=str), kind="stable")
+        file_ranks = np.empty(len(file_table), dtype=np.int64)
+        file_ranks[file_order] = np.arange(len(file_table))
+        self.file_rank = np.where(segment_files >= 0, file_ranks[segment_files], len(file_table)) if len(segment_files) \
+            else np.empty(0, dtype=np.int64)
+
+    def _search_shard(self, shard: int, x: np.ndarray, k: int):
+        from .query_index import search_index
+
+        distances, indices = search_index(self.shards[shard], x, k, self.shard_metadata[shard])
+        return distances, np.where(indices >= 0, indices + self.offsets[shard], -1)
+
+    def search(self, x: np.ndarray, k: int):
+        """Search all shards (in parallel) and merge their results; same contract as faiss.Index.search."""
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        shards = [shard for shard in range(self.num_shards) if self.shards[shard].ntotal > 0]
+        if not shards:
+            return (np.full((len(x), k), -np.inf if self.metric_type == faiss.METRIC_INNER_PRODUCT else np.inf,
+                            dtype=np.float32),
+                    np.full((len(x), k), -1, dtype=np.int64))
+        if len(shards) == 1 or self.search_threads <= 1:
+            results = [self._search_shard(shard, x, k) for shard in shards]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.search_threads, thread_name_prefix="shard-search")
+            results = list(self._executor.map(lambda shard: self._search_shard(shard, x, k), shards))
+        return merge_shard_results(
+            [distances for distances, _ in results],
+            [indices for _, indices in results],
+            k,
+            inner_product=self.metric_type == faiss.METRIC_INNER_PRODUCT,
+            file_rank=self.file_rank
+        )
+
+    def add(self, x: np.ndarray):
+        raise NotImplementedError("Vectors of a sharded index are added per file with add_files()")
+
+    def _files_by_shard(self, file_ids: List[str], embeddings: Optional[List[np.ndarray]] = None) -> Dict[int, tuple]:
+        """Files (and their embeddings) grouped by the shard they belong to."""
+        by_shard: Dict[int, tuple] = {}
+        for position, file_id in enumerate(file_ids):
+            files, arrays = by_shard.setdefault(shard_of(file_id, self.num_shards), ([], []))
+            files.append(str(file_id))
+            if embeddings is not None:
+                arrays.append(embeddings[position])
+        return by_shard
+
+    def _update_shards(
+        self,
+        updates: Dict[int, Callable[[faiss.Index, Dict, Path], Tuple[faiss.Index, Dict]]],
+        index_path: Optional[Path] = None
+    ) -> Dict:
+        """
+        Apply per-shard updates and save the shards that changed, then the manifest.
+
+        Each update takes (shard index, shard metadata, shard path), saves the
+        shard and returns its (index, metadata). Saving to a different
+        index_path writes every shard there.
+        """
+        from .query_index import save_index
+
+        index_path = Path(index_path) if index_path is not None else self.index_path
+        relocated = index_path != self.index_path
+        for shard in range(self.num_shards):
+            path = shard_path(index_path, shard)
+            if shard in updates:
+                self.shards[shard], self.shard_metadata[shard] = updates[shard](
+                    self.shards[shard], self.shard_metadata[shard], path
+                )
+            elif relocated:
+                self.shard_metadata[shard] = save_index(self.shards[shard], path, self.shard_metadata[shard])
+
+        self.index_path = index_path
+        if relocated:
+            self.manifest["sharding"]["shards"] = [shard_path(index_path, shard).name for shard in range(self.num_shards)]
+        self.manifest["last_updated"] = time.time()
+        self.manifest["generation"] = int(self.manifest.get("generation") or 0) + 1
+        self._refresh()
+        write_manifest(index_path, self.manifest, self)
+        return self.metadata
+
+    def add_files(self, file_ids: List[str], embeddings: List[np.ndarray], index_path: Optional[Path] = None) -> Dict:
+        """
+        Add new files to their shards and save the shards that changed.
+
+        Shards have to be loaded with mmap=False. Saving to a different
+        index_path writes every shard there.
+
+        Args:
+            file_ids: New files, in order
+            embeddings: Embeddings (N_segments, D) of each file
+            index_path: Where to save (default: where the index was loaded from)
+
+        Returns:
+            Combined metadata of the updated index
+        """
+        from .query_index import append_files
+
+        def add(files, arrays):
+            return lambda index, metadata, path: (index, append_files(index, metadata, path, files, arrays))
+
+        updates = {}
+        for shard, (files, arrays) in self._files_by_shard(file_ids, embeddings).items():
+            logger.info(f"Adding {len(files)} files to shard {shard}")
+            updates[shard] = add(files, arrays)
+        return self._update_shards(updates, index_path)
+
+    def remove_files(self, file_ids: List[str], index_path: Optional[Path] = None) -> Dict:
+        """Remove files from their shards (see index_updates.remove_files); returns the combined metadata."""
+        from .index_updates import remove_files
+
+        def remove(files):
+            return lambda index, metadata, path: (index, remove_files(index, metadata, path, files))
+
+        updates = {shard: remove(files) for shard, (files, _) in self._files_by_shard(file_ids).items()}
+        return self._update_shards(updates, index_path)
+
+    def replace_files(self, file_ids: List[str], embeddings: List[np.ndarray], index_path: Optional[Path] = None) -> Dict:
+        """Replace the vectors of files in their shards (see index_updates.replace_files)."""
+        from .index_updates import replace_files
+
+        def replace(files, arrays):
+            return lambda index, metadata, path: (index, replace_files(index, metadata, path, files, arrays))
+
+        updates = {shard: replace(files, arrays)
+                   for shard, (files, arrays) in self._files_by_shard(file_ids, embeddings).items()}
+        return self._update_shards(updates, index_path)
+
+    def compact(self, index_path: Optional[Path] = None, min_ratio: float = 0.0) -> Dict:
+        """Compact the shards with at least min_ratio of their vectors tombstoned (see index_updates.compact_index)."""
+        from .index_updates import compact_index, removed_ratio
+
+        updates = {}
+        for shard, metadata in enumerate(self.shard_metadata):
+            mapping = segment_file_map(metadata)
+            if mapping is not None and mapping.num_removed and removed_ratio(metadata) >= min_ratio:
+                updates[shard] = compact_index
+        return self._update_shards(updates, index_path)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @classmethod
+    def load(cls, index_path: Path, manifest: Dict, mmap: bool = True, with_daw_metadata: bool = True) -> "ShardedIndex":
+        """Load every shard of a sharded index (see load_index for the arguments)."""
+        from .query_index import load_index
+
+        shards = []
+        shard_metadata = []
+        for name in manifest["sharding"]["shards"]:
+            shard, metadata = load_index(index_path.parent / name, mmap=mmap, with_daw_metadata=with_daw_metadata)
+            shards.append(shard)
+            shard_metadata.append(metadata)
+        search_threads = manifest["sharding"].get("search_threads")
+        index = cls(index_path, manifest, shards, shard_metadata, search_threads=search_threads)
+        logger.info(f"Loaded sharded index from {index_path} ({index.num_shards} shards, {index.ntotal} vectors)")
+        return index
+
+
+def write_manifest(index_path: Path, manifest: Dict, index: Optional[ShardedIndex] = None):
+    """Write the shard manifest (the JSON metadata of a sharded index) atomically."""
+    manifest = {key: value for key, value in manifest.items() if not str(key).startswith("_")}
+    manifest["format_version"] = SIDECAR_FORMAT_VERSION
+    if index is not None:
+        manifest["num_vectors"] = index.ntotal
+        manifest["num_files"] = len(index.metadata["file_table"])
+        manifest["sharding"]["shard_vectors"] = [int(shard.ntotal) for shard in index.shards]
+    metadata_path = index_path.with_suffix(".json")
+    metadata_path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_json(metadata_path, manifest)
+
+
+def build_sharded_index(
+    embeddings: np.ndarray,
+    ids: List[str],
+    index_path: Path,
+    index_config: Dict,
+    num_shards: int,
+    daw_metadata: Optional[Dict[str, Dict]] = None,
+    training_vectors: Optional[np.ndarray] = None
+) -> ShardedIndex:
+    """
+    Build a sharded index: files are assigned to shards with shard_of and
+    each shard is built with build_index.
+
+    Trained index types use one training set for all shards
+    (training_vectors, else the whole catalog), so small shards train as
+    well as large ones.
+
+    Returns:
+        ShardedIndex of the built shards
+    """
+    from .query_index import build_index
+
+    sharding = dict(index_config.get("sharding") or {})
+    shard_config = {key: value for key, value in index_config.items() if key != "sharding"}
+    mapping = SegmentFileMap.from_ids(ids)
+    file_shards = np.array([shard_of(file_id, num_shards) for file_id in mapping.file_ids], dtype=np.int32)
+    vector_shards = file_shards[mapping.segment_files] if len(mapping.segment_files) else np.empty(0, dtype=np.int32)
+    if index_config.get("index_type", "hnsw") not in ("flat", "hnsw") and training_vectors is None:
+        training_vectors = embeddings
+
+    logger.info(f"Building sharded index: {len(ids)} vectors of {mapping.num_files} files in {num_shards} shards")
+    shards = []
+    shard_metadata = []
+    for shard in range(num_shards):
+        rows = np.flatnonzero(vector_shards == shard)
+        shard_ids = [ids[row] for row in rows]
+        shard_files = set(mapping.file_ids[code] for code in np.flatnonzero(file_shards == shard))
+        shard_daw = {file_id: data for file_id, data in (daw_metadata or {}).items() if str(file_id) in shard_files}
+        path = shard_path(index_path, shard)
+        shards.append(build_index(
+            embeddings[rows], shard_ids, path, shard_config,
+            daw_metadata=shard_daw, training_vectors=training_vectors
+        ))
+        with open(path.with_suffix(".json"), 'r') as f:
+            metadata = json.load(f)
+        metadata["ids"] = shard_ids
+        metadata["daw_metadata"] = shard_daw
+        shard_metadata.append(metadata)
+
+    sharding.update({
+        "num_shards": num_shards,
+        "partition": PARTITION,
+        "shards": [shard_path(index_path, shard).name for shard in range(num_shards)],
+    })
+    manifest = {
+        "dimension": embeddings.shape[1],
+        "index_type": shard_metadata[0].get("index_type"),
+        "metric": shard_metadata[0].get("metric"),
+        "config": index_config,
+        "sharding": sharding,
+    }
+    index = ShardedIndex(index_path, manifest, shards, shard_metadata, search_threads=sharding.get("search_threads"))
+    write_manifest(index_path, manifest, index)
+    logger.info(f"Saved shard manifest to {index_path.with_suffix('.json')}")
+    return index
@@ -5,7 +5,13 @@ from typing import List, Dict, Any, Optional
 
 from core.interfaces import IIndexRepository
 from core.models import IndexMetadata
-from fingerprint.query_index import load_index as _load_index, query_index as _query_index
+from fingerprint.query_index import (
+    load_index as _load_index,
+    query_index as _query_index,
+    search_batch,
+    format_results,
+    is_inner_product,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +19,10 @@ logger = logging.getLogger(__name__)
 class IndexRepository(IIndexRepository):
     """Repository for FAISS index operations."""
     
+    def __init__(self):
+        # (IndexMetadata, dict form) of the last index queried
+        self._cached_metadata = None
+    
     def load_index(self, index_path: Path) -> tuple[Any, IndexMetadata]:
         """Load FAISS index and metadata."""
         logger.info(f"Loading index from {index_path}")
@@ -24,11 +34,33 @@ class IndexRepository(IIndexRepository):
             file_paths=[Path(p) for p in metadata_dict.get("file_paths", [])] if metadata_dict.get("file_paths") else None,
             embedding_dim=metadata_dict.get("embedding_dim"),
             index_type=metadata_dict.get("index_type"),
-            metadata=metadata_dict.get("metadata", {})
+            metadata={
+                **metadata_dict.get("metadata", {}),
+                # Search settings, the segment -> file map and DAW data travel with the metadata
+                **{key: metadata_dict[key]
+                   for key in ("metric", "config", "sharding", "file_table", "file_ranges", "segment_files", "daw_metadata")
+                   if key in metadata_dict}
+            }
         )
         
         return index, index_metadata
     
+    def _metadata_dict(self, index_metadata: Optional[IndexMetadata]) -> Optional[Dict[str, Any]]:
+        """Metadata in the dict form of fingerprint.query_index (built once per IndexMetadata)."""
+        if index_metadata is None:
+            return None
+        if self._cached_metadata is not None and self._cached_metadata[0] is index_metadata:
+            return self._cached_metadata[1]
+        metadata_dict = {
+            "ids": index_metadata.ids,
+            "file_paths": [str(p) for p in index_metadata.file_paths] if index_metadata.file_paths else None,
+            "embedding_dim": index_metadata.embedding_dim,
+            "index_type": index_metadata.index_type,
+            **index_metadata.metadata
+        }
+        self._cached_metadata = (index_metadata, metadata_dict)
+        return metadata_dict
+    
     def query_index(
         self,
         index: Any,
@@ -37,21 +69,29 @@ class IndexRepository(IIndexRepository):
         index_metadata: Optional[IndexMetadata] = None
     ) -> List[Dict[str, Any]]:
         """Query index with embedding."""
-        metadata_dict = None
-        if index_metadata:
-            metadata_dict = {
-                "ids": index_metadata.ids,
-                "file_paths": [str(p) for p in index_metadata.file_paths] if index_metadata.file_paths else None,
-                "embedding_dim": index_metadata.embedding_dim,
-                "index_type": index_metadata.index_type,
-                **index_metadata.metadata
-            }
-        
         return _query_index(
             index=index,
-            query_vector=embedding,
+            query_vectors=embedding,
             topk=topk,
             ids=index_metadata.ids if index_metadata else None,
             normalize=True,
-            index_metadata=metadata_dict
+            index_metadata=self._metadata_dict(index_metadata)
+        )
+    
+    def query_index_batch(
+        self,
+        index: Any,
+        embeddings: Any,
+        topk: int,
+        index_metadata: Optional[IndexMetadata] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Query index with all embeddings (N, D) in one search; one result list per row."""
+        metadata_dict = self._metadata_dict(index_metadata)
+        distances, indices, file_ids = search_batch(index, embeddings, topk, metadata_dict)
+        return format_results(
+            distances,
+            indices,
+            ids=index_metadata.ids if index_metadata else None,
+            inner_product=is_inner_product(index, metadata_dict),
+            file_ids=file_ids
         )
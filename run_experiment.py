@@ -8,8 +8,9 @@ from datetime import datetime
 # Import all pipeline modules
 from data_ingest import ingest_manifest
 from transforms.generate_transforms import generate_transforms
-from fingerprint.embed import segment_audio, extract_embeddings, normalize_embeddings
-from fingerprint.query_index import build_index, load_index
+from fingerprint.embed import segment_audio_matrix, extract_embeddings, normalize_embeddings
+from fingerprint.query_index import build_index, load_index, index_exists
+from fingerprint.segment_map import segment_file_map
 from daw_parser.integration import load_daw_metadata_from_manifest
 from fingerprint.run_queries import run_queries
 from evaluation.analyze import analyze_results
@@ -144,6 +145,7 @@ def run_full_experiment(
         from fingerprint.load_model import load_fingerprint_model
         from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
         from fingerprint.incremental_index import update_index_incremental
+        from fingerprint.catalog_ingest import ingest_catalog
         
         # Initialize cache
         cache = OriginalEmbeddingsCache()
@@ -170,13 +172,13 @@ def run_full_experiment(
         existing_metadata = None
         existing_file_ids = set()
         
-        if index_path.exists():
+        if index_exists(index_path):
             try:
                 logger.info(f"Found existing index: {index_path}")
                 existing_index, existing_metadata = load_index(index_path)
-                existing_ids = existing_metadata.get("ids", [])
-                # Extract file IDs from segment IDs (format: "file_id_seg_0000")
-                existing_file_ids = {id_str.split("_seg_")[0] for id_str in existing_ids if "_seg_" in id_str}
+                # File table of the index (parsed from segment IDs for older metadata)
+                existing_files = segment_file_map(existing_metadata)
+                existing_file_ids = set(existing_files.file_ids) if existing_files is not None else set()
                 logger.info(f"Existing index contains {existing_index.ntotal} vectors from {len(existing_file_ids)} files")
             except Exception as e:
                 logger.warning(f"Failed to load existing index: {e}, will rebuild")
@@ -207,69 +209,93 @@ def run_full_experiment(
         cached_count = 0
         generated_count = 0
         
-        for row in files_to_index_rows:
-            # Handle both "file_path" and "path" column names for compatibility
-            file_path_str = row.get("file_path") or row.get("path")
-            if not file_path_str:
-                logger.error(f"Manifest row missing 'file_path' or 'path' column. Available columns: {list(row.index)}")
-                continue
-            
-            file_path = Path(file_path_str)
-            file_id = row["id"]
-            
-            # Resolve relative paths
-            if not file_path.is_absolute():
+        ingestion_config = model_config.get("config", {}).get("ingestion") or {}
+        num_workers = ingestion_config.get("num_workers") or 1
+        
+        if num_workers > 1 and files_to_index_rows:
+            # Process pool: one model per worker, results cached as they complete
+            ingest = ingest_catalog(
+                pd.DataFrame(files_to_index_rows),
+                fingerprint_config_path,
+                cache=cache,
+                num_workers=num_workers,
+                threads_per_worker=ingestion_config.get("threads_per_worker"),
+                decode_threads=ingestion_config.get("decode_threads", 2),
+                embeddings_dir=embeddings_dir
+            )
+            for row in files_to_index_rows:
+                embeddings = ingest.embeddings.get(str(row["id"]))
+                if embeddings is None:
+                    continue
+                for i, emb in enumerate(embeddings):
+                    all_embeddings.append(emb)
+                    all_ids.append(f"{row['id']}_seg_{i:04d}")
+            cached_count = len(ingest.cached)
+            generated_count = len(ingest.generated)
+        else:
+            for row in files_to_index_rows:
+                # Handle both "file_path" and "path" column names for compatibility
+                file_path_str = row.get("file_path") or row.get("path")
+                if not file_path_str:
+                    logger.error(f"Manifest row missing 'file_path' or 'path' column. Available columns: {list(row.index)}")
+                    continue
+                
+                file_path = Path(file_path_str)
+                file_id = row["id"]
+                
+                # Resolve relative paths
+                if not file_path.is_absolute():
+                    if not file_path.exists():
+                        # Try resolving relative to project root (current working directory)
+                        potential_path = Path.cwd() / file_path
+                        if potential_path.exists():
+                            file_path = potential_path
+                            logger.info(f"Resolved relative path: {file_path_str} -> {file_path}")
+                
                 if not file_path.exists():
-                    # Try resolving relative to project root (current working directory)
-                    potential_path = Path.cwd() / file_path
-                    if potential_path.exists():
-                        file_path = potential_path
-                        logger.info(f"Resolved relative path: {file_path_str} -> {file_path}")
-            
-            if not file_path.exists():
-                logger.error(f"File not found: {file_path} (from manifest: {file_path_str})")
-                continue
-            
-            # Check cache first
-            cached_embeddings, cached_segments = cache.get(file_id, file_path, model_config)
-            
-            if cached_embeddings is not None:
-                # Use cached embeddings
-                logger.info(f"Using cached embeddings for {file_id} ({len(cached_embeddings)} segments)")
-                segments = cached_segments if cached_segments else []
-                embeddings = cached_embeddings
-                cached_count += 1
-            else:
-                # Generate new embeddings
-                logger.info(f"Generating embeddings for {file_id} -> {file_path}")
-                overlap_ratio = model_config.get("overlap_ratio", None)
-                segments = segment_audio(
-                    file_path,
-                    segment_length=model_config["segment_length"],
-                    sample_rate=model_config["sample_rate"],
-                    overlap_ratio=overlap_ratio
-                )
+                    logger.error(f"File not found: {file_path} (from manifest: {file_path_str})")
+                    continue
                 
-                embeddings = extract_embeddings(
-                    segments,
-                    model_config,
-                    output_dir=embeddings_dir / file_id,
-                    save_embeddings=True
-                )
+                # Check cache first
+                cached_embeddings, cached_segments = cache.get(file_id, file_path, model_config)
                 
-                # Normalize
-                embeddings = normalize_embeddings(embeddings, method="l2")
+                if cached_embeddings is not None:
+                    # Use cached embeddings
+                    logger.info(f"Using cached embeddings for {file_id} ({len(cached_embeddings)} segments)")
+                    segments = cached_segments if cached_segments else []
+                    embeddings = cached_embeddings
+                    cached_count += 1
+                else:
+                    # Generate new embeddings
+                    logger.info(f"Generating embeddings for {file_id} -> {file_path}")
+                    overlap_ratio = model_config.get("overlap_ratio", None)
+                    segments = segment_audio_matrix(
+                        file_path,
+                        segment_length=model_config["segment_length"],
+                        sample_rate=model_config["sample_rate"],
+                        overlap_ratio=overlap_ratio
+                    )
+                    
+                    embeddings = extract_embeddings(
+                        segments,
+                        model_config,
+                        output_dir=embeddings_dir / file_id,
+                        save_embeddings=True
+                    )
+                    
+                    # Normalize
+                    embeddings = normalize_embeddings(embeddings, method="l2")
+                    
+                    # Cache for future use
+                    cache.set(file_id, file_path, model_config, embeddings, segments.to_dicts())
+                    generated_count += 1
                 
-                # Cache for future use
-                cache.set(file_id, file_path, model_config, embeddings, segments)
-                generated_count += 1
+                # Store with IDs
+                for i, emb in enumerate(embeddings):
+                    seg_id = f"{file_id}_seg_{i:04d}"
+                    all_embeddings.append(emb)
+                    all_ids.append(seg_id)
             
-            # Store with IDs
-            for i, emb in enumerate(embeddings):
-                seg_id = f"{file_id}_seg_{i:04d}"
-                all_embeddings.append(emb)
-                all_ids.append(seg_id)
-        
         logger.info(f"Embedding generation complete: {cached_count} from cache, {generated_count} newly generated")
         
         # Build or update index
@@ -295,7 +321,8 @@ def run_full_experiment(
                         existing_index_path=index_path,
                         fingerprint_config_path=fingerprint_config_path,
                         output_index_path=index_path,
-                        index_config_path=index_config_path
+                        index_config_path=index_config_path,
+                        num_workers=1  # Embeddings were generated and cached above
                     )
                     
                     # Clean up temp file
@@ -329,7 +356,7 @@ def run_full_experiment(
                         if cached_embeddings is None:
                             # Generate if not cached
                             overlap_ratio = model_config.get("overlap_ratio", None)
-                            segments = segment_audio(
+                            segments = segment_audio_matrix(
                                 file_path,
                                 segment_length=model_config["segment_length"],
                                 sample_rate=model_config["sample_rate"],
@@ -339,7 +366,7 @@ def run_full_experiment(
                                 segments, model_config, output_dir=None, save_embeddings=False
                             )
                             cached_embeddings = normalize_embeddings(cached_embeddings, method="l2")
-                            cache.set(file_id, file_path, model_config, cached_embeddings, segments)
+                            cache.set(file_id, file_path, model_config, cached_embeddings, segments.to_dicts())
                         
                         for i, emb in enumerate(cached_embeddings):
                             seg_id = f"{file_id}_seg_{i:04d}"
@@ -372,11 +399,21 @@ def run_full_experiment(
             except Exception as e:
                 logger.warning(f"Failed to load DAW metadata: {e}")
             
-            build_index(embeddings_array, all_ids, index_path, index_config, daw_metadata=daw_metadata)
+            # Compressed index types train on a sample of the whole cache
+            # (not only the files of this run) when configured so
+            training_vectors = None
+            training = index_config.get("training") or {}
+            if index_config.get("index_type") not in ("flat", "hnsw") and training.get("source") == "cache":
+                training_vectors = cache.sample_embeddings(
+                    model_config, training.get("num_vectors", 100000), training.get("seed", 0)
+                )
+
+            build_index(embeddings_array, all_ids, index_path, index_config, daw_metadata=daw_metadata,
+                        training_vectors=training_vectors)
             logger.info(f"✓ Built new index with {len(all_ids)} vectors")
     else:
         index_path = indexes_dir / "faiss_index.bin"
-        if not index_path.exists():
+        if not index_exists(index_path):
             raise FileNotFoundError(f"Index not found: {index_path}")
         logger.info(f"Using existing index: {index_path}")
     
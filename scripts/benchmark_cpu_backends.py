@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Compare CPU inference backends for the MERT embedding model.
+
+Reports cosine drift against FP32 eager and speedup for int8 dynamic
+quantization, bf16 autocast, graph capture (torch.compile / TorchScript) and
+ONNX Runtime (--onnx).
+By default a tiny randomly-initialized MERT-architecture model is used so the
+report runs offline; pass --fingerprint-config to benchmark the real model.
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+import sys
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fingerprint.cpu_backend import CpuBackendConfig, PRECISIONS, GRAPH_MODES, cpu_backend_parity_report
+from fingerprint.embedding_generator import EmbeddingGenerator
+from fingerprint.onnx_backend import OnnxBackendConfig, OPTIMIZATION_LEVELS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def build_tiny_generator(sample_rate: int = 16000) -> EmbeddingGenerator:
+    """EmbeddingGenerator on a tiny random HuBERT (MERT's architecture), no download needed."""
+    import torch
+    from transformers import HubertConfig, HubertModel, Wav2Vec2FeatureExtractor
+
+    torch.manual_seed(0)
+    config = HubertConfig(
+        hidden_size=128, num_hidden_layers=4, num_attention_heads=4, intermediate_size=512,
+        conv_dim=(64,) * 7, num_conv_pos_embeddings=16, num_conv_pos_embedding_groups=4,
+        feat_extract_norm="layer", do_stable_layer_norm=True
+    )
+    generator = EmbeddingGenerator(embedding_dim=128, sample_rate=sample_rate, model_type="openl3", device="cpu")
+    generator.mert_model = HubertModel(config).eval()
+    generator.mert_processor = Wav2Vec2FeatureExtractor(sampling_rate=sample_rate)
+    generator.active_model_name = "mert"
+    return generator
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare CPU backends (int8/bf16/compiled) against FP32 for MERT embeddings"
+    )
+    parser.add_argument(
+        "--fingerprint-config",
+        type=Path,
+        default=None,
+        help="Benchmark the model from this fingerprint config (default: tiny random model)"
+    )
+    parser.add_argument(
+        "--precisions",
+        nargs="+",
+        default=["fp32", "int8", "bf16"],
+        choices=PRECISIONS,
+        help="Precisions to compare"
+    )
+    parser.add_argument(
+        "--graph-modes",
+        nargs="+",
+        default=["eager", "torchscript"],
+        choices=GRAPH_MODES,
+        help="Graph modes to compare (torch_compile can take minutes to compile)"
+    )
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="torch/ONNX Runtime intra-op threads")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="torch/ONNX Runtime inter-op threads")
+    parser.add_argument("--onnx", action="store_true", help="Also compare ONNX Runtime (CPU execution provider)")
+    parser.add_argument(
+        "--onnx-optimization-level",
+        default="all",
+        choices=OPTIMIZATION_LEVELS,
+        help="ONNX Runtime graph optimization level"
+    )
+    parser.add_argument(
+        "--onnx-cache-dir",
+        type=Path,
+        default=Path("data/cache/onnx"),
+        help="Directory for exported ONNX graphs"
+    )
+    parser.add_argument("--segments", type=int, default=16, help="Number of segments per run")
+    parser.add_argument("--segment-length", type=float, default=3.5, help="Segment length in seconds")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per backend")
+    parser.add_argument("--output", type=Path, default=None, help="Write the report as JSON")
+
+    args = parser.parse_args()
+
+    if args.fingerprint_config:
+        from fingerprint.load_model import load_fingerprint_model
+        # Backends are set on the in-process model, not on a running model server
+        model_config = load_fingerprint_model(args.fingerprint_config, use_server=False)
+        generator = model_config["model"]
+        if getattr(generator, "active_model_name", None) != "mert" or generator.device != "cpu":
+            logger.error("CPU backends apply to MERT on CPU; set model.type: mert and model.device: cpu")
+            sys.exit(1)
+        sample_rate = model_config["sample_rate"]
+    else:
+        sample_rate = 16000
+        generator = build_tiny_generator(sample_rate)
+
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal((args.segments, int(args.segment_length * sample_rate))).astype(np.float32)
+
+    backends = [
+        CpuBackendConfig(
+            precision=precision,
+            graph_mode=graph_mode,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads
+        )
+        for precision in args.precisions
+        for graph_mode in args.graph_modes
+    ]
+    if args.onnx:
+        backends.append(OnnxBackendConfig(
+            cache_dir=str(args.onnx_cache_dir),
+            optimization_level=args.onnx_optimization_level,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads
+        ))
+    report = cpu_backend_parity_report(generator, backends, audio, sample_rate, repeats=args.repeats)
+
+    print(f"\n{'backend':<22} {'applied':>7} {'latency_ms':>11} {'speedup':>8} {'drift_mean':>11} {'drift_max':>11}")
+    for row in report:
+        print(
+            f"{row['backend']:<22} {str(row['applied']):>7} {row['latency_ms']:>11.1f} "
+            f"{row['speedup']:>7.2f}x {row['cosine_drift_mean']:>11.2e} {row['cosine_drift_max']:>11.2e}"
+        )
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
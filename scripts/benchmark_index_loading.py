@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare index cold start before and after the binary metadata sidecar.
+
+Builds a synthetic index (random vectors, ``{file}_seg_{i:04d}`` IDs) twice:
+once with the former JSON-only metadata (full ID list inline, read into RAM)
+and once as build_index writes it now (ID tables in .npy, memory-mapped).
+Each layout is loaded in fresh processes; load time, first-query time and
+resident/private memory are reported.
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+import sys
+import tempfile
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fingerprint.query_index import build_index
+from fingerprint.index_sidecar import index_loading_report
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def build_synthetic_index(index_path: Path, num_vectors: int, dim: int, segments_per_file: int,
+                          index_type: str, legacy: bool) -> None:
+    """Build a random index; legacy=True writes the former JSON-only metadata."""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    ids = [f"file{k // segments_per_file:07d}_seg_{k % segments_per_file:04d}" for k in range(num_vectors)]
+    index_config = {"index_type": index_type, "metric": "cosine", "parameters": {"M": 16, "nlist": 256}}
+    build_index(embeddings, ids, index_path, index_config, save_metadata=not legacy)
+    if legacy:
+        with open(index_path.with_suffix(".json"), 'w') as f:
+            json.dump({
+                "ids": ids,
+                "num_vectors": num_vectors,
+                "dimension": dim,
+                "index_type": index_type,
+                "metric": 0,
+                "config": index_config,
+                "daw_metadata": {},
+            }, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index cold start: JSON metadata vs. memory-mapped sidecar")
+    parser.add_argument("--vectors", type=int, default=200000, help="Number of index vectors")
+    parser.add_argument("--dim", type=int, default=128, help="Embedding dimension")
+    parser.add_argument("--segments-per-file", type=int, default=60, help="Segments per synthetic file")
+    parser.add_argument("--index-type", default="flat", choices=["flat", "hnsw", "ivf"], help="Index type")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh-process runs per layout")
+    parser.add_argument("--work-dir", type=Path, default=None, help="Keep the built indexes here")
+    parser.add_argument("--output", type=Path, default=None, help="Write the report as JSON")
+
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="index_loading_"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    report = []
+    for layout, legacy, mmap in (("json (before)", True, False), ("sidecar (after)", False, True)):
+        index_path = work_dir / ("legacy" if legacy else "sidecar") / "faiss_index.bin"
+        logger.info(f"Building {layout} index with {args.vectors} vectors at {index_path}")
+        build_synthetic_index(index_path, args.vectors, args.dim, args.segments_per_file, args.index_type, legacy)
+        row = index_loading_report(index_path, mmap=mmap, repeats=args.repeats)
+        row["layout"] = layout
+        report.append(row)
+
+    print(f"\n{'layout':<16} {'load_s':>8} {'query_s':>8} {'rss_mb':>8} {'anon_mb':>8} {'rss_delta':>10} {'anon_delta':>11}")
+    for row in report:
+        print(
+            f"{row['layout']:<16} {row['load_seconds']:>8.3f} {row['first_query_seconds']:>8.3f} "
+            f"{row['rss_mb'] or 0:>8.1f} {row['rss_anon_mb'] or 0:>8.1f} "
+            f"{row['rss_delta_mb']:>10.1f} {row['anon_delta_mb']:>11.1f}"
+        )
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
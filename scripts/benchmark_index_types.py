@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Compare index types against the current index configuration.
+
+Builds the index of config/index_config.json and the compressed index types
+(IVF-PQ, OPQ+IVF-PQ, HNSW-SQ8, HNSW-fp16, with and without refine) over the
+same vectors and reports size on disk, resident memory of a process that
+loads the index memory-mapped and answers a query, recall@k against exact
+search and search latency.
+
+Vectors come from a .npy file (e.g. embeddings exported from the cache) or
+are synthetic: clustered unit vectors, with queries that are noisy copies
+of indexed vectors (like transformed audio against its original).
+"""
+import argparse
+import copy
+import json
+import logging
+from pathlib import Path
+import sys
+import tempfile
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fingerprint.index_types import COMPRESSED_INDEX_TYPES, compare_index_types
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def synthetic_vectors(num_vectors: int, dim: int, num_queries: int, noise: float, seed: int = 0):
+    """Clustered unit vectors and noisy copies of some of them as queries."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, num_vectors // 100), dim)).astype(np.float32)
+    embeddings = centers[rng.integers(len(centers), size=num_vectors)]
+    embeddings += 0.5 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    queries = embeddings[rng.choice(num_vectors, size=num_queries, replace=False)]
+    queries = queries + noise * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(dim)
+    return embeddings, queries.astype(np.float32)
+
+
+def candidate_configs(base_config: dict, overrides: dict) -> dict:
+    """The current config plus one config per compressed index type (and refine variant)."""
+    configs = {f"{base_config.get('index_type', 'hnsw')} (current)": base_config}
+    for index_type in COMPRESSED_INDEX_TYPES:
+        config = copy.deepcopy(base_config)
+        config["index_type"] = index_type
+        by_type = config.setdefault("parameters_by_type", {})
+        params = {**(by_type.get(index_type) or {}), **overrides}
+        by_type[index_type] = params
+        configs[index_type + (f" +refine {params['refine']}" if params.get("refine") else "")] = config
+        if params.get("refine"):
+            unrefined = copy.deepcopy(config)
+            unrefined["parameters_by_type"][index_type]["refine"] = None
+            configs[index_type] = unrefined
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory / recall / latency of index types")
+    parser.add_argument("--index-config", type=Path, default=Path("config/index_config.json"),
+                        help="Current index configuration (compressed types use its parameters_by_type)")
+    parser.add_argument("--embeddings", type=Path, default=None, help="(N, D) .npy to index instead of synthetic vectors")
+    parser.add_argument("--vectors", type=int, default=100000, help="Number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=512, help="Synthetic embedding dimension")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of query vectors")
+    parser.add_argument("--noise", type=float, default=0.5, help="Relative noise of synthetic queries")
+    parser.add_argument("--topk", type=int, default=10, help="Query depth (recall@k)")
+    parser.add_argument("--nlist", type=int, default=None, help="Override nlist of the IVF types")
+    parser.add_argument("--pq-m", type=int, default=None, help="Override pq_m of the PQ types")
+    parser.add_argument("--types", nargs="*", default=None, help="Only these configurations (names as printed)")
+    parser.add_argument("--work-dir", type=Path, default=None, help="Keep the built indexes here")
+    parser.add_argument("--output", type=Path, default=None, help="Write the report as JSON")
+
+    args = parser.parse_args()
+
+    with open(args.index_config, 'r') as f:
+        base_config = json.load(f)
+
+    if args.embeddings is not None:
+        embeddings = np.load(args.embeddings).astype(np.float32)
+        rng = np.random.default_rng(0)
+        queries = embeddings[rng.choice(len(embeddings), size=min(args.queries, len(embeddings)), replace=False)]
+        queries = queries + args.noise * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+    else:
+        embeddings, queries = synthetic_vectors(args.vectors, args.dim, args.queries, args.noise)
+
+    overrides = {}
+    if args.nlist is not None:
+        overrides["nlist"] = args.nlist
+    if args.pq_m is not None:
+        overrides["pq_m"] = args.pq_m
+    configs = candidate_configs(base_config, overrides)
+    if args.types:
+        configs = {name: config for name, config in configs.items() if name in args.types}
+
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="index_types_"))
+    report = compare_index_types(embeddings, queries, configs, work_dir, topk=args.topk)
+
+    print(f"\n{len(embeddings)} vectors x {embeddings.shape[1]}, {len(queries)} queries, k={args.topk}")
+    print(f"{'index':<24} {'B/vector':>9} {'size_mb':>8} {'rss_mb':>7} {'anon_mb':>8} {'recall':>7} {'ms/query':>9} {'build_s':>8}")
+    for row in report:
+        print(
+            f"{row['name']:<24} {row['bytes_per_vector']:>9.0f} {row['index_bytes'] / 2**20:>8.1f} "
+            f"{row.get('rss_mb') or 0:>7.1f} {row.get('rss_anon_mb') or 0:>8.1f} "
+            f"{row['recall_at_k']:>7.3f} {row['ms_per_query']:>9.3f} {row['build_seconds']:>8.1f}"
+        )
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Sweep MERT depth (model.max_layer) against retrieval quality.
+
+For each layer count N the originals are embedded with only the first N
+transformer layers, an exact (flat) index is built, and every transformed
+file is queried. The report lists latency per segment and Recall@K from
+evaluation.metrics per N; the smallest N whose Recall@5 is within
+--tolerance of full depth is chosen and, with --write-config, written back
+to model.max_layer in the fingerprint config.
+"""
+import argparse
+import json
+import logging
+import re
+from pathlib import Path
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation.metrics import compute_recall_at_k
+from fingerprint.embed import segment_audio_matrix, extract_embeddings, normalize_embeddings
+from fingerprint.load_model import load_fingerprint_model
+from fingerprint.query_index import build_index, load_index
+from fingerprint.run_queries import run_query_on_file
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _resolve_path(path_str: str) -> Path:
+    """Manifest paths may be relative to the project root."""
+    path = Path(path_str)
+    if not path.is_absolute() and not path.exists():
+        path = Path.cwd() / path
+    return path
+
+
+def evaluate_depth(
+    model_config: Dict,
+    files_df: pd.DataFrame,
+    transform_df: pd.DataFrame,
+    output_dir: Path,
+    topk: int = 10,
+    k_values: List[int] = [1, 5, 10]
+) -> Dict:
+    """
+    Index the originals and query the transforms at the generator's current depth.
+
+    Args:
+        model_config: Loaded fingerprint model config
+        files_df: Files manifest (id, file_path/path)
+        transform_df: Transform manifest (transformed_id, orig_id, output_path)
+        output_dir: Directory for the index and per-query result JSONs
+        topk: Candidates per segment search
+        k_values: K values for Recall@K
+
+    Returns:
+        Dictionary with latency per segment and recall_at_K
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results_dir = output_dir / "results"
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    # Index originals (timed: model latency per segment)
+    all_embeddings = []
+    all_ids = []
+    embed_time = 0.0
+    for _, row in files_df.iterrows():
+        file_path = _resolve_path(row.get("file_path") or row.get("path"))
+        if not file_path.exists():
+            logger.warning(f"File not found: {file_path}")
+            continue
+        segments = segment_audio_matrix(
+            file_path,
+            segment_length=model_config["segment_length"],
+            sample_rate=model_config["sample_rate"],
+            overlap_ratio=model_config.get("overlap_ratio")
+        )
+        start = time.perf_counter()
+        embeddings = extract_embeddings(segments, model_config, output_dir=None, save_embeddings=False)
+        embed_time += time.perf_counter() - start
+        all_embeddings.append(normalize_embeddings(embeddings, method="l2"))
+        all_ids.extend(f"{row['id']}_seg_{i:04d}" for i in range(len(segments)))
+
+    if not all_embeddings:
+        raise ValueError("No original files could be embedded. Check the files manifest.")
+
+    # Exact search isolates the effect of depth from ANN recall
+    index_path = output_dir / "faiss_index.bin"
+    build_index(np.vstack(all_embeddings), all_ids, index_path, {"index_type": "flat", "metric": "cosine"})
+    index, index_metadata = load_index(index_path)
+
+    # Query transforms
+    query_records = []
+    query_time = 0.0
+    for _, row in transform_df.iterrows():
+        file_path = _resolve_path(row["output_path"])
+        if not file_path.exists():
+            logger.warning(f"File not found: {file_path}")
+            continue
+        start = time.perf_counter()
+        result = run_query_on_file(
+            file_path,
+            index,
+            model_config,
+            topk=topk,
+            index_metadata=index_metadata,
+            transform_type=row.get("transform_type"),
+            expected_orig_id=row.get("orig_id")
+        )
+        query_time += time.perf_counter() - start
+
+        result_path = results_dir / f"{re.sub(r'[^A-Za-z0-9._-]+', '_', str(row['transformed_id']))}_query.json"
+        with open(result_path, 'w') as f:
+            json.dump(result, f, indent=2)
+        top_match = result.get("aggregated_results", [{}])[0] if result.get("aggregated_results") else {}
+        query_records.append({
+            "transformed_id": row["transformed_id"],
+            "orig_id": row["orig_id"],
+            "top_match_id": top_match.get("id", ""),
+            "result_path": str(result_path),
+        })
+
+    query_df = pd.DataFrame(query_records)
+    if query_df.empty:
+        raise ValueError("No transformed files could be queried. Check the transform manifest.")
+    ground_truth_map = dict(zip(transform_df["transformed_id"], transform_df["orig_id"]))
+    recalls = compute_recall_at_k(query_df, ground_truth_map, k_values=k_values)
+
+    return {
+        "num_segments": len(all_ids),
+        "num_queries": len(query_df),
+        "latency_ms_per_segment": embed_time * 1000 / len(all_ids),
+        "query_latency_ms": query_time * 1000 / len(query_df),
+        **recalls,
+    }
+
+
+def choose_layer(report: List[Dict], tolerance: float) -> int:
+    """Smallest depth whose Recall@5 is within ``tolerance`` of the deepest one."""
+    reference = max(report, key=lambda row: row["max_layer"])["recall_at_5"]
+    eligible = [row["max_layer"] for row in report if row["recall_at_5"] >= reference - tolerance]
+    return min(eligible)
+
+
+def write_max_layer(config_path: Path, max_layer: Optional[int]):
+    """
+    Set ``model.max_layer`` in the fingerprint config, keeping comments and layout.
+
+    Args:
+        config_path: Fingerprint config YAML
+        max_layer: Layer count to write (None writes null)
+    """
+    text = Path(config_path).read_text()
+    value = "null" if max_layer is None else str(int(max_layer))
+    pattern = re.compile(r"^(  max_layer:[ \t]*)[^\s#]+", re.MULTILINE)
+    if pattern.search(text):
+        text = pattern.sub(lambda m: m.group(1) + value, text, count=1)
+    else:
+        text, count = re.subn(r"^model:[ \t]*\n", f"model:\n  max_layer: {value}\n", text, count=1, flags=re.MULTILINE)
+        if count == 0:
+            raise ValueError(f"No 'model:' section in {config_path}")
+    Path(config_path).write_text(text)
+    logger.info(f"Wrote model.max_layer: {value} to {config_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweep MERT depth (model.max_layer) against latency and Recall@5"
+    )
+    parser.add_argument("--config", type=Path, default=Path("config/fingerprint_v1.yaml"), help="Fingerprint config YAML")
+    parser.add_argument("--files-manifest", type=Path, default=Path("data/manifests/files_manifest.csv"), help="Originals manifest CSV")
+    parser.add_argument("--transform-manifest", type=Path, default=Path("data/manifests/transform_manifest.csv"), help="Transform manifest CSV")
+    parser.add_argument("--layers", type=int, nargs="+", default=None, help="Layer counts to test (default: every 4th layer and full depth)")
+    parser.add_argument("--max-files", type=int, default=None, help="Limit the number of originals")
+    parser.add_argument("--max-queries", type=int, default=None, help="Limit the number of transformed queries")
+    parser.add_argument("--topk", type=int, default=10, help="Candidates per segment search")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Max Recall@5 drop vs full depth for the chosen layer")
+    parser.add_argument("--output", type=Path, default=Path("reports/mert_depth"), help="Output directory")
+    parser.add_argument("--write-config", action="store_true", help="Write the chosen layer to model.max_layer in --config")
+
+    args = parser.parse_args()
+
+    # The sweep truncates layers of the in-process model, not of a running model server
+    model_config = load_fingerprint_model(args.config, use_server=False)
+    generator = model_config["model"]
+    if getattr(generator, "active_model_name", None) != "mert":
+        logger.error("Depth sweep needs the MERT model; set model.type: mert")
+        sys.exit(1)
+
+    files_df = pd.read_csv(args.files_manifest)
+    transform_df = pd.read_csv(args.transform_manifest)
+    if args.max_files:
+        files_df = files_df.head(args.max_files)
+        transform_df = transform_df[transform_df["orig_id"].isin(files_df["id"])]
+    if args.max_queries:
+        transform_df = transform_df.head(args.max_queries)
+
+    total_layers = generator.num_mert_layers
+    layers = args.layers or sorted(set(list(range(4, total_layers, 4)) + [total_layers]))
+    layers = sorted(set(min(n, total_layers) for n in layers))
+
+    report = []
+    for max_layer in layers:
+        logger.info(f"Evaluating max_layer={max_layer}/{total_layers}")
+        generator.set_max_layer(max_layer)
+        row = evaluate_depth(model_config, files_df, transform_df, args.output / f"layer_{max_layer:02d}", topk=args.topk)
+        row["max_layer"] = max_layer
+        report.append(row)
+    generator.set_max_layer(None)
+
+    chosen = choose_layer(report, args.tolerance)
+
+    print(f"\n{'max_layer':>9} {'ms/segment':>11} {'query_ms':>9} {'recall@1':>9} {'recall@5':>9}")
+    for row in report:
+        marker = "  <- chosen" if row["max_layer"] == chosen else ""
+        print(
+            f"{row['max_layer']:>9} {row['latency_ms_per_segment']:>11.1f} {row['query_latency_ms']:>9.1f} "
+            f"{row['recall_at_1']:>9.3f} {row['recall_at_5']:>9.3f}{marker}"
+        )
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    report_path = args.output / "depth_sweep.json"
+    with open(report_path, 'w') as f:
+        json.dump({"chosen_max_layer": chosen, "tolerance": args.tolerance, "layers": report}, f, indent=2)
+    logger.info(f"Report written to {report_path}")
+
+    if args.write_config:
+        # Full depth is written as null (no truncation)
+        write_max_layer(args.config, None if chosen == total_layers else chosen)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,17 @@
 """
 Cleanup script to remove embeddings, indexes, and cache files.
 This allows for a fresh regeneration of all data.
+
+With --maintain the embeddings cache is trimmed instead of removed: outdated
+model entries are purged, orphaned files are deleted and least recently
+accessed entries are evicted down to a size limit.
 """
 import argparse
 import logging
 import shutil
 from pathlib import Path
 import sys
+from typing import List, Optional
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -122,6 +127,44 @@ def cleanup_all(
     logger.info("")
 
 
+def maintain_cache(
+    cache_dir: Path,
+    max_size_gb: Optional[float] = None,
+    keep_model_hashes: Optional[List[str]] = None,
+    remove_orphans: bool = True
+):
+    """
+    Run one maintenance pass over the embeddings cache.
+    
+    Args:
+        cache_dir: Embeddings cache directory
+        max_size_gb: Size limit in GB (None = no eviction)
+        keep_model_hashes: Model hashes to keep; other entries are purged (None = keep all)
+        remove_orphans: Delete files and manifest rows that do not match each other
+    """
+    from fingerprint.cache_maintenance import run_cache_maintenance
+    from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+    
+    if not Path(cache_dir).exists():
+        logger.info(f"⏭️  Embeddings cache does not exist: {cache_dir}")
+        return None
+    
+    cache = OriginalEmbeddingsCache(cache_dir=Path(cache_dir))
+    before_mb = cache.get_cache_stats()["total_cache_size_mb"]
+    report = run_cache_maintenance(
+        cache,
+        max_bytes=int(max_size_gb * 1024 ** 3) if max_size_gb is not None else None,
+        keep_model_hashes=keep_model_hashes,
+        remove_orphans=remove_orphans
+    )
+    stats = cache.get_cache_stats()
+    logger.info(
+        f"✅ Embeddings cache: {before_mb:.1f} MB -> {stats['total_cache_size_mb']:.1f} MB "
+        f"({stats['num_cached_files']} entries)"
+    )
+    return report
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Cleanup embeddings, indexes, and cache files for fresh regeneration"
@@ -152,8 +195,60 @@ def main():
         help="Also remove transform manifest CSV"
     )
     
+    maintenance = parser.add_argument_group("cache maintenance (instead of removal)")
+    maintenance.add_argument(
+        "--maintain",
+        action="store_true",
+        help="Trim the embeddings cache instead of removing anything"
+    )
+    maintenance.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=Path(__file__).parent.parent / "data" / "cache" / "original_embeddings",
+        help="Embeddings cache directory"
+    )
+    maintenance.add_argument(
+        "--max-size-gb",
+        type=float,
+        help="Evict least recently accessed entries beyond this size"
+    )
+    maintenance.add_argument(
+        "--config",
+        type=Path,
+        help="Fingerprint config: purge entries not computed with its model, and use its "
+             "embeddings_cache.max_size_gb when --max-size-gb is not given"
+    )
+    maintenance.add_argument(
+        "--keep-model-hash",
+        action="append",
+        help="Purge entries of every other model hash (repeatable)"
+    )
+    maintenance.add_argument(
+        "--keep-orphans",
+        action="store_true",
+        help="Do not delete files the cache manifest does not reference"
+    )
+    
     args = parser.parse_args()
     
+    if args.maintain:
+        keep_model_hashes = list(args.keep_model_hash) if args.keep_model_hash else None
+        max_size_gb = args.max_size_gb
+        if args.config:
+            from fingerprint.load_model import load_fingerprint_model
+            from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+            model_config = load_fingerprint_model(args.config)
+            keep_model_hashes = (keep_model_hashes or []) + [OriginalEmbeddingsCache.compute_model_hash(model_config)]
+            if max_size_gb is None:
+                max_size_gb = (model_config["config"].get("embeddings_cache") or {}).get("max_size_gb")
+        maintain_cache(
+            args.cache_dir,
+            max_size_gb=max_size_gb,
+            keep_model_hashes=keep_model_hashes,
+            remove_orphans=not args.keep_orphans
+        )
+        return
+    
     cleanup_all(
         remove_indexes=not args.no_indexes,
         remove_cache=not args.no_cache,
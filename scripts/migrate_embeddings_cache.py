@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Migrate the original-embeddings cache to the packed storage layout.
+
+Entries written as one seg_XXXX.npy per segment are rewritten as a single
+(N_segments, D) matrix plus columnar segment metadata. With --benchmark the
+read time of every entry is measured in the old layout before migrating and
+in the packed layout (in memory and memory-mapped) afterwards.
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache, STORAGE_DTYPES
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def benchmark_reads(cache: OriginalEmbeddingsCache, repeats: int = 3, mmap_mode: str = None) -> Dict:
+    """
+    Time reading every cache entry from disk.
+
+    Args:
+        cache: Cache to read
+        repeats: Passes over all entries (the best pass is reported)
+        mmap_mode: Passed to the packed-layout reader
+
+    Returns:
+        Dictionary with entry/segment counts and best-pass timings
+    """
+    keys = list(cache.manifest)
+    num_segments = 0
+    pass_times: List[float] = []
+    for _ in range(max(1, repeats)):
+        num_segments = 0
+        start = time.perf_counter()
+        for cache_key in keys:
+            embeddings, _ = cache._load_entry(cache_key, mmap_mode=mmap_mode)
+            if embeddings is not None:
+                # Touch the data so memory maps are actually read
+                float(np.asarray(embeddings).sum())
+                num_segments += len(embeddings)
+        pass_times.append(time.perf_counter() - start)
+
+    best = min(pass_times)
+    return {
+        "num_entries": len(keys),
+        "num_segments": num_segments,
+        "total_s": best,
+        "ms_per_entry": 1000 * best / max(1, len(keys)),
+        "us_per_segment": 1e6 * best / max(1, num_segments),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the embeddings cache to the packed layout"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=Path("data/cache/original_embeddings"),
+        help="Embeddings cache directory"
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=STORAGE_DTYPES,
+        default="float32",
+        help="Storage dtype of migrated entries"
+    )
+    parser.add_argument(
+        "--keep-legacy",
+        action="store_true",
+        help="Keep the seg_XXXX.npy directories after packing"
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Measure read time before and after migration"
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Benchmark passes over all entries"
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        help="Write the benchmark results to this JSON file"
+    )
+
+    args = parser.parse_args()
+
+    cache = OriginalEmbeddingsCache(cache_dir=args.cache_dir, dtype=args.dtype)
+    report = {}
+    if args.benchmark:
+        report["before"] = benchmark_reads(cache, repeats=args.repeats)
+
+    report["migration"] = cache.migrate(remove_legacy=not args.keep_legacy)
+
+    if args.benchmark:
+        report["after"] = benchmark_reads(cache, repeats=args.repeats)
+        report["after_mmap"] = benchmark_reads(cache, repeats=args.repeats, mmap_mode="r")
+        for label in ("before", "after", "after_mmap"):
+            stats = report[label]
+            logger.info(
+                f"{label:>10}: {stats['num_entries']} entries, {stats['num_segments']} segments, "
+                f"{stats['ms_per_entry']:.3f} ms/entry, {stats['us_per_segment']:.1f} us/segment"
+            )
+        if report["after"]["total_s"] > 0:
+            logger.info(f"Read speedup: {report['before']['total_s'] / report['after']['total_s']:.1f}x")
+
+    report["stats"] = cache.get_cache_stats()
+    if args.report:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.report}")
+
+    return 0 if report["migration"]["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
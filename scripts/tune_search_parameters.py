@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tune index search parameters against per-tier latency targets.
+
+Replays held-out query embeddings against an index, sweeping efSearch /
+nprobe / topk, and measures recall of the true original and p50 / p99
+search latency per severity tier. The Pareto-optimal setting of each tier
+(see fingerprint.search_tuning) is written to ``search_tiers`` of the index
+config and of the built index, so queries use it right away.
+
+Held-out queries come from an .npz (embeddings, file_ids, tiers,
+query_ids), from a transform manifest (transformed files are embedded with
+the fingerprint model) or, by default, are noisy copies of indexed segments.
+Re-run after the catalog grew.
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fingerprint.query_index import load_index
+from fingerprint.search_tuning import (
+    DEFAULT_GRID,
+    DEFAULT_TARGETS,
+    HeldOutQueries,
+    apply_search_tiers,
+    held_out_from_index,
+    search_tiers_entry,
+    select_tier_settings,
+    tune_search_parameters,
+    write_search_tiers,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def held_out_from_manifest(manifest_path: Path, fingerprint_config: Path, limit: int = None) -> HeldOutQueries:
+    """Embed the transformed files of a transform manifest (output_path, orig_id, transform_type)."""
+    from fingerprint.embed import DecodedAudio, extract_embeddings, normalize_embeddings
+    from fingerprint.load_model import load_fingerprint_model
+    from fingerprint.run_queries import transform_severity
+
+    model_config = load_fingerprint_model(fingerprint_config)
+    transform_df = pd.read_csv(manifest_path)
+    if limit:
+        transform_df = transform_df.sample(n=min(limit, len(transform_df)), random_state=0)
+
+    embeddings, file_ids, tiers, query_ids = [], [], [], []
+    for _, row in transform_df.iterrows():
+        file_path = Path(row["output_path"])
+        if not file_path.exists() or pd.isna(row.get("orig_id")):
+            continue
+        audio = DecodedAudio.load(file_path, model_config["sample_rate"])
+        segments = audio.segment(
+            segment_length=model_config["segment_length"],
+            overlap_ratio=model_config.get("overlap_ratio")
+        )
+        file_embeddings = normalize_embeddings(
+            extract_embeddings(segments, model_config, save_embeddings=False), method="l2"
+        )
+        if len(file_embeddings) == 0:
+            continue
+        tier = transform_severity(row.get("transform_type"), file_path)
+        embeddings.append(file_embeddings)
+        file_ids += [str(row["orig_id"])] * len(file_embeddings)
+        tiers += [tier] * len(file_embeddings)
+        query_ids += [str(row.get("transformed_id", file_path.stem))] * len(file_embeddings)
+    if not embeddings:
+        raise ValueError(f"No transformed files of {manifest_path} could be embedded")
+
+    return HeldOutQueries(
+        embeddings=np.vstack(embeddings).astype(np.float32),
+        file_ids=np.asarray(file_ids, dtype=str),
+        tiers=np.asarray(tiers, dtype=str),
+        query_ids=np.asarray(query_ids, dtype=str),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune efSearch / nprobe / topk per severity tier")
+    parser.add_argument("--index", type=Path, default=Path("data/indexes/faiss_index.bin"), help="Index to tune")
+    parser.add_argument("--index-config", type=Path, default=Path("config/index_config.json"),
+                        help="Index config (targets from search_tuning; tuned tiers are written here)")
+    parser.add_argument("--queries", type=Path, default=None, help="Held-out queries .npz")
+    parser.add_argument("--transform-manifest", type=Path, default=None,
+                        help="Embed the transformed files of this manifest as held-out queries")
+    parser.add_argument("--fingerprint-config", type=Path, default=Path("config/fingerprint_v1.yaml"),
+                        help="Fingerprint configuration YAML (with --transform-manifest)")
+    parser.add_argument("--num-queries", type=int, default=300, help="Queries to draw (synthetic or from the manifest)")
+    parser.add_argument("--segments-per-query", type=int, default=16, help="Segments per synthetic query")
+    parser.add_argument("--save-queries", type=Path, default=None, help="Save the held-out queries as .npz")
+    parser.add_argument("--ef-search", type=int, nargs="*", default=None, help="efSearch values to sweep")
+    parser.add_argument("--nprobe", type=int, nargs="*", default=None, help="nprobe values to sweep")
+    parser.add_argument("--topk", type=int, nargs="*", default=None, help="topk values to sweep")
+    parser.add_argument("--output", type=Path, default=None, help="Write the full sweep as JSON")
+    parser.add_argument("--dry-run", action="store_true", help="Report only, write no config")
+
+    args = parser.parse_args()
+
+    with open(args.index_config, 'r') as f:
+        tuning_config = json.load(f).get("search_tuning") or {}
+    grid = {**DEFAULT_GRID, **(tuning_config.get("grid") or {})}
+    for key, values in (("ef_search", args.ef_search), ("nprobe", args.nprobe), ("topk", args.topk)):
+        if values:
+            grid[key] = values
+    targets = {**DEFAULT_TARGETS, **(tuning_config.get("targets") or {})}
+
+    index, index_metadata = load_index(args.index, with_daw_metadata=False)
+    if args.queries is not None:
+        queries = HeldOutQueries.load(args.queries)
+    elif args.transform_manifest is not None:
+        queries = held_out_from_manifest(args.transform_manifest, args.fingerprint_config, limit=args.num_queries)
+    else:
+        queries = held_out_from_index(index, index_metadata, args.num_queries, args.segments_per_query)
+    if args.save_queries:
+        queries.save(args.save_queries)
+    logger.info(f"{len(queries)} held-out query segments in {len(queries.queries())} queries")
+
+    report = tune_search_parameters(index, index_metadata, queries, grid)
+    selected = select_tier_settings(report, targets)
+
+    print(f"\n{index.ntotal} vectors, {len(queries.queries())} queries")
+    print(f"{'tier':<9} {'topk':>5} {'ef':>5} {'nprobe':>6} {'recall':>7} {'p50_ms':>8} {'p99_ms':>8}  target")
+    for tier, setting in selected.items():
+        target = targets.get(tier) or {}
+        print(
+            f"{tier:<9} {setting['topk']:>5} {setting.get('ef_search', '-'):>5} {setting.get('nprobe', '-'):>6} "
+            f"{setting['recall']:>7.3f} {setting['p50_ms']:>8.2f} {setting['p99_ms']:>8.2f}  "
+            f"recall>={target.get('min_recall')} p99<={target.get('target_p99_ms')}ms"
+        )
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({"selected": selected, "sweep": report}, f, indent=2)
+        logger.info(f"Sweep written to {args.output}")
+
+    if not args.dry_run:
+        search_tiers = search_tiers_entry(selected, index_metadata)
+        write_search_tiers(args.index_config, search_tiers)
+        apply_search_tiers(args.index, search_tiers)
+
+
+if __name__ == "__main__":
+    main()
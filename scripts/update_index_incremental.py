@@ -9,6 +9,8 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from fingerprint.incremental_index import update_index_incremental
+from fingerprint.index_updates import MutableIndex
+from fingerprint.query_index import index_exists
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,7 +26,7 @@ def main():
     parser.add_argument(
         "--new-files",
         type=Path,
-        required=True,
+        default=None,
         help="CSV manifest with new files to add"
     )
     parser.add_argument(
@@ -45,15 +47,42 @@ def main():
         default=Path("config/fingerprint_v1.yaml"),
         help="Fingerprint configuration YAML"
     )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Embedding worker processes (default: ingestion.num_workers from the fingerprint config)"
+    )
+    parser.add_argument(
+        "--replace-existing",
+        action="store_true",
+        help="Re-embed and replace files of the manifest that are already in the index"
+    )
+    parser.add_argument(
+        "--remove",
+        nargs="*",
+        default=[],
+        metavar="FILE_ID",
+        help="File IDs to remove from the index (before adding new files)"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Rebuild the index without vectors of removed files afterwards"
+    )
     
     args = parser.parse_args()
     
     # Validate inputs
-    if not args.new_files.exists():
+    if args.new_files is None and not args.remove and not args.compact:
+        logger.error("Nothing to do: pass --new-files, --remove or --compact")
+        return 1
+    
+    if args.new_files is not None and not args.new_files.exists():
         logger.error(f"New files manifest not found: {args.new_files}")
         return 1
     
-    if not args.existing_index.exists():
+    if not index_exists(args.existing_index):
         logger.error(f"Existing index not found: {args.existing_index}")
         return 1
     
@@ -63,17 +92,38 @@ def main():
     
     # Update index
     try:
-        updated_index, updated_metadata = update_index_incremental(
-            args.new_files,
-            args.existing_index,
-            args.fingerprint_config,
-            args.output_index
-        )
+        source_index = args.existing_index
+        if args.remove:
+            index = MutableIndex(source_index, output_path=args.output_index)
+            removed = index.remove_files(args.remove)
+            logger.info(f"Removed {removed} of {len(args.remove)} files")
+            if removed:
+                source_index = args.output_index
+        
+        if args.new_files is not None:
+            update_index_incremental(
+                args.new_files,
+                source_index,
+                args.fingerprint_config,
+                args.output_index,
+                num_workers=args.num_workers,
+                replace_existing=args.replace_existing
+            )
+            source_index = args.output_index
+        
+        index = MutableIndex(source_index, output_path=args.output_index)
+        if args.compact:
+            dropped = index.compact(force=True)
+            logger.info(f"Compaction dropped {dropped} vectors")
+        if index.source_path != index.index_path:
+            # No update wrote the output index (e.g. none of the files to remove
+            # were indexed); save it unchanged where later steps expect it
+            index.save()
         
         logger.info("=" * 60)
         logger.info("Incremental update completed successfully!")
         logger.info(f"Updated index saved to: {args.output_index}")
-        logger.info(f"Total vectors: {updated_index.ntotal}")
+        logger.info(f"Total vectors: {index.index.ntotal} ({index.num_removed} removed, awaiting compaction)")
         logger.info("=" * 60)
         
         return 0
@@ -4,6 +4,7 @@ from typing import List, Dict, Any, Optional
 import numpy as np
 
 from core.models import SegmentResult, QueryConfig
+from fingerprint.score_aggregation import SegmentHits, CandidateScores
 
 logger = logging.getLogger(__name__)
 
@@ -31,120 +32,62 @@ class AggregationService:
         if not segment_results:
             return []
         
-        # Collect all candidates with their scores
-        candidate_scores = {}
+        hits = SegmentHits.from_segment_results(segment_results)
+        keys = hits.candidate_keys()
         
-        for seg_result in segment_results:
-            if not seg_result.results:
-                continue
-            
-            scale_weight = seg_result.scale_weight
-            
-            # Filter by similarity threshold
-            filtered_results = [
-                r for r in seg_result.results
-                if r.get("similarity", 0) >= query_config.min_similarity_threshold
-            ]
-            
-            if not filtered_results:
-                # If all filtered out, use top result anyway
-                filtered_results = seg_result.results[:1] if seg_result.results else []
-            
-            # Weight results by scale weight and rank
-            for rank, result in enumerate(filtered_results, start=1):
-                candidate_id = result.get("id", f"index_{result.get('index', '')}")
-                similarity = result.get("similarity", 0.0)
-                
-                # Calculate weighted score
-                # Higher rank = higher score, higher similarity = higher score
-                rank_score = 1.0 / rank  # Inverse rank
-                weighted_score = similarity * scale_weight * rank_score
-                
-                if candidate_id not in candidate_scores:
-                    candidate_scores[candidate_id] = {
-                        "id": candidate_id,
-                        "index": result.get("index"),
-                        "total_score": 0.0,
-                        "max_similarity": 0.0,
-                        "min_rank": float('inf'),
-                        "segment_count": 0,
-                        "rank_5_count": 0,
-                        "rank_10_count": 0,
-                    }
-                
-                candidate_scores[candidate_id]["total_score"] += weighted_score
-                candidate_scores[candidate_id]["max_similarity"] = max(
-                    candidate_scores[candidate_id]["max_similarity"],
-                    similarity
-                )
-                candidate_scores[candidate_id]["min_rank"] = min(
-                    candidate_scores[candidate_id]["min_rank"],
-                    rank
-                )
-                candidate_scores[candidate_id]["segment_count"] += 1
-                
-                if rank <= 5:
-                    candidate_scores[candidate_id]["rank_5_count"] += 1
-                if rank <= 10:
-                    candidate_scores[candidate_id]["rank_10_count"] += 1
+        # Filter by similarity threshold; segments with nothing left keep their top result
+        kept = hits.valid & (hits.similarities >= query_config.min_similarity_threshold)
+        kept[:, :1] |= hits.valid[:, :1] & ~kept.any(axis=1, keepdims=True)
+        
+        # Ranks among each segment's kept results
+        ranks = np.where(kept, np.cumsum(kept, axis=1), 0)
+        scores = CandidateScores(hits, keys, mask=kept, ranks=ranks)
+        
+        # Weighted score: higher similarity, scale weight and (inverse) rank = higher score
+        weighted_scores = scores.hit_values(hits.weighted_similarities / np.maximum(ranks, 1))
+        total_scores = scores.sum(weighted_scores)
+        max_similarities = scores.max(scores.hit_values(hits.similarities))
         
         # Apply temporal consistency if enabled
         if query_config.use_temporal_consistency:
-            candidate_scores = AggregationService._apply_temporal_consistency(
-                candidate_scores,
-                segment_results,
+            total_scores = AggregationService._apply_temporal_consistency(
+                total_scores,
+                scores.consecutive_pairs(hits, keys),
                 query_config.temporal_consistency_weight
             )
         
-        # Convert to list and sort by total score
-        candidates = list(candidate_scores.values())
-        candidates.sort(key=lambda x: x["total_score"], reverse=True)
+        # Sort by total score (stable: first-seen candidates win ties)
+        order = np.argsort(-total_scores, kind="stable")
         
         # Format as query results
         formatted_results = []
-        for rank, candidate in enumerate(candidates, start=1):
+        for rank, c in enumerate(order.tolist(), start=1):
+            hit = hits.hit(scores.best_hit[c])
             formatted_results.append({
-                "id": candidate["id"],
-                "index": candidate["index"],
+                "id": hit.get("id", f"index_{hit.get('index', '')}"),
+                "index": hit.get("index"),
                 "rank": rank,
-                "similarity": candidate["max_similarity"],
-                "score": candidate["total_score"],
-                "segment_count": candidate["segment_count"],
-                "min_rank": candidate["min_rank"],
-                "rank_5_count": candidate["rank_5_count"],
-                "rank_10_count": candidate["rank_10_count"],
+                "similarity": float(max_similarities[c]),
+                "score": float(total_scores[c]),
+                "segment_count": int(scores.match_count[c]),
+                "min_rank": int(scores.min_rank[c]),
+                "rank_5_count": int(scores.rank_5_count[c]),
+                "rank_10_count": int(scores.rank_10_count[c]),
             })
         
         return formatted_results
     
     @staticmethod
     def _apply_temporal_consistency(
-        candidate_scores: Dict[str, Dict[str, Any]],
-        segment_results: List[SegmentResult],
+        total_scores: np.ndarray,
+        consecutive_pairs: np.ndarray,
         consistency_weight: float
-    ) -> Dict[str, Dict[str, Any]]:
+    ) -> np.ndarray:
         """
         Apply temporal consistency boost to candidates.
         
-        Boosts candidates that appear consistently across consecutive segments.
+        Boosts candidates that appear consistently across consecutive segments:
+        every neighbouring segment pair sharing a candidate in its top-10 adds
+        consistency_weight times the candidate's current score.
         """
-        # Group segments by position
-        sorted_segments = sorted(segment_results, key=lambda s: s.start)
-        
-        # Find consecutive matches
-        for i in range(len(sorted_segments) - 1):
-            seg1_results = sorted_segments[i].results[:10] if sorted_segments[i].results else []
-            seg2_results = sorted_segments[i + 1].results[:10] if sorted_segments[i + 1].results else []
-            
-            # Find common candidates in top-10
-            seg1_ids = {r.get("id") for r in seg1_results}
-            seg2_ids = {r.get("id") for r in seg2_results}
-            common_ids = seg1_ids & seg2_ids
-            
-            # Boost common candidates
-            for candidate_id in common_ids:
-                if candidate_id in candidate_scores:
-                    boost = consistency_weight * candidate_scores[candidate_id]["total_score"]
-                    candidate_scores[candidate_id]["total_score"] += boost
-        
-        return candidate_scores
+        return total_scores * (1.0 + consistency_weight) ** consecutive_pairs
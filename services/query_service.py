@@ -3,6 +3,7 @@ import logging
 import time
 from pathlib import Path
 from typing import List, Optional, Dict, Any
+import numpy as np
 
 from core.interfaces import (
     IQueryService,
@@ -18,7 +19,7 @@ from core.models import (
     ModelConfig,
     IndexMetadata
 )
-from fingerprint.embed import segment_audio, extract_embeddings, normalize_embeddings
+from fingerprint.embed import DecodedAudio, SegmentMatrix, extract_embeddings, normalize_embeddings
 from services.aggregation_service import AggregationService
 from services.recall_estimator import RecallEstimator
 
@@ -118,11 +119,13 @@ class QueryService(IQueryService):
         first_scale_len = segment_lengths[0]
         first_scale_weight = scale_weights[0]
         
-        segments = segment_audio(
-            file_path,
+        # Decode once; every scale segments the same decoded signal
+        query_audio = DecodedAudio.load(file_path, model_config.sample_rate)
+        
+        segments = query_audio.segment(
             segment_length=first_scale_len,
-            sample_rate=model_config.sample_rate,
-            overlap_ratio=query_config.overlap_ratio
+            overlap_ratio=query_config.overlap_ratio,
+            scale_weight=first_scale_weight
         )
         
         embeddings = extract_embeddings(segments, model_config.__dict__, save_embeddings=False)
@@ -170,25 +173,20 @@ class QueryService(IQueryService):
             else:
                 expanded_topk = min(expanded_topk, 30)
             
+            scales = []
             for scale_len, scale_weight in zip(segment_lengths[1:], scale_weights[1:]):
-                segments = segment_audio(
-                    file_path,
+                segments = query_audio.segment(
                     segment_length=scale_len,
-                    sample_rate=model_config.sample_rate,
-                    overlap_ratio=query_config.overlap_ratio
+                    overlap_ratio=query_config.overlap_ratio,
+                    scale_weight=scale_weight
                 )
                 
                 embeddings = extract_embeddings(segments, model_config.__dict__, save_embeddings=False)
                 embeddings = normalize_embeddings(embeddings, method="l2")
-                
-                scale_results = self._query_segments(
-                    segments,
-                    embeddings,
-                    expanded_topk,
-                    scale_len,
-                    scale_weight
-                )
-                all_segment_results.extend(scale_results)
+                scales.append((segments, embeddings, scale_len, scale_weight))
+            
+            # All additional scales in one batched search
+            all_segment_results.extend(self._query_scales(scales, expanded_topk))
         else:
             logger.debug(f"Single-scale sufficient for {transform_type} (estimated Recall@5: {estimated_recall_5:.3f})")
         
@@ -280,34 +278,59 @@ class QueryService(IQueryService):
     
     def _query_segments(
         self,
-        segments: List[Dict],
+        segments: SegmentMatrix,
         embeddings: Any,
         topk: int,
         scale_length: float,
         scale_weight: float
     ) -> List[SegmentResult]:
         """Query segments and return SegmentResults."""
+        return self._query_scales([(segments, embeddings, scale_length, scale_weight)], topk)
+    
+    def _query_scales(
+        self,
+        scales: List[tuple],
+        topk: int
+    ) -> List[SegmentResult]:
+        """
+        Query the segments of several scales with one batched index search.
+        
+        Args:
+            scales: (segments, embeddings, scale_length, scale_weight) per scale
+            topk: Number of results per segment
+            
+        Returns:
+            SegmentResults of all scales, in order
+        """
         if not self._index:
             raise ValueError("Index must be provided")
+        scales = [scale for scale in scales if len(scale[1]) > 0]
+        if not scales:
+            return []
+        
+        batch_results = self.index_repository.query_index_batch(
+            self._index,
+            np.concatenate([embeddings for _, embeddings, _, _ in scales]),
+            topk,
+            self._index_metadata
+        )
         
         segment_results = []
-        for seg, emb in zip(segments, embeddings):
-            results = self.index_repository.query_index(
-                self._index,
-                emb,
-                topk,
-                self._index_metadata
-            )
-            
-            segment_results.append(SegmentResult(
-                segment_id=seg["segment_id"],
-                start=seg["start"],
-                end=seg["end"],
-                segment_idx=len(segment_results),
-                scale_length=scale_length,
-                scale_weight=scale_weight,
-                results=results
-            ))
+        offset = 0
+        for segments, embeddings, scale_length, scale_weight in scales:
+            starts = segments.starts
+            ends = segments.ends
+            for i in range(len(embeddings)):
+                segment_results.append(SegmentResult(
+                    segment_id=segments.segment_id(i),
+                    start=float(starts[i]),
+                    end=float(ends[i]),
+                    segment_idx=i,
+                    scale_length=scale_length,
+                    scale_weight=scale_weight,
+                    results=batch_results[offset + i]
+                ))
+            offset += len(embeddings)
         
         return segment_results
     
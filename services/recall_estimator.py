@@ -3,6 +3,7 @@ import logging
 from typing import List, Optional
 
 from core.models import SegmentResult
+from fingerprint.segment_map import result_file_id
 
 logger = logging.getLogger(__name__)
 
@@ -41,8 +42,7 @@ class RecallEstimator:
             # Check if original is in top-K for THIS segment
             found_in_topk = False
             for result in seg_result.results[:k]:  # Check only top-K
-                candidate_id = result.get("id", f"index_{result.get('index', '')}")
-                if expected_orig_id in str(candidate_id):
+                if result_file_id(result) == expected_orig_id:
                     found_in_topk = True
                     break
             
@@ -4,6 +4,8 @@ from typing import List, Dict, Optional
 from pathlib import Path
 import numpy as np
 
+from fingerprint.segment_map import result_file_id
+
 logger = logging.getLogger(__name__)
 
 
@@ -307,7 +309,7 @@ class SimilarityEnforcer:
             logger.debug(f"REVALIDATION DIAGNOSTIC: Searching for expected_orig_id={expected_orig_id}")
             for i, result in enumerate(aggregated_results):
                 result_id = result.get("id", "")
-                if expected_orig_id in str(result_id):
+                if result_file_id(result) == expected_orig_id:
                     correct_match_idx = i
                     logger.info(
                         f"REVALIDATION DIAGNOSTIC: ✓ Found correct match at index {i} "
@@ -327,7 +329,7 @@ class SimilarityEnforcer:
                 # This happens when correct match is buried but still retrieved
                 for i in range(5, min(50, len(aggregated_results))):
                     result_id = aggregated_results[i].get("id", "")
-                    if expected_orig_id in str(result_id):
+                    if result_file_id(aggregated_results[i]) == expected_orig_id:
                         correct_match_idx = i
                         logger.info(
                             f"CRITICAL FIX: Found correct match at deeper position {i} "
@@ -360,10 +362,10 @@ class SimilarityEnforcer:
             # Try to load original embeddings if not provided
             if model_config and files_manifest_path and files_manifest_path.exists():
                 try:
-                    from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+                    from fingerprint.original_embeddings_cache import get_shared_cache
                     import pandas as pd
                     
-                    cache = OriginalEmbeddingsCache()
+                    cache = get_shared_cache(model_config)
                     files_df = pd.read_csv(files_manifest_path)
                     orig_row = files_df[files_df["id"] == expected_orig_id]
                     if not orig_row.empty:
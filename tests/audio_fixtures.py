@@ -0,0 +1,16 @@
+"""Shared test audio."""
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+
+
+SAMPLE_RATE = 22050
+
+
+def write_test_audio(path: Path, duration_sec: float = 8.0) -> np.ndarray:
+    """Write a deterministic chirp with a rising envelope and return its samples."""
+    t = np.arange(int(duration_sec * SAMPLE_RATE)) / SAMPLE_RATE
+    y = np.sin(2 * np.pi * (220 + 40 * t) * t) * np.linspace(0.1, 1.0, len(t))
+    y = y.astype(np.float32)
+    sf.write(str(path), y, SAMPLE_RATE)
+    return y
@@ -0,0 +1,66 @@
+"""Tests for process-pool catalog embedding extraction."""
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+
+from fingerprint.embed import segment_audio_matrix, extract_embeddings
+from audio_fixtures import SAMPLE_RATE, write_test_audio
+
+
+class TestCatalogIngest(unittest.TestCase):
+    """Test process-pool embedding extraction for index building."""
+
+    def test_pool_matches_in_process_and_resumes_from_cache(self):
+        """Workers produce in-process embeddings, fill the cache, and a rerun only reads the cache."""
+        import pandas as pd
+        import yaml
+        from fingerprint.catalog_ingest import ingest_catalog
+        from fingerprint.load_model import load_fingerprint_model
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            rows = []
+            for k in range(3):
+                path = tmp / f"track{k}.wav"
+                write_test_audio(path, duration_sec=3.0 + k)
+                rows.append({"id": f"track{k}", "file_path": str(path)})
+            rows.append({"id": "missing", "file_path": str(tmp / "missing.wav")})
+            config_path = tmp / "fingerprint.yaml"
+            config_path.write_text(yaml.safe_dump({
+                "model": {"type": "openl3"},
+                "audio": {"sample_rate": SAMPLE_RATE, "segment_length": 1.0},
+                "embedding": {"dimension": 64},
+                "segmentation": {"overlap_ratio": 0.1},
+            }))
+
+            result = ingest_catalog(
+                pd.DataFrame(rows), config_path,
+                cache=OriginalEmbeddingsCache(cache_dir=tmp / "cache"),
+                num_workers=2, threads_per_worker=1
+            )
+            self.assertEqual(sorted(result.generated), ["track0", "track1", "track2"])
+            self.assertEqual(list(result.failed), ["missing"])
+            self.assertEqual(sum(stats.files for stats in result.worker_stats.values()), 3)
+
+            model_config = load_fingerprint_model(config_path, use_server=False)
+            for row in rows[:3]:
+                segments = segment_audio_matrix(
+                    Path(row["file_path"]), segment_length=1.0, sample_rate=SAMPLE_RATE, overlap_ratio=0.1
+                )
+                expected = extract_embeddings(segments, model_config, save_embeddings=False)
+                expected = expected / np.linalg.norm(expected, axis=1, keepdims=True)
+                np.testing.assert_allclose(result.embeddings[row["id"]], expected, atol=1e-6)
+
+            rerun = ingest_catalog(
+                pd.DataFrame(rows), config_path,
+                cache=OriginalEmbeddingsCache(cache_dir=tmp / "cache"),
+                num_workers=1
+            )
+            self.assertEqual(rerun.generated, [])
+            self.assertEqual(sorted(rerun.cached), ["track0", "track1", "track2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+"""Tests for in-memory segmentation and embedding extraction."""
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+import numpy as np
+import soundfile as sf
+
+from fingerprint.embed import (
+    DecodedAudio,
+    segment_audio,
+    segment_audio_matrix,
+    segment_signal,
+    extract_embeddings,
+)
+from fingerprint.load_model import FallbackEmbeddingGenerator
+from fingerprint.embedding_generator import EmbeddingGenerator
+from audio_fixtures import SAMPLE_RATE, write_test_audio
+
+
+class TestInMemoryEmbeddings(unittest.TestCase):
+    """Test the array-based embedding API."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.audio_path = Path(self.tmp_dir.name) / "track.wav"
+        write_test_audio(self.audio_path)
+        self.segments = segment_audio(
+            self.audio_path,
+            segment_length=2.0,
+            sample_rate=SAMPLE_RATE,
+            overlap_ratio=0.1
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _path_based_embeddings(self, generator) -> np.ndarray:
+        """Reference: embed each segment through a WAV file on disk."""
+        embeddings = []
+        for seg in self.segments:
+            seg_path = Path(self.tmp_dir.name) / f"{seg['segment_id']}.wav"
+            sf.write(str(seg_path), seg["audio"], seg["sample_rate"])
+            embeddings.append(generator.generate_embedding(seg_path))
+        return np.vstack(embeddings)
+
+    def test_fallback_generator_matches_file_path(self):
+        """In-memory fallback embeddings equal the file-based ones."""
+        generator = FallbackEmbeddingGenerator(embedding_dim=64, sample_rate=SAMPLE_RATE)
+        embeddings = extract_embeddings(self.segments, {"model": generator}, save_embeddings=False)
+
+        self.assertEqual(embeddings.shape, (len(self.segments), 64))
+        np.testing.assert_allclose(embeddings, self._path_based_embeddings(generator), atol=1e-5)
+
+    def test_librosa_generator_matches_file_path(self):
+        """EmbeddingGenerator librosa path gives the same result in memory."""
+        generator = EmbeddingGenerator(embedding_dim=128, sample_rate=SAMPLE_RATE, model_type="openl3")
+        if generator.active_model_name != "librosa":
+            self.skipTest("OpenL3 installed; librosa fallback not active")
+        embeddings = generator.generate_embeddings_from_audio(
+            np.stack([seg["audio"] for seg in self.segments]), SAMPLE_RATE
+        )
+
+        self.assertEqual(embeddings.dtype, np.float32)
+        np.testing.assert_allclose(embeddings, self._path_based_embeddings(generator), atol=1e-5)
+
+    def test_extract_embeddings_writes_no_temp_files(self):
+        """extract_embeddings never touches tempfile."""
+        generator = FallbackEmbeddingGenerator(embedding_dim=64, sample_rate=SAMPLE_RATE)
+        with patch("tempfile.NamedTemporaryFile", side_effect=AssertionError("temp file created")):
+            embeddings = extract_embeddings(self.segments, {"model": generator}, save_embeddings=False)
+        self.assertEqual(len(embeddings), len(self.segments))
+
+    def test_model_without_array_api_uses_fallback(self):
+        """Models lacking the in-memory API fall back to librosa features."""
+        embeddings = extract_embeddings(self.segments, {"model": object(), "embedding_dim": 32}, save_embeddings=False)
+        self.assertEqual(embeddings.shape, (len(self.segments), 32))
+
+
+class TestSegmentMatrix(unittest.TestCase):
+    """Test strided segmentation into a segment matrix."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.audio_path = Path(self.tmp_dir.name) / "track.wav"
+        write_test_audio(self.audio_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_matrix_is_view_of_signal(self):
+        """Segments are strided views that match explicit slicing."""
+        y = np.arange(1000, dtype=np.float32)
+        segments = segment_signal(y, 100, "sig", segment_length=2.0, overlap_ratio=0.5)
+
+        expected_starts = list(range(0, 1000 - 200 + 1, 100))
+        self.assertEqual(segments.audio.shape, (len(expected_starts), 200))
+        self.assertTrue(np.shares_memory(segments.audio, y))
+        np.testing.assert_array_equal(segments.start_samples, expected_starts)
+        for row, start in zip(segments.audio, expected_starts):
+            np.testing.assert_array_equal(row, y[start:start + 200])
+
+    def test_short_signal_has_no_segments(self):
+        """Signals shorter than one segment produce an empty matrix."""
+        segments = segment_signal(np.zeros(50, dtype=np.float32), 100, "sig", segment_length=1.0)
+        self.assertEqual(len(segments), 0)
+        self.assertEqual(segments.to_dicts(), [])
+
+    def test_lazy_dicts_match_segment_audio(self):
+        """Metadata dicts built on access match the segment_audio output."""
+        matrix = segment_audio_matrix(
+            self.audio_path, segment_length=2.0, sample_rate=SAMPLE_RATE,
+            overlap_ratio=0.1, scale_weight=0.6
+        )
+        legacy = segment_audio(self.audio_path, segment_length=2.0, sample_rate=SAMPLE_RATE, overlap_ratio=0.1)
+
+        self.assertEqual(len(matrix), len(legacy))
+        for i, seg in enumerate(legacy):
+            lazy = matrix[i]
+            for key in ("segment_id", "file_id", "start", "end", "start_sample", "end_sample"):
+                self.assertEqual(lazy[key], seg[key])
+            self.assertNotIn("audio", lazy)
+            self.assertEqual(lazy["segment_idx"], i)
+            self.assertAlmostEqual(lazy["scale_weight"], 0.6, places=6)
+
+    def test_extract_embeddings_accepts_matrix(self):
+        """extract_embeddings gives identical results for matrix and dict input."""
+        generator = FallbackEmbeddingGenerator(embedding_dim=64, sample_rate=SAMPLE_RATE)
+        matrix = segment_audio_matrix(self.audio_path, segment_length=2.0, sample_rate=SAMPLE_RATE, overlap_ratio=0.1)
+
+        from_matrix = extract_embeddings(matrix, {"model": generator}, save_embeddings=False)
+        from_dicts = extract_embeddings(matrix.to_dicts(include_audio=True), {"model": generator}, save_embeddings=False)
+        np.testing.assert_array_equal(from_matrix, from_dicts)
+
+
+class TestDecodedAudio(unittest.TestCase):
+    """Test the per-query decoded-audio context."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.audio_path = Path(self.tmp_dir.name) / "query.wav"
+        write_test_audio(self.audio_path)
+        self.audio = DecodedAudio.load(self.audio_path, SAMPLE_RATE)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_scales_share_one_decode(self):
+        """Every scale is a view of the same decoded signal."""
+        with patch("fingerprint.embed.librosa.load", side_effect=AssertionError("decoded twice")):
+            scales = [self.audio.segment(segment_length=length, overlap_ratio=0.1) for length in (2.0, 3.0, 5.0)]
+
+        for segments in scales:
+            self.assertTrue(np.shares_memory(segments.audio, self.audio.samples))
+            self.assertEqual(segments.file_id, "query")
+        reference = segment_audio_matrix(self.audio_path, segment_length=3.0, sample_rate=SAMPLE_RATE, overlap_ratio=0.1)
+        np.testing.assert_array_equal(scales[1].audio, reference.audio)
+
+    def test_optimizer_uses_shared_audio(self):
+        """Low-pass and overlay optimizers reuse the context instead of reloading."""
+        import faiss
+        from services.transform_optimizer import TransformOptimizer
+
+        segments = self.audio.segment(segment_length=2.0)
+        embeddings = np.eye(len(segments), 8, dtype=np.float32)
+        index = faiss.IndexFlatIP(8)
+        index.add(embeddings)
+        metadata = {"ids": [f"orig_seg_{i:04d}" for i in range(len(segments))]}
+
+        with patch("librosa.load") as mock_load:
+            for transform in ("low_pass_filter", "overlay_vocals"):
+                results = TransformOptimizer.apply_optimization(
+                    transform, self.audio_path, {"sample_rate": SAMPLE_RATE}, index, metadata,
+                    segments, embeddings, topk=2, audio=self.audio
+                )
+                self.assertEqual(len(results), len(segments))
+                self.assertEqual(results[0]["results"][0]["id"], "orig_seg_0000")
+        mock_load.assert_not_called()
+        # Both optimizers share one cached mel spectrogram
+        self.assertEqual(len(self.audio._feature_cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
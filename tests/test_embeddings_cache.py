@@ -0,0 +1,360 @@
+"""Tests for the original-embeddings cache."""
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+import numpy as np
+
+from fingerprint.load_model import FallbackEmbeddingGenerator
+from audio_fixtures import SAMPLE_RATE, write_test_audio
+
+
+class TestPackedEmbeddingsCache(unittest.TestCase):
+    """Test the packed on-disk layout of the original-embeddings cache."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        self.audio_path = self.tmp / "track.wav"
+        write_test_audio(self.audio_path, duration_sec=1.0)
+        self.model_config = {"embedding_dim": 8, "model_hash": "abcdef0123456789"}
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((5, 8)).astype(np.float32)
+        self.segments = [
+            {"segment_id": f"track_seg_{i:04d}", "file_id": "track", "segment_idx": i,
+             "start": i * 0.5, "end": i * 0.5 + 1.0, "sample_rate": SAMPLE_RATE}
+            for i in range(5)
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_set_get_roundtrip(self):
+        """One matrix file per entry; embeddings and segment metadata round-trip."""
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        cache.set("track", self.audio_path, self.model_config, self.embeddings, self.segments)
+        self.assertEqual(len(list((self.tmp / "cache").glob("*.npy"))), 1)
+
+        for mmap_mode in (None, "r"):
+            embeddings, segments = cache.get("track", self.audio_path, self.model_config, mmap_mode=mmap_mode)
+            np.testing.assert_array_equal(embeddings, self.embeddings)
+            self.assertEqual(segments, self.segments)
+
+        half = OriginalEmbeddingsCache(cache_dir=self.tmp / "half", dtype="float16")
+        half.set("track", self.audio_path, self.model_config, self.embeddings, self.segments)
+        embeddings, _ = half.get("track", self.audio_path, self.model_config)
+        self.assertEqual(embeddings.dtype, np.float32)
+        np.testing.assert_allclose(embeddings, self.embeddings, atol=1e-2)
+
+    def test_migrate_legacy_entries(self):
+        """Legacy one-file-per-segment entries are readable and migrate to the packed layout."""
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache, PACKED_FORMAT
+
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        file_hash = cache._get_file_hash(self.audio_path)
+        model_hash = cache._get_model_hash(self.model_config)
+        cache_key = cache._get_cache_key("track", file_hash, model_hash)
+        legacy_dir = self.tmp / "cache" / cache_key
+        legacy_dir.mkdir()
+        for i, emb in enumerate(self.embeddings):
+            np.save(legacy_dir / f"seg_{i:04d}.npy", emb)
+        (legacy_dir / "segments.json").write_text(json.dumps(self.segments))
+        cache.manifest[cache_key] = {"file_id": "track", "num_segments": 5, "embedding_dim": 8}
+
+        embeddings, _ = cache.get("track", self.audio_path, self.model_config)
+        np.testing.assert_array_equal(embeddings, self.embeddings)
+
+        self.assertEqual(cache.migrate(), {"migrated": 1, "skipped": 0, "failed": 0})
+        self.assertFalse(legacy_dir.exists())
+        self.assertEqual(cache.manifest[cache_key]["format"], PACKED_FORMAT)
+
+        reopened = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        embeddings, segments = reopened.get("track", self.audio_path, self.model_config)
+        np.testing.assert_array_equal(embeddings, self.embeddings)
+        self.assertEqual(segments, self.segments)
+        self.assertEqual(reopened.migrate()["skipped"], 1)
+
+
+class TestCacheFileIdentity(unittest.TestCase):
+    """Test the stat-based file hash cache of the embeddings cache."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        self.audio_path = self.tmp / "track.wav"
+        write_test_audio(self.audio_path, duration_sec=1.0)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hash_reused_until_stat_changes(self):
+        """The file is hashed once and again only after it is modified."""
+        import hashlib
+        import os
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        first = cache._get_file_hash(self.audio_path)
+        self.assertEqual(first, hashlib.md5(self.audio_path.read_bytes()).hexdigest())
+
+        reopened = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        with patch("fingerprint.original_embeddings_cache.hashlib.md5", side_effect=AssertionError("rehashed")):
+            self.assertEqual(reopened._get_file_hash(self.audio_path), first)
+
+        write_test_audio(self.audio_path, duration_sec=2.0)
+        stat = self.audio_path.stat()
+        os.utime(self.audio_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        second = reopened._get_file_hash(self.audio_path)
+        self.assertNotEqual(second, first)
+        self.assertEqual(second, hashlib.md5(self.audio_path.read_bytes()).hexdigest())
+
+    def test_reads_flat_manifest(self):
+        """Manifests written as a bare {cache_key: entry} dictionary still load."""
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        cache_dir = self.tmp / "cache"
+        cache_dir.mkdir()
+        (cache_dir / "cache_manifest.json").write_text(json.dumps({"track_abc_def": {"file_id": "track"}}))
+        cache = OriginalEmbeddingsCache(cache_dir=cache_dir)
+        self.assertEqual(list(cache.manifest), ["track_abc_def"])
+        self.assertEqual(cache.file_stats, {})
+
+    def test_get_new_files_hashes_in_parallel(self):
+        """get_new_files finds uncached files and records their hashes."""
+        import pandas as pd
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        rows = []
+        for k in range(4):
+            path = self.tmp / f"track{k}.wav"
+            write_test_audio(path, duration_sec=1.0 + k)
+            rows.append({"id": f"track{k}", "file_path": str(path)})
+        manifest_path = self.tmp / "files.csv"
+        pd.DataFrame(rows).to_csv(manifest_path, index=False)
+
+        model_config = {"model_hash": "abcdef0123456789"}
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        cache.set("track0", Path(rows[0]["file_path"]), model_config, np.ones((2, 4), dtype=np.float32), [])
+        new_df = cache.get_new_files(manifest_path, model_config, max_workers=4)
+
+        self.assertEqual(sorted(new_df["id"]), ["track1", "track2", "track3"])
+        self.assertEqual(len(OriginalEmbeddingsCache(cache_dir=self.tmp / "cache").file_stats), 4)
+
+
+class TestCacheManifest(unittest.TestCase):
+    """Test the SQLite-backed cache manifest."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp_dir.name) / "cache_manifest.sqlite"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_batch_commits_once_and_rolls_back_on_error(self):
+        """Writes in a batch are invisible to other connections until it exits."""
+        from fingerprint.cache_manifest import CacheManifest
+
+        writer = CacheManifest(self.db_path)
+        reader = CacheManifest(self.db_path)
+        with writer.batch():
+            for k in range(3):
+                writer.entries[f"key{k}"] = {"file_id": f"track{k % 2}", "format": "packed"}
+            self.assertEqual(len(reader.entries), 0)
+        self.assertEqual(reader.entries.keys_where(file_id="track0"), ["key0", "key2"])
+        self.assertEqual(reader.entries.count_where(format="packed"), 3)
+
+        with self.assertRaises(RuntimeError):
+            with writer.batch():
+                del writer.entries["key0"]
+                raise RuntimeError("abort")
+        self.assertIn("key0", reader.entries)
+
+    def test_concurrent_writers(self):
+        """Writers on several threads and manifest instances lose no rows."""
+        from concurrent.futures import ThreadPoolExecutor
+        from fingerprint.cache_manifest import CacheManifest
+
+        manifests = [CacheManifest(self.db_path) for _ in range(4)]
+
+        def write(worker):
+            manifest = manifests[worker]
+            for k in range(25):
+                manifest.entries[f"w{worker}_{k}"] = {"file_id": f"w{worker}"}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(write, range(4)))
+        self.assertEqual(len(CacheManifest(self.db_path).entries), 100)
+
+    def test_json_manifest_is_migrated(self):
+        """An existing cache_manifest.json is imported once and renamed."""
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        cache_dir = Path(self.tmp_dir.name) / "cache"
+        cache_dir.mkdir()
+        json_path = cache_dir / "cache_manifest.json"
+        json_path.write_text(json.dumps({
+            "entries": {"track_abc_def": {"file_id": "track", "format": "packed"}},
+            "file_stats": {"/audio/track.wav": {"ino": 1, "size": 2, "mtime_ns": 3, "hash": "abc"}},
+        }))
+        cache = OriginalEmbeddingsCache(cache_dir=cache_dir)
+
+        self.assertFalse(json_path.exists())
+        self.assertTrue((cache_dir / "cache_manifest.json.migrated").exists())
+        self.assertEqual(cache.manifest["track_abc_def"]["file_id"], "track")
+        self.assertEqual(cache.file_stats["/audio/track.wav"]["hash"], "abc")
+        self.assertEqual(cache.get_cache_stats()["num_packed_files"], 1)
+
+
+class TestEmbeddingsMemoryTier(unittest.TestCase):
+    """Test the in-memory LRU tier of the embeddings cache."""
+
+    def test_lru_eviction_under_byte_budget(self):
+        """Least recently used entries are evicted once the budget is exceeded."""
+        from fingerprint.original_embeddings_cache import EmbeddingsMemoryTier
+
+        entry = np.zeros((4, 64), dtype=np.float32)  # 1 KB
+        tier = EmbeddingsMemoryTier(budget_bytes=2 * entry.nbytes)
+        tier.put("a", entry, None)
+        tier.put("b", entry, None)
+        self.assertIsNotNone(tier.get("a")[0])  # "b" is now least recently used
+        tier.put("c", entry, None)
+
+        self.assertIsNone(tier.get("b")[0])
+        self.assertIsNotNone(tier.get("c")[0])
+        stats = tier.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (2, 1, 1))
+        self.assertLessEqual(stats["bytes_used"], stats["budget_bytes"])
+        self.assertFalse(tier.get("a")[0].flags.writeable)
+
+    def test_shared_cache_serves_repeat_lookups_from_memory(self):
+        """get_shared_cache returns one instance whose repeat lookups skip the disk."""
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache, get_shared_cache
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            audio_path = tmp / "track.wav"
+            write_test_audio(audio_path, duration_sec=1.0)
+            model_config = {"model_hash": "abcdef0123456789", "config": {"embeddings_cache": {"memory_budget_mb": 1}}}
+            embeddings = np.ones((3, 8), dtype=np.float32)
+            # Written by another instance after the shared one loaded its manifest
+            cache = get_shared_cache(model_config, cache_dir=tmp / "cache")
+            OriginalEmbeddingsCache(cache_dir=tmp / "cache").set("track", audio_path, model_config, embeddings, [])
+
+            self.assertIs(get_shared_cache(model_config, cache_dir=tmp / "cache"), cache)
+            np.testing.assert_array_equal(cache.get("track", audio_path, model_config)[0], embeddings)
+            with patch.object(OriginalEmbeddingsCache, "_load_entry", side_effect=AssertionError("read from disk")):
+                np.testing.assert_array_equal(cache.get("track", audio_path, model_config)[0], embeddings)
+            self.assertEqual(cache.get_cache_stats()["memory"]["hits"], 1)
+            self.assertEqual(cache.memory.budget_bytes, 1024 * 1024)
+
+
+class TestCacheWarmup(unittest.TestCase):
+    """Test the pre-query cache warm-up job."""
+
+    def test_background_warmup_embeds_missing_originals(self):
+        """Uncached originals are embedded, cached ones loaded into memory, and coverage reported."""
+        import pandas as pd
+        from fingerprint.cache_prewarmer import warm_up_originals
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            rows = []
+            for k in range(3):
+                path = tmp / f"track{k}.wav"
+                write_test_audio(path, duration_sec=2.0)
+                rows.append({"id": f"track{k}", "file_path": str(path)})
+            manifest_path = tmp / "files.csv"
+            pd.DataFrame(rows).to_csv(manifest_path, index=False)
+
+            generator = FallbackEmbeddingGenerator(embedding_dim=32, sample_rate=SAMPLE_RATE)
+            model_config = {"model": generator, "sample_rate": SAMPLE_RATE, "segment_length": 1.0, "embedding_dim": 32}
+            cache = OriginalEmbeddingsCache(cache_dir=tmp / "cache", memory_budget_bytes=1 << 20)
+            cache.set("track0", Path(rows[0]["file_path"]), model_config, np.ones((2, 32), dtype=np.float32), [])
+
+            warmup = warm_up_originals(
+                manifest_path, model_config, orig_ids=["track0", "track1", "unknown"],
+                num_workers=1, cache=cache
+            )
+            report = warmup.wait(timeout=120)
+
+            self.assertTrue(warmup.done)
+            self.assertEqual((report.requested, report.already_cached, report.embedded), (3, 1, 1))
+            self.assertEqual(report.not_found, ["unknown"])
+            self.assertAlmostEqual(report.coverage, 2 / 3)
+            with patch.object(OriginalEmbeddingsCache, "_load_entry", side_effect=AssertionError("read from disk")):
+                embeddings, _ = cache.get("track1", Path(rows[1]["file_path"]), model_config)
+            self.assertEqual(embeddings.shape[1], 32)
+            self.assertIsNone(cache.get("track2", Path(rows[2]["file_path"]), model_config)[0])
+
+
+class TestCacheMaintenance(unittest.TestCase):
+    """Test size-capped eviction and cleanup of the embeddings cache."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        self.embeddings = np.ones((4, 8), dtype=np.float32)
+        self.segments = [{"segment_id": f"seg_{i}", "segment_idx": i} for i in range(4)]
+        self.audio_paths = []
+        for k in range(3):
+            audio_path = self.tmp / f"track{k}.wav"
+            write_test_audio(audio_path, duration_sec=0.5)
+            self.audio_paths.append(audio_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _fill(self, cache, model_hash="abcdef0123456789"):
+        for k, audio_path in enumerate(self.audio_paths):
+            cache.set(f"track{k}", audio_path, {"model_hash": model_hash}, self.embeddings, self.segments)
+
+    def test_size_counters_and_lru_eviction(self):
+        """Stats follow writes and removals; eviction drops the least recently accessed entries."""
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache", memory_budget_bytes=0)
+        self._fill(cache)
+        on_disk = sum(path.stat().st_size for path in (self.tmp / "cache").iterdir()
+                      if not path.name.startswith("cache_manifest"))
+        self.assertEqual(cache.total_bytes(), on_disk)
+        self.assertEqual(cache.get_cache_stats()["num_cached_files"], 3)
+
+        keys = {cache.manifest[key]["file_id"]: key for key in cache.manifest}
+        cache.manifest.update_columns(keys["track0"], last_access=1.0)
+        cache.manifest.update_columns(keys["track1"], last_access=3.0)
+        cache.manifest.update_columns(keys["track2"], last_access=2.0)
+        removed, freed = cache.evict_to_size(on_disk // 3)
+        self.assertEqual(removed, 2)
+        self.assertEqual(list(cache.manifest), [keys["track1"]])
+        self.assertEqual(cache.total_bytes(), on_disk - freed)
+
+    def test_purge_and_orphans(self):
+        """Entries of other models are purged; unreferenced files and dangling rows are removed."""
+        from fingerprint.cache_maintenance import run_cache_maintenance
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache", memory_budget_bytes=0)
+        self._fill(cache, model_hash="old0123456789abc")
+        cache.set("track0", self.audio_paths[0], {"model_hash": "new0123456789abc"}, self.embeddings, self.segments)
+        (self.tmp / "cache" / "stray.npy").write_bytes(b"x")
+        (self.tmp / "cache" / "stray_dir").mkdir()
+        dangling = cache.manifest.keys_where(model_hash="new0123456789abc")[0]
+        cache.manifest[dangling + "_copy"] = dict(cache.manifest[dangling], file_id="copy")
+
+        report = run_cache_maintenance(cache, keep_model_hashes=["new0123456789abc"], orphan_grace_seconds=0)
+        self.assertEqual(report.purged, 3)
+        self.assertEqual(report.orphan_files, 2)
+        self.assertEqual(report.missing_entries, 1)
+        self.assertEqual(list(cache.manifest), [dangling])
+        embeddings, _ = cache.get("track0", self.audio_paths[0], {"model_hash": "new0123456789abc"})
+        np.testing.assert_array_equal(embeddings, self.embeddings)
+        self.assertEqual(cache.total_bytes(), cache._entry_size(dangling))
+
+
+if __name__ == "__main__":
+    unittest.main()
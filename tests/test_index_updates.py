@@ -0,0 +1,223 @@
+"""Tests for removing and replacing files of a saved index."""
+import json
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+
+
+class TestIndexUpdates(unittest.TestCase):
+    """Test removing and replacing files of a saved index, tombstones and compaction."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((200, 8)).astype(np.float32)
+        self.embeddings /= np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        self.ids = [f"track{k // 10:02d}_seg_{k % 10:04d}" for k in range(200)]
+        self.index_path = self.tmp / "faiss_index.bin"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_segment_map_without_files(self):
+        """Removed files leave tombstones (code -1) and drop out of the file table."""
+        from fingerprint.segment_map import SegmentFileMap
+
+        mapping = SegmentFileMap.from_ids(self.ids[:30]).without_files(["track01", "missing"])
+        self.assertNotIn("track01", mapping)
+        self.assertEqual(mapping.file_ids, ["track00", "track02"])
+        self.assertEqual(mapping.num_removed, 10)
+        self.assertEqual(mapping.removed_positions().tolist(), list(range(10, 20)))
+        self.assertEqual(mapping.segments_of("track02").tolist(), list(range(20, 30)))
+        self.assertIsNone(mapping.file_ids_of(np.array([15]))[0])
+
+        compacted, kept = mapping.compacted()
+        self.assertEqual(kept.tolist(), list(range(10)) + list(range(20, 30)))
+        self.assertEqual(compacted.file_range("track02"), (10, 20))
+
+    def test_flat_index_removes_vectors(self):
+        """Flat indexes drop a removed file's vectors at once."""
+        from fingerprint.query_index import build_index, load_index, search_batch
+        from fingerprint.index_updates import MutableIndex
+
+        build_index(self.embeddings, self.ids, self.index_path, {"index_type": "flat"},
+                    daw_metadata={"track03": {"daw_type": "ableton"}, "track04": {"daw_type": "logic"}})
+        index = MutableIndex(self.index_path)
+        self.assertIn("track03", index)
+        self.assertTrue(index.remove_file("track03"))
+        self.assertFalse(index.remove_file("track03"))
+        self.assertNotIn("track03", index)
+
+        reloaded, metadata = load_index(self.index_path)
+        self.assertEqual(reloaded.ntotal, 190)
+        self.assertEqual(metadata["daw_metadata"], {"track04": {"daw_type": "logic"}})
+        _, indices, file_ids = search_batch(reloaded, self.embeddings[45], topk=1, index_metadata=metadata)
+        self.assertEqual(metadata["ids"][indices[0, 0]], "track04_seg_0005")
+        self.assertEqual(file_ids[0, 0], "track04")
+
+    def test_hnsw_tombstones_until_compaction(self):
+        """Graph indexes skip tombstoned vectors in searches; compaction drops them."""
+        from fingerprint.query_index import build_index, load_index, search_batch
+        from fingerprint.index_updates import MutableIndex, compact_saved_index
+
+        build_index(self.embeddings, self.ids, self.index_path, {
+            "index_type": "hnsw", "parameters": {"M": 8, "ef_construction": 40, "ef_search": 32},
+            "maintenance": {"compaction_ratio": 0.2},
+        })
+        index = MutableIndex(self.index_path)
+        index.remove_files(["track01", "track02"])
+        self.assertEqual(index.num_removed, 20)
+        self.assertFalse(index.needs_compaction())
+
+        reloaded, metadata = load_index(self.index_path)
+        self.assertEqual(reloaded.ntotal, 200)
+        _, _, file_ids = search_batch(reloaded, self.embeddings[10:30], topk=5, index_metadata=metadata)
+        self.assertFalse({"track01", "track02"} & set(file_ids.ravel().tolist()))
+
+        replacement = self.embeddings[:10][::-1].copy()
+        index.replace_file("track05", replacement)
+        self.assertIn("track05", index)
+        self.assertEqual(compact_saved_index(self.index_path, min_ratio=0.5), 0)
+        self.assertEqual(compact_saved_index(self.index_path, min_ratio=0.1), 30)
+
+        compacted, metadata = load_index(self.index_path)
+        self.assertEqual(compacted.ntotal, 180)
+        self.assertEqual(metadata["num_removed"], 0)
+        _, indices, file_ids = search_batch(compacted, replacement[3], topk=2, index_metadata=metadata)
+        self.assertEqual(sorted(metadata["ids"][i] for i in indices[0]), ["track00_seg_0006", "track05_seg_0003"])
+
+    def test_updates_commit_a_new_generation(self):
+        """Each update writes new index and sidecar files; the JSON switches over last."""
+        from fingerprint.query_index import build_index, load_index, index_exists
+        from fingerprint.index_updates import MutableIndex
+
+        build_index(self.embeddings, self.ids, self.index_path, {"index_type": "flat"})
+        stale = MutableIndex(self.index_path)
+        MutableIndex(self.index_path).remove_file("track00")
+
+        saved = json.loads(self.index_path.with_suffix(".json").read_text())
+        self.assertEqual(saved["generation"], 1)
+        self.assertEqual(saved["index_file"], "faiss_index.g000001.bin")
+        self.assertFalse(self.index_path.exists())
+        self.assertTrue(index_exists(self.index_path))
+
+        # A writer holding an older generation reloads before updating
+        stale.remove_file("track01")
+        index, metadata = load_index(self.index_path)
+        self.assertEqual(index.ntotal, 180)
+        self.assertEqual(metadata["generation"], 2)
+        self.assertEqual(sorted(path.name for path in self.tmp.iterdir()), [
+            "faiss_index.g000002.bin", "faiss_index.g000002.file_table.npy", "faiss_index.g000002.ids.npy",
+            "faiss_index.g000002.segment_files.npy", "faiss_index.json",
+        ])
+
+    def test_sharded_index_removes_from_its_shard(self):
+        """Removing from a sharded index tombstones the file in its shard only."""
+        from fingerprint.query_index import build_index, load_index, search_batch
+        from fingerprint.index_updates import MutableIndex
+
+        build_index(self.embeddings, self.ids, self.index_path, {
+            "index_type": "hnsw", "parameters": {"M": 8, "ef_construction": 40},
+            "sharding": {"num_shards": 2},
+        })
+        index = MutableIndex(self.index_path)
+        index.remove_file("track07")
+        reloaded, metadata = load_index(self.index_path)
+        self.assertNotIn("track07", metadata["file_table"])
+        _, _, file_ids = search_batch(reloaded, self.embeddings[70:80], topk=3, index_metadata=metadata)
+        self.assertNotIn("track07", file_ids.ravel().tolist())
+        self.assertEqual(index.compact(force=True), 10)
+        self.assertEqual(load_index(self.index_path)[0].ntotal, 190)
+
+    def test_periodic_compaction_runs_once_per_index(self):
+        """Background compaction compacts the saved index; a second start reuses the running task."""
+        import time
+        from fingerprint.query_index import build_index, load_index
+        from fingerprint.index_updates import MutableIndex, start_periodic_compaction
+
+        build_index(self.embeddings, self.ids, self.index_path, {
+            "index_type": "hnsw", "parameters": {"M": 8, "ef_construction": 40},
+        })
+        MutableIndex(self.index_path).remove_files(["track03", "track04"])
+        config = {"maintenance": {"compaction_interval_minutes": 60, "compaction_ratio": 0.05}}
+        task = start_periodic_compaction(self.index_path, config)
+        try:
+            self.assertIs(start_periodic_compaction(self.index_path, config), task)
+            deadline = time.time() + 10
+            while task.last_dropped is None and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            task.stop(timeout=10)
+        self.assertFalse(task.running)
+        self.assertEqual(task.last_dropped, 20)
+        self.assertEqual(load_index(self.index_path)[0].ntotal, 180)
+        self.assertIsNone(start_periodic_compaction(self.index_path, {}))
+
+    def test_update_script_always_writes_output_index(self):
+        """--remove of files that are not indexed still saves the index to --output-index."""
+        import importlib.util
+        from unittest.mock import patch
+        from fingerprint.query_index import build_index, load_index
+        from fingerprint.index_updates import MutableIndex
+
+        script_path = Path(__file__).resolve().parent.parent / "scripts" / "update_index_incremental.py"
+        spec = importlib.util.spec_from_file_location("update_index_incremental", script_path)
+        script = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(script)
+
+        build_index(self.embeddings, self.ids, self.index_path, {
+            "index_type": "hnsw", "parameters": {"M": 8, "ef_construction": 40},
+        })
+        MutableIndex(self.index_path).remove_file("track03")
+        output_path = self.tmp / "updated" / "faiss_index.bin"
+        output_path.parent.mkdir()
+        argv = ["update_index_incremental.py", "--existing-index", str(self.index_path),
+                "--output-index", str(output_path), "--remove", "missing",
+                "--fingerprint-config", str(script_path.parent.parent / "config" / "fingerprint_v1.yaml")]
+        with patch("sys.argv", argv):
+            self.assertEqual(script.main(), 0)
+
+        index, metadata = load_index(output_path)
+        self.assertEqual(index.ntotal, 200)
+        self.assertEqual(metadata["num_removed"], 10)  # Tombstones are kept
+        self.assertNotIn("track03", metadata["file_table"])
+
+        sharded_path = self.tmp / "sharded" / "faiss_index.bin"
+        build_index(self.embeddings, self.ids, sharded_path, {"index_type": "flat", "sharding": {"num_shards": 2}})
+        MutableIndex(sharded_path, output_path=output_path.with_name("sharded.bin")).save()
+        self.assertEqual(load_index(output_path.with_name("sharded.bin"))[0].ntotal, 200)
+
+    def test_update_script_writes_output_index_without_new_files(self):
+        """--new-files listing only indexed files still saves the index to --output-index."""
+        import importlib.util
+        from unittest.mock import patch
+        from fingerprint.query_index import build_index, load_index
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        script_path = Path(__file__).resolve().parent.parent / "scripts" / "update_index_incremental.py"
+        spec = importlib.util.spec_from_file_location("update_index_incremental", script_path)
+        script = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(script)
+
+        build_index(self.embeddings, self.ids, self.index_path, {"index_type": "flat"})
+        audio_path = self.tmp / "track00.wav"
+        audio_path.write_bytes(b"")
+        manifest_path = self.tmp / "new_files.csv"
+        manifest_path.write_text(f"id,file_path\ntrack00,{audio_path}\n")
+        output_path = self.tmp / "updated" / "faiss_index.bin"
+        output_path.parent.mkdir()
+        argv = ["update_index_incremental.py", "--existing-index", str(self.index_path),
+                "--output-index", str(output_path), "--new-files", str(manifest_path), "--num-workers", "1",
+                "--fingerprint-config", str(script_path.parent.parent / "config" / "fingerprint_v1.yaml")]
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        with patch("sys.argv", argv), patch("fingerprint.incremental_index.OriginalEmbeddingsCache", return_value=cache):
+            self.assertEqual(script.main(), 0)
+
+        index, metadata = load_index(output_path)
+        self.assertEqual(index.ntotal, 200)
+        self.assertIn("track00", metadata["file_table"])
+
+if __name__ == "__main__":
+    unittest.main()
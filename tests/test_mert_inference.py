@@ -0,0 +1,302 @@
+"""Tests for MERT inference: track pooling, bucketed batching and inference backends."""
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+import numpy as np
+
+from fingerprint.embed import DecodedAudio, extract_embeddings
+from fingerprint.embedding_generator import (
+    BatchStats,
+    EmbeddingGenerator,
+    LengthBucketScheduler,
+    HAS_TRANSFORMERS,
+    frame_mask,
+    plan_track_chunks,
+)
+from audio_fixtures import SAMPLE_RATE
+
+
+def _stub_mert_generator(num_layers: int = 2, **kwargs) -> EmbeddingGenerator:
+    """EmbeddingGenerator whose MERT model is a stand-in object (no torch needed)."""
+    generator = EmbeddingGenerator(embedding_dim=8, sample_rate=SAMPLE_RATE, model_type="openl3", **kwargs)
+    generator.mert_model = SimpleNamespace(
+        config=SimpleNamespace(_name_or_path="m-a-p/MERT-v1-95M", num_hidden_layers=num_layers),
+        encoder=SimpleNamespace(layers=[f"layer{k}" for k in range(num_layers)]),
+    )
+    generator.active_model_name = "mert"
+    return generator
+
+
+def _tiny_mert_generator(feat_extract_norm: str = "group", **kwargs) -> EmbeddingGenerator:
+    """EmbeddingGenerator driving a tiny randomly initialized HuBERT (MERT's architecture)."""
+    import torch
+    from transformers import HubertConfig, HubertModel, Wav2Vec2FeatureExtractor
+
+    torch.manual_seed(0)
+    config = HubertConfig(
+        hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+        conv_dim=(16,) * 7, num_conv_pos_embeddings=16, num_conv_pos_embedding_groups=2,
+        feat_extract_norm=feat_extract_norm, do_stable_layer_norm=feat_extract_norm == "layer"
+    )
+    generator = EmbeddingGenerator(embedding_dim=32, sample_rate=SAMPLE_RATE, model_type="openl3", **kwargs)
+    generator.mert_model = HubertModel(config).eval()
+    generator.mert_processor = Wav2Vec2FeatureExtractor(sampling_rate=16000)
+    generator.active_model_name = "mert"
+    return generator
+
+
+class TestTrackPooling(unittest.TestCase):
+    """Test track-level MERT extraction with frame pooling."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.audio = DecodedAudio(
+            samples=rng.standard_normal(SAMPLE_RATE * 10).astype(np.float32),
+            sample_rate=SAMPLE_RATE,
+            file_id="track"
+        )
+
+    def test_pool_matches_explicit_mean(self):
+        """Cumulative-sum pooling equals the mean over each window's frames."""
+        generator = EmbeddingGenerator(embedding_dim=8, sample_rate=SAMPLE_RATE, model_type="openl3")
+        frames = np.random.default_rng(1).standard_normal((100, 8)).astype(np.float32)
+        pooled = generator.pool_frame_embeddings(frames, 10.0, np.array([0.0, 2.5]), np.array([3.0, 9.95]))
+
+        expected = np.stack([frames[0:30].mean(axis=0), frames[25:100].mean(axis=0)])
+        expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+        np.testing.assert_allclose(pooled, expected, atol=1e-6)
+
+    def test_scales_share_one_track_pass(self):
+        """Segments of every scale are pooled from one cached set of track frames."""
+        generator = _stub_mert_generator(track_pooling=True)
+        frames = np.random.default_rng(1).standard_normal((750, 8)).astype(np.float32)
+        with patch.object(generator, "generate_track_frame_embeddings", return_value=(frames, 75.0)) as track_pass:
+            scales = [self.audio.segment(segment_length=length, overlap_ratio=0.1) for length in (2.0, 3.0, 5.0)]
+            pooled = [extract_embeddings(segments, {"model": generator}, save_embeddings=False) for segments in scales]
+        track_pass.assert_called_once()
+
+        for segments, embeddings in zip(scales, pooled):
+            self.assertEqual(embeddings.shape, (len(segments), 8))
+            first = int(np.floor(segments.starts[1] * 75.0))
+            last = int(np.ceil(segments.ends[1] * 75.0))
+            expected = frames[first:last].mean(axis=0)
+            np.testing.assert_allclose(embeddings[1], expected / np.linalg.norm(expected), atol=1e-5)
+
+    def test_chunk_plan_tiles_track_frames(self):
+        """Chunk cores cover every frame once; windows add whole-frame context within the track."""
+        hop, num_samples = 320, 16000 * 10 + 123
+        chunks = plan_track_chunks(num_samples, hop, chunk_samples=16000 * 4 + 100, context_samples=16000 + 50)
+
+        self.assertEqual(len(chunks), 3)  # Chunks round down to 64000 samples
+        covered = []
+        for window_start, window_end, first, num_core in chunks:
+            self.assertEqual(window_start % hop, 0)
+            self.assertTrue(0 <= window_start < window_end <= num_samples)
+            covered.extend(range(window_start // hop + first, window_start // hop + first + num_core))
+        self.assertEqual(covered, list(range(int(np.ceil(num_samples / hop)))))
+        self.assertEqual(chunks[1][:3], (64000 - 16000, 128000 + 16000, 16000 // hop))
+
+
+class TestLengthBucketBatching(unittest.TestCase):
+    """Test length-bucketed dynamic batching for MERT."""
+
+    def test_plan_respects_buckets_and_budget(self):
+        """Batches never mix buckets and stay within the padded-audio budget."""
+        scheduler = LengthBucketScheduler(budget_seconds=10.0, bucket_width_seconds=0.25)
+        lengths = [300, 300, 500, 100, 300, 300, 300, 310]
+        batches = scheduler.plan(lengths, sample_rate=100)
+
+        self.assertEqual(sorted(np.concatenate(batches).tolist()), list(range(len(lengths))))
+        for batch in batches:
+            batch_lengths = [lengths[i] for i in batch]
+            self.assertLessEqual(len(batch) * max(batch_lengths), 1000)
+            self.assertLess(max(batch_lengths) - min(batch_lengths), 25)
+        self.assertEqual(
+            [len(b) for b in scheduler.plan(lengths, sample_rate=100, exact_lengths=True)],
+            [1, 3, 2, 1, 1]
+        )
+
+    def test_batch_cap_and_stats(self):
+        """Item caps split batches; recorded stats summarize padding and throughput."""
+        scheduler = LengthBucketScheduler(budget_seconds=100.0, max_batch_size=4)
+        self.assertEqual([len(b) for b in scheduler.plan([100] * 10, sample_rate=100)], [4, 4, 2])
+        self.assertEqual([len(b) for b in scheduler.plan([100] * 10, sample_rate=100, max_batch_size=3)], [3, 3, 3, 1])
+
+        scheduler.record(BatchStats(num_items=2, real_samples=300, padded_samples=400, elapsed_seconds=0.5, sample_rate=100))
+        scheduler.record(BatchStats(num_items=1, real_samples=100, padded_samples=100, elapsed_seconds=0.5, sample_rate=100))
+        summary = scheduler.summary()
+        self.assertEqual((summary["batches"], summary["segments"]), (2, 3))
+        self.assertAlmostEqual(summary["padding_efficiency"], 0.8)
+        self.assertAlmostEqual(summary["throughput"], 4.0)
+        scheduler.reset()
+        self.assertEqual(scheduler.summary()["batches"], 0)
+
+    def test_frame_mask_covers_real_audio(self):
+        """Padded items keep only the frames their real samples reach."""
+        mask = frame_mask([960, 321, 320, 0, 5000], num_frames=3, hop=320)
+        np.testing.assert_array_equal(mask, [
+            [True, True, True],
+            [True, True, False],
+            [True, False, False],
+            [False, False, False],
+            [True, True, True],
+        ])
+
+
+class TestCpuBackend(unittest.TestCase):
+    """Test CPU inference backend configuration and selection."""
+
+    def test_invalid_backend_rejected(self):
+        """Unknown precisions, graph modes, runtimes and ORT levels fail at config time."""
+        from fingerprint.cpu_backend import CpuBackendConfig
+        from fingerprint.onnx_backend import OnnxBackendConfig
+
+        for config in ({"precision": "int4"}, {"graph_mode": "xla"}):
+            with self.assertRaises(ValueError):
+                CpuBackendConfig.from_dict(config)
+        with self.assertRaises(ValueError):
+            OnnxBackendConfig.from_dict({"optimization_level": "max"})
+        with self.assertRaises(ValueError):
+            EmbeddingGenerator(embedding_dim=8, model_type="openl3", backend="tensorrt")
+        self.assertEqual(CpuBackendConfig.from_dict({"precision": "int8", "graph_mode": "torchscript"}).label,
+                         "int8/torchscript")
+        self.assertEqual(OnnxBackendConfig.from_dict(None).label, "onnx/all")
+
+    def test_forward_model_selection(self):
+        """ONNX sessions get the mask; traced graphs run unmasked batches only; the rest runs eager."""
+        generator = _stub_mert_generator()
+        unmasked = {"input_values": "values"}
+        masked = {"input_values": "values", "attention_mask": "mask"}
+        self.assertIs(generator._select_forward_model(masked), generator.mert_model)
+
+        def traced(input_values):
+            return f"traced({input_values})"
+
+        generator._mert_forward_model = traced
+        self.assertEqual(generator._select_forward_model(unmasked)(**unmasked), "traced(values)")
+        self.assertIs(generator._select_forward_model(masked), generator.mert_model)
+
+        session = Mock(accepts_attention_mask=True)
+        generator._mert_forward_model = session
+        self.assertIs(generator._select_forward_model(masked), session)
+
+    def test_applied_flags(self):
+        """cpu_backend_applied reports backends whose bf16 or graph capture did not take effect."""
+        from fingerprint.cpu_backend import CpuBackendConfig
+
+        generator = _stub_mert_generator()
+        with patch("fingerprint.embedding_generator.apply_cpu_backend",
+                   side_effect=lambda model, backend, example_inputs=None: (model, None, None)):
+            generator.set_cpu_backend(CpuBackendConfig(precision="bf16"))
+            self.assertFalse(generator.cpu_backend_applied)  # No bfloat16 autocast
+            generator.set_cpu_backend({"precision": "int8"})
+            self.assertTrue(generator.cpu_backend_applied)
+        self.assertEqual(generator.backend, "torch")
+
+
+class TestOnnxBackend(unittest.TestCase):
+    """Test the ONNX Runtime backend."""
+
+    def test_export_failure_falls_back_to_torch(self):
+        """A failed export keeps the torch backend; a session replaces the forward model."""
+        generator = _stub_mert_generator()
+        with patch("fingerprint.embedding_generator.apply_cpu_backend",
+                   side_effect=lambda model, backend, example_inputs=None: (model, None, None)) as apply, \
+                patch("fingerprint.embedding_generator.OnnxMertSession.from_model",
+                      side_effect=RuntimeError("export failed")):
+            self.assertFalse(generator.set_onnx_backend({"cache_dir": "unused"}))
+        self.assertEqual(generator.backend, "torch")
+        apply.assert_called_once()
+        self.assertIsNone(generator._mert_forward_model)
+
+        session = Mock(accepts_attention_mask=True)
+        with patch("fingerprint.embedding_generator.OnnxMertSession.from_model", return_value=session) as from_model:
+            self.assertTrue(generator.set_onnx_backend({"cache_dir": "unused"}))
+        self.assertEqual(from_model.call_args[0][1], "m-a-p/MERT-v1-95M")
+        self.assertEqual(generator.backend, "onnx")
+        self.assertIs(generator._mert_forward_model, session)
+        self.assertEqual(generator.get_model_info()["backend"], "onnx")
+
+    def test_cache_key_covers_weights_and_revision(self):
+        """Checkpoints with the same config but other weights or revision get their own graph."""
+        from fingerprint.onnx_backend import model_config_hash
+
+        class Model:
+            def __init__(self, weight, revision=None):
+                self.weight = weight
+                self.config = SimpleNamespace(to_dict=lambda: {"hidden_size": 8}, _commit_hash=revision)
+
+            def state_dict(self):
+                return {"encoder.weight": self.weight}
+
+        weight = np.random.default_rng(0).standard_normal((8, 8)).astype(np.float32)
+        key = model_config_hash(Model(weight), opset=17)
+        self.assertEqual(model_config_hash(Model(weight.copy()), opset=17), key)
+        self.assertNotEqual(model_config_hash(Model(weight * 1.01), opset=17), key)
+        self.assertNotEqual(model_config_hash(Model(weight, revision="abc123"), opset=17), key)
+        self.assertNotEqual(model_config_hash(Model(weight), opset=18), key)
+
+    def test_dynamo_argument_only_where_supported(self):
+        """The legacy exporter is requested only from torch releases that know the dynamo argument."""
+        from fingerprint.onnx_backend import _legacy_export_kwargs
+
+        def old_export(model, args, f, input_names=None, output_names=None, dynamic_axes=None, opset_version=None):
+            pass
+
+        def new_export(model, args, f, input_names=None, output_names=None, dynamic_axes=None,
+                       opset_version=None, dynamo=True):
+            pass
+
+        for export, expected in ((old_export, {}), (new_export, {"dynamo": False})):
+            fake_torch = SimpleNamespace(onnx=SimpleNamespace(export=export))
+            with patch("fingerprint.onnx_backend.torch", fake_torch, create=True):
+                self.assertEqual(_legacy_export_kwargs(), expected)
+
+
+class TestTruncatedDepth(unittest.TestCase):
+    """Test running only the first N MERT transformer layers."""
+
+    def test_truncate_and_restore_layers(self):
+        """max_layer=N keeps the first N layers (and the config in step); None restores all."""
+        generator = _stub_mert_generator(num_layers=3)
+        encoder = generator.mert_model.encoder
+        generator.set_max_layer(1)
+        self.assertEqual(encoder.layers, ["layer0"])
+        self.assertEqual(generator.mert_model.config.num_hidden_layers, 1)
+        self.assertEqual(generator.get_model_info()["max_layer"], 1)
+        self.assertEqual(generator.num_mert_layers, 3)
+
+        generator.set_max_layer(None)
+        self.assertEqual(encoder.layers, ["layer0", "layer1", "layer2"])
+        self.assertIsNone(generator.max_layer)
+        for max_layer in (0, 4):
+            with self.assertRaises(ValueError):
+                generator.set_max_layer(max_layer)
+
+
+@unittest.skipUnless(HAS_TRANSFORMERS, "transformers/torch not installed")
+class TestTinyMertModel(unittest.TestCase):
+    """Check the pooling and masked batching paths against a tiny real model."""
+
+    def test_pooled_and_batched_match_per_segment(self):
+        """Track pooling stays close to per-segment MERT; masked ragged batches match one-by-one."""
+        rng = np.random.default_rng(0)
+        audio = DecodedAudio(rng.standard_normal(SAMPLE_RATE * 6).astype(np.float32), SAMPLE_RATE, file_id="track")
+        generator = _tiny_mert_generator(track_pooling=True, track_chunk_seconds=4.0, track_context_seconds=1.0)
+        segments = audio.segment(segment_length=3.0, overlap_ratio=0.1)
+        pooled = extract_embeddings(segments, {"model": generator}, save_embeddings=False)
+        generator.track_pooling = False
+        reference = extract_embeddings(segments, {"model": generator}, save_embeddings=False)
+        self.assertGreater(np.min(np.sum(pooled * reference, axis=1)), 0.99)
+
+        generator = _tiny_mert_generator(feat_extract_norm="layer", bucket_width_seconds=5.0)
+        generator.mert_processor.return_attention_mask = True
+        ragged = [rng.standard_normal(int(16000 * length)).astype(np.float32) for length in (3.0, 3.5, 1.2)]
+        batched = generator.generate_embeddings_from_audio_list(ragged, 16000)
+        single = np.vstack([generator.generate_embeddings_from_audio(y, 16000) for y in ragged])
+        np.testing.assert_allclose(batched, single, atol=1e-5)
+        self.assertLess(generator.get_batching_stats()["batches"], len(ragged))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for the persistent embedding model server."""
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+
+from fingerprint.embed import segment_audio, extract_embeddings
+from fingerprint.load_model import FallbackEmbeddingGenerator
+from audio_fixtures import SAMPLE_RATE, write_test_audio
+
+
+class TestModelServer(unittest.TestCase):
+    """Test the persistent model server and its auto-detecting client."""
+
+    def setUp(self):
+        from fingerprint.model_server import ModelServer
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model = FallbackEmbeddingGenerator(embedding_dim=64, sample_rate=SAMPLE_RATE)
+        self.model_config = {"model": self.model, "config": {"model": {"type": "librosa"}}}
+        self.server = ModelServer(self.model_config, port=0).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.tmp_dir.cleanup()
+
+    def test_remote_embeddings_match_in_process(self):
+        """Stacks, ragged lists and concurrent requests return the in-process embeddings."""
+        from concurrent.futures import ThreadPoolExecutor
+        from fingerprint.model_server import RemoteEmbeddingGenerator, config_fingerprint
+
+        remote = RemoteEmbeddingGenerator.connect(self.server.url, config_fingerprint(self.model_config["config"]))
+        self.assertIsNotNone(remote)
+        self.assertEqual(remote.embedding_dim, 64)
+
+        rng = np.random.default_rng(0)
+        stacks = [rng.standard_normal((3, SAMPLE_RATE)).astype(np.float32) for _ in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda audio: remote.generate_embeddings_from_audio(audio, SAMPLE_RATE), stacks))
+        for audio, embeddings in zip(stacks, results):
+            np.testing.assert_allclose(embeddings, self.model.generate_embeddings_from_audio(audio, SAMPLE_RATE), atol=1e-6)
+
+        audio_path = Path(self.tmp_dir.name) / "track.wav"
+        write_test_audio(audio_path)
+        segments = segment_audio(audio_path, segment_length=2.0, sample_rate=SAMPLE_RATE, overlap_ratio=0.1)
+        segments[-1]["audio"] = segments[-1]["audio"][:SAMPLE_RATE]  # Ragged tail
+        np.testing.assert_allclose(
+            extract_embeddings(segments, {"model": remote}, save_embeddings=False),
+            extract_embeddings(segments, {"model": self.model}, save_embeddings=False),
+            atol=1e-6
+        )
+
+    def test_client_detection(self):
+        """load_fingerprint_model uses a server with the same config and falls back otherwise."""
+        import yaml
+        from fingerprint.load_model import load_fingerprint_model
+        from fingerprint.model_server import RemoteEmbeddingGenerator, config_fingerprint
+
+        self.assertIsNone(RemoteEmbeddingGenerator.connect(self.server.url, config_hash="other"))
+
+        config = {
+            "model": {"type": "openl3"},
+            "audio": {"sample_rate": SAMPLE_RATE},
+            "embedding": {"dimension": 64},
+            "model_server": {"host": self.server.host, "port": self.server.port},
+        }
+        config_path = Path(self.tmp_dir.name) / "fingerprint.yaml"
+        config_path.write_text(yaml.safe_dump(config))
+        self.server.config_hash = config_fingerprint(config)
+        self.assertIsInstance(load_fingerprint_model(config_path)["model"], RemoteEmbeddingGenerator)
+
+        config["model_server"]["enabled"] = False
+        config_path.write_text(yaml.safe_dump(config))
+        self.assertNotIsInstance(load_fingerprint_model(config_path)["model"], RemoteEmbeddingGenerator)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,352 @@
+"""Tests for index building, loading and batched search."""
+import json
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+
+from audio_fixtures import write_test_audio
+
+
+class TestBatchedSearch(unittest.TestCase):
+    """Test the batched multi-vector index search."""
+
+    def setUp(self):
+        import faiss
+
+        rng = np.random.default_rng(0)
+        self.catalog = rng.standard_normal((40, 8)).astype(np.float32)
+        self.catalog /= np.linalg.norm(self.catalog, axis=1, keepdims=True)
+        self.index = faiss.IndexHNSWFlat(8, 16, faiss.METRIC_INNER_PRODUCT)
+        self.index.add(self.catalog)
+        self.metadata = {
+            "ids": [f"track{k // 10}_seg_{k % 10:04d}" for k in range(40)],
+            "metric": faiss.METRIC_INNER_PRODUCT,
+            "config": {"parameters": {"ef_search": 20}},
+        }
+        self.queries = self.catalog[[3, 17, 35]] + 0.01 * rng.standard_normal((3, 8)).astype(np.float32)
+
+    def test_search_batch_matches_per_vector_queries(self):
+        """One batched search returns the same hits as one query_index call per vector."""
+        from fingerprint.query_index import search_batch, query_index
+
+        distances, indices, file_ids = search_batch(self.index, self.queries, topk=5, index_metadata=self.metadata)
+        self.assertEqual(distances.shape, (3, 5))
+        self.assertEqual(indices[:, 0].tolist(), [3, 17, 35])
+        self.assertEqual(file_ids[:, 0].tolist(), ["track0", "track1", "track3"])
+        self.assertEqual(self.index.hnsw.efSearch, 20)
+
+        for row, query in enumerate(self.queries):
+            results = query_index(self.index, query, topk=5, ids=self.metadata["ids"], index_metadata=self.metadata)
+            self.assertEqual([r["index"] for r in results], indices[row].tolist())
+            np.testing.assert_allclose([r["similarity"] for r in results], distances[row], rtol=1e-6)
+
+    def test_query_segments_batch(self):
+        """Segment results of several scales come back in input order."""
+        from fingerprint.parallel_utils import query_segments_batch
+
+        segments = [
+            {"segment_id": f"q_seg_{i:04d}", "start": float(i), "end": i + 1.0, "segment_idx": i,
+             "scale_length": 1.0 if i < 2 else 3.0}
+            for i in range(3)
+        ]
+        results = query_segments_batch(segments, self.queries, self.index, 3, self.metadata)
+        self.assertEqual([r["segment_id"] for r in results], ["q_seg_0000", "q_seg_0001", "q_seg_0002"])
+        self.assertEqual(results[2]["scale_length"], 3.0)
+        self.assertEqual(results[1]["results"][0]["id"], "track1_seg_0007")
+        self.assertEqual(results[1]["results"][0]["rank"], 1)
+
+    def test_score_file(self):
+        """File-restricted scoring matches exact search similarities of the file's segments."""
+        import faiss
+        from fingerprint.query_index import score_file, search_batch, to_similarity
+
+        similarities, positions = score_file(self.index, self.queries, "track1", self.metadata)
+        self.assertEqual(positions.tolist(), list(range(10, 20)))
+        np.testing.assert_allclose(
+            similarities, self.queries / np.linalg.norm(self.queries, axis=1, keepdims=True) @ self.catalog[10:20].T,
+            rtol=1e-5
+        )
+        self.assertEqual(int(np.argmax(similarities[1])), 7)
+
+        l2_index = faiss.IndexFlatL2(8)
+        l2_index.add(self.catalog)
+        l2_metadata = {**self.metadata, "metric": faiss.METRIC_L2}
+        similarities, _ = score_file(l2_index, self.queries, "track1", l2_metadata)
+        distances, indices, _ = search_batch(l2_index, self.queries, topk=40, index_metadata=l2_metadata)
+        exact = np.take_along_axis(to_similarity(distances, False), np.argsort(indices, axis=1), axis=1)
+        np.testing.assert_allclose(similarities, exact[:, 10:20], rtol=1e-4)
+
+        similarities, positions = score_file(self.index, self.queries, "missing", self.metadata)
+        self.assertEqual(similarities.shape, (3, 0))
+        self.assertEqual(len(positions), 0)
+
+    def test_song_a_in_song_b_adds_expected_original(self):
+        """The expected original's best segment joins shallow results without a deep search."""
+        from services.transform_optimizer import TransformOptimizer
+
+        segments = [{"segment_id": f"q_seg_{i:04d}", "start": float(i), "end": i + 1.0} for i in range(3)]
+        results = TransformOptimizer.optimize_song_a_in_song_b(
+            Path("query.wav"), {}, self.index, self.metadata, segments, self.queries,
+            expected_orig_id="track2", topk=1
+        )
+        for seg_result in results:
+            hits = seg_result["results"]
+            self.assertLessEqual(len(hits), 2)
+            self.assertIn("track2", [hit["file_id"] for hit in hits])
+            self.assertEqual([hit["rank"] for hit in hits], list(range(1, len(hits) + 1)))
+        self.assertEqual(results[0]["results"][0]["id"], "track0_seg_0003")
+
+
+class TestSegmentFileMap(unittest.TestCase):
+    """Test the integer segment -> file map of the index."""
+
+    def setUp(self):
+        from fingerprint.segment_map import SegmentFileMap
+
+        self.ids = [f"track1_seg_{i:04d}" for i in range(3)] + [f"track10_seg_{i:04d}" for i in range(2)]
+        self.mapping = SegmentFileMap.from_ids(self.ids)
+
+    def test_exact_file_lookups(self):
+        """File IDs that prefix each other are kept apart."""
+        self.assertEqual(self.mapping.file_ids, ["track1", "track10"])
+        self.assertEqual(self.mapping.num_segments("track1"), 3)
+        self.assertEqual(self.mapping.file_range("track10"), (3, 5))
+        self.assertEqual(self.mapping.segments_of("track1").tolist(), [0, 1, 2])
+        self.assertNotIn("track", self.mapping)
+        self.assertEqual(self.mapping.file_ids_of(np.array([[4, 0, -1]])).tolist(), [["track10", "track1", None]])
+
+    def test_metadata_roundtrip(self):
+        """Contiguous maps are stored as ranges; appended files may interleave."""
+        from fingerprint.segment_map import SegmentFileMap, segment_file_map, public_metadata
+
+        stored = self.mapping.to_metadata()
+        self.assertEqual(stored["file_ranges"], [[0, 3], [3, 5]])
+        restored = SegmentFileMap.from_metadata(json.loads(json.dumps(stored)))
+        self.assertEqual(restored.segment_files.tolist(), self.mapping.segment_files.tolist())
+
+        extended = self.mapping.extend(["track2", "track1"], [1, 2])
+        self.assertEqual(extended.segments_of("track1").tolist(), [0, 1, 2, 6, 7])
+        self.assertIsNone(extended.file_range("track1"))
+        self.assertIn("segment_files", extended.to_metadata())
+
+        metadata = {"ids": self.ids}
+        self.assertIs(segment_file_map(metadata), segment_file_map(metadata))
+        self.assertEqual(public_metadata(metadata), {"ids": self.ids})
+
+
+class TestIndexSidecar(unittest.TestCase):
+    """Test the binary metadata sidecar and memory-mapped index loading."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_path = Path(self.tmp_dir.name) / "faiss_index.bin"
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((30, 8)).astype(np.float32)
+        self.ids = [f"track{k // 10}_seg_{k % 10:04d}" for k in range(30)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_build_and_load_with_sidecar(self):
+        """IDs and DAW metadata live in sidecar files; the index loads memory-mapped."""
+        from fingerprint.query_index import build_index, load_index, search_batch
+        from fingerprint.index_sidecar import IdTable
+
+        build_index(self.embeddings, self.ids, self.index_path, {"index_type": "flat"},
+                    daw_metadata={"track1": {"daw_type": "ableton"}})
+        stored = json.loads(self.index_path.with_suffix(".json").read_text())
+        self.assertNotIn("ids", stored)
+        self.assertNotIn("daw_metadata", stored)
+        self.assertTrue(self.index_path.with_suffix(".ids.npy").exists())
+
+        index, metadata = load_index(self.index_path)
+        self.assertIsInstance(metadata["ids"], IdTable)
+        self.assertEqual(metadata["ids"][12], "track1_seg_0002")
+        self.assertEqual(metadata["daw_metadata"], {"track1": {"daw_type": "ableton"}})
+        _, indices, file_ids = search_batch(index, self.embeddings[[5, 25]], topk=3, index_metadata=metadata)
+        self.assertEqual(indices[:, 0].tolist(), [5, 25])
+        self.assertEqual(file_ids[:, 0].tolist(), ["track0", "track2"])
+
+        _, metadata = load_index(self.index_path, mmap=False, with_daw_metadata=False)
+        self.assertNotIn("daw_metadata", metadata)
+        self.assertEqual(metadata["ids"][:2], self.ids[:2])
+
+    def test_json_only_metadata_still_loads(self):
+        """Indexes saved before the sidecar keep loading from their JSON."""
+        from fingerprint.query_index import build_index, load_index
+
+        build_index(self.embeddings, self.ids, self.index_path, {"index_type": "flat"}, save_metadata=False)
+        self.index_path.with_suffix(".json").write_text(json.dumps({"ids": self.ids, "metric": 0}))
+        index, metadata = load_index(self.index_path)
+        self.assertEqual(index.ntotal, 30)
+        self.assertEqual(metadata["ids"], self.ids)
+
+    def test_saved_segment_map_roundtrip(self):
+        """An extended segment map is saved and reloaded without reparsing IDs."""
+        from fingerprint.query_index import build_index, load_index, save_index_metadata
+        from fingerprint.segment_map import SegmentFileMap, segment_file_map
+
+        build_index(self.embeddings, self.ids, self.index_path, {"index_type": "flat"})
+        _, metadata = load_index(self.index_path, mmap=False)
+        mapping = segment_file_map(metadata).extend(["track3", "track0"], [2, 1])
+        ids = list(metadata["ids"]) + ["track3_seg_0000", "track3_seg_0001", "track0_seg_0010"]
+        save_index_metadata(self.index_path, {**metadata, "ids": ids}, segment_map=mapping)
+
+        _, reloaded = load_index(self.index_path)
+        self.assertEqual(reloaded["ids"][32], "track0_seg_0010")
+        self.assertEqual(segment_file_map(reloaded).segments_of("track0").tolist(), list(range(10)) + [32])
+        self.assertEqual(SegmentFileMap.from_ids(reloaded["ids"]).file_ids, reloaded["file_table"])
+
+
+class TestCompressedIndexTypes(unittest.TestCase):
+    """Test IVF-PQ / HNSW-SQ index types, refine stages and training samples."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((600, 16)).astype(np.float32)
+        self.ids = [f"track{k // 20}_seg_{k % 20:04d}" for k in range(600)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_ivf_pq_with_refine(self):
+        """A refined IVF-PQ index finds exact matches and takes nprobe / k_factor from its config."""
+        from fingerprint.query_index import build_index, load_index, search_batch
+        from fingerprint.index_types import index_components
+
+        index_config = {
+            "index_type": "ivf_pq",
+            "parameters": {"M": 8},
+            "parameters_by_type": {"ivf_pq": {"nlist": 8, "nprobe": 4, "pq_m": 4, "pq_nbits": 4,
+                                              "refine": "flat", "refine_k_factor": 3}},
+            "training": {"num_vectors": 400},
+        }
+        index_path = self.tmp / "faiss_index.bin"
+        build_index(self.embeddings, self.ids, index_path, index_config)
+        index, metadata = load_index(index_path)
+        components = index_components(index)
+        self.assertEqual(set(components), {"ivf", "refine"})
+
+        _, indices, file_ids = search_batch(index, self.embeddings[[3, 250]], topk=5, index_metadata=metadata)
+        self.assertEqual(indices[:, 0].tolist(), [3, 250])
+        self.assertEqual(file_ids[:, 0].tolist(), ["track0", "track12"])
+        self.assertEqual(components["ivf"].nprobe, 4)
+        self.assertEqual(components["refine"].k_factor, 3.0)
+
+    def test_hnsw_sq_and_small_training_set(self):
+        """HNSW-SQ8 builds without extra parameters; too few vectors for PQ fall back to flat."""
+        from fingerprint.query_index import build_index, load_index, search_batch
+
+        index_path = self.tmp / "sq8" / "faiss_index.bin"
+        build_index(self.embeddings, self.ids, index_path, {"index_type": "hnsw_sq8", "parameters": {"M": 8}})
+        index, metadata = load_index(index_path)
+        _, indices, _ = search_batch(index, self.embeddings[:10], topk=3, index_metadata=metadata)
+        self.assertEqual(indices[:, 0].tolist(), list(range(10)))
+
+        index_path = self.tmp / "small" / "faiss_index.bin"
+        index = build_index(self.embeddings[:50], self.ids[:50], index_path, {"index_type": "ivf_pq"})
+        self.assertEqual(index.ntotal, 50)
+        self.assertEqual(json.loads(index_path.with_suffix(".json").read_text())["index_type"], "flat")
+
+    def test_training_sample_from_cache(self):
+        """Training vectors are sampled across all cache entries of a model config."""
+        from fingerprint.original_embeddings_cache import OriginalEmbeddingsCache
+
+        cache = OriginalEmbeddingsCache(cache_dir=self.tmp / "cache")
+        model_config = {"model_hash": "abcdef0123456789"}
+        for k in range(3):
+            audio_path = self.tmp / f"track{k}.wav"
+            write_test_audio(audio_path, duration_sec=0.5)
+            cache.set(f"track{k}", audio_path, model_config, np.full((10, 4), k, dtype=np.float32), [])
+
+        sample = cache.sample_embeddings(model_config, num_vectors=12, seed=1)
+        self.assertEqual(sample.shape, (12, 4))
+        self.assertEqual(set(sample[:, 0].tolist()), {0.0, 1.0, 2.0})
+        self.assertEqual(len(cache.sample_embeddings(model_config, num_vectors=100)), 30)
+        self.assertIsNone(cache.sample_embeddings({"model_hash": "0000000000000000"}, num_vectors=5))
+
+
+class TestShardedIndex(unittest.TestCase):
+    """Test building, searching and updating a sharded index."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((200, 8)).astype(np.float32)
+        self.ids = [f"track{k // 10:02d}_seg_{k % 10:04d}" for k in range(200)]
+        self.index_path = self.tmp / "faiss_index.bin"
+        self.index_config = {"index_type": "flat", "sharding": {"num_shards": 3, "search_threads": 3}}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_sharded_search_matches_single_index(self):
+        """Shards partition the catalog by file; merged results equal an unsharded search."""
+        from fingerprint.query_index import build_index, load_index, search_batch, index_exists
+        from fingerprint.sharded_index import ShardedIndex, shard_of
+
+        build_index(self.embeddings, self.ids, self.tmp / "single.bin", {"index_type": "flat"})
+        build_index(self.embeddings, self.ids, self.index_path, self.index_config,
+                    daw_metadata={"track03": {"daw_type": "ableton"}})
+        self.assertTrue(index_exists(self.index_path))
+
+        index, metadata = load_index(self.index_path)
+        single, single_metadata = load_index(self.tmp / "single.bin")
+        self.assertIsInstance(index, ShardedIndex)
+        self.assertEqual(index.ntotal, 200)
+        for shard, shard_metadata in enumerate(index.shard_metadata):
+            self.assertTrue(all(shard_of(file_id, 3) == shard for file_id in shard_metadata["file_table"]))
+        self.assertEqual(metadata["daw_metadata"], {"track03": {"daw_type": "ableton"}})
+
+        distances, indices, file_ids = search_batch(index, self.embeddings[::7], topk=5, index_metadata=metadata)
+        expected_distances, expected_indices, expected_file_ids = search_batch(
+            single, self.embeddings[::7], topk=5, index_metadata=single_metadata
+        )
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-5)
+        self.assertEqual(file_ids.tolist(), expected_file_ids.tolist())
+        self.assertEqual([metadata["ids"][i] for i in indices[:, 0]],
+                         [single_metadata["ids"][i] for i in expected_indices[:, 0]])
+
+    def test_merge_breaks_ties_by_file(self):
+        """Equal scores are ordered by file rank, then index position, whatever the shard order."""
+        from fingerprint.sharded_index import merge_shard_results
+
+        file_rank = np.array([2, 2, 0, 1])
+        first = (np.array([[0.9, 0.5]]), np.array([[0, 1]]))
+        second = (np.array([[0.5, 0.5]]), np.array([[3, 2]]))
+        for shards in ((first, second), (second, first)):
+            distances, indices = merge_shard_results(
+                [d for d, _ in shards], [i for _, i in shards], 3, inner_product=True, file_rank=file_rank
+            )
+            self.assertEqual(indices.tolist(), [[0, 2, 3]])
+            np.testing.assert_allclose(distances, [[0.9, 0.5, 0.5]])
+
+    def test_add_files_rewrites_only_their_shards(self):
+        """New files go to their own shard; the other shards stay untouched."""
+        from fingerprint.query_index import build_index, load_index, search_batch
+        from fingerprint.sharded_index import shard_of, shard_path
+
+        build_index(self.embeddings, self.ids, self.index_path, self.index_config)
+        index, _ = load_index(self.index_path, mmap=False)
+        shard = shard_of("newtrack", 3)
+        before = {s: shard_path(self.index_path, s).with_suffix(".json").stat().st_mtime_ns for s in range(3)}
+
+        new_embeddings = np.random.default_rng(1).standard_normal((4, 8)).astype(np.float32)
+        index.add_files(["newtrack"], [new_embeddings])
+        after = {s: shard_path(self.index_path, s).with_suffix(".json").stat().st_mtime_ns for s in range(3)}
+        self.assertEqual([s for s in range(3) if before[s] != after[s]], [shard])
+
+        reloaded, metadata = load_index(self.index_path)
+        self.assertEqual(reloaded.ntotal, 204)
+        self.assertEqual(json.loads(self.index_path.with_suffix(".json").read_text())["num_vectors"], 204)
+        _, indices, file_ids = search_batch(reloaded, new_embeddings[2], topk=1, index_metadata=metadata)
+        self.assertEqual(file_ids[0, 0], "newtrack")
+        self.assertEqual(metadata["ids"][indices[0, 0]], "newtrack_seg_0002")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""Tests for querying single files against an index."""
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+import numpy as np
+
+from fingerprint.load_model import FallbackEmbeddingGenerator
+from audio_fixtures import SAMPLE_RATE, write_test_audio
+
+
+class TestRunQueryOnFile(unittest.TestCase):
+    """Test run_query_on_file error handling."""
+
+    def test_optimizer_error_returns_fallback_result(self):
+        """A failing transform optimizer yields the fallback result instead of raising."""
+        import faiss
+        from fingerprint.run_queries import run_query_on_file
+        from utils.error_handler import TransformOptimizationError
+
+        index = faiss.IndexFlatIP(64)
+        index.add(np.eye(4, 64, dtype=np.float32))
+        metadata = {"ids": [f"orig_seg_{i:04d}" for i in range(4)]}
+        model_config = {
+            "model": FallbackEmbeddingGenerator(embedding_dim=64, sample_rate=SAMPLE_RATE),
+            "sample_rate": SAMPLE_RATE,
+            "segment_length": 2.0,
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            audio_path = Path(tmpdir) / "query.wav"
+            write_test_audio(audio_path, duration_sec=4.0)
+            with patch(
+                "fingerprint.run_queries.TransformOptimizer.apply_optimization",
+                side_effect=TransformOptimizationError("optimizer failed")
+            ) as optimizer:
+                result = run_query_on_file(
+                    audio_path, index, model_config, topk=2, index_metadata=metadata,
+                    transform_type="low_pass_filter"
+                )
+        optimizer.assert_called()
+        self.assertEqual(result, {"error": "Query failed", "latency_ms": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Tests for vectorized candidate score aggregation."""
+import unittest
+import numpy as np
+
+
+def _recorded_segment_results(num_segments: int = 12, topk: int = 6, seed: int = 0):
+    """Segment results as recorded in query JSONs (two scales, repeated candidates)."""
+    rng = np.random.default_rng(seed)
+    segment_results = []
+    for s in range(num_segments):
+        indices = rng.choice(20, size=topk, replace=False)
+        if s % 4 == 1:
+            indices[0] = 7  # Runs of the same top hit
+        similarities = np.sort(rng.uniform(0.05, 0.95, size=topk))[::-1]
+        segment_results.append({
+            "segment_id": f"q_seg_{s:04d}",
+            "start": float(s),
+            "scale_weight": 1.0 if s % 2 else 0.5,
+            "scale_length": 1.0 if s % 2 else 3.0,
+            "results": [
+                {"rank": k + 1, "index": int(idx), "similarity": float(sim),
+                 "id": f"track{idx // 5}_seg_{idx % 5:04d}"}
+                for k, (idx, sim) in enumerate(zip(indices, similarities))
+            ],
+        })
+    return segment_results
+
+
+class TestScoreAggregation(unittest.TestCase):
+    """Test the vectorized candidate aggregation against per-candidate loops."""
+
+    def test_candidate_scores_match_loop(self):
+        """Weighted similarity, votes, geometric mean and temporal runs match the loop."""
+        from fingerprint.score_aggregation import SegmentHits, aggregate_hits
+
+        segment_results = _recorded_segment_results()
+        scores = aggregate_hits(SegmentHits.from_segment_results(segment_results))
+
+        reference = {}
+        for seg in segment_results:
+            for result in seg["results"]:
+                entry = reference.setdefault(result["index"], {"sims": [], "weights": [], "ranks": []})
+                entry["sims"].append(result["similarity"] * seg["scale_weight"])
+                entry["weights"].append(seg["scale_weight"])
+                entry["ranks"].append(result["rank"])
+        self.assertEqual(scores.keys.tolist(), list(reference))
+
+        for c, entry in enumerate(reference.values()):
+            sims = np.array(entry["sims"])
+            weights = sims ** 2 * np.array(entry["weights"])
+            self.assertAlmostEqual(scores.weighted_similarity[c], np.sum(sims * weights) / np.sum(weights))
+            self.assertAlmostEqual(scores.geometric_mean[c], np.exp(np.mean(np.log(sims))))
+            self.assertAlmostEqual(scores.max_similarity[c], sims.max())
+            self.assertEqual(scores.rank_1_count[c], entry["ranks"].count(1))
+            self.assertEqual(scores.rank_5_count[c], sum(r <= 5 for r in entry["ranks"]))
+            self.assertEqual(scores.min_rank[c], min(entry["ranks"]))
+
+        runs = {}
+        previous, length = None, 0
+        for seg in segment_results + [{"results": [{"index": None}]}]:
+            top = seg["results"][0]["index"]
+            if top == previous:
+                length += 1
+                continue
+            if previous is not None:
+                runs.setdefault(previous, []).append(length)
+            previous, length = top, 1
+        for c, key in enumerate(scores.keys.tolist()):
+            self.assertEqual(scores.max_run[c], max(runs.get(key, [0])))
+            self.assertEqual(scores.total_run[c], sum(runs.get(key, [0])))
+
+    def test_file_level_candidates(self):
+        """With a segment map, all segments of a file are one candidate."""
+        from fingerprint.score_aggregation import SegmentHits, aggregate_hits
+        from fingerprint.segment_map import SegmentFileMap
+
+        segment_results = _recorded_segment_results()
+        mapping = SegmentFileMap.from_ids([f"track{k // 5}_seg_{k % 5:04d}" for k in range(20)])
+        hits = SegmentHits.from_segment_results(segment_results)
+        scores = aggregate_hits(hits, mapping)
+        self.assertEqual(sorted(scores.keys.tolist()), [0, 1, 2, 3])
+        self.assertEqual(int(scores.match_count.sum()), len(segment_results) * 6)
+        best = hits.hit(scores.best_hit[0])
+        self.assertEqual(best["id"].split("_seg_")[0], mapping.file_ids[scores.keys[0]])
+
+    def test_aggregation_service_matches_loop(self):
+        """AggregationService scores match the per-candidate loop with temporal boosts."""
+        from core.models import QueryConfig, SegmentResult
+        from services.aggregation_service import AggregationService
+
+        config = QueryConfig(min_similarity_threshold=0.4, temporal_consistency_weight=0.15)
+        segment_results = [
+            SegmentResult(seg["segment_id"], seg["start"], seg["start"] + 1.0, 0,
+                          seg["scale_length"], seg["scale_weight"], seg["results"])
+            for seg in _recorded_segment_results(seed=3)
+        ]
+        candidates = AggregationService.aggregate_segment_results(segment_results, config)
+
+        totals = {}
+        for seg in segment_results:
+            kept = [r for r in seg.results if r["similarity"] >= 0.4] or seg.results[:1]
+            for rank, result in enumerate(kept, start=1):
+                totals[result["id"]] = totals.get(result["id"], 0.0) + result["similarity"] * seg.scale_weight / rank
+        for first, second in zip(segment_results, segment_results[1:]):
+            common = {r["id"] for r in first.results[:10]} & {r["id"] for r in second.results[:10]}
+            for candidate_id in common & set(totals):
+                totals[candidate_id] += 0.15 * totals[candidate_id]
+
+        self.assertEqual({c["id"] for c in candidates}, set(totals))
+        for candidate in candidates:
+            self.assertAlmostEqual(candidate["score"], totals[candidate["id"]])
+        self.assertEqual([c["score"] for c in candidates], sorted((c["score"] for c in candidates), reverse=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests for per-tier search-parameter tuning."""
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+
+
+class TestSearchTuning(unittest.TestCase):
+    """Test the per-tier search parameter tuner."""
+
+    def test_select_tier_settings_from_pareto_front(self):
+        """The fastest setting reaching the recall target within the p99 budget wins."""
+        from fingerprint.search_tuning import pareto_front, select_tier_settings
+
+        rows = [
+            {"tier": "mild", "topk": 10, "ef_search": 16, "recall": 0.90, "p50_ms": 1.0, "p99_ms": 2.0},
+            {"tier": "mild", "topk": 10, "ef_search": 32, "recall": 0.99, "p50_ms": 2.0, "p99_ms": 3.0},
+            {"tier": "mild", "topk": 20, "ef_search": 32, "recall": 0.98, "p50_ms": 3.0, "p99_ms": 4.0},
+            {"tier": "mild", "topk": 20, "ef_search": 64, "recall": 1.00, "p50_ms": 5.0, "p99_ms": 9.0},
+            {"tier": "severe", "topk": 50, "ef_search": 64, "recall": 0.80, "p50_ms": 4.0, "p99_ms": 6.0},
+            {"tier": "severe", "topk": 100, "ef_search": 128, "recall": 0.85, "p50_ms": 8.0, "p99_ms": 12.0},
+        ]
+        front = pareto_front([row for row in rows if row["tier"] == "mild"])
+        self.assertEqual([row["p99_ms"] for row in front], [2.0, 3.0, 9.0])
+
+        selected = select_tier_settings(rows, {
+            "mild": {"min_recall": 0.99, "target_p99_ms": 5.0},
+            "severe": {"min_recall": 0.95, "target_p99_ms": 10.0},
+        })
+        self.assertEqual(selected["mild"]["ef_search"], 32)
+        # Recall target out of reach within the budget: best recall within it
+        self.assertEqual(selected["severe"]["topk"], 50)
+
+    def test_tuned_tiers_apply_to_searches(self):
+        """Tuning writes search_tiers to the index; tier_metadata searches with the tier's ef_search."""
+        from fingerprint.query_index import build_index, load_index, search_batch, search_tier, tier_metadata
+        from fingerprint.search_tuning import (
+            apply_search_tiers, held_out_from_index, search_tiers_entry, select_tier_settings,
+            tune_search_parameters,
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index_path = Path(tmp) / "faiss_index.bin"
+            rng = np.random.default_rng(0)
+            embeddings = rng.standard_normal((600, 16)).astype(np.float32)
+            ids = [f"track{k // 20:02d}_seg_{k % 20:04d}" for k in range(600)]
+            build_index(embeddings, ids, index_path, {
+                "index_type": "hnsw", "parameters": {"M": 8, "ef_construction": 40, "ef_search": 60}
+            })
+            index, metadata = load_index(index_path)
+
+            queries = held_out_from_index(index, metadata, num_queries=12, segments_per_query=4)
+            self.assertEqual(sorted(set(queries.tiers)), ["mild", "moderate", "severe"])
+            self.assertEqual(len(queries.queries()), 12)
+            report = tune_search_parameters(index, metadata, queries, {"ef_search": [8, 24], "topk": [5, 10]})
+            self.assertEqual(len(report), 3 * 4)
+            self.assertTrue(all(0.0 <= row["recall"] <= 1.0 and row["p99_ms"] >= row["p50_ms"] for row in report))
+            # 4 segments per query: per-segment latency is a quarter of the query's
+            self.assertTrue(all(row["p99_segment_ms"] <= row["p99_ms"] / 4 + 1e-9 for row in report))
+
+            selected = select_tier_settings(report, {tier: {"min_recall": 0.0} for tier in ("mild", "moderate", "severe")})
+            apply_search_tiers(index_path, search_tiers_entry(selected, metadata))
+            index, metadata = load_index(index_path)
+            mild = search_tier(metadata, "mild")
+            self.assertEqual(mild, selected["mild"])
+            self.assertIsNone(search_tier(metadata, "unknown"))
+
+            view = tier_metadata(metadata, "mild")
+            self.assertIs(tier_metadata(metadata, "mild"), view)
+            self.assertIs(view["_segment_map"], metadata["_segment_map"])
+            search_batch(index, embeddings[:2], mild["topk"], view)
+            self.assertEqual(index.hnsw.efSearch, mild["ef_search"])
+            search_batch(index, embeddings[:2], 5, metadata)
+            self.assertEqual(index.hnsw.efSearch, 60)
+
+
+if __name__ == "__main__":
+    unittest.main()